@@ -0,0 +1,256 @@
+import asyncio
+import time
+
+# 帯域制限の対象範囲
+SCOPES = ("global", "per_ip", "per_connection")
+# 帯域制限の方向（receive: クライアント→サーバー、send: サーバー→クライアント）
+DIRECTIONS = ("receive", "send")
+
+
+def validate_limit(scope: str, direction: str, rate) -> None:
+    """制限値の指定を検証する
+
+    Args
+        scope [str] "global", "per_ip", "per_connection"
+        direction [str] "receive", "send"
+        rate 1秒あたりのバイト数（0以上の数値）またはNone
+
+    Raises
+        ValueError 指定が不正な場合
+    """
+    if scope not in SCOPES or direction not in DIRECTIONS:
+        raise ValueError(f"不明な帯域制限の指定です: {scope}.{direction}")
+    if rate is not None and (not isinstance(rate, (int, float)) or isinstance(rate, bool) or rate < 0):
+        raise ValueError(f"制限値は0以上の数値またはnullで指定してください: {rate}")
+
+
+class TokenBucket:
+    """トークンバケットによる帯域制限
+
+    - rate バイト/秒でトークンが増え、最大 burst バイトまで貯まる
+    - 送受信したバイト数だけトークンを消費し、不足分（マイナス）を回復するまで待機する
+        待機中は次の読み込みを行わないため、ソケットの受信バッファが埋まりTCPの送信側が止まる
+    """
+
+    def __init__(self, rate: float | None, burst_seconds: float = 1.0) -> None:
+        """
+        Args
+            rate [float] 1秒あたりのバイト数。Noneの場合は制限しない
+            burst_seconds [float] 初期値 = 1.0 貯められるトークンの量（rate の何秒分か）
+        """
+        self.burst_seconds = burst_seconds
+        self.rate: float | None = None
+        self.burst: float = 0.0
+        self.tokens: float = 0.0
+        self.updated_at = time.monotonic()
+        self.set_rate(rate)
+        # 開始直後は burst 分まで待たずに送受信できる
+        self.tokens = self.burst
+
+    def set_rate(self, rate: float | None) -> None:
+        """
+        制限値を変更する（待機中の処理にも次の待機から反映される）
+
+        Args
+            rate [float] 1秒あたりのバイト数。Noneまたは0以下の場合は制限しない
+        """
+        self.refill()
+        self.rate = float(rate) if rate and rate > 0 else None
+        if self.rate is None:
+            self.burst = 0.0
+            self.tokens = 0.0
+        else:
+            self.burst = self.rate * self.burst_seconds
+            self.tokens = min(self.tokens, self.burst)
+
+    def refill(self) -> None:
+        """
+        経過時間分のトークンを追加する
+        """
+        now = time.monotonic()
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def consume(self, size: int) -> float:
+        """
+        トークンを消費し、不足分を回復するまでの待ち時間を返す
+
+        Args
+            size [int] 送受信したバイト数
+
+        Return
+            [float] 待ち時間（秒）
+        """
+        if self.rate is None:
+            return 0.0
+        self.refill()
+        self.tokens -= size
+        return max(0.0, -self.tokens / self.rate)
+
+
+class ConnectionBandwidth:
+    """1接続分の帯域制限
+        接続・IPアドレス・サーバー全体のバケットからトークンを消費し、最も長い待ち時間だけ待機する
+    """
+
+    def __init__(self, ip: str, connection_buckets: dict[str, TokenBucket], buckets: dict[str, list[TokenBucket]]) -> None:
+        """
+        Args
+            ip [str] クライアントのIPアドレス
+            connection_buckets [dict] {direction: 接続のバケット}
+            buckets [dict] {direction: [接続, IPアドレス, サーバー全体 のバケット]}
+        """
+        self.ip = ip
+        self.connection_buckets = connection_buckets
+        self.buckets = buckets
+
+    async def throttle(self, direction: str, size: int) -> None:
+        """
+        送受信したバイト数に応じて待機する
+
+        Args
+            direction [str] "receive" または "send"
+            size [int] 送受信したバイト数
+        """
+        delay = max((bucket.consume(size) for bucket in self.buckets[direction]), default=0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class BandwidthShaper:
+    """接続ごと・IPアドレスごと・サーバー全体の帯域制限を管理する
+
+    制限値（バイト/秒）は limits で指定し、set_limit で実行中に変更できる
+        {"global": {"receive": None, "send": None}, "per_ip": {...}, "per_connection": {...}}
+        Noneの場合は制限しない
+    """
+
+    def __init__(self, limits: dict | None = None, burst_seconds: float = 1.0) -> None:
+        """
+        Args
+            limits [dict] 初期値 = None 制限値
+            burst_seconds [float] 初期値 = 1.0 貯められるトークンの量（制限値の何秒分か）
+        """
+        self.burst_seconds = burst_seconds
+        self.limits: dict[str, dict[str, float | None]] = {
+            scope: {direction: None for direction in DIRECTIONS} for scope in SCOPES
+        }
+
+        # サーバー全体のバケット
+        self.global_buckets = {direction: TokenBucket(None, burst_seconds) for direction in DIRECTIONS}
+        # {ip: {"buckets": {direction: TokenBucket}, "connections": 接続数}}
+        self.ip_buckets: dict[str, dict] = {}
+        # 接続中のバケット（制限値の変更を反映するため保持する）
+        self.connection_buckets: list[dict[str, TokenBucket]] = []
+
+        for scope, directions in (limits or {}).items():
+            for direction, rate in directions.items():
+                self.set_limit(scope, direction, rate)
+
+    def set_limit(self, scope: str, direction: str, rate: float | None) -> None:
+        """
+        制限値を変更し、接続中のバケットにも反映する
+
+        Args
+            scope [str] "global", "per_ip", "per_connection"
+            direction [str] "receive", "send"
+            rate [float] 1秒あたりのバイト数。Noneの場合は制限しない
+        """
+        validate_limit(scope, direction, rate)
+
+        rate = rate or None
+        self.limits[scope][direction] = rate
+
+        if scope == "global":
+            self.global_buckets[direction].set_rate(rate)
+        elif scope == "per_ip":
+            for entry in self.ip_buckets.values():
+                entry["buckets"][direction].set_rate(rate)
+        else:
+            for buckets in self.connection_buckets:
+                buckets[direction].set_rate(rate)
+
+    def update_limits(self, limits: dict) -> None:
+        """
+        複数の制限値をまとめて変更する（全て検証してから反映する）
+
+        Args
+            limits [dict] {scope: {direction: rate}}
+        """
+        changes = []
+        for scope, directions in limits.items():
+            if not isinstance(directions, dict):
+                raise ValueError(f"不明な帯域制限の指定です: {scope}")
+            for direction, rate in directions.items():
+                validate_limit(scope, direction, rate)
+                changes.append((scope, direction, rate))
+
+        for scope, direction, rate in changes:
+            self.set_limit(scope, direction, rate)
+
+    def open_connection(self, ip: str) -> ConnectionBandwidth:
+        """
+        接続開始時に呼び出し、接続用の帯域制限を作成する
+
+        Args
+            ip [str] クライアントのIPアドレス
+
+        Return
+            [ConnectionBandwidth] 接続用の帯域制限（終了時に close_connection へ渡す）
+        """
+        ip_entry = self.ip_buckets.get(ip)
+        if ip_entry is None:
+            ip_entry = {
+                "buckets": {
+                    direction: TokenBucket(self.limits["per_ip"][direction], self.burst_seconds)
+                    for direction in DIRECTIONS
+                },
+                "connections": 0,
+            }
+            self.ip_buckets[ip] = ip_entry
+        ip_entry["connections"] += 1
+
+        connection_buckets = {
+            direction: TokenBucket(self.limits["per_connection"][direction], self.burst_seconds)
+            for direction in DIRECTIONS
+        }
+        self.connection_buckets.append(connection_buckets)
+
+        return ConnectionBandwidth(
+            ip=ip,
+            connection_buckets=connection_buckets,
+            buckets={
+                direction: [connection_buckets[direction], ip_entry["buckets"][direction], self.global_buckets[direction]]
+                for direction in DIRECTIONS
+            }
+        )
+
+    def close_connection(self, connection: ConnectionBandwidth) -> None:
+        """
+        接続終了時に呼び出し、接続用のバケットを破棄する（IPアドレスの接続がなくなればIPのバケットも破棄）
+
+        Args
+            connection [ConnectionBandwidth] open_connectionの戻り値
+        """
+        if connection.connection_buckets in self.connection_buckets:
+            self.connection_buckets.remove(connection.connection_buckets)
+
+        ip_entry = self.ip_buckets.get(connection.ip)
+        if ip_entry is not None:
+            ip_entry["connections"] -= 1
+            if ip_entry["connections"] <= 0:
+                del self.ip_buckets[connection.ip]
+
+    def get_metrics(self) -> dict:
+        """
+        帯域制限の設定と接続状況（メトリクス用）
+
+        Return
+            [dict] メトリクス
+        """
+        return {
+            "limits_bytes_per_second": self.limits,
+            "connections": len(self.connection_buckets),
+            "clients": {ip: entry["connections"] for ip, entry in self.ip_buckets.items()},
+        }
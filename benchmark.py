@@ -0,0 +1,431 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import ffmpeg_function
+from encoder_registry import EncoderRegistry
+
+# 生成する素材の解像度 {名前: (幅, 高さ)}
+CORPUS_RESOLUTIONS: dict[str, tuple[int, int]] = {
+    "360p": (640, 360),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+# 生成する素材の長さ（秒）
+CORPUS_DURATIONS: list[int] = [5, 30]
+# 生成する素材のコーデック {名前: ffmpegの引数}
+CORPUS_CODECS: dict[str, list[str]] = {
+    "h264": ["-c:v", "libx264", "-preset", "medium", "-crf", "23", "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "128k"],
+    "mpeg4": ["-c:v", "mpeg4", "-q:v", "5", "-pix_fmt", "yuv420p", "-c:a", "libmp3lame", "-b:a", "128k"],
+}
+CORPUS_FRAME_RATE = 30
+
+# trim で切り取る範囲（秒）
+TRIM_START_SECONDS = 1
+TRIM_DURATION_SECONDS = 3
+
+# 1件の処理の実行時間の上限（秒）
+CASE_TIMEOUT_SECONDS = 3600.0
+
+# 前回の結果と比較するときに、悪化とみなす実行時間の増加率
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+
+def build_cases(operations: list[str] | None = None) -> list[dict]:
+    """計測する処理とパラメーターの組み合わせを作成する
+
+    Args
+        operations [list[str]] 初期値 = None 対象の処理（Noneの場合は全て）
+
+    Returns
+        [list[dict]] {"operation", "parameters"} の一覧
+    """
+    cases = [{"operation": "compress", "parameters": {}}]
+    cases += [{"operation": "resize", "parameters": {"size": size}} for size in ("1", "2", "3", "4")]
+    cases += [
+        {"operation": "aspect", "parameters": {"ratio": ratio, "fit_mode": fit_mode}}
+        for ratio in ("1", "2", "3") for fit_mode in ("1", "2")
+    ]
+    cases.append({"operation": "convert", "parameters": {}})
+    cases += [
+        {"operation": "trim", "parameters": {"start": str(TRIM_START_SECONDS), "duration": str(TRIM_DURATION_SECONDS), "type": output_type}}
+        for output_type in ("gif", "webm")
+    ]
+    if operations:
+        cases = [case for case in cases if case["operation"] in operations]
+    return cases
+
+
+def get_corpus_file_name(resolution: str, duration: int, codec: str) -> str:
+    """
+    素材のファイル名（例: "720p_5s_h264.mp4"）
+    """
+    return f"{resolution}_{duration}s_{codec}.mp4"
+
+
+def generate_corpus(corpus_dir: str, resolutions: list[str], durations: list[int], codecs: list[str]) -> list[dict]:
+    """
+    ffmpegの testsrc / sine で素材の動画を生成する（作成済みのファイルは再利用する）
+        同じ指定からは常に同じ内容になるよう、bitexact で出力する
+
+    Args
+        corpus_dir [str] 素材の保存先
+        resolutions [list[str]] CORPUS_RESOLUTIONS のキー
+        durations [list[int]] 長さ（秒）
+        codecs [list[str]] CORPUS_CODECS のキー
+
+    Return
+        [list[dict]] {"name", "path", "resolution", "duration", "codec"} の一覧
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    corpus = []
+
+    for resolution in resolutions:
+        width, height = CORPUS_RESOLUTIONS[resolution]
+        for duration in durations:
+            for codec in codecs:
+                name = get_corpus_file_name(resolution, duration, codec)
+                path = os.path.join(corpus_dir, name)
+
+                if not os.path.exists(path):
+                    print(f"素材を生成します: {name}")
+                    tmp_path = path + ".tmp"
+                    command = [
+                        "ffmpeg", "-hide_banner", "-loglevel", "error",
+                        "-f", "lavfi", "-i", f"testsrc=size={width}x{height}:rate={CORPUS_FRAME_RATE}:duration={duration}",
+                        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}",
+                        *CORPUS_CODECS[codec],
+                        "-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact",
+                        "-shortest",
+                        "-f", "mp4",
+                        "-y", tmp_path,
+                    ]
+                    result = subprocess.run(command, stdin=subprocess.DEVNULL)
+                    if result.returncode != 0:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                        raise RuntimeError(f"素材を生成できません: {name}")
+                    # 途中で停止しても不完全なファイルを再利用しないよう、完成後に名前を変更する
+                    os.replace(tmp_path, path)
+
+                corpus.append({
+                    "name": name,
+                    "path": path,
+                    "resolution": resolution,
+                    "duration": duration,
+                    "codec": codec,
+                })
+
+    return corpus
+
+
+def get_output_extension(case: dict) -> str:
+    """
+    処理の出力ファイルの拡張子
+    """
+    match case["operation"]:
+        case "convert":
+            return "mp3"
+        case "trim":
+            return case["parameters"]["type"]
+    return "mp4"
+
+
+def get_media_seconds(case: dict, input_duration: float) -> float:
+    """
+    処理する素材の長さ（秒）。速度（素材の秒数 / 実行時間）の計算に使用する
+    """
+    if case["operation"] == "trim":
+        return max(0.0, min(float(TRIM_DURATION_SECONDS), input_duration - TRIM_START_SECONDS))
+    return input_duration
+
+
+async def run_operation(case: dict, input_path: str, output_path: str) -> bool:
+    """
+    ffmpeg_function の処理を実行する（サーバーの process_operation と同じ呼び出し）
+
+    Args
+        case [dict] {"operation", "parameters"}
+        input_path [str] 入力ファイルパス
+        output_path [str] 出力ファイルパス
+
+    Return
+        [bool] 成功時True
+    """
+    parameters = case["parameters"]
+    match case["operation"]:
+        case "compress":
+            return await ffmpeg_function.compress_video_file(input_path, output_path, timeout=CASE_TIMEOUT_SECONDS)
+        case "resize":
+            return await ffmpeg_function.resize_video_resolution(input_path, parameters["size"], output_path, timeout=CASE_TIMEOUT_SECONDS)
+        case "aspect":
+            return await ffmpeg_function.change_video_aspect_ratio(
+                input_path, parameters["ratio"], output_path, parameters["fit_mode"], timeout=CASE_TIMEOUT_SECONDS
+            )
+        case "convert":
+            return await ffmpeg_function.convert_to_mp3file(input_path, output_path, timeout=CASE_TIMEOUT_SECONDS)
+        case "trim":
+            return await ffmpeg_function.trim_video_to_gif_webm(
+                input_path, parameters["start"], parameters["duration"], output_path, parameters["type"], timeout=CASE_TIMEOUT_SECONDS
+            )
+    raise ValueError(f"不明な処理です: {case['operation']}")
+
+
+async def run_worker(case: dict, input_path: str, output_path: str) -> dict:
+    """
+    1件の処理を計測する（--worker で起動した子プロセスで実行する）
+        CPU時間と最大メモリ使用量は、このプロセスの子プロセス（ffmpeg）の合計・最大値を使用する
+        処理ごとにプロセスを分けるため、前の処理の最大メモリ使用量は含まれない
+
+    Args
+        case [dict] {"operation", "parameters"}
+        input_path [str] 入力ファイルパス
+        output_path [str] 出力ファイルパス
+
+    Return
+        [dict] 計測結果
+    """
+    # サーバーと同じく、ffmpegが対応しているエンコーダーを選択してから実行する
+    registry = EncoderRegistry()
+    await registry.load()
+    ffmpeg_function.set_encoder_registry(registry)
+
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started_at = time.perf_counter()
+    success = await run_operation(case, input_path, output_path)
+    wall_seconds = time.perf_counter() - started_at
+    usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu_seconds = (
+        (usage_after.ru_utime - usage_before.ru_utime)
+        + (usage_after.ru_stime - usage_before.ru_stime)
+    )
+    # Linuxの ru_maxrss はKB単位（macOSはバイト単位）
+    peak_rss_bytes = usage_after.ru_maxrss if sys.platform == "darwin" else usage_after.ru_maxrss * 1024
+
+    return {
+        "success": success,
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": cpu_seconds,
+        "peak_rss_bytes": peak_rss_bytes,
+        "encoders": registry.get_metrics()["encoders"],
+    }
+
+
+def run_case(case: dict, corpus_item: dict, work_dir: str) -> dict:
+    """
+    1件の処理を子プロセスで計測し、結果をまとめる
+
+    Args
+        case [dict] {"operation", "parameters"}
+        corpus_item [dict] generate_corpus の要素
+        work_dir [str] 出力ファイルの保存先（計測後に削除する）
+
+    Return
+        [dict] 計測結果
+    """
+    output_path = os.path.join(work_dir, f"output.{get_output_extension(case)}")
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    worker_args = json.dumps({"case": case, "input_path": corpus_item["path"], "output_path": output_path})
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", worker_args],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+    # 標準出力の最終行が計測結果（それ以前はffmpeg_functionのログ）
+    lines = result.stdout.strip().splitlines()
+    try:
+        measurement = json.loads(lines[-1]) if lines else {}
+    except json.JSONDecodeError:
+        measurement = {}
+    if result.returncode != 0 or "success" not in measurement:
+        measurement = {"success": False}
+
+    input_bytes = os.path.getsize(corpus_item["path"])
+    output_bytes = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    media_seconds = get_media_seconds(case, corpus_item["duration"])
+    wall_seconds = measurement.get("wall_seconds")
+    success = bool(measurement["success"]) and output_bytes > 0
+
+    return {
+        "input": corpus_item["name"],
+        "resolution": corpus_item["resolution"],
+        "duration": corpus_item["duration"],
+        "codec": corpus_item["codec"],
+        "operation": case["operation"],
+        "parameters": case["parameters"],
+        "success": success,
+        "wall_seconds": wall_seconds,
+        "media_seconds": media_seconds,
+        "speed_factor": (media_seconds / wall_seconds) if success and wall_seconds else None,
+        "cpu_seconds": measurement.get("cpu_seconds"),
+        "peak_rss_bytes": measurement.get("peak_rss_bytes"),
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "size_ratio": (output_bytes / input_bytes) if success and input_bytes else None,
+        "encoders": measurement.get("encoders"),
+    }
+
+
+def get_case_key(result: dict) -> str:
+    """
+    前回の結果と対応付けるためのキー（素材・処理・パラメーター）
+    """
+    return f"{result['input']} {result['operation']} {json.dumps(result['parameters'], sort_keys=True)}"
+
+
+def get_ffmpeg_version() -> str | None:
+    """
+    ffmpeg -version の1行目
+    """
+    try:
+        result = subprocess.run(["ffmpeg", "-version"], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, text=True)
+    except OSError:
+        return None
+    lines = result.stdout.splitlines()
+    return lines[0] if lines else None
+
+
+def print_results(results: list[dict]) -> None:
+    """
+    計測結果を表形式で表示する
+    """
+    print(f"{'素材':<22} {'処理':<8} {'パラメーター':<40} {'実行時間':>9} {'速度':>7} {'CPU':>8} {'最大RSS':>9} {'サイズ比':>8}")
+    for result in results:
+        parameters = json.dumps(result["parameters"], sort_keys=True)
+        if not result["success"]:
+            print(f"{result['input']:<22} {result['operation']:<8} {parameters:<46} 失敗")
+            continue
+        print(
+            f"{result['input']:<22} {result['operation']:<8} {parameters:<46} "
+            f"{result['wall_seconds']:>8.2f}s {result['speed_factor']:>6.2f}x "
+            f"{result['cpu_seconds']:>7.2f}s {result['peak_rss_bytes'] / (1024 * 1024):>7.1f}MB "
+            f"{result['size_ratio']:>8.3f}"
+        )
+
+
+def compare_results(baseline: dict, results: list[dict], threshold: float) -> int:
+    """
+    前回の結果（ベースライン）と比較して、実行時間の変化を表示する
+
+    Args
+        baseline [dict] 前回の結果（このスクリプトが保存したJSON）
+        results [list[dict]] 今回の計測結果
+        threshold [float] 悪化とみなす実行時間の増加率（0.10 = 10%）
+
+    Return
+        [int] 悪化した件数
+    """
+    baseline_results = {get_case_key(result): result for result in baseline.get("results", [])}
+    regressions = 0
+
+    print(f"\nベースラインとの比較（{baseline.get('created_at')}、{baseline.get('ffmpeg_version')}）")
+    for result in results:
+        before = baseline_results.get(get_case_key(result))
+        if before is None or not before.get("success") or not result["success"]:
+            continue
+
+        wall_change = result["wall_seconds"] / before["wall_seconds"] - 1 if before["wall_seconds"] else 0.0
+        size_change = (result["size_ratio"] / before["size_ratio"] - 1) if before.get("size_ratio") else 0.0
+        mark = ""
+        if wall_change > threshold:
+            regressions += 1
+            mark = " ← 悪化"
+        print(f"{get_case_key(result)}: 実行時間 {wall_change:+.1%} サイズ比 {size_change:+.1%}{mark}")
+
+    print(f"悪化: {regressions}件（実行時間が {threshold:.0%} 以上増加）")
+    return regressions
+
+
+def parse_list(value: str | None, choices) -> list[str] | None:
+    """
+    カンマ区切りの指定を一覧にする（指定可能な値か確認する）
+    """
+    if value is None:
+        return None
+    items = [item.strip() for item in value.split(",") if item.strip()]
+    for item in items:
+        if item not in choices:
+            raise SystemExit(f"不明な指定です: {item}（{', '.join(map(str, choices))}）")
+    return items
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ffmpeg_function の処理ごとの性能を計測する")
+    parser.add_argument("--corpus-dir", default="benchmark_corpus", help="生成した素材の保存先")
+    parser.add_argument("--output", default=None, help="計測結果(JSON)の保存先（未指定時は benchmark_results/日時.json）")
+    parser.add_argument("--compare", default=None, help="比較するベースライン(JSON)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD, help="悪化とみなす実行時間の増加率")
+    parser.add_argument("--resolutions", default=None, help=f"素材の解像度（カンマ区切り、{', '.join(CORPUS_RESOLUTIONS)}）")
+    parser.add_argument("--durations", default=None, help=f"素材の長さ（カンマ区切り、{', '.join(map(str, CORPUS_DURATIONS))}）")
+    parser.add_argument("--codecs", default=None, help=f"素材のコーデック（カンマ区切り、{', '.join(CORPUS_CODECS)}）")
+    parser.add_argument("--operations", default=None, help="計測する処理（カンマ区切り、compress, resize, aspect, convert, trim）")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # 計測用の子プロセス
+    if args.worker is not None:
+        worker_args = json.loads(args.worker)
+        measurement = asyncio.run(run_worker(worker_args["case"], worker_args["input_path"], worker_args["output_path"]))
+        print(json.dumps(measurement))
+        return
+
+    resolutions = parse_list(args.resolutions, list(CORPUS_RESOLUTIONS)) or list(CORPUS_RESOLUTIONS)
+    durations = [int(duration) for duration in (parse_list(args.durations, [str(d) for d in CORPUS_DURATIONS]) or CORPUS_DURATIONS)]
+    codecs = parse_list(args.codecs, list(CORPUS_CODECS)) or list(CORPUS_CODECS)
+    operations = parse_list(args.operations, ["compress", "resize", "aspect", "convert", "trim"])
+
+    corpus = generate_corpus(args.corpus_dir, resolutions, durations, codecs)
+    cases = build_cases(operations)
+
+    work_dir = os.path.join(args.corpus_dir, "work")
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = []
+    total = len(corpus) * len(cases)
+    for corpus_item in corpus:
+        for case in cases:
+            print(f"[{len(results) + 1}/{total}] {corpus_item['name']} {case['operation']} {json.dumps(case['parameters'])}")
+            results.append(run_case(case, corpus_item, work_dir))
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "ffmpeg_version": get_ffmpeg_version(),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    output_path = args.output or os.path.join("benchmark_results", time.strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_results(results)
+    print(f"\n計測結果を保存しました: {output_path}")
+
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare_results(baseline, results, args.threshold) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,29 @@
+import argparse
 import asyncio
 import datetime
+import hashlib
 import inspect
 import json
 import os
+import random
+import struct
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
 from mmp_protocol import (
+    CHUNKED_PAYLOAD_SIZE,
+    MAX_CHECKSUM_CHUNK_DATA_SIZE,
+    MMP_VERSION,
+    ChunkedPayloadError,
     create_mmp_body,
+    create_mmp_chunk_header,
+    create_mmp_end_chunk,
     create_mmp_header,
     parse_mmp_body,
     parse_mmp_header,
+    read_mmp_chunks,
 )
 
 
@@ -19,14 +34,52 @@ class Client:
         self.port = 8888
         # プロトコル情報
         self.header_bytes_int: int = 8
+        # 使用するMMPのバージョン（2の場合はリクエストJSONに "mmp_version": 2 を含め、分割形式のレスポンスを受け付ける）
+        self.mmp_version: int = MMP_VERSION
+        # 分割形式の分割データにCRC32を付けるか（送信時、およびサーバーへの要求）
+        self.chunk_checksum: bool = True
+        # サーバーが対応しているMMPのバージョン（レスポンスJSONの "mmp_version" で確認する。未確認の場合None）
+        # 2の場合はアップロードするファイルを分割形式で送信する
+        self.server_mmp_version: int | None = None
+        # ファイル読込・送信時の分割サイズ
+        self.chunk_size: int = 1024 * 1024
+        # ファイル操作（読込・書込）専用のスレッドプール
+        self.io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="client_io")
         #
         self.reader: asyncio.StreamReader | None = None
         self.writer: asyncio.StreamWriter | None = None
+        # ファイル送信中に受信を開始したレスポンスのヘッダー（サーバーが送信前に拒否した場合に使用）
+        self.early_header_task: asyncio.Future | None = None
 
         # レスポンスデータ保存場所
         self.response_dir = "./response_data/"
         os.makedirs(self.response_dir, exist_ok=True)
 
+        # 処理中の途中経過（進捗率）を表示するか
+        self.show_progress: bool = True
+
+        # 処理中に出力を受信するか（ストリーミング）
+        # サーバーが対応する出力形式（MP4、MP3、WEBM）の場合、処理の完了を待たずに受信を開始する
+        self.stream_output: bool = False
+
+        # probe（動画の情報の取得）で送信するファイル先頭のサイズ
+        self.probe_head_bytes: int = 4 * 1024 * 1024
+
+        # アップロード時の同時接続数（2以上の場合はファイルを範囲に分けて並列に送信する）
+        # 遅延の大きい回線で1接続では帯域を使い切れない場合に使用する
+        self.upload_stripes: int = 1
+
+        # 最後に受け付けられたジョブのID（切断した場合はこのIDで結果を再受信できる）
+        self.last_job_id: str | None = None
+
+        # 拡張子とメディアタイプの関係性を辞書で管理
+        self.extension_map: dict[str, str] = {
+            ".mp4": "video/mp4",
+            ".avi": "video/avi",
+            ".mov": "video/mov",
+            ".mp3": "audio/mp3"
+        }
+
     async def connect(self):
         """
         サーバーへ接続
@@ -35,7 +88,7 @@ class Client:
         self.reader, self.writer = await asyncio.open_connection(host=self.host, port=self.port)
         print(f"サーバーに接続中 host: {self.host} port: {self.port}")
 
-    async def create_request(self, json_data: dict, media_type: str, payload: bytes):
+    async def create_request(self, json_data: dict, media_type: str, payload: bytes, payload_size: int | None = None):
         """
         MMPリクエストの作成
 
@@ -46,19 +99,29 @@ class Client:
                 ファイルタイプ 例）mp4、mp3、json、avi ...
             payload [bytes]
                 動画データ
+            payload_size [int]
+                初期値 = None
+                ペイロードを別途送信する場合のサイズ（指定時はpayloadを空にする）
 
         Returns
             header_data_bytes
             body_data_bytes
         """
+        # MMP v2 の分割形式を受け付けることをサーバーへ通知する（対応していないサーバーは無視する）
+        if self.mmp_version >= 2:
+            json_data = {**json_data, "mmp_version": self.mmp_version}
+            if self.chunk_checksum:
+                json_data["chunk_checksum"] = "crc32"
+
         # 各データのサイズを取得
         # json
-        json_string = json.dumps(json_data)
+        json_string = json.dumps(json_data, ensure_ascii=False)
         json_size = len(json_string.encode("utf-8"))
         # media
         media_type_size = len(media_type.encode("utf-8"))
         # payload
-        payload_size = len(payload)
+        if payload_size is None:
+            payload_size = len(payload)
 
         # ヘッダーデータ作成
         header_data_bytes = create_mmp_header(json_size=json_size, media_type_size=media_type_size, payload_size=payload_size)
@@ -95,24 +158,127 @@ class Client:
         Returns
             tuple [json_data, media_type, payload]
         """
+        # ヘッダー、JSON、メディアタイプの受信
+        json_data, media_type, payload_size = await self.receive_response_head()
+
+        # ペイロードの受信
+        if payload_size == CHUNKED_PAYLOAD_SIZE:
+            payload = b"".join([chunk async for chunk in read_mmp_chunks(self.reader, read_size=self.chunk_size)])
+        else:
+            payload = await self.reader.readexactly(payload_size) # type: ignore
+        print("レスポンスデータの受信完了")
+
+        return json_data, media_type, payload
+
+    async def receive_response_head(self):
+        """サーバーからのレスポンスデータのうち、ヘッダー、JSON、メディアタイプを受信
+            ペイロードは受信しない（呼び出し側で読み込む）
+
+        Raises
+            ConnectionError サーバーとの接続状態の確認
+
+        Returns
+            tuple [json_data, media_type, payload_size]
+        """
         # サーバーとの接続確認
         if self.reader is None:
             raise ConnectionError("サーバーと通信できていません。再度接続してください")
 
-        # ヘッダーデータの受信
-        header_data_bytes: bytes = await self.reader.readexactly(self.header_bytes_int)
+        # ヘッダーデータの受信（ファイル送信中に受信を開始している場合はその結果を使用）
+        if self.early_header_task is not None:
+            header_task, self.early_header_task = self.early_header_task, None
+            header_data_bytes: bytes = await header_task
+        else:
+            header_data_bytes = await self.reader.readexactly(self.header_bytes_int)
 
         # ヘッダーデータの解析
         json_size, media_type_size, payload_size= parse_mmp_header(header_bytes=header_data_bytes)
 
-        # ボディデータの受信
-        body_data_bytes = await self.reader.readexactly(json_size + media_type_size + payload_size)
+        # JSON、メディアタイプの受信
+        body_data_bytes = await self.reader.readexactly(json_size + media_type_size)
 
         # ボディデータの解析
-        json_data, media_type, payload = parse_mmp_body(body_bytes=body_data_bytes, json_size=json_size, media_type_size=media_type_size, payload_size=payload_size)
+        json_data, media_type, _ = parse_mmp_body(body_bytes=body_data_bytes, json_size=json_size, media_type_size=media_type_size, payload_size=0)
+
+        # サーバーが対応しているMMPのバージョンを記録する
+        version = json_data.get("mmp_version") if isinstance(json_data, dict) else None
+        if isinstance(version, int) and version >= 2:
+            self.server_mmp_version = version
+
+        return json_data, media_type, payload_size
+
+    async def receive_payload_to_file(self, file_path: str, payload_size: int) -> None:
+        """
+        ペイロードを分割して受信しながらファイルへ書き込む
+            書き込みはI/Oスレッドで行い、その間に次の分割データを受信する
+
+        Args
+            file_path [str] 保存先
+            payload_size [int] ペイロードサイズ（CHUNKED_PAYLOAD_SIZE の場合は分割形式で終端まで受信する）
+
+        Raises
+            ChunkedPayloadError 分割形式のCRC32が一致しない場合など（受信途中のファイルは削除する）
+        """
+        # サーバーとの接続確認
+        if self.reader is None:
+            raise ConnectionError("サーバーと通信できていません。再度接続してください")
+        reader = self.reader
+
+        async def read_payload():
+            if payload_size == CHUNKED_PAYLOAD_SIZE:
+                async for chunk in read_mmp_chunks(reader, read_size=self.chunk_size):
+                    yield chunk
+                return
+            remaining = payload_size
+            while remaining > 0:
+                chunk = await reader.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(partial=b"", expected=remaining)
+                remaining -= len(chunk)
+                yield chunk
+
+        f = await self.run_io(open, file_path, "wb")
+        # 書き込み中のタスク（同時に保持する分割データは最大2つ）
+        pending_write: asyncio.Future | None = None
+        try:
+            async for chunk in read_payload():
+                # 前の書き込みの完了を待ってから次を書き込む
+                if pending_write is not None:
+                    await pending_write
+                pending_write = asyncio.ensure_future(self.run_io(f.write, chunk))
+
+            if pending_write is not None:
+                await pending_write
+
+        except ChunkedPayloadError:
+            # 破損したファイルは閉じてから削除する
+            if pending_write is not None and not pending_write.done():
+                await asyncio.wait({pending_write})
+            await self.run_io(f.close)
+            await self.run_io(os.remove, file_path)
+            raise
+
+        finally:
+            # 受信エラー時も書き込みの終了を待ってから閉じる
+            if pending_write is not None and not pending_write.done():
+                await asyncio.wait({pending_write})
+            await self.run_io(f.close)
+
         print("レスポンスデータの受信完了")
 
-        return json_data, media_type, payload
+    async def run_io(self, func, *args):
+        """
+        ファイル操作をI/O専用のスレッドプールで実行する
+
+        Args
+            func 実行する関数
+            args 関数の位置引数
+
+        Returns
+            funcの戻り値
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.io_executor, func, *args)
 
     async def send_ping(self) -> None:
         """
@@ -137,6 +303,189 @@ class Client:
         elif response_json.get("status") == "error":
             print("サーバーとの疎通確認が失敗しました。")
 
+    async def request_metrics(self) -> dict:
+        """
+        サーバーの状態（メトリクス）を取得する
+
+        Returns
+            metrics [dict] メトリクス
+        """
+        json_data = {"action": "metrics"}
+
+        # リクエストデータの作成
+        header_data_bytes, body_data_bytes = await self.create_request(json_data=json_data, media_type="text/plain", payload=b"")
+
+        # リクエストデータの送信
+        await self.send_request(header_data_bytes=header_data_bytes, body_data_bytes=body_data_bytes)
+
+        # レスポンスデータの受信
+        response_json, _, _ = await self.receive_response()
+
+        return response_json.get("metrics", {})
+
+    async def set_bandwidth_limits(self, limits: dict | None = None) -> dict:
+        """
+        サーバーの帯域制限を変更する
+
+        Args
+            limits [dict] 初期値 = None 変更する制限値（バイト/秒、nullで制限解除）
+                例 {"per_ip": {"receive": 10485760}}
+                Noneの場合は変更せず現在の設定を取得する
+
+        Returns
+            response_json [dict] レスポンスJSON（limitsに変更後の設定）
+        """
+        json_data: dict = {"action": "bandwidth"}
+        if limits is not None:
+            json_data["limits"] = limits
+
+        # リクエストデータの作成
+        header_data_bytes, body_data_bytes = await self.create_request(json_data=json_data, media_type="text/plain", payload=b"")
+
+        # リクエストデータの送信
+        await self.send_request(header_data_bytes=header_data_bytes, body_data_bytes=body_data_bytes)
+
+        # レスポンスデータの受信
+        response_json, _, _ = await self.receive_response()
+
+        return response_json
+
+    async def update_router_backends(self, changes: dict | None = None) -> dict:
+        """
+        ルーター（router.py）の振り分け先を追加・削除する
+
+        Args
+            changes [dict] 初期値 = None 変更内容
+                例 {"add": ["127.0.0.1:8890"], "remove": ["127.0.0.1:8888"]}
+                Noneの場合は変更せず現在の振り分け先を取得する
+
+        Returns
+            response_json [dict] レスポンスJSON（backendsに変更後の振り分け先）
+        """
+        json_data: dict = {"action": "backends", **(changes or {})}
+
+        # リクエストデータの作成
+        header_data_bytes, body_data_bytes = await self.create_request(json_data=json_data, media_type="text/plain", payload=b"")
+
+        # リクエストデータの送信
+        await self.send_request(header_data_bytes=header_data_bytes, body_data_bytes=body_data_bytes)
+
+        # レスポンスデータの受信
+        response_json, _, _ = await self.receive_response()
+
+        return response_json
+
+    async def attach_job(self, job_id: str):
+        """
+        ジョブIDを指定して処理結果を受信する（切断後・サーバーの再起動後の再受信）
+            処理中の場合はサーバーで完了を待ってから受信する
+
+        Args
+            job_id [str] ジョブID（アップロード時に通知されたID）
+
+        Returns
+            tuple [response_json, save_file_path]（response_data_analysis参照）
+        """
+        json_data = {"action": "attach", "job_id": job_id}
+
+        # リクエストデータの作成
+        header_data_bytes, body_data_bytes = await self.create_request(json_data=json_data, media_type="text/plain", payload=b"")
+
+        # リクエストデータの送信
+        await self.send_request(header_data_bytes=header_data_bytes, body_data_bytes=body_data_bytes)
+
+        # レスポンスデータの受信
+        return await self.response_data_analysis()
+
+    async def probe_file(self, file_path: str, content_hash: str | None = None) -> dict:
+        """
+        ファイルの一部だけを送信して、動画の情報（長さ、コーデック、解像度など）を取得する
+            先頭 probe_head_bytes バイトと、MP4でmoovがそれより後ろにある場合はmoovの範囲を送信する
+            content_hash を指定した場合、サーバーは結果をキャッシュし以降の処理でffprobeを省略する
+
+        Args
+            file_path [str] ファイルパス
+            content_hash [str] 初期値 = None ファイル内容のハッシュ値
+
+        Returns
+            response_json [dict] レスポンスJSON（probeにffprobeの出力）
+        """
+        file_size = os.path.getsize(file_path)
+
+        # 送信する範囲 [(offset, length)]
+        ranges = [(0, min(self.probe_head_bytes, file_size))]
+        moov = await self.run_io(self.find_mp4_box, file_path, b"moov")
+        if moov is not None:
+            moov_offset, moov_size = moov
+            moov_end = min(moov_offset + moov_size, file_size)
+            if moov_end > ranges[0][1]:
+                start = max(moov_offset, ranges[0][1])
+                ranges.append((start, moov_end - start))
+
+        json_data = {
+            "action": "probe",
+            "file_name": os.path.basename(file_path),
+            "total_size": file_size,
+            "ranges": [{"offset": offset, "length": length} for offset, length in ranges],
+        }
+        if content_hash is not None:
+            json_data["content_hash"] = content_hash
+
+        # ペイロードを除いたリクエストデータの作成
+        header_data_bytes, body_data_bytes = await self.create_request(
+            json_data=json_data,
+            media_type=await self.get_media_type(file_path=file_path),
+            payload=b"",
+            payload_size=sum(length for _, length in ranges)
+        )
+        await self.send_request(header_data_bytes=header_data_bytes, body_data_bytes=body_data_bytes)
+
+        # 範囲ごとにファイルを読み込みながら送信
+        for offset, length in ranges:
+            await self.send_file_payload(file_path=file_path, offset=offset, length=length)
+
+        response_json, _, _ = await self.receive_response()
+        return response_json
+
+    def find_mp4_box(self, file_path: str, box_type: bytes) -> tuple[int, int] | None:
+        """
+        MP4（ISO BMFF）の最上位のボックスを探す（ボックスのヘッダーのみ読み込む）
+
+        Args
+            file_path [str] ファイルパス
+            box_type [bytes] ボックスの種類（例: b"moov"）
+
+        Returns
+            tuple [offset, size] 見つからない場合・MP4でない場合None
+        """
+        _, ext = os.path.splitext(file_path)
+        if ext.lower() not in (".mp4", ".mov", ".m4v", ".m4a"):
+            return None
+
+        file_size = os.path.getsize(file_path)
+        with open(file_path, mode="rb") as f:
+            offset = 0
+            while offset + 8 <= file_size:
+                f.seek(offset)
+                header = f.read(16)
+                if len(header) < 8:
+                    return None
+                size, current_type = struct.unpack(">I4s", header[:8])
+                if size == 1:
+                    # 64ビットのサイズ
+                    if len(header) < 16:
+                        return None
+                    size = struct.unpack(">Q", header[8:16])[0]
+                elif size == 0:
+                    # ファイルの最後まで
+                    size = file_size - offset
+                if size < 8:
+                    return None
+                if current_type == box_type:
+                    return offset, size
+                offset += size
+        return None
+
     async def get_media_type(self, file_path: str) -> str:
         """
         ファイルパスから拡張子を取得してメディアタイプを返す
@@ -147,33 +496,30 @@ class Client:
         Returns:
             media_type [str] メディアタイプ （例）video/mp4
         """
-        # 拡張子とメディアタイプの関係性を辞書で管理
-        extension_map = {
-            ".mp4": "video/mp4",
-            ".avi": "video/avi",
-            ".mov": "video/mov",
-            ".mp3": "audio/mp3"
-        }
-
         # ファイルから拡張子を抽出
         _, ext =  os.path.splitext(file_path)
 
         # 拡張子に合ったメディアタイプを取得
-        media_type = extension_map.get(ext)
+        media_type = self.extension_map.get(ext)
 
         if media_type is None:
             raise ValueError(f"{ext} 拡張子は対応しておりません")
         else:
             return media_type
 
-    async def upload_video_file(self, operation: str, file_path: str, parameters: dict) -> None:
+    async def upload_video_file(self, operation: str, file_path: str, parameters: dict, deduplicate: bool = True, content_hash: str | None = None) -> None:
         """
         サーバーへ動画ファイルをアップロード
 
+        deduplicate が True の場合は事前にファイル内容のハッシュをサーバーへ確認し、
+        同一内容のファイルを保持していれば参照のみを送信する（ペイロードは送信しない）
+
         Args
             operation [str] 処理内容
             file_path [str] ファイルパス
             parameters dict[str, str] 追加パラメーター
+            deduplicate [bool] 初期値 = True 事前確認を行うか
+            content_hash [str] 初期値 = None 計算済みのハッシュ値（未指定時はここで計算）
         """
 
         # json作成
@@ -183,20 +529,265 @@ class Client:
             "operation": operation,
             "parameters": parameters
         }
+        if self.stream_output:
+            json_data["stream"] = True
 
         # メディアタイプを取得
         media_type = await self.get_media_type(file_path=file_path)
 
-        # バイナリモードで読込
+        if deduplicate:
+            # ファイルを少しずつ読み込みながらハッシュ値を計算
+            if content_hash is None:
+                content_hash = await self.run_io(self.calculate_content_hash, file_path)
+
+            # ルーター経由の場合に、事前確認と同じサーバーへ送られるようにする
+            json_data["route_key"] = content_hash
+
+            # サーバーが同一内容のファイルを保持しているか確認
+            if await self.probe_hash(content_hash=content_hash):
+                print("サーバーが同一ファイルを保持しているため、ファイルの送信を省略します")
+                json_data["content_ref"] = content_hash
+
+                # リクエストデータの作成（ペイロードなし）
+                header_data_bytes, body_data_bytes = await self.create_request(json_data=json_data, media_type=media_type, payload=b"")
+
+                # リクエストデータの送信
+                await self.send_request(header_data_bytes=header_data_bytes, body_data_bytes=body_data_bytes)
+                return
+
+        file_size = os.path.getsize(file_path)
+
+        # 分割アップロード（1範囲が分割サイズ未満になる小さいファイルは1接続で送信）
+        stripes = min(self.upload_stripes, file_size // self.chunk_size)
+        if stripes >= 2:
+            await self.upload_striped_file(
+                json_data=json_data,
+                media_type=media_type,
+                file_path=file_path,
+                file_size=file_size,
+                stripes=stripes,
+                content_hash=content_hash
+            )
+            return
+
+        # サーバーがMMP v2 に対応している場合（事前確認などのレスポンスで確認済み）は分割形式で送信する
+        # 分割データごとのCRC32で、転送中の破損をサーバーが受信時に検出できる
+        chunked = self.mmp_version >= 2 and (self.server_mmp_version or 1) >= 2
+
+        # ペイロードを除いたリクエストデータの作成
+        header_data_bytes, body_data_bytes = await self.create_request(
+            json_data=json_data,
+            media_type=media_type,
+            payload=b"",
+            payload_size=CHUNKED_PAYLOAD_SIZE if chunked else file_size
+        )
+
+        # リクエストデータの送信
+        await self.send_request(header_data_bytes=header_data_bytes, body_data_bytes=body_data_bytes)
+
+        # ファイルを少しずつ読み込みながら送信
+        # サーバーは対応していない処理などをファイルの受信前に拒否するため、送信中もレスポンスを待ち受ける
+        self.early_header_task = asyncio.ensure_future(self.reader.readexactly(self.header_bytes_int)) # type: ignore
+        send_task = asyncio.ensure_future(self.send_file_payload(file_path=file_path, chunked=chunked))
+        done, _ = await asyncio.wait({send_task, self.early_header_task}, return_when=asyncio.FIRST_COMPLETED)
+        if send_task not in done:
+            # 送信完了前にレスポンスが届いた場合は送信を中止する（レスポンスは response_data_analysis で受信）
+            send_task.cancel()
+            try:
+                await send_task
+            except (asyncio.CancelledError, ConnectionError):
+                pass
+            print("サーバーがファイルの受信前に応答したため、送信を中止しました")
+            return
+        await send_task
+
+    async def upload_striped_file(self, json_data: dict, media_type: str, file_path: str, file_size: int, stripes: int, content_hash: str | None = None) -> None:
+        """
+        ファイルを範囲に分け、複数の接続で並列にアップロードする
+            この接続では処理要求（upload_id付き、ペイロードなし）を送信し、レスポンスを待つ
+            範囲データ（upload_range）は別の接続で送信し、サーバーは全範囲が揃ってから処理を開始する
+
+        Args
+            json_data [dict] 処理要求のJSON
+            media_type [str] メディアタイプ
+            file_path [str] ファイルパス
+            file_size [int] ファイルサイズ
+            stripes [int] 同時接続数
+            content_hash [str] 初期値 = None 計算済みのハッシュ値（サーバーで照合する）
+        """
+        upload_id = uuid.uuid4().hex
+        json_data = {**json_data, "upload_id": upload_id, "total_size": file_size}
+        if content_hash is not None:
+            json_data["content_hash"] = content_hash
+
+        # 処理要求を送信（範囲データより先に届かなくてもよい）
+        header_data_bytes, body_data_bytes = await self.create_request(json_data=json_data, media_type=media_type, payload=b"")
+        await self.send_request(header_data_bytes=header_data_bytes, body_data_bytes=body_data_bytes)
+
+        # 範囲の境界は分割サイズの倍数にそろえる
+        range_size = -(-file_size // stripes)
+        range_size = -(-range_size // self.chunk_size) * self.chunk_size
+
+        async def send_range(offset: int):
+            worker_client = self.create_worker_client()
+            length = min(range_size, file_size - offset)
+            range_json = {
+                "action": "upload_range",
+                "upload_id": upload_id,
+                "file_name": json_data["file_name"],
+                "offset": offset,
+                "total_size": file_size,
+            }
+            # ルーター経由の場合に、処理要求と同じサーバーへ送られるようにする
+            if "route_key" in json_data:
+                range_json["route_key"] = json_data["route_key"]
+
+            async def upload_range():
+                header_data_bytes, body_data_bytes = await worker_client.create_request(
+                    json_data=range_json,
+                    media_type=media_type,
+                    payload=b"",
+                    payload_size=length
+                )
+                await worker_client.send_request(header_data_bytes=header_data_bytes, body_data_bytes=body_data_bytes)
+                await worker_client.send_file_payload(file_path=file_path, offset=offset, length=length)
+                response_json, _, _ = await worker_client.receive_response()
+                if response_json.get("status") != "success":
+                    raise ConnectionError(f"範囲データの送信に失敗しました: {response_json.get('description')}")
+
+            await worker_client.execute_request(upload_range)
+
+        range_tasks = [asyncio.ensure_future(send_range(offset)) for offset in range(0, file_size, range_size)]
+        try:
+            await asyncio.gather(*range_tasks)
+        finally:
+            # 1つでも失敗した場合は残りの送信を中止する
+            for task in range_tasks:
+                task.cancel()
+        print(f"分割アップロード完了（{stripes}接続）")
+
+    def create_worker_client(self) -> "Client":
+        """
+        同じ接続先・設定で別の接続を使うクライアントを作成する
+            ファイル操作のスレッドプールは共有する
+
+        Returns
+            [Client] クライアント
+        """
+        worker_client = Client()
+        worker_client.host = self.host
+        worker_client.port = self.port
+        worker_client.response_dir = self.response_dir
+        worker_client.chunk_size = self.chunk_size
+        worker_client.upload_stripes = self.upload_stripes
+        worker_client.stream_output = self.stream_output
+        worker_client.mmp_version = self.mmp_version
+        worker_client.chunk_checksum = self.chunk_checksum
+        worker_client.server_mmp_version = self.server_mmp_version
+        # 同時に処理するため、途中経過は表示しない
+        worker_client.show_progress = False
+        worker_client.io_executor = self.io_executor
+        return worker_client
+
+    async def send_file_payload(self, file_path: str, offset: int = 0, length: int | None = None, chunked: bool = False) -> None:
+        """
+        ファイルデータを分割してサーバーへ送信
+            読込はI/Oスレッドで行い、送信中に次の分割データを読み込む
+
+        Args
+            file_path [str] ファイルパス
+            offset [int] 初期値 = 0 送信を開始する位置
+            length [int] 初期値 = None 送信するバイト数（Noneの場合はファイルの最後まで）
+            chunked [bool] 初期値 = False MMP v2 の分割形式で送信する場合True（chunk_checksum が True の場合はCRC32を付ける）
+        """
+        # サーバーとの接続確認
+        if self.writer is None:
+            raise ConnectionError("サーバーと通信できていません。再度接続してください")
+
+        checksum = chunked and self.chunk_checksum
+        # CRC32を付ける分割データは MAX_CHECKSUM_CHUNK_DATA_SIZE まで
+        read_size = min(self.chunk_size, MAX_CHECKSUM_CHUNK_DATA_SIZE) if checksum else self.chunk_size
+        # ペイロード全体のCRC32（分割形式の終端で送信する）
+        payload_crc32 = 0
+
+        f = await self.run_io(open, file_path, "rb")
+        try:
+            await self.run_io(f.seek, offset)
+            remaining = length
+
+            def read_chunk() -> bytes:
+                if remaining is None:
+                    return f.read(read_size)
+                return f.read(min(read_size, remaining))
+
+            read_task = asyncio.ensure_future(self.run_io(read_chunk))
+            while True:
+                chunk = await read_task
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                # 送信している間に次の分割データを読み込む
+                read_task = asyncio.ensure_future(self.run_io(read_chunk))
+                if chunked:
+                    self.writer.write(create_mmp_chunk_header(chunk, checksum=checksum))
+                    if checksum:
+                        payload_crc32 = zlib.crc32(chunk, payload_crc32)
+                self.writer.write(chunk)
+                await self.writer.drain()
+        finally:
+            await self.run_io(f.close)
+
+        if chunked:
+            self.writer.write(create_mmp_end_chunk(payload_crc32=payload_crc32 if checksum else None))
+            await self.writer.drain()
+
+        print("ファイル送信完了")
+
+    def calculate_content_hash(self, file_path: str) -> str:
+        """
+        ファイル内容のハッシュ値（SHA-256）を計算する
+            ファイル全体をメモリに載せないよう分割して読み込む
+
+        Args
+            file_path [str] ファイルパス
+
+        Returns
+            [str] 16進数のハッシュ値
+        """
+        sha256 = hashlib.sha256()
         with open(file=file_path, mode="rb") as f:
-            payload = f.read()
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+
+        return sha256.hexdigest()
+
+    async def probe_hash(self, content_hash: str) -> bool:
+        """
+        サーバーが同一内容のファイルを保持しているか確認する
+
+        Args
+            content_hash [str] ファイル内容のハッシュ値
+
+        Returns
+            [bool] 保持している場合True
+        """
+        json_data = {"action": "probe_hash", "content_hash": content_hash}
 
         # リクエストデータの作成
-        header_data_bytes, body_data_bytes = await self.create_request(json_data=json_data, media_type=media_type, payload=payload)
+        header_data_bytes, body_data_bytes = await self.create_request(json_data=json_data, media_type="text/plain", payload=b"")
 
         # リクエストデータの送信
         await self.send_request(header_data_bytes=header_data_bytes, body_data_bytes=body_data_bytes)
 
+        # レスポンスデータの受信
+        response_json, _, _ = await self.receive_response()
+
+        return response_json.get("status") == "success" and response_json.get("exists") is True
+
     async def get_user_input(self):
         """
         ユーザーから対話形式で入力を受け取る
@@ -253,7 +844,37 @@ class Client:
 
         parameters: dict[str, str] = {}
         # 追加パラメーターの設定
-        if operation == "resize": # 解像度変更
+        if operation == "compress": # 圧縮
+            print("\n===圧縮方法を選択してください")
+            print("1. 自動（標準の画質）")
+            print("2. 目標サイズを指定(MB)")
+            print("3. 目標画質を指定(SSIM 0~1 例: 0.95)")
+            while True:
+                choice: str= input("\n番号を入力してください (1-3):").strip()
+                # 未入力の確認
+                if choice != "":
+                    # 入力内容の確認
+                    if choice in ["1", "2", "3"]:
+                        break
+                    else:
+                        print("エラー: 番号1~3を入力してください")
+                else:
+                    print("エラー: 未入力です")
+
+            if choice in ["2", "3"]:
+                parameter_name = "target_size_mb" if choice == "2" else "target_quality"
+                while True:
+                    value: str = input("\n目標値を入力してください:").strip()
+                    # 入力内容の確認（正の数値のみ）
+                    try:
+                        if float(value) > 0:
+                            parameters[parameter_name] = value
+                            break
+                        print("エラー: 正の数値を入力してください")
+                    except ValueError:
+                        print("エラー: 数値を入力してください")
+
+        elif operation == "resize": # 解像度変更
             print("\n===解像度を選択してください")
             print("1. 1900*1080")
             print("2. 1280*720")
@@ -350,9 +971,89 @@ class Client:
     async def response_data_analysis(self):
         """
         レスポンスデータの受信と解析
+
+        Returns
+            tuple [response_json, save_file_path]
+                save_file_path はファイルを保存しなかった場合None
         """
-        # レスポンスデータの受信
-        response_json, response_media_type, response_payload = await self.receive_response()
+        # 保存先（エラー時はNone）
+        save_file_path: str | None = None
+
+        # 保存時のメッセージ
+        save_messages: dict[str, str] = {
+            "compress": "圧縮ファイル",
+            "resize": "解像度が変更されたファイル",
+            "aspect": "アスペクト比が変更されたファイル",
+            "convert": "コンバートファイル",
+            "trim": "コンバートファイル",
+            "pipeline": "連結処理したファイル",
+        }
+
+        # レスポンスデータの受信（ペイロード以外）
+        # 処理中は途中経過メッセージ・分割データ（ストリーミング時）が届くため、最終結果が届くまで受信を続ける
+        progress_shown = False
+        # ストリーミングで受信中のファイル
+        stream_file = None
+        try:
+            while True:
+                response_json, response_media_type, payload_size = await self.receive_response_head()
+                status = response_json.get("status")
+
+                if status == "accepted":
+                    # 受信前に切断した場合は、このジョブIDで結果を再受信できる（--attach）
+                    self.last_job_id = response_json.get("job_id")
+                    if self.show_progress:
+                        print(f"ジョブID: {self.last_job_id}")
+                    continue
+
+                if status == "progress":
+                    self.render_progress(progress_json=response_json)
+                    progress_shown = True
+                    continue
+
+                if status == "stream":
+                    # MMP v2: 出力全体が1つのメッセージ（分割形式）で届くため、終端まで受信しながら書き込む
+                    save_file_path = await self.save_file_path_creation(
+                        operation=response_json.get("operation"),
+                        media_type=response_media_type
+                    )
+                    await self.receive_payload_to_file(file_path=save_file_path, payload_size=payload_size)
+                    continue
+
+                if status == "chunk":
+                    # 最初の分割データを受信した時点で保存先を作成し、受信しながら書き込む
+                    if stream_file is None:
+                        save_file_path = await self.save_file_path_creation(
+                            operation=response_json.get("operation"),
+                            media_type=response_media_type
+                        )
+                        stream_file = await self.run_io(open, save_file_path, "wb")
+                    chunk = await self.reader.readexactly(payload_size) # type: ignore
+                    await self.run_io(stream_file.write, chunk)
+                    continue
+
+                break
+        finally:
+            if stream_file is not None:
+                await self.run_io(stream_file.close)
+
+        # 途中経過の表示行を改行する
+        if progress_shown and self.show_progress:
+            print()
+
+        # ストリーミングで受信済みの場合
+        if response_json.get("streamed") or save_file_path is not None:
+            if response_json.get("status") == "success":
+                if save_file_path is not None:
+                    save_message = save_messages.get(response_json.get("operation"), "ファイル") # type: ignore
+                    print(f"{save_message}を {save_file_path} へ保存しました（ストリーミング）")
+            else:
+                # 処理に失敗した場合は途中まで受信したファイルを削除する
+                if save_file_path is not None:
+                    await self.run_io(os.remove, save_file_path)
+                    save_file_path = None
+                print("エラーが発生しました")
+            return response_json, save_file_path
 
         # レスポンスデータの確認
         if response_json.get("status") == "success":
@@ -362,55 +1063,50 @@ class Client:
             if operation is None:
                 raise ValueError("指示内容が存在しません。再度処理を行ってください")
 
-            # 圧縮、音声抽出...ごとに処理を行う
-            match operation:
-                case "compress": # 圧縮
-                    # レスポンスデータの保存パスを作成
-                    save_file_path = await self.save_file_path_creation(operation=operation)
-
-                    # 圧縮処理されたレスポンスデータを書き込む
-                    with open(save_file_path, mode="wb") as f:
-                        f.write(response_payload)
-                        print(f"圧縮ファイルを {save_file_path} へ保存しました")
-
-                case "resize": # 解像度変更
-                    # レスポンスデータの保存パスを作成
-                    save_file_path = await self.save_file_path_creation(operation=operation)
-
-                    # 解像度変更されたレスポンスデータを書き込む
-                    with open(save_file_path, mode="wb") as f:
-                        f.write(response_payload)
-                        print(f"解像度が変更されたファイルを {save_file_path} へ保存しました")
-
-                case "aspect": # アスペクト比変更
-                    # レスポンスデータの保存パスを作成
-                    save_file_path = await self.save_file_path_creation(operation=operation)
-
-                    # アスペクト比変更されたレスポンスデータを書き込む
-                    with open(save_file_path, mode="wb") as f:
-                        f.write(response_payload)
-                        print(f"アスペクト比が変更されたファイルを {save_file_path} へ保存しました")
-
-                case "convert": # コンバート
-                    # レスポンスデータの保存パスを作成
-                    save_file_path = await self.save_file_path_creation(operation=operation)
-
-                    # コンバートされたレスポンスデータを書き込む
-                    with open(save_file_path, mode="wb") as f:
-                        f.write(response_payload)
-                        print(f"コンバートファイルを {save_file_path} へ保存しました")
-
-                case "trim": # gif or webm
-                    # レスポンスデータの保存パスを作成
-                    save_file_path = await self.save_file_path_creation(operation=operation, media_type=response_media_type)
-
-                    # コンバートされたレスポンスデータを書き込む
-                    with open(save_file_path, mode="wb") as f:
-                        f.write(response_payload)
-                        print(f"コンバートファイルを {save_file_path} へ保存しました")
+            # 圧縮、音声抽出...ごとに保存先を作成し、受信しながら書き込む
+            if operation in save_messages:
+                # レスポンスデータの保存パスを作成
+                save_file_path = await self.save_file_path_creation(operation=operation, media_type=response_media_type)
+
+                # 処理されたレスポンスデータを書き込む
+                await self.receive_payload_to_file(file_path=save_file_path, payload_size=payload_size)
+                print(f"{save_messages[operation]}を {save_file_path} へ保存しました")
+                if response_json.get("codec_path") == "stream_copy":
+                    print("再エンコードせずにコピーしました")
+                elif response_json.get("preset") is not None:
+                    print(f"エンコード設定: {response_json['preset']} (速度段階 {response_json.get('speed_level')})")
+                if response_json.get("coalesced"):
+                    print("処理中の同じジョブの結果を受け取りました")
 
         elif response_json.get("status") == "error":
             print("エラーが発生しました")
+            # サーバーが示したエラー内容と解決策
+            if response_json.get("description"):
+                print(f"内容: {response_json['description']}")
+            if response_json.get("solution"):
+                print(f"解決策: {response_json['solution']}")
+
+        return response_json, save_file_path
+
+    def render_progress(self, progress_json: dict) -> None:
+        """
+        途中経過メッセージ（進捗率、残り時間）を表示する
+
+        Args
+            progress_json [dict] 途中経過メッセージのJSON
+        """
+        if not self.show_progress:
+            return
+
+        percent = progress_json.get("percent")
+        eta_seconds = progress_json.get("eta_seconds")
+        speed = progress_json.get("speed")
+
+        percent_text = f"{percent:5.1f}%" if percent is not None else "---.-%"
+        eta_text = f"残り約{eta_seconds:.0f}秒" if eta_seconds is not None else "残り時間不明"
+        speed_text = f"速度 {speed:.2f}x" if speed is not None else ""
+
+        print(f"\r処理中({progress_json.get('operation')}) {percent_text} {eta_text} {speed_text}", end="", flush=True)
 
     async def upload_and_receive(self):
         """
@@ -427,6 +1123,229 @@ class Client:
         # サーバーからのレスポンスデータの受信と解析
         await self.response_data_analysis()
 
+    def load_batch_jobs(self, source: str, operation: str | None = None, parameters: dict | None = None) -> list[dict]:
+        """
+        バッチ処理の対象を読み込む
+
+        Args
+            source [str]
+                マニフェスト(JSON)またはディレクトリのパス
+                マニフェストは {"file_path", "operation", "parameters"} のリスト
+                （"jobs"キーを持つオブジェクトも可）
+            operation [str]
+                初期値 = None
+                マニフェストで省略された場合、ディレクトリ指定時に使用する処理内容
+            parameters [dict]
+                初期値 = None
+                マニフェストで省略された場合、ディレクトリ指定時に使用する追加パラメーター
+
+        Returns
+            jobs [list[dict]] {"file_path", "operation", "parameters"} のリスト
+        """
+        default_parameters = parameters or {}
+        jobs: list[dict] = []
+
+        if os.path.isdir(source):
+            if operation is None:
+                raise ValueError("ディレクトリを指定する場合は処理内容(operation)も指定してください")
+
+            # 対応している拡張子のファイルのみ対象にする
+            for file_name in sorted(os.listdir(source)):
+                file_path = os.path.join(source, file_name)
+                _, ext = os.path.splitext(file_name)
+                if os.path.isfile(file_path) and ext in self.extension_map:
+                    jobs.append({"file_path": file_path, "operation": operation, "parameters": dict(default_parameters)})
+        else:
+            with open(source, mode="r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if isinstance(manifest, dict):
+                manifest = manifest.get("jobs", [])
+
+            # マニフェスト内の相対パスはマニフェストの場所を基準にする
+            base_dir = os.path.dirname(os.path.abspath(source))
+            for entry in manifest:
+                job_operation = entry.get("operation", operation)
+                if job_operation is None:
+                    raise ValueError(f"処理内容(operation)が指定されていません: {entry}")
+                jobs.append({
+                    "file_path": os.path.join(base_dir, entry["file_path"]),
+                    "operation": job_operation,
+                    "parameters": entry.get("parameters", dict(default_parameters)),
+                })
+
+        return jobs
+
+    async def run_batch(
+        self,
+        jobs: list[dict],
+        concurrency: int = 2,
+        max_retries: int = 3,
+        retry_backoff: float = 1.0,
+        summary_path: str | None = None,
+        deduplicate: bool = True,
+    ) -> dict:
+        """
+        複数ファイルを対話なしで処理する
+
+        - 同時処理数を concurrency までに制限する
+        - 接続エラー時は指数バックオフで再試行する
+        - レスポンス待ちの間に次のファイルのハッシュ計算（ディスク読込）を進める
+
+        Args
+            jobs [list[dict]] {"file_path", "operation", "parameters"} のリスト
+            concurrency [int] 初期値 = 2 同時処理数
+            max_retries [int] 初期値 = 3 接続エラー時の再試行回数
+            retry_backoff [float] 初期値 = 1.0 再試行までの待機秒数（試行ごとに倍増）
+            summary_path [str] 初期値 = None 結果(JSON)の保存先
+            deduplicate [bool] 初期値 = True 事前確認を行うか
+
+        Returns
+            summary [dict] 処理結果のまとめ
+        """
+        started_at = datetime.datetime.now()
+
+        # 次に処理するジョブの番号
+        next_index = 0
+        # ジョブ番号ごとのハッシュ計算タスク
+        hash_tasks: dict[int, asyncio.Future] = {}
+        results: list[dict] = [{} for _ in jobs]
+
+        def prefetch_hash(index: int) -> None:
+            """指定したジョブのハッシュ計算を先に始める"""
+            if deduplicate and index < len(jobs) and index not in hash_tasks:
+                hash_tasks[index] = asyncio.ensure_future(
+                    self.run_io(self.calculate_content_hash, jobs[index]["file_path"])
+                )
+
+        async def worker() -> None:
+            nonlocal next_index
+            while next_index < len(jobs):
+                index = next_index
+                next_index += 1
+                prefetch_hash(index)
+                results[index] = await self.process_batch_job(
+                    job=jobs[index],
+                    hash_task=hash_tasks.get(index),
+                    on_uploaded=lambda: prefetch_hash(next_index),
+                    max_retries=max_retries,
+                    retry_backoff=retry_backoff,
+                    deduplicate=deduplicate,
+                )
+                hash_tasks.pop(index, None)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+        finished_at = datetime.datetime.now()
+        summary = {
+            "started_at": started_at.isoformat(),
+            "finished_at": finished_at.isoformat(),
+            "elapsed_seconds": (finished_at - started_at).total_seconds(),
+            "concurrency": concurrency,
+            "total": len(jobs),
+            "succeeded": sum(1 for result in results if result.get("status") == "success"),
+            "failed": sum(1 for result in results if result.get("status") != "success"),
+            "results": results,
+        }
+
+        if summary_path is not None:
+            def write_summary():
+                with open(summary_path, mode="w", encoding="utf-8") as f:
+                    json.dump(summary, f, ensure_ascii=False, indent=2)
+
+            await self.run_io(write_summary)
+            print(f"処理結果を {summary_path} へ保存しました")
+
+        return summary
+
+    async def process_batch_job(
+        self,
+        job: dict,
+        hash_task: asyncio.Future | None,
+        on_uploaded,
+        max_retries: int,
+        retry_backoff: float,
+        deduplicate: bool,
+    ) -> dict:
+        """
+        バッチ処理の1ファイル分を実行する
+            ジョブごとに接続を分けるため、同じ接続先の別クライアントを使用する
+
+        Args
+            job [dict] {"file_path", "operation", "parameters"}
+            hash_task [asyncio.Future] 先行して開始したハッシュ計算（None可）
+            on_uploaded 送信完了時（レスポンス待ちに入る時）に呼び出す関数
+            max_retries [int] 接続エラー時の再試行回数
+            retry_backoff [float] 再試行までの待機秒数（試行ごとに倍増）
+            deduplicate [bool] 事前確認を行うか
+
+        Returns
+            result [dict] ファイルごとの処理結果
+        """
+        result: dict = {
+            "file_path": job["file_path"],
+            "operation": job["operation"],
+            "parameters": job["parameters"],
+            "status": "error",
+            "output_path": None,
+            "codec_path": None,
+            "preset": None,
+            "coalesced": False,
+            "attempts": 0,
+            "error": None,
+        }
+        started = time.perf_counter()
+
+        # 途中経過は表示せず、ファイル操作のスレッドプールは全ジョブで共有する
+        worker_client = self.create_worker_client()
+
+        async def upload_and_wait():
+            content_hash = await hash_task if hash_task is not None else None
+            upload_started = time.perf_counter()
+            await worker_client.upload_video_file(
+                operation=job["operation"],
+                file_path=job["file_path"],
+                parameters=job["parameters"],
+                deduplicate=deduplicate,
+                content_hash=content_hash,
+            )
+            result["upload_seconds"] = time.perf_counter() - upload_started
+            on_uploaded()
+
+            response_started = time.perf_counter()
+            response = await worker_client.response_data_analysis()
+            result["response_seconds"] = time.perf_counter() - response_started
+            return response
+
+        for attempt in range(max_retries + 1):
+            result["attempts"] = attempt + 1
+            try:
+                response_json, save_file_path = await worker_client.execute_request(upload_and_wait)
+                result["status"] = response_json.get("status", "error")
+                result["output_path"] = save_file_path
+                result["codec_path"] = response_json.get("codec_path")
+                result["preset"] = response_json.get("preset")
+                result["coalesced"] = bool(response_json.get("coalesced"))
+                if result["status"] != "success":
+                    result["error"] = response_json.get("description") or response_json.get("code")
+                break
+
+            except (ConnectionError, asyncio.IncompleteReadError, OSError, ChunkedPayloadError) as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+                if attempt >= max_retries:
+                    break
+                wait_seconds = retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"接続エラーのため {wait_seconds:.1f}秒後に再試行します: {job['file_path']} ({e})")
+                await asyncio.sleep(wait_seconds)
+
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+                break
+
+        result["elapsed_seconds"] = time.perf_counter() - started
+        print(f"{job['file_path']}: {result['status']} ({result['elapsed_seconds']:.1f}秒)")
+
+        return result
+
     async def save_file_path_creation(self, operation: str, media_type: str = "") -> str:
         """
         保存場所の作成をするヘルパーメソッド
@@ -439,8 +1358,9 @@ class Client:
         Returns
             save_file_path [str] ファイルの保存先
         """
+        # マイクロ秒まで含めて、同時に受信したファイル同士の重複を避ける
         now = datetime.datetime.now()
-        time_stamp_str = now.strftime("%Y%m%d_%H%M%S")
+        time_stamp_str = now.strftime("%Y%m%d_%H%M%S_%f")
 
         match operation:
             case "compress": # 圧縮
@@ -459,6 +1379,10 @@ class Client:
                 save_file_name = f"converted_video_{time_stamp_str}.mp3"
                 save_file_path = os.path.join(self.response_dir, save_file_name)
 
+            case "pipeline": # 複数の処理の連結
+                save_file_name = f"pipeline_video_{time_stamp_str}.mp4"
+                save_file_path = os.path.join(self.response_dir, save_file_name)
+
             case "trim": # gif or webm
                 if media_type != "":
                     if media_type == "video/gif":
@@ -470,7 +1394,7 @@ class Client:
 
         return save_file_path
 
-    async def execute_request(self, request_func, *args, **kwargs) -> None:
+    async def execute_request(self, request_func, *args, **kwargs):
         """
         リクエストを実行するヘルパーメソッド
         - 接続 → リクエスト → 切断 を自動で行う
@@ -479,15 +1403,19 @@ class Client:
             request_fund 実行するメソッド (例: send_ping, upload_video...)
             args メソッドの位置引数
             kwargs メソッドのキーワード引数
+
+        Returns
+            request_funcの戻り値
         """
         # サーバーへ接続
         await self.connect()
 
-        # リクエスト処理
-        await request_func(*args, **kwargs)
-
-        # 接続を閉じる
-        await self.close()
+        try:
+            # リクエスト処理
+            return await request_func(*args, **kwargs)
+        finally:
+            # 接続を閉じる
+            await self.close()
 
     async def close(self):
         """
@@ -497,9 +1425,18 @@ class Client:
         if self.writer is None:
             return
 
+        if self.early_header_task is not None:
+            self.early_header_task.cancel()
+            self.early_header_task = None
+
         # 接続を閉じる
         self.writer.close()
-        await self.writer.wait_closed()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        self.reader = None
+        self.writer = None
         print("サーバーとの接続を閉じました。")
 
     async def main(self):
@@ -515,8 +1452,86 @@ class Client:
             print(f"エラー内容：{e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VideoCompressorService クライアント（引数なしで対話モード）")
+    parser.add_argument("--batch", help="バッチ処理のマニフェスト(JSON)またはディレクトリ")
+    parser.add_argument("--operation", help="処理内容 (compress, resize, aspect, convert, trim, pipeline)")
+    parser.add_argument("--parameters", default="{}", help='追加パラメーター(JSON) 例: \'{"size": "2"}\'')
+    parser.add_argument("--concurrency", type=int, default=2, help="同時処理数")
+    parser.add_argument("--retries", type=int, default=3, help="接続エラー時の再試行回数")
+    parser.add_argument("--summary", default=None, help="処理結果(JSON)の保存先（未指定時は標準出力）")
+    parser.add_argument("--host", default=None, help="接続先ホスト")
+    parser.add_argument("--port", type=int, default=None, help="接続先ポート")
+    parser.add_argument("--no-dedup", action="store_true", help="事前確認(probe_hash)を行わない")
+    parser.add_argument("--stream", action="store_true", help="処理中に出力を受信する（MP4、MP3、WEBMのみ）")
+    parser.add_argument("--mmp-version", type=int, choices=[1, 2], default=MMP_VERSION, help="使用するMMPのバージョン（2: サーバーが対応している場合は分割形式で送受信する）")
+    parser.add_argument("--no-checksum", action="store_true", help="MMP v2 の分割データにCRC32を付けない")
+    parser.add_argument("--stripes", type=int, default=1, help="アップロードの同時接続数（2以上でファイルを範囲に分けて並列に送信）")
+    parser.add_argument("--probe", default=None, help="ファイルの一部を送信して動画の情報(ffprobe)を表示して終了")
+    parser.add_argument("--metrics", action="store_true", help="サーバーの状態（メトリクス）を表示して終了")
+    parser.add_argument("--attach", default=None, help="ジョブIDを指定して処理結果を受信して終了（切断後・サーバーの再起動後）")
+    parser.add_argument(
+        "--bandwidth",
+        nargs="?",
+        const="null",
+        default=None,
+        help='サーバーの帯域制限(JSON, バイト/秒)を変更して終了 例: \'{"per_ip": {"receive": 10485760}}\'（値なしで現在の設定を表示）'
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="?",
+        const="null",
+        default=None,
+        help='ルーターの振り分け先を変更して終了 例: \'{"add": ["127.0.0.1:8890"]}\'（値なしで現在の振り分け先を表示）'
+    )
+    args = parser.parse_args()
+
     client = Client()
+    if args.host is not None:
+        client.host = args.host
+    if args.port is not None:
+        client.port = args.port
+    client.upload_stripes = max(1, args.stripes)
+    client.stream_output = args.stream
+    client.mmp_version = args.mmp_version
+    client.chunk_checksum = not args.no_checksum
+
     try:
-        asyncio.run(client.main())
+        if args.metrics:
+            metrics = asyncio.run(client.execute_request(client.request_metrics))
+            print(json.dumps(metrics, ensure_ascii=False, indent=2))
+        elif args.attach is not None:
+            response_json, _ = asyncio.run(client.execute_request(client.attach_job, args.attach))
+            if response_json.get("status") != "success":
+                print(json.dumps(response_json, ensure_ascii=False, indent=2))
+                raise SystemExit(1)
+        elif args.probe is not None:
+            content_hash = None if args.no_dedup else client.calculate_content_hash(args.probe)
+            response = asyncio.run(client.execute_request(client.probe_file, args.probe, content_hash))
+            print(json.dumps(response, ensure_ascii=False, indent=2))
+        elif args.bandwidth is not None:
+            response = asyncio.run(client.execute_request(client.set_bandwidth_limits, json.loads(args.bandwidth)))
+            print(json.dumps(response, ensure_ascii=False, indent=2))
+        elif args.backends is not None:
+            response = asyncio.run(client.execute_request(client.update_router_backends, json.loads(args.backends)))
+            print(json.dumps(response, ensure_ascii=False, indent=2))
+        elif args.batch is None:
+            asyncio.run(client.main())
+        else:
+            jobs = client.load_batch_jobs(
+                source=args.batch,
+                operation=args.operation,
+                parameters=json.loads(args.parameters)
+            )
+            summary = asyncio.run(client.run_batch(
+                jobs=jobs,
+                concurrency=args.concurrency,
+                max_retries=args.retries,
+                summary_path=args.summary,
+                deduplicate=not args.no_dedup,
+            ))
+            if args.summary is None:
+                print(json.dumps(summary, ensure_ascii=False, indent=2))
+            # 失敗したファイルがある場合は終了コード1
+            raise SystemExit(0 if summary["failed"] == 0 else 1)
     except KeyboardInterrupt:
         print("\nサーバーへの接続を終了します")
\ No newline at end of file
@@ -0,0 +1,281 @@
+import asyncio
+import re
+
+# 用途ごとのエンコーダーの優先順位（先頭から順に、ffmpegが対応しているものを使用する）
+# args の "{crf}" は画質（CRF）、"{qscale}" はCRFから換算した固定量子化値に置き換える
+# args の "{speed}" は速度段階（PresetController が負荷に応じて選ぶ）に対応する speed_ladder の値に置き換える
+#   speed_ladder は先頭が通常の設定で、後ろほど速く（同じCRFでの出力サイズは大きく）なる
+#   段階が speed_ladder の長さを超える場合は末尾の値を使用する
+# tune が True のエンコーダーのみ -tune を指定できる
+ENCODER_PREFERENCES: dict[str, list[dict]] = {
+    # MP4の映像（compress, resize, aspect, pipeline）
+    "mp4_video": [
+        {
+            "encoder": "libx264",
+            "args": ["-c:v", "libx264", "-preset", "{speed}", "-crf", "{crf}"],
+            "tune": True,
+            "speed_ladder": ["medium", "fast", "faster", "veryfast"],
+        },
+        {"encoder": "mpeg4", "args": ["-c:v", "mpeg4", "-q:v", "{qscale}"]},
+    ],
+    # WEBMの映像（trim）
+    # 行単位の並列化と realtime 設定で、libvpx-vp9の既定設定より大幅に速くエンコードする
+    # 通常の設定が realtime の最速（-cpu-used 8）のため、speed_ladder は1段階のみ
+    # （画質を優先する場合は先頭に小さい値を追加する。例: ["6", "7", "8"]）
+    "webm_video": [
+        {
+            "encoder": "libvpx-vp9",
+            "args": ["-c:v", "libvpx-vp9", "-crf", "{crf}", "-b:v", "0", "-row-mt", "1", "-deadline", "realtime", "-cpu-used", "{speed}"],
+            "speed_ladder": ["8"],
+        },
+        {
+            "encoder": "libvpx",
+            "args": ["-c:v", "libvpx", "-crf", "{crf}", "-b:v", "1M", "-deadline", "realtime", "-cpu-used", "{speed}"],
+            "speed_ladder": ["8"],
+        },
+    ],
+    # MP3の音声（convert）
+    "mp3_audio": [
+        {"encoder": "libmp3lame", "args": ["-c:a", "libmp3lame"]},
+        {"encoder": "libshine", "args": ["-c:a", "libshine"]},
+    ],
+    # GIF（trim）
+    "gif_video": [
+        {"encoder": "gif", "args": ["-c:v", "gif"]},
+    ],
+}
+
+# ffmpeg -encoders / -filters の一覧の行（先頭がフラグ、次が名前）
+ENCODER_LINE_PATTERN = re.compile(r"^\s*[VASFXBD.]{6}\s+(\S+)")
+FILTER_LINE_PATTERN = re.compile(r"^\s*[TSC.|]{2,3}\s+(\S+)")
+
+
+def get_speed_setting(preference: dict, speed_level: int = 0) -> str | None:
+    """速度段階に対応するエンコーダーの設定値（libx264 の -preset、libvpx の -cpu-used）
+
+    Args
+        preference [dict] ENCODER_PREFERENCES の要素
+        speed_level [int] 初期値 = 0 速度段階（0が通常の設定）
+
+    Returns
+        [str] 設定値。速度段階のないエンコーダーの場合None
+    """
+    ladder = preference.get("speed_ladder")
+    if not ladder:
+        return None
+    return ladder[max(0, min(speed_level, len(ladder) - 1))]
+
+
+def format_encoder_args(preference: dict, crf: int | None = None, tune: str | None = None, speed_level: int = 0) -> list[str]:
+    """エンコーダーの優先順位の設定からffmpegの引数を作成する
+
+    Args
+        preference [dict] ENCODER_PREFERENCES の要素
+        crf [int] 初期値 = None 画質（CRF）
+        tune [str] 初期値 = None -tune に指定する値（対応するエンコーダーのみ）
+        speed_level [int] 初期値 = 0 速度段階（speed_ladder のあるエンコーダーのみ）
+
+    Returns
+        [list[str]] ffmpegの引数
+    """
+    crf = 23 if crf is None else crf
+    # CRFをmpeg4などの固定量子化値(2〜31)へおおよそ換算する
+    qscale = max(2, min(31, round((crf - 11) / 3)))
+    speed = get_speed_setting(preference, speed_level) or ""
+
+    args = [
+        arg.replace("{crf}", str(crf)).replace("{qscale}", str(qscale)).replace("{speed}", speed)
+        for arg in preference["args"]
+    ]
+    if tune is not None and preference.get("tune"):
+        args += ["-tune", tune]
+    return args
+
+
+def get_operation_requirements(operation: str | None, parameters: dict) -> tuple[list[str], list[str]] | None:
+    """処理に必要なエンコーダーの用途とフィルターを取得する
+
+    Args
+        operation [str] 指示内容
+        parameters [dict] 追加パラメーター
+
+    Returns
+        tuple [encoder_kinds, filters] 不明な処理の場合None
+    """
+    match operation:
+        case "compress":
+            filters = []
+            if "target_quality" in parameters:
+                filters.append(parameters.get("quality_metric", "ssim"))
+            return ["mp4_video"], filters
+        case "resize":
+            return ["mp4_video"], ["scale"]
+        case "aspect":
+            return ["mp4_video"], ["scale", "pad", "setsar"]
+        case "convert":
+            return ["mp3_audio"], []
+        case "trim":
+            if parameters.get("type") == "gif":
+                return ["gif_video"], ["fps", "scale"]
+            return ["webm_video"], []
+        case "pipeline":
+            filters = []
+            for step in parameters.get("steps") or []:
+                if isinstance(step, dict) and step.get("operation") == "aspect":
+                    filters += ["scale", "pad", "setsar"]
+                elif isinstance(step, dict) and step.get("operation") == "resize":
+                    filters.append("scale")
+            return ["mp4_video"], sorted(set(filters))
+    return None
+
+
+class EncoderRegistry:
+    """ffmpegが対応しているエンコーダー・フィルターの一覧
+
+    - サーバー起動時に "ffmpeg -encoders" と "ffmpeg -filters" を1回だけ実行して保持する
+    - 用途ごとに ENCODER_PREFERENCES の優先順位で、対応しているエンコーダーを選択する
+    - 処理に必要なエンコーダー・フィルターがない場合は、ファイルを受信する前に拒否できる
+    """
+
+    def __init__(self) -> None:
+        # 一覧を取得できたか（取得できない場合はエンコーダーの有無を確認しない）
+        self.loaded: bool = False
+        self.encoders: set[str] = set()
+        self.filters: set[str] = set()
+        # {用途: 選択したエンコーダーの設定（対応するものがない場合None）}
+        self.selected: dict[str, dict | None] = {}
+
+    async def load(self, timeout: float = 30.0) -> None:
+        """
+        ffmpegのエンコーダー・フィルターの一覧を取得し、用途ごとのエンコーダーを選択する
+
+        Args
+            timeout [float] 初期値 = 30.0 実行時間の上限（秒）
+        """
+        try:
+            encoders_output = await self.run_ffmpeg_list("-encoders", timeout)
+            filters_output = await self.run_ffmpeg_list("-filters", timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"ffmpegのエンコーダー一覧を取得できません（エンコーダーの確認を行いません）: {e}")
+            self.loaded = False
+            return
+
+        self.encoders = {
+            match.group(1) for match in map(ENCODER_LINE_PATTERN.match, encoders_output.splitlines())
+            if match is not None and match.group(1) != "="
+        }
+        self.filters = {
+            match.group(1) for match in map(FILTER_LINE_PATTERN.match, filters_output.splitlines())
+            if match is not None and match.group(1) != "="
+        }
+        self.loaded = True
+
+        for kind, preferences in ENCODER_PREFERENCES.items():
+            self.selected[kind] = next(
+                (preference for preference in preferences if preference["encoder"] in self.encoders),
+                None
+            )
+            selected = self.selected[kind]
+            print(f"エンコーダー({kind}): {selected['encoder'] if selected else '対応なし'}")
+
+    async def run_ffmpeg_list(self, option: str, timeout: float) -> str:
+        """
+        "ffmpeg -encoders" などの一覧を取得する
+
+        Args
+            option [str] "-encoders" または "-filters"
+            timeout [float] 実行時間の上限（秒）
+
+        Return
+            [str] 標準出力
+        """
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", option,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        return stdout.decode("utf-8", errors="replace")
+
+    def select(self, kind: str) -> dict | None:
+        """
+        用途に使用するエンコーダーの設定
+
+        Args
+            kind [str] 用途（ENCODER_PREFERENCES のキー）
+
+        Return
+            [dict] エンコーダーの設定。対応するものがない場合None
+        """
+        if not self.loaded:
+            return ENCODER_PREFERENCES[kind][0]
+        return self.selected.get(kind)
+
+    def get_operation_preset(self, operation: str | None, parameters: dict, speed_level: int = 0) -> str | None:
+        """
+        処理の映像エンコーダーに適用する速度段階の設定値（レスポンス・ログ用）
+
+        Args
+            operation [str] 指示内容
+            parameters [dict] 追加パラメーター
+            speed_level [int] 初期値 = 0 速度段階
+
+        Return
+            [str] 設定値（"veryfast" など）。速度段階のないエンコーダーのみを使用する処理の場合None
+        """
+        requirements = get_operation_requirements(operation, parameters)
+        if requirements is None:
+            return None
+        for kind in requirements[0]:
+            preference = self.select(kind)
+            if preference is not None and preference.get("speed_ladder"):
+                return get_speed_setting(preference, speed_level)
+        return None
+
+    def check_operation(self, operation: str | None, parameters: dict) -> str | None:
+        """
+        処理に必要なエンコーダー・フィルターにffmpegが対応しているか確認する
+
+        Args
+            operation [str] 指示内容
+            parameters [dict] 追加パラメーター
+
+        Return
+            [str] 対応していない場合はその内容、問題ない場合None
+        """
+        if not self.loaded:
+            return None
+        requirements = get_operation_requirements(operation, parameters)
+        if requirements is None:
+            return None
+
+        encoder_kinds, filters = requirements
+        missing = [
+            " / ".join(preference["encoder"] for preference in ENCODER_PREFERENCES[kind])
+            for kind in encoder_kinds if self.selected.get(kind) is None
+        ]
+        missing += [f"{name}フィルター" for name in filters if name not in self.filters]
+        if missing:
+            return f"サーバーのffmpegが {operation} に必要な機能に対応していません: {', '.join(missing)}"
+        return None
+
+    def get_metrics(self) -> dict:
+        """
+        選択したエンコーダー（メトリクス用）
+
+        Return
+            [dict] {"loaded", "encoders": {用途: エンコーダー名}}
+        """
+        return {
+            "loaded": self.loaded,
+            "encoders": {
+                kind: (preference["encoder"] if preference else None)
+                for kind, preference in self.selected.items()
+            },
+        }
@@ -1,105 +1,934 @@
+import asyncio
 import inspect
-import subprocess
+import json
+import os
+import re
+import shutil
+import signal
+import tempfile
+from collections import deque
+from contextvars import ContextVar
 
+from encoder_registry import ENCODER_PREFERENCES, format_encoder_args
 
-def compress_video_file(input_path: str, output_path: str) -> bool:
+# ffmpegのエラー出力のうち保持する末尾の行数
+# 長時間の処理でもメモリを使い続けないよう、末尾だけを残す
+STDERR_TAIL_LINES = 40
+
+# 停止要求(SIGTERM)後、強制終了(SIGKILL)するまでの待機秒数
+TERMINATE_GRACE_SECONDS = 5.0
+
+# 目標サイズ・目標画質での圧縮時に試すCRFの候補（昇順）
+CRF_CANDIDATES = [18, 22, 26, 30, 34, 38]
+# CRFの決定に使用するサンプル区間の数と長さ（秒）
+CRF_SAMPLE_COUNT = 3
+CRF_SAMPLE_SECONDS = 4.0
+
+# ffmpegの子プロセスのリソース制御（nice、CPU固定、cgroup）
+# サーバー起動時に set_resource_governor で設定する。Noneの場合は制御しない
+resource_governor = None
+
+# ffmpegが対応しているエンコーダーの一覧（用途ごとに使用するエンコーダーを選択する）
+# サーバー起動時に set_encoder_registry で設定する。Noneの場合は優先順位の先頭を使用する
+encoder_registry = None
+
+# エンコードの速度段階（ENCODER_PREFERENCES の speed_ladder の位置、0が通常の設定）
+# サーバーがジョブの開始時にジョブのタスク内で設定する（同時に実行する他のジョブには影響しない）
+encoder_speed_level: ContextVar[int] = ContextVar("encoder_speed_level", default=0)
+
+# パイプへの出力（"pipe:N"）を表す出力先
+PIPE_OUTPUT_PATTERN = re.compile(r"pipe:(\d+)")
+
+# ssim/psnrフィルターの出力から画質を取り出す
+SSIM_PATTERN = re.compile(r"SSIM .*All:([0-9.]+)")
+PSNR_PATTERN = re.compile(r"PSNR .*average:([0-9.]+|inf)")
+
+# 再エンコードせずにコピー（-c copy）できるコーデック（出力形式ごと）
+STREAM_COPY_VIDEO_CODECS: dict[str, set[str]] = {
+    "mp4": {"h264", "hevc", "mpeg4", "av1"},
+    "webm": {"vp9"},
+}
+STREAM_COPY_AUDIO_CODECS: dict[str, set[str]] = {
+    "mp3": {"mp3"},
+}
+
+# 解像度の番号と幅・高さ
+RESIZE_SIZES: dict[str, tuple[int, int]] = {
+    "1": (1920, 1080),
+    "2": (1280, 720),
+    "3": (640, 480),
+    "4": (320, 240),
+}
+
+
+def is_pipe_output(output_path: str) -> bool:
+    """出力先がパイプ（"pipe:N"）か
+
+    Args
+        output_path [str] 出力先
+
+    Returns
+        [bool] パイプの場合True
+    """
+    return PIPE_OUTPUT_PATTERN.fullmatch(output_path) is not None
+
+
+def mp4_output_args(output_path: str) -> list[str]:
+    """MP4出力時の追加引数
+        パイプへ出力する場合は、書き戻し（moovの後書き）が不要なフラグメント形式にする
+
+    Args
+        output_path [str] 出力先
+
+    Returns
+        [list[str]] ffmpegの引数
+    """
+    if is_pipe_output(output_path):
+        return ["-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+    return []
+
+
+def set_encoder_registry(registry) -> None:
+    """用途ごとのエンコーダーの選択に使用する一覧を設定する
+
+    Args
+        registry [EncoderRegistry] エンコーダーの一覧（Noneの場合は優先順位の先頭を使用）
+    """
+    global encoder_registry
+    encoder_registry = registry
+
+
+def get_encoder_args(kind: str, crf: int | None = None, tune: str | None = None) -> list[str]:
+    """用途に応じたエンコーダーの引数を取得する
+        速度段階（-preset など）は encoder_speed_level の値を使用する
+
+    Args
+        kind [str] 用途 ("mp4_video", "webm_video", "mp3_audio", "gif_video")
+        crf [int] 初期値 = None 画質（CRF）
+        tune [str] 初期値 = None -tune に指定する値（libx264のみ）
+
+    Returns
+        [list[str]] ffmpegの引数
+
+    Raises
+        RuntimeError 対応するエンコーダーがない場合
+    """
+    preference = encoder_registry.select(kind) if encoder_registry is not None else ENCODER_PREFERENCES[kind][0]
+    if preference is None:
+        raise RuntimeError(f"ffmpegが対応するエンコーダーがありません: {kind}")
+    return format_encoder_args(preference, crf=crf, tune=tune, speed_level=encoder_speed_level.get())
+
+
+def set_resource_governor(governor) -> None:
+    """ffmpegの子プロセスに適用するリソース制御を設定する
+
+    Args
+        governor [ResourceGovernor] リソース制御（Noneの場合は制御しない）
+    """
+    global resource_governor
+    resource_governor = governor
+
+
+async def run_ffmpeg(command_args: list[str], timeout: float | None = None, progress_callback=None, stderr_tail: deque | None = None) -> bool:
+    """ffmpegを子プロセスとして非同期で実行する
+
+    - timeout 秒を超えた場合はプロセスグループごと停止する
+    - エラー出力は末尾 STDERR_TAIL_LINES 行のみ保持する
+    - 呼び出し元がキャンセルされた場合（クライアント切断など）もプロセスグループごと停止する
+    - progress_callback を指定した場合は "-progress pipe:1" の出力を解析して通知する
+    - resource_governor が設定されている場合は nice値、CPU固定、cgroupの制限を適用して起動する
+    - 出力先に "pipe:N"（N >= 3）を指定した場合は、ファイル記述子Nをffmpegへ引き継ぐ
+        （書き込み側は呼び出し元で保持し、ffmpeg終了後に閉じる）
+
+    Args
+        command_args [list[str]] "ffmpeg" に続く引数
+        timeout [float] 初期値 = None 実行時間の上限（秒）。Noneの場合は無制限
+        progress_callback 初期値 = None
+            進捗を受け取る関数 {"out_time_seconds", "fps", "speed"} を引数に呼び出される
+        stderr_tail [deque] 初期値 = None
+            エラー出力の保持先。ffmpegの出力（SSIMなど）を解析する場合に指定する
+
+    Returns
+        [bool] 成功時True、失敗時False
+    """
+    caller_name = inspect.currentframe().f_back.f_code.co_name # type: ignore
+
+    # 進捗を標準出力へ出力させる
+    progress_args = ["-progress", "pipe:1", "-nostats"] if progress_callback is not None else []
+
+    command = ["ffmpeg", "-hide_banner", "-nostdin", *progress_args, *command_args]
+
+    # パイプへ出力する場合はファイル記述子を引き継ぐ（0〜2は標準入出力のため除く）
+    pass_fds = tuple(
+        int(match.group(1))
+        for match in map(PIPE_OUTPUT_PATTERN.fullmatch, command_args)
+        if match is not None and int(match.group(1)) > 2
+    )
+
+    # nice値、CPU固定、cgroupなどのリソース制御を適用
+    cgroup_path = None
+    if resource_governor is not None:
+        command, cgroup_path = resource_governor.prepare_command(command)
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE if progress_callback is not None else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            # 子プロセスをまとめて停止できるよう、新しいプロセスグループで起動
+            start_new_session=(os.name != "nt"),
+            pass_fds=pass_fds,
+        )
+    except Exception:
+        if resource_governor is not None:
+            resource_governor.release(cgroup_path)
+        raise
+
+    if resource_governor is not None:
+        resource_governor.apply_to_process(process.pid)
+
+    try:
+        return await wait_ffmpeg(
+            process=process,
+            caller_name=caller_name,
+            timeout=timeout,
+            progress_callback=progress_callback,
+            stderr_tail=stderr_tail,
+        )
+    finally:
+        if resource_governor is not None:
+            resource_governor.release(cgroup_path)
+
+
+async def wait_ffmpeg(
+    process: asyncio.subprocess.Process,
+    caller_name: str,
+    timeout: float | None,
+    progress_callback,
+    stderr_tail: deque | None,
+) -> bool:
+    """起動したffmpegの終了を待ち、出力（エラー出力、進捗）を処理する
+
+    Args
+        process [asyncio.subprocess.Process] ffmpegのプロセス
+        caller_name [str] 呼び出し元の関数名（ログ用）
+        timeout [float] 実行時間の上限（秒）
+        progress_callback 進捗を受け取る関数（None可）
+        stderr_tail [deque] エラー出力の保持先（None可）
+
+    Returns
+        [bool] 成功時True、失敗時False
+    """
+    if stderr_tail is None:
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    output_tasks = [asyncio.create_task(read_stderr_tail(process.stderr, stderr_tail))] # type: ignore
+    if progress_callback is not None:
+        output_tasks.append(asyncio.create_task(read_progress(process.stdout, progress_callback))) # type: ignore
+
+    try:
+        await asyncio.wait_for(process.wait(), timeout=timeout)
+
+    except asyncio.TimeoutError:
+        print(f"{caller_name}関数でffmpegが制限時間({timeout}秒)を超えたため停止します")
+        await terminate_process_group(process)
+        return False
+
+    except asyncio.CancelledError:
+        print(f"{caller_name}関数の処理がキャンセルされたため、ffmpegを停止します")
+        await terminate_process_group(process)
+        raise
+
+    finally:
+        # プロセス終了後に残りの出力を読み切る
+        for task in output_tasks:
+            if not task.done():
+                try:
+                    await asyncio.wait_for(task, timeout=TERMINATE_GRACE_SECONDS)
+                except (asyncio.TimeoutError, asyncio.CancelledError):
+                    task.cancel()
+
+    if process.returncode == 0:
+        return True
+    else:
+        print(f"{caller_name}関数でffmpegエラーが発生しました: " + "\n".join(stderr_tail))
+        return False
+
+
+async def read_progress(stream: asyncio.StreamReader, progress_callback) -> None:
+    """"-progress pipe:1" の出力を解析して進捗を通知する
+        出力は key=value の行の集まりで、"progress=continue" または "progress=end" で1回分が終わる
+
+    Args
+        stream [asyncio.StreamReader] 標準出力
+        progress_callback 進捗を受け取る関数
+    """
+    values: dict[str, str] = {}
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+
+        key, _, value = line.decode("utf-8", errors="replace").strip().partition("=")
+        values[key] = value
+        if key != "progress":
+            continue
+
+        # 出力済みの時間（out_time_us はマイクロ秒）
+        # 開始直後などは "N/A" になるため、数値でない場合は out_time を使用する（どちらもない場合None）
+        out_time_seconds: float | None = None
+        try:
+            out_time_seconds = max(0.0, int(values.get("out_time_us", "")) / 1_000_000)
+        except ValueError:
+            if values.get("out_time", "N/A") != "N/A":
+                out_time_seconds = parse_time_to_seconds(values["out_time"])
+
+        try:
+            fps: float | None = float(values.get("fps", ""))
+        except ValueError:
+            fps = None
+        try:
+            # 例: "1.52x"
+            speed: float | None = float(values.get("speed", "").rstrip("x"))
+        except ValueError:
+            speed = None
+
+        progress_callback({"out_time_seconds": out_time_seconds, "fps": fps, "speed": speed})
+        values = {}
+
+
+def parse_time_to_seconds(time_str: str) -> float | None:
+    """時間の文字列を秒数に変換する
+
+    Args
+        time_str [str] 時間 (例: "00:01:05.5" または "65.5")
+
+    Returns
+        [float] 秒数。解析できない場合None
+    """
+    try:
+        seconds = 0.0
+        for part in str(time_str).strip().split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except ValueError:
+        return None
+
+
+async def probe_media(input_path: str, timeout: float = 30.0) -> dict | None:
+    """ffprobeで動画の情報（長さ、コーデック、解像度など）を取得する
+
+    Args
+        input_path [str] 入力動画ファイルパス
+        timeout [float] 初期値 = 30.0 実行時間の上限（秒）
+
+    Returns
+        [dict] ffprobeの出力(JSON)。{"format": {...}, "streams": [...]}
+        取得できない場合None
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_format",
+            "-show_streams",
+            "-of",
+            "json",
+            input_path,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            print(f"{inspect.currentframe().f_code.co_name}関数でffprobeが制限時間({timeout}秒)を超えました") # type: ignore
+            return None
+
+        if process.returncode != 0:
+            print(f"{inspect.currentframe().f_code.co_name}関数でffprobeエラーが発生しました: {stderr.decode('utf-8', errors='replace')[-1000:]}") # type: ignore
+            return None
+
+        return json.loads(stdout)
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"{inspect.currentframe().f_code.co_name}関数でエラーが発生しました: {e}") # type: ignore
+        return None
+
+
+def get_media_duration(probe: dict | None) -> float | None:
+    """ffprobeの出力から動画の長さ（秒）を取得する
+
+    Args
+        probe [dict] probe_mediaの戻り値
+
+    Returns
+        [float] 長さ（秒）。取得できない場合None
+    """
+    if probe is None:
+        return None
+    try:
+        return float(probe["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_first_stream(probe: dict | None, codec_type: str) -> dict | None:
+    """ffprobeの出力から最初のストリームを取得する
+
+    Args
+        probe [dict] probe_mediaの戻り値
+        codec_type [str] ストリームの種類 ("video", "audio")
+
+    Returns
+        [dict] ストリームの情報。ない場合None
+    """
+    for stream in (probe or {}).get("streams", []):
+        if stream.get("codec_type") == codec_type:
+            return stream
+    return None
+
+
+def is_rotated(stream: dict) -> bool:
+    """映像ストリームに回転の指定があるか
+        ffmpegは再エンコード時に回転を適用するため、コピーすると出力の向き・解像度が変わる
+
+    Args
+        stream [dict] ffprobeの映像ストリームの情報
+
+    Returns
+        [bool] 回転の指定がある場合True
+    """
+    rotations = [stream.get("tags", {}).get("rotate")]
+    rotations += [side_data.get("rotation") for side_data in stream.get("side_data_list", [])]
+    for rotation in rotations:
+        try:
+            if rotation is not None and int(float(rotation)) % 360 != 0:
+                return True
+        except (TypeError, ValueError):
+            continue
+    return False
+
+
+def can_stream_copy(operation: str | None, parameters: dict, probe: dict | None) -> bool:
+    """再エンコードせずにストリームをコピー（-c copy）して出力できるか
+
+    - resize: 映像が既に指定の解像度で、MP4にそのまま格納できるコーデックの場合
+    - convert: 音声が既にMP3の場合
+    - trim (webm): 映像が既にVP9の場合（切り取りの開始位置は直前のキーフレームになる）
+    - parameters に "passthrough": false が指定された場合は常に再エンコードする
+
+    Args
+        operation [str] 指示内容
+        parameters [dict] 追加パラメーター
+        probe [dict] ffprobeの出力（取得できない場合None）
+
+    Returns
+        [bool] コピーできる場合True
+    """
+    if probe is None or parameters.get("passthrough") is False:
+        return False
+
+    video = get_first_stream(probe, "video")
+    audio = get_first_stream(probe, "audio")
+
+    match operation:
+        case "resize":
+            if video is None or is_rotated(video) or video.get("codec_name") not in STREAM_COPY_VIDEO_CODECS["mp4"]:
+                return False
+            return (video.get("width"), video.get("height")) == RESIZE_SIZES.get(str(parameters.get("size")))
+        case "convert":
+            return audio is not None and audio.get("codec_name") in STREAM_COPY_AUDIO_CODECS["mp3"]
+        case "trim":
+            return (
+                parameters.get("type") == "webm"
+                and video is not None
+                and not is_rotated(video)
+                and video.get("codec_name") in STREAM_COPY_VIDEO_CODECS["webm"]
+            )
+    return False
+
+
+async def run_stream_copy(copy_args: list[str], output_path: str, timeout: float | None = None, progress_callback=None) -> dict | bool | None:
+    """ストリームのコピー（-c copy）を実行する
+
+    Args
+        copy_args [list[str]] "ffmpeg" に続く引数
+        output_path [str] 出力先
+        timeout [float] 初期値 = None 実行時間の上限（秒）
+        progress_callback 初期値 = None 進捗を受け取る関数（run_ffmpeg参照）
+
+    Returns
+        [dict] 成功時 {"codec_path": "stream_copy"}
+        失敗時、再エンコードで続行できる場合None。パイプへの出力で失敗した場合（一部を送信済みの可能性がある）False
+    """
+    if await run_ffmpeg(copy_args, timeout=timeout, progress_callback=progress_callback):
+        return {"codec_path": "stream_copy"}
+    if is_pipe_output(output_path):
+        return False
+    print(f"ストリームのコピーに失敗したため再エンコードします: {output_path}")
+    return None
+
+
+async def read_stderr_tail(stream: asyncio.StreamReader, stderr_tail: deque) -> None:
+    """ffmpegのエラー出力を読み続け、末尾の行のみ保持する
+
+    Args
+        stream [asyncio.StreamReader] エラー出力
+        stderr_tail [deque] 保持先（最大行数はdequeのmaxlenで制限）
+    """
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        stderr_tail.append(line.decode("utf-8", errors="replace").rstrip())
+
+
+async def terminate_process_group(process: asyncio.subprocess.Process) -> None:
+    """ffmpegのプロセスグループを停止する
+        SIGTERMで停止を要求し、終了しない場合はSIGKILLで強制終了する
+
+    Args
+        process [asyncio.subprocess.Process] 停止するプロセス
+    """
+    if process.returncode is not None:
+        return
+
+    try:
+        if os.name == "nt":
+            process.terminate()
+        else:
+            os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+
+    try:
+        await asyncio.wait_for(asyncio.shield(process.wait()), timeout=TERMINATE_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        try:
+            if os.name == "nt":
+                process.kill()
+            else:
+                os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            return
+        await process.wait()
+
+
+async def compress_video_file(input_path: str, output_path: str, timeout: float | None = None, progress_callback=None, crf: int = 28) -> bool:
     """動画を圧縮する
 
     Args
         input_path [str] 入力動画ファイルパス
         output_path [str] 出力動画ファイルパス
+        timeout [float] 初期値 = None 実行時間の上限（秒）
+        progress_callback 初期値 = None 進捗を受け取る関数（run_ffmpeg参照）
+        crf [int] 初期値 = 28 画質（小さいほど高画質・大きなファイル）
     """
     try:
-        result = subprocess.run(
+        return await run_ffmpeg(
             [
-                "ffmpeg",
                 "-i",
                 input_path,
-                "-vcodec",
-                "libx264",
-                "-crf",
-                "28",
-                "-preset",
-                "medium",
-                "-tune",
-                "film",
+                *get_encoder_args("mp4_video", crf=crf, tune="film"),
                 "-an",  # 音声を削除
+                *mp4_output_args(output_path),
                 "-f",
                 "mp4",
+                "-y",  # 既存ファイルを上書き
                 output_path,
             ],
-            capture_output=True,
-            text=True,
+            timeout=timeout,
+            progress_callback=progress_callback,
         )
 
-        if result.returncode == 0:
-            return True
-        else:
-            print(f"{inspect.currentframe().f_code.co_name}関数でffmpegエラーが発生しました: {result.stderr}") # type: ignore
-            return False
-
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         print(f"{inspect.currentframe().f_code.co_name}関数でエラーが発生しました: {e}") # type: ignore
         return False
 
+async def compress_video_to_target(
+    input_path: str,
+    output_path: str,
+    work_dir: str,
+    duration_seconds: float | None,
+    target_size_bytes: int | None = None,
+    target_quality: float | None = None,
+    quality_metric: str = "ssim",
+    timeout: float | None = None,
+    progress_callback=None,
+) -> dict | None:
+    """目標サイズまたは目標画質を満たすCRFを探してから動画を圧縮する
+
+    動画全体を試しにエンコードする代わりに、短いサンプル区間を候補のCRFで1つずつエンコードし、
+    サイズ（動画全体の長さに換算）と画質（SSIM/PSNR）を測定してCRFを決める
+
+    - target_size_bytes 指定時: 推定サイズが目標以下になる最も高画質（小さい）CRF
+    - target_quality 指定時: 画質が目標以上になる最も圧縮率の高い（大きい）CRF
+    - 条件を満たすCRFがない場合は、目標に最も近い端の候補を使用する
 
-def resize_video_resolution(input_path: str, resolution: str, output_path: str) -> bool:
+    Args
+        input_path [str] 入力動画ファイルパス
+        output_path [str] 出力動画ファイルパス
+        work_dir [str] サンプルファイルの作成先
+        duration_seconds [float] 動画の長さ（秒）。不明な場合は既定のCRFで圧縮する
+        target_size_bytes [int] 初期値 = None 目標サイズ（バイト）
+        target_quality [float] 初期値 = None 目標画質（SSIM: 0〜1、PSNR: dB）
+        quality_metric [str] 初期値 = "ssim" 画質の指標 ("ssim" または "psnr")
+        timeout [float] 初期値 = None サンプル測定と圧縮全体の実行時間の上限（秒）
+        progress_callback 初期値 = None 圧縮時の進捗を受け取る関数（run_ffmpeg参照）
+
+    Returns
+        [dict] 成功時 {"crf", "estimated_size_bytes", "estimated_quality", "quality_metric"}、失敗時None
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout is not None else None
+
+    def remaining_time() -> float | None:
+        return None if deadline is None else max(1.0, deadline - loop.time())
+
+    try:
+        search_result = None
+        if duration_seconds:
+            search_result = await search_compress_crf(
+                input_path=input_path,
+                work_dir=work_dir,
+                duration_seconds=duration_seconds,
+                target_size_bytes=target_size_bytes,
+                target_quality=target_quality,
+                quality_metric=quality_metric,
+                timeout=remaining_time(),
+            )
+
+        if search_result is None:
+            print(f"{inspect.currentframe().f_code.co_name}関数: CRFを決定できないため既定値で圧縮します") # type: ignore
+            search_result = {"crf": 28, "estimated_size_bytes": None, "estimated_quality": None, "quality_metric": quality_metric}
+
+        print(f"圧縮に使用するCRF: {search_result['crf']} (推定サイズ: {search_result['estimated_size_bytes']}, 推定画質: {search_result['estimated_quality']})")
+
+        success = await compress_video_file(
+            input_path,
+            output_path,
+            timeout=remaining_time(),
+            progress_callback=progress_callback,
+            crf=search_result["crf"],
+        )
+
+        return search_result if success else None
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"{inspect.currentframe().f_code.co_name}関数でエラーが発生しました: {e}") # type: ignore
+        return None
+
+
+async def search_compress_crf(
+    input_path: str,
+    work_dir: str,
+    duration_seconds: float,
+    target_size_bytes: int | None,
+    target_quality: float | None,
+    quality_metric: str,
+    timeout: float | None,
+) -> dict | None:
+    """サンプル区間を候補のCRFでエンコードし、目標を満たすCRFを選ぶ
+
+    Args
+        input_path [str] 入力動画ファイルパス
+        work_dir [str] サンプルファイルの作成先
+        duration_seconds [float] 動画の長さ（秒）
+        target_size_bytes [int] 目標サイズ（バイト）
+        target_quality [float] 目標画質
+        quality_metric [str] 画質の指標 ("ssim" または "psnr")
+        timeout [float] 実行時間の上限（秒）
+
+    Returns
+        [dict] {"crf", "estimated_size_bytes", "estimated_quality", "quality_metric"}
+        サンプルを測定できない場合None
+    """
+    # サンプル区間（開始秒, 長さ）を動画全体に均等に配置
+    sample_seconds = min(CRF_SAMPLE_SECONDS, duration_seconds)
+    if duration_seconds <= sample_seconds * CRF_SAMPLE_COUNT:
+        samples = [(0.0, duration_seconds)]
+    else:
+        step = duration_seconds / (CRF_SAMPLE_COUNT + 1)
+        samples = [(step * (index + 1) - sample_seconds / 2, sample_seconds) for index in range(CRF_SAMPLE_COUNT)]
+    total_sample_seconds = sum(seconds for _, seconds in samples)
+
+    sample_dir = await asyncio.to_thread(tempfile.mkdtemp, prefix="crf_search_", dir=work_dir)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout is not None else None
+
+    def remaining_time() -> float | None:
+        return None if deadline is None else max(1.0, deadline - loop.time())
+
+    async def measure(crf: int, sample_index: int) -> tuple[int, float | None] | None:
+        """1つのサンプル区間を指定したCRFでエンコードし、(サイズ, 画質)を測定"""
+        start, seconds = samples[sample_index]
+        sample_path = os.path.join(sample_dir, f"sample_{crf}_{sample_index}.mp4")
+
+        encoded = await run_ffmpeg(
+            [
+                "-ss", f"{start:.3f}",
+                "-t", f"{seconds:.3f}",
+                "-i", input_path,
+                *get_encoder_args("mp4_video", crf=crf, tune="film"),
+                "-an",
+                "-f", "mp4",
+                "-y",
+                sample_path,
+            ],
+            timeout=remaining_time(),
+        )
+        if not encoded:
+            return None
+
+        quality = None
+        if target_quality is not None:
+            quality = await measure_sample_quality(
+                input_path=input_path,
+                start=start,
+                seconds=seconds,
+                sample_path=sample_path,
+                quality_metric=quality_metric,
+                timeout=remaining_time(),
+            )
+
+        size = await asyncio.to_thread(os.path.getsize, sample_path)
+        return size, quality
+
+    # ジョブが使用できるのはスケジューラーの1枠のため、サンプルは1つずつエンコードする（同時に複数のffmpegを実行しない）
+    # CRFの昇順に測定し、以降の候補で選択が変わらない時点で打ち切る
+    #   目標サイズ: CRFが大きいほどサイズは小さいため、最初に目標以下になったCRFで決まる
+    #   目標画質: CRFが大きいほど画質は低いため、目標を下回ったCRFより後の候補は満たさない
+    candidates: list[dict] = []
+    try:
+        for crf in CRF_CANDIDATES:
+            if deadline is not None and loop.time() >= deadline:
+                break
+            results = []
+            for sample_index in range(len(samples)):
+                measurement = await measure(crf, sample_index)
+                if measurement is None:
+                    break
+                results.append(measurement)
+            if len(results) != len(samples):
+                continue
+
+            # サイズは合計を全体の長さに換算、画質はサンプル中の最低値
+            qualities = [quality for _, quality in results if quality is not None]
+            candidate = {
+                "crf": crf,
+                "estimated_size_bytes": int(sum(size for size, _ in results) * duration_seconds / total_sample_seconds),
+                "estimated_quality": round(min(qualities), 4) if qualities else None,
+                "quality_metric": quality_metric,
+            }
+            candidates.append(candidate)
+
+            if target_quality is not None:
+                if candidate["estimated_quality"] is not None and candidate["estimated_quality"] < target_quality:
+                    break
+            elif target_size_bytes is not None and candidate["estimated_size_bytes"] <= target_size_bytes:
+                break
+    finally:
+        await asyncio.to_thread(shutil.rmtree, sample_dir, True)
+
+    if not candidates:
+        return None
+
+    # candidates はCRFの昇順（高画質→高圧縮）
+    if target_quality is not None:
+        satisfied = [candidate for candidate in candidates if candidate["estimated_quality"] is not None and candidate["estimated_quality"] >= target_quality]
+        return satisfied[-1] if satisfied else candidates[0]
+
+    if target_size_bytes is not None:
+        satisfied = [candidate for candidate in candidates if candidate["estimated_size_bytes"] <= target_size_bytes]
+        return satisfied[0] if satisfied else candidates[-1]
+
+    return None
+
+
+async def measure_sample_quality(
+    input_path: str,
+    start: float,
+    seconds: float,
+    sample_path: str,
+    quality_metric: str,
+    timeout: float | None,
+) -> float | None:
+    """サンプルの画質を元動画の同じ区間と比較して測定する（ffmpegのssim/psnrフィルター）
+
+    Args
+        input_path [str] 元動画ファイルパス
+        start [float] サンプル区間の開始秒
+        seconds [float] サンプル区間の長さ（秒）
+        sample_path [str] エンコードしたサンプルのパス
+        quality_metric [str] 画質の指標 ("ssim" または "psnr")
+        timeout [float] 実行時間の上限（秒）
+
+    Returns
+        [float] SSIM（All）またはPSNR（average）。測定できない場合None
+    """
+    stderr_tail: deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+    measured = await run_ffmpeg(
+        [
+            "-i", sample_path,
+            "-ss", f"{start:.3f}",
+            "-t", f"{seconds:.3f}",
+            "-i", input_path,
+            "-lavfi", f"[0:v][1:v]{quality_metric}",
+            "-f", "null",
+            "-",
+        ],
+        timeout=timeout,
+        stderr_tail=stderr_tail,
+    )
+    if not measured:
+        return None
+
+    pattern = SSIM_PATTERN if quality_metric == "ssim" else PSNR_PATTERN
+    for line in reversed(stderr_tail):
+        match = pattern.search(line)
+        if match:
+            value = match.group(1)
+            # 同一映像のPSNRは "inf" になる
+            return float("inf") if value == "inf" else float(value)
+
+    return None
+
+
+def build_resize_filter(resolution: str) -> str | None:
+    """解像度変更のフィルターを作成する
+
+    Args
+        resolution [str] 変更したい解像度 (例: "1" 1900*1080 "2" 1280*720 "3" 640*480)
+
+    Returns
+        [str] -vf に指定するフィルター。不正な解像度の場合None
+    """
+    if resolution not in RESIZE_SIZES:
+        return None
+    width, height = RESIZE_SIZES[resolution]
+    return f"scale={width}:{height}"
+
+
+def build_aspect_filter(aspect_ratio: str, fit_mode: str) -> str | None:
+    """アスペクト比変更のフィルターを作成する
+
+    Args
+        aspect_ratio [str] アスペクト比 "1" (16:9), "2" (4:3), "3" (1:1)
+        fit_mode [str] フィット方法 "1" (letterbox), "2" (stretch)
+
+    Returns
+        [str] -vf に指定するフィルター。不正な指定の場合None
+    """
+    ratios = {
+        "1": (16, 9),
+        "2": (4, 3),
+        "3": (1, 1),
+    }
+    if aspect_ratio not in ratios:
+        print(f"不正なアスペクト比: {aspect_ratio}")
+        return None
+
+    # アスペクト比を計算
+    width_ratio, height_ratio = ratios[aspect_ratio]
+    target_aspect = float(width_ratio) / float(height_ratio)
+
+    if fit_mode == "1":
+        # letterbox: 元の映像を維持し、余白を黒で埋める
+        return f"scale=iw*min(1\\,if(sar\\,1/sar\\,1)*{target_aspect}/dar):ih*min(1\\,dar/({target_aspect}*if(sar\\,sar\\,1))),pad=iw*{target_aspect}/dar:ih:x=(ow-iw)/2:y=(oh-ih)/2:color=black"
+    elif fit_mode == "2":
+        # stretch: 元の映像を引き延ばして目標アスペクト比に合わせる
+        return f"scale=iw:ih,setsar={aspect_ratio}"
+
+    print(f"不正なfit_mode: {fit_mode}. 'letterbox', 'stretch'のいずれかを指定してください")
+    return None
+
+
+async def resize_video_resolution(
+    input_path: str,
+    resolution: str,
+    output_path: str,
+    timeout: float | None = None,
+    progress_callback=None,
+    stream_copy: bool = False,
+) -> bool | dict:
     """動画の解像度を変更する
 
     Args
         input_path [str] 入力動画ファイルパス
         resolution [str] 変更したい解像度 (例: "1" 1900*1080 "2" 1280*720 "3" 640*480)
         output_path [str] 出力動画ファイルパス
+        timeout [float] 初期値 = None 実行時間の上限（秒）
+        progress_callback 初期値 = None 進捗を受け取る関数（run_ffmpeg参照）
+        stream_copy [bool] 初期値 = False 既に指定の解像度の場合True（再エンコードせずMP4へ格納し直す。can_stream_copy参照）
+
+    Returns
+        [bool | dict] 成功時True（コピーした場合 {"codec_path": "stream_copy"}）、失敗時False
     """
     try:
-        if resolution == "1":
-            width = 1920
-            height = 1080
-        elif resolution == "2":
-            width = 1280
-            height = 720
-        elif resolution == "3":
-            width = 640
-            height = 480
-        elif resolution == "4":
-            width = 320
-            height = 240
-
-        result = subprocess.run(
+        scale_filter = build_resize_filter(resolution)
+        if scale_filter is None:
+            print(f"不正な解像度: {resolution}")
+            return False
+
+        if stream_copy:
+            result = await run_stream_copy(
+                [
+                    "-i",
+                    input_path,
+                    "-c:v",
+                    "copy",
+                    "-c:a",
+                    "copy",
+                    *mp4_output_args(output_path),
+                    "-f",
+                    "mp4",
+                    "-y",  # 既存ファイルを上書き
+                    output_path,
+                ],
+                output_path=output_path,
+                timeout=timeout,
+                progress_callback=progress_callback,
+            )
+            if result is not None:
+                return result
+
+        return await run_ffmpeg(
             [
-                "ffmpeg",
                 "-i",
                 input_path,
                 "-vf",
-                f"scale={width}:{height}",
-                "-c:v",
-                "libx264",
-                "-preset",
-                "medium",
-                "-crf",
-                "23",
+                scale_filter,
+                *get_encoder_args("mp4_video", crf=23),
                 "-c:a",
                 "copy",
+                *mp4_output_args(output_path),
                 "-f",
                 "mp4",
+                "-y",  # 既存ファイルを上書き
                 output_path,
             ],
-            capture_output=True,
-            text=True,
+            timeout=timeout,
+            progress_callback=progress_callback,
         )
 
-        if result.returncode == 0:
-            return True
-        else:
-            print(f"{inspect.currentframe().f_code.co_name}関数でffmpegエラーが発生しました: {result.stderr}") # type: ignore
-            return False
-
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         print(f"{inspect.currentframe().f_code.co_name}関数でエラーが発生しました: {e}") # type: ignore
         return False
 
 
-def change_video_aspect_ratio(input_path: str, aspect_ratio: str, output_path: str, fit_mode: str) -> bool:
+async def change_video_aspect_ratio(input_path: str, aspect_ratio: str, output_path: str, fit_mode: str, timeout: float | None = None, progress_callback=None) -> bool:
     """動画のアスペクト比を変更する
 
     Args
@@ -109,108 +938,206 @@ def change_video_aspect_ratio(input_path: str, aspect_ratio: str, output_path: s
         fit_mode [str] フィット方法
             "1" (letterbox: 元の映像を維持し、余白を黒で埋める)
             "2" ("stretch: 元の映像を引き延ばして目標アスペクト比に合わせる)
+        timeout [float] 初期値 = None 実行時間の上限（秒）
+        progress_callback 初期値 = None 進捗を受け取る関数（run_ffmpeg参照）
     """
-
-    # アスペクト比の設定
-    if aspect_ratio == "1":
-        width_ratio = 16
-        height_ratio = 9
-    elif aspect_ratio == "2":
-        width_ratio = 4
-        height_ratio = 3
-    elif aspect_ratio == "3":
-        width_ratio = 1
-        height_ratio = 1
-
     try:
-        # アスペクト比を計算
-        target_aspect = float(width_ratio) / float(height_ratio)
-
-        if fit_mode == "1":
-            # letterbox: 元の映像を維持し、余白を黒で埋める
-            scale_filter = f"scale=iw*min(1\\,if(sar\\,1/sar\\,1)*{target_aspect}/dar):ih*min(1\\,dar/({target_aspect}*if(sar\\,sar\\,1))),pad=iw*{target_aspect}/dar:ih:x=(ow-iw)/2:y=(oh-ih)/2:color=black"
-        elif fit_mode == "2":
-            # stretch: 元の映像を引き延ばして目標アスペクト比に合わせる
-            scale_filter = f"scale=iw:ih,setsar={aspect_ratio}"
-        else:
-            print(f"不正なfit_mode: {fit_mode}. 'letterbox', 'stretch'のいずれかを指定してください")
+        scale_filter = build_aspect_filter(aspect_ratio, fit_mode)
+        if scale_filter is None:
             return False
 
-        result = subprocess.run(
+        return await run_ffmpeg(
             [
-                "ffmpeg",
                 "-i",
                 input_path,
                 "-vf",
                 scale_filter,
-                "-c:v",
-                "libx264",
-                "-preset",
-                "medium",
-                "-crf",
-                "23",
+                *get_encoder_args("mp4_video", crf=23),
                 "-c:a",
                 "copy",
+                *mp4_output_args(output_path),
                 "-f",
                 "mp4",
+                "-y",  # 既存ファイルを上書き
                 output_path,
             ],
-            capture_output=True,
-            text=True,
+            timeout=timeout,
+            progress_callback=progress_callback,
         )
 
-        if result.returncode == 0:
-            return True
-        else:
-            print(f"{inspect.currentframe().f_code.co_name}関数でffmpegエラーが発生しました: {result.stderr}") # type: ignore
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"{inspect.currentframe().f_code.co_name}関数でエラーが発生しました: {e}") # type: ignore
+        return False
+
+
+def compile_pipeline(steps: list[dict]) -> list[str] | None:
+    """複数の処理（aspect, resize, compress）を1回のffmpegの引数にまとめる
+        フィルターは指定順に1つの -vf にまとめ、エンコードは最後に1回だけ行う
+
+    Args
+        steps [list[dict]] 処理の一覧（指定順に適用）
+            {"operation": "aspect", "ratio": "1", "fit_mode": "1"}
+            {"operation": "resize", "size": "2"}
+            {"operation": "compress"}  エンコード設定（1つまで）。省略時はresize/aspectと同じ設定
+
+    Returns
+        [list[str]] 入出力を除いたffmpegの引数。不正な指定の場合None
+    """
+    filters: list[str] = []
+    compress_step: dict | None = None
+
+    for step in steps:
+        if not isinstance(step, dict):
+            print(f"不正な処理の指定: {step}")
+            return None
+
+        match step.get("operation"):
+            case "aspect":
+                video_filter = build_aspect_filter(str(step.get("ratio")), str(step.get("fit_mode")))
+            case "resize":
+                video_filter = build_resize_filter(str(step.get("size")))
+                if video_filter is None:
+                    print(f"不正な解像度: {step.get('size')}")
+            case "compress":
+                if compress_step is not None:
+                    print("compressは1つまで指定できます")
+                    return None
+                compress_step = step
+                continue
+            case _:
+                print(f"pipelineで使用できない処理です: {step.get('operation')}")
+                return None
+
+        if video_filter is None:
+            return None
+        filters.append(video_filter)
+
+    if not filters and compress_step is None:
+        print("処理が指定されていません")
+        return None
+
+    filter_args = ["-vf", ",".join(filters)] if filters else []
+
+    if compress_step is not None:
+        # compress_video_file と同じ設定（音声は削除）
+        encoder_args = [
+            *get_encoder_args("mp4_video", crf=int(compress_step.get("crf", 28)), tune="film"),
+            "-an",
+        ]
+    else:
+        # resize_video_resolution, change_video_aspect_ratio と同じ設定
+        encoder_args = [
+            *get_encoder_args("mp4_video", crf=23),
+            "-c:a", "copy",
+        ]
+
+    return [*filter_args, *encoder_args]
+
+
+async def run_pipeline(input_path: str, steps: list[dict], output_path: str, timeout: float | None = None, progress_callback=None) -> bool:
+    """複数の処理を1回のffmpegで実行する（デコード・エンコードは1回のみ）
+
+    Args
+        input_path [str] 入力動画ファイルパス
+        steps [list[dict]] 処理の一覧（compile_pipeline参照）
+        output_path [str] 出力動画ファイルパス
+        timeout [float] 初期値 = None 実行時間の上限（秒）
+        progress_callback 初期値 = None 進捗を受け取る関数（run_ffmpeg参照）
+    """
+    try:
+        pipeline_args = compile_pipeline(steps)
+        if pipeline_args is None:
             return False
 
+        return await run_ffmpeg(
+            [
+                "-i",
+                input_path,
+                *pipeline_args,
+                *mp4_output_args(output_path),
+                "-f",
+                "mp4",
+                "-y",  # 既存ファイルを上書き
+                output_path,
+            ],
+            timeout=timeout,
+            progress_callback=progress_callback,
+        )
+
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         print(f"{inspect.currentframe().f_code.co_name}関数でエラーが発生しました: {e}") # type: ignore
         return False
 
 
-def convert_to_mp3file(input_path: str, output_path: str) -> bool:
+async def convert_to_mp3file(input_path: str, output_path: str, timeout: float | None = None, progress_callback=None, stream_copy: bool = False) -> bool | dict:
     """MP3形式へ変換する
 
         input_path [str] 入力動画ファイルパス
         output_path [str] 出力動画ファイルパス
+        timeout [float] 初期値 = None 実行時間の上限（秒）
+        progress_callback 初期値 = None 進捗を受け取る関数（run_ffmpeg参照）
+        stream_copy [bool] 初期値 = False 音声が既にMP3の場合True（再エンコードせず取り出す。can_stream_copy参照）
+
+    Returns
+        [bool | dict] 成功時True（コピーした場合 {"codec_path": "stream_copy"}）、失敗時False
     """
     try:
-        result = subprocess.run(
+        if stream_copy:
+            result = await run_stream_copy(
+                [
+                    "-i",
+                    input_path,
+                    "-vn",
+                    "-c:a",
+                    "copy",
+                    "-f",
+                    "mp3",
+                    "-y",  # 既存ファイルを上書き
+                    output_path,
+                ],
+                output_path=output_path,
+                timeout=timeout,
+                progress_callback=progress_callback,
+            )
+            if result is not None:
+                return result
+
+        return await run_ffmpeg(
             [
-                "ffmpeg",
                 "-i",
                 input_path,
                 "-vn",
-                "-acodec",
-                "libmp3lame",
+                *get_encoder_args("mp3_audio"),
                 "-f",
                 "mp3",
+                "-y",  # 既存ファイルを上書き
                 output_path,
             ],
-            capture_output=True,
-            text=True,
+            timeout=timeout,
+            progress_callback=progress_callback,
         )
 
-        if result.returncode == 0:
-            return True
-        else:
-            print(f"{inspect.currentframe().f_code.co_name}関数でffmpegエラーが発生しました: {result.stderr}") # type: ignore
-            return False
-
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         print(f"{inspect.currentframe().f_code.co_name}関数でエラーが発生しました: {e}") # type: ignore
         return False
 
 
-def trim_video_to_gif_webm(
+async def trim_video_to_gif_webm(
     input_path: str,
     start_time: str,
     duration: str,
     output_path: str,
     output_format: str,
-) -> bool:
+    timeout: float | None = None,
+    progress_callback=None,
+    stream_copy: bool = False,
+) -> bool | dict:
     """時間範囲を指定して動画を切り取り、GIFまたはWEBMフォーマットに変換する
 
     Args
@@ -219,65 +1146,82 @@ def trim_video_to_gif_webm(
         duration [str] 切り取り時間の長さ (例: "00:00:05" または "5")
         output_path [str] 出力ファイルのパス
         output_format [str] 出力フォーマット ("gif" または "webm")
+        timeout [float] 初期値 = None 実行時間の上限（秒）
+        progress_callback 初期値 = None 進捗を受け取る関数（run_ffmpeg参照）
+        stream_copy [bool] 初期値 = False 映像が既にVP9の場合True（WEBMのみ。再エンコードせず切り取る。can_stream_copy参照）
+            開始位置は直前のキーフレームからになる
 
     Returns
-        [bool] 成功時True、失敗時False
+        [bool | dict] 成功時True（コピーした場合 {"codec_path": "stream_copy"}）、失敗時False
     """
     try:
-        if output_format.lower() == "gif": # GIF変換用のffmpegコマンド
-            result = subprocess.run(
+        if stream_copy and output_format.lower() == "webm":
+            result = await run_stream_copy(
                 [
-                    "ffmpeg",
-                    "-i",
-                    input_path,
-                    "-ss",
+                    "-ss",  # 入力側でシークし、キーフレームから切り取る
                     start_time,
-                    "-t",
-                    duration,
-                    "-vf",
-                    "fps=10,scale=320:-1:flags=lanczos",
-                    "-c:v",
-                    "gif",
-                    "-y",  # 既存ファイルを上書き
-                    output_path,
-                ],
-                capture_output=True,
-                text=True,
-            )
-        elif output_format.lower() == "webm": # WEBM変換用のffmpegコマンド
-            result = subprocess.run(
-                [
-                    "ffmpeg",
                     "-i",
                     input_path,
-                    "-ss",
-                    start_time,
                     "-t",
                     duration,
                     "-c:v",
-                    "libvpx-vp9",
-                    "-crf",
-                    "30",
-                    "-b:v",
-                    "0",
+                    "copy",
                     "-an",  # 音声を削除
+                    "-f",
+                    "webm",
                     "-y",  # 既存ファイルを上書き
                     output_path,
                 ],
-                capture_output=True,
-                text=True,
+                output_path=output_path,
+                timeout=timeout,
+                progress_callback=progress_callback,
             )
+            if result is not None:
+                if result:
+                    print(f"動画切り取り成功（コピー）: {output_path}")
+                return result
+
+        if output_format.lower() == "gif": # GIF変換用のffmpegコマンド
+            command_args = [
+                "-i",
+                input_path,
+                "-ss",
+                start_time,
+                "-t",
+                duration,
+                "-vf",
+                "fps=10,scale=320:-1:flags=lanczos",
+                *get_encoder_args("gif_video"),
+                "-y",  # 既存ファイルを上書き
+                output_path,
+            ]
+        elif output_format.lower() == "webm": # WEBM変換用のffmpegコマンド
+            command_args = [
+                "-i",
+                input_path,
+                "-ss",
+                start_time,
+                "-t",
+                duration,
+                *get_encoder_args("webm_video", crf=30),
+                "-an",  # 音声を削除
+                "-f",
+                "webm",
+                "-y",  # 既存ファイルを上書き
+                output_path,
+            ]
         else:
             print(f"サポートされていないフォーマット: {output_format}")
             return False
 
-        if result.returncode == 0:
+        success = await run_ffmpeg(command_args, timeout=timeout, progress_callback=progress_callback)
+        if success:
             print(f"動画切り取り・変換成功: {output_path}")
-            return True
-        else:
-            print(f"{inspect.currentframe().f_code.co_name}関数でffmpegエラーが発生しました: {result.stderr}") # type: ignore
-            return False
 
+        return success
+
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         print(f"{inspect.currentframe().f_code.co_name}関数でエラーが発生しました: {e}") # type: ignore
         return False
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import time
+
+# これ以降は再開・再受信しないジョブの状態
+TERMINAL_STATES = ("delivered", "cancelled", "expired")
+# クライアントへ送信するまで保持する処理結果の状態
+RESULT_STATES = ("completed", "failed")
+
+
+class JobJournal:
+    """ジョブの状態を追記していく記録（JSONL）
+
+    - 1行が1つの状態の変化 {"job_id", "state", "ts", ...}。同じjob_idの行を順に重ねたものが最新の状態
+        staged（入力を保存済み） → running（ffmpeg実行中） → completed / failed → delivered（クライアントへ送信済み）
+        cancelled（処理中にクライアントが切断した、または再開できない）
+        expired（処理結果が保持期間内に受信されなかった）
+    - 追記は flush_interval_seconds の間まとめてから書き込み、fsyncしてから完了とする
+    - 起動時に load で読み込み、完了していないジョブだけを書き直す（記録が増え続けないようにする）
+        受信されない処理結果は保持期間を過ぎたら expire_results で expired にする（メモリ・記録が増え続けないようにする）
+    - 書き込み途中で停止した最終行は読み込み時に無視する
+    """
+
+    def __init__(self, path: str, flush_interval_seconds: float = 0.05, executor=None) -> None:
+        """
+        Args
+            path [str] 記録ファイルのパス
+            flush_interval_seconds [float] 初期値 = 0.05 追記をまとめる時間（秒）
+            executor 初期値 = None 書き込み・fsyncを行うスレッドプール（Noneの場合はイベントループの既定）
+        """
+        self.path = path
+        self.flush_interval_seconds = flush_interval_seconds
+        self.executor = executor
+
+        # {job_id: 最新の状態}（完了したジョブは含まない）
+        self.jobs: dict[str, dict] = {}
+        # 書き込み待ちの行 [(line, future)]
+        self.pending: list[tuple[str, asyncio.Future]] = []
+        self.flush_task: asyncio.Future | None = None
+        self.file = None
+
+    def load(self, result_ttl_seconds: float | None = None) -> dict[str, dict]:
+        """
+        記録を読み込み、完了していないジョブの最新の状態を取得する
+            読み込み後、完了していないジョブだけの記録に書き直して追記用に開く
+
+        Args
+            result_ttl_seconds [float] 初期値 = None 処理結果の保持期間（秒）。過ぎたものは読み込まない（Noneの場合は全て読み込む）
+
+        Return
+            [dict] {job_id: 最新の状態}
+        """
+        jobs: dict[str, dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 書き込み途中で停止した行
+                        continue
+                    job_id = record.get("job_id")
+                    if not isinstance(job_id, str):
+                        continue
+                    jobs.setdefault(job_id, {}).update(record)
+                    if record.get("state") in TERMINAL_STATES:
+                        del jobs[job_id]
+
+        if result_ttl_seconds is not None:
+            now = time.time()
+            jobs = {
+                job_id: job for job_id, job in jobs.items()
+                if job.get("state") not in RESULT_STATES or now - job.get("ts", now) < result_ttl_seconds
+            }
+
+        # 最新の状態だけを書き直す（一時ファイルに書いてから置き換える）
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for job in jobs.values():
+                f.write(json.dumps(job, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.jobs = jobs
+        return {job_id: dict(job) for job_id, job in jobs.items()}
+
+    async def record(self, job_id: str, state: str, **fields) -> None:
+        """
+        状態の変化を記録する（ファイルへ書き込みfsyncするまで待機する）
+
+        Args
+            job_id [str] ジョブID
+            state [str] 状態
+            fields 状態とあわせて記録する内容（入力ファイルパス、パラメーターなど）
+        """
+        record = {"job_id": job_id, "state": state, "ts": time.time(), **fields}
+
+        if state in TERMINAL_STATES:
+            self.jobs.pop(job_id, None)
+        else:
+            self.jobs.setdefault(job_id, {}).update(record)
+
+        if self.file is None:
+            # 読み込み前（記録しない）
+            return
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.pending.append((json.dumps(record, ensure_ascii=False) + "\n", future))
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.ensure_future(self.flush())
+
+        # 待機中にキャンセルされても書き込みは続ける
+        try:
+            await asyncio.shield(future)
+        except OSError:
+            # 記録できない場合も処理は続ける（再起動後に再開できないだけ）
+            pass
+
+    async def flush(self) -> None:
+        """
+        書き込み待ちの行をまとめて書き込み、fsyncする
+        """
+        loop = asyncio.get_running_loop()
+        # 同時に記録される行をまとめる
+        await asyncio.sleep(self.flush_interval_seconds)
+
+        while self.pending:
+            batch, self.pending = self.pending, []
+            try:
+                await loop.run_in_executor(self.executor, self.write_lines, [line for line, _ in batch])
+            except OSError as e:
+                print(f"ジョブの記録に失敗しました: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    def write_lines(self, lines: list[str]) -> None:
+        """
+        行を追記してfsyncする（I/Oスレッドで実行）
+        """
+        self.file.write("".join(lines)) # type: ignore
+        self.file.flush() # type: ignore
+        os.fsync(self.file.fileno()) # type: ignore
+
+    async def expire_results(self, result_ttl_seconds: float, exclude: set[str] | None = None) -> list[str]:
+        """
+        保持期間を過ぎた処理結果（completed / failed）を expired にする
+
+        Args
+            result_ttl_seconds [float] 処理結果の保持期間（秒）
+            exclude [set[str]] 初期値 = None 対象外のジョブID（送信中のジョブなど）
+
+        Return
+            [list[str]] expired にしたジョブID
+        """
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.get("state") in RESULT_STATES
+            and job_id not in (exclude or ())
+            and now - job.get("ts", now) >= result_ttl_seconds
+        ]
+        for job_id in expired:
+            await self.record(job_id, "expired")
+        return expired
+
+    def get(self, job_id: str) -> dict | None:
+        """
+        ジョブの最新の状態（完了したジョブ、不明なジョブはNone）
+        """
+        return self.jobs.get(job_id)
+
+    def get_metrics(self) -> dict:
+        """
+        状態ごとのジョブ数（メトリクス用）
+        """
+        states: dict[str, int] = {}
+        for job in self.jobs.values():
+            states[job["state"]] = states.get(job["state"], 0) + 1
+        return {"jobs": states}
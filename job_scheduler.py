@@ -0,0 +1,252 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+# 処理内容ごとのコスト係数（libx264で再エンコードする処理を1.0とする）
+OPERATION_COST_FACTORS: dict[str, float] = {
+    "compress": 1.0,
+    "resize": 1.0,
+    "aspect": 1.0,
+    "convert": 0.05,  # 音声のみ
+    "trim_gif": 0.3,  # 幅320px、10fpsに縮小
+    "trim_webm": 1.5,  # VP9はlibx264より遅い
+    "pipeline": 1.0,  # フィルターをまとめて1回だけエンコード
+    "stream_copy": 0.01,  # 再エンコードせずにコピー（ファイルの読み書きのみ）
+}
+
+# 解像度やフレームレートが取得できない場合の画素レート（1280x720, 30fps）
+DEFAULT_PIXEL_RATE = 1280 * 720 * 30
+
+# 長さが取得できない場合の長さ（秒）
+DEFAULT_DURATION_SECONDS = 60.0
+
+# 処理区分ごとに保持する待ち時間・処理時間の件数
+LATENCY_SAMPLES = 200
+
+
+def estimate_job_cost(operation: str, parameters: dict, probe: dict | None, target_seconds: float | None, stream_copy: bool = False) -> float:
+    """ジョブの処理コストを見積もる
+        コスト = 処理対象の長さ × 画素レート(幅×高さ×fps) × 処理内容ごとの係数
+
+    Args
+        operation [str] 指示内容
+        parameters [dict] 追加パラメーター
+        probe [dict] ffprobeの出力（取得できない場合None）
+        target_seconds [float] 処理対象の長さ（trimは切り取り時間）。不明な場合None
+        stream_copy [bool] 初期値 = False 再エンコードせずにコピーする場合True
+
+    Returns
+        [float] 見積もりコスト
+    """
+    # 映像ストリームから画素レートを計算
+    pixel_rate = DEFAULT_PIXEL_RATE
+    for stream in (probe or {}).get("streams", []):
+        if stream.get("codec_type") != "video":
+            continue
+        try:
+            numerator, _, denominator = stream.get("avg_frame_rate", stream.get("r_frame_rate", "30/1")).partition("/")
+            fps = float(numerator) / float(denominator or 1)
+            pixel_rate = int(stream["width"]) * int(stream["height"]) * (fps if fps > 0 else 30)
+        except (KeyError, TypeError, ValueError, ZeroDivisionError):
+            pass
+        break
+
+    if stream_copy:
+        factor = OPERATION_COST_FACTORS["stream_copy"]
+    elif operation == "trim":
+        factor = OPERATION_COST_FACTORS.get(f"trim_{parameters.get('type')}", 1.0)
+    else:
+        factor = OPERATION_COST_FACTORS.get(operation, 1.0)
+
+    duration = target_seconds if target_seconds is not None else DEFAULT_DURATION_SECONDS
+
+    return duration * pixel_rate * factor
+
+
+class JobScheduler:
+    """見積もりコストの小さいジョブから順に実行するスケジューラー
+
+    - 同時に実行するジョブ数を max_concurrent_jobs までに制限する
+    - 待ち時間に応じて優先度を上げ（エイジング）、大きなジョブが実行されないままになるのを防ぐ
+        優先度 = コスト / (1 + 待ち時間 / aging_seconds) が小さいものから実行
+    - エイジングだけではコストの差が大きい場合に待ち時間が長くなりすぎるため（コスト比1600倍で約26時間）、
+        max_wait_seconds 以上待っているジョブはコストによらず先着順で先に実行する（待ち時間の上限）
+    - 処理区分ごとの待ち時間・処理時間を記録する
+    """
+
+    def __init__(self, max_concurrent_jobs: int = 2, aging_seconds: float = 60.0, max_wait_seconds: float = 600.0) -> None:
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.aging_seconds = aging_seconds
+        self.max_wait_seconds = max_wait_seconds
+
+        # 実行中のジョブ数
+        self.running_jobs: int = 0
+        # 実行待ちのジョブ [{"cost", "job_class", "enqueued_at", "future", "seq"}]
+        self.waiting_jobs: list[dict] = []
+        # 同じ優先度の場合は先着順にするための番号
+        self.sequence = itertools.count()
+
+        # {job_class: {"queue_wait": deque, "total": deque, "count": int}}
+        self.latency_samples: dict[str, dict] = {}
+
+    @asynccontextmanager
+    async def slot(self, cost: float, job_class: str):
+        """
+        実行枠を確保してから処理を行う
+
+        Args
+            cost [float] 見積もりコスト
+            job_class [str] 処理区分（待ち時間・処理時間の集計単位）
+
+        使用例
+            async with scheduler.slot(cost=cost, job_class="compress"):
+                await 処理
+        """
+        enqueued_at = time.monotonic()
+        await self.acquire(cost=cost, job_class=job_class)
+        started_at = time.monotonic()
+
+        try:
+            yield
+        finally:
+            self.release()
+            self.record_latency(
+                job_class=job_class,
+                queue_wait=started_at - enqueued_at,
+                total=time.monotonic() - enqueued_at
+            )
+
+    async def acquire(self, cost: float, job_class: str) -> None:
+        """
+        実行枠が確保できるまで待機する
+
+        Args
+            cost [float] 見積もりコスト
+            job_class [str] 処理区分
+        """
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        waiting_job = {
+            "cost": cost,
+            "job_class": job_class,
+            "enqueued_at": time.monotonic(),
+            "future": future,
+            "seq": next(self.sequence),
+        }
+        self.waiting_jobs.append(waiting_job)
+        self.dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 待機中にキャンセルされた場合は待ち行列から外す
+            if waiting_job in self.waiting_jobs:
+                self.waiting_jobs.remove(waiting_job)
+            # 枠の割り当て直後にキャンセルされた場合は枠を返す
+            elif future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """
+        実行枠を返却し、次のジョブを実行する
+        """
+        self.running_jobs -= 1
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        """
+        空いている実行枠を、優先度の高い（値の小さい）ジョブから割り当てる
+        """
+        now = time.monotonic()
+        while self.running_jobs < self.max_concurrent_jobs and self.waiting_jobs:
+            next_job = min(self.waiting_jobs, key=lambda job: self.dispatch_order(job, now))
+            self.waiting_jobs.remove(next_job)
+            if next_job["future"].done():
+                continue
+            self.running_jobs += 1
+            next_job["future"].set_result(None)
+
+    def dispatch_order(self, waiting_job: dict, now: float) -> tuple:
+        """
+        実行枠を割り当てる順序（値が小さいほど先）
+            max_wait_seconds 以上待っているジョブは先着順で最優先、それ以外は優先度順
+
+        Args
+            waiting_job [dict] 実行待ちのジョブ
+            now [float] 現在時刻（time.monotonic）
+
+        Return
+            [tuple] 比較用の値
+        """
+        if now - waiting_job["enqueued_at"] >= self.max_wait_seconds:
+            return (0, 0.0, waiting_job["seq"])
+        return (1, self.effective_priority(waiting_job, now), waiting_job["seq"])
+
+    def effective_priority(self, waiting_job: dict, now: float) -> float:
+        """
+        待ち時間を考慮した優先度（値が小さいほど優先）
+
+        Args
+            waiting_job [dict] 実行待ちのジョブ
+            now [float] 現在時刻（time.monotonic）
+
+        Return
+            [float] 優先度
+        """
+        waited = now - waiting_job["enqueued_at"]
+        return waiting_job["cost"] / (1 + waited / self.aging_seconds)
+
+    def record_latency(self, job_class: str, queue_wait: float, total: float) -> None:
+        """
+        処理区分ごとの待ち時間・処理時間を記録する
+        """
+        samples = self.latency_samples.setdefault(job_class, {
+            "queue_wait": deque(maxlen=LATENCY_SAMPLES),
+            "total": deque(maxlen=LATENCY_SAMPLES),
+            "count": 0,
+        })
+        samples["queue_wait"].append(queue_wait)
+        samples["total"].append(total)
+        samples["count"] += 1
+
+    def queue_depth(self) -> int:
+        """
+        実行待ちのジョブ数
+        """
+        return len(self.waiting_jobs)
+
+    def get_metrics(self) -> dict:
+        """
+        スケジューラーの状態と処理区分ごとの待ち時間・処理時間（直近 LATENCY_SAMPLES 件）
+
+        Return
+            [dict] メトリクス
+        """
+        def summarize(values) -> dict:
+            ordered = sorted(values)
+            if not ordered:
+                return {"avg": None, "p50": None, "p95": None, "max": None}
+            return {
+                "avg": round(sum(ordered) / len(ordered), 3),
+                "p50": round(ordered[len(ordered) // 2], 3),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                "max": round(ordered[-1], 3),
+            }
+
+        return {
+            "max_concurrent_jobs": self.max_concurrent_jobs,
+            "aging_seconds": self.aging_seconds,
+            "max_wait_seconds": self.max_wait_seconds,
+            "running": self.running_jobs,
+            "queued": self.queue_depth(),
+            "classes": {
+                job_class: {
+                    "count": samples["count"],
+                    "queue_wait_seconds": summarize(samples["queue_wait"]),
+                    "total_seconds": summarize(samples["total"]),
+                }
+                for job_class, samples in self.latency_samples.items()
+            },
+        }
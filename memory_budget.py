@@ -0,0 +1,151 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class MemoryBudget:
+    """サーバー全体で保持する送受信データ（メモリ）の上限
+
+    - 送受信の前に reserve で使用量を確保し、上限を超える場合は確保できるまで待機する
+        待機中は読み込みを行わないため、ソケットの受信バッファが埋まりTCPの送信側が止まる
+    - 接続ごとの受信バッファなど、待機できない使用量は charge で加算する（上限を超えても加算する）
+    - 確保中の送受信がない場合は、上限を超えていても確保する（全ての接続が止まらないようにする）
+    - 待機中の確保は先着順に割り当てる
+    """
+
+    def __init__(self, max_bytes: int | None = None) -> None:
+        """
+        Args
+            max_bytes [int] 初期値 = None 上限（バイト）。Noneの場合は制限しない（使用量のみ記録する）
+        """
+        self.max_bytes = max_bytes
+        # 使用量（確保中の送受信 + 接続ごとの受信バッファ）
+        self.used_bytes: int = 0
+        # 使用量の最大値
+        self.high_water_bytes: int = 0
+        # 確保中の送受信の数
+        self.reservations: int = 0
+        # 確保待ち [(size, future)]
+        self.waiters: deque[tuple[int, asyncio.Future]] = deque()
+        # 確保待ちになった回数
+        self.paused_count: int = 0
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        """
+        使用量を確保してから送受信を行う
+
+        Args
+            size [int] 確保するバイト数
+
+        使用例
+            async with budget.reserve(chunk_size * 2):
+                await 受信
+        """
+        await self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
+
+    async def acquire(self, size: int) -> None:
+        """
+        使用量を確保できるまで待機する
+
+        Args
+            size [int] 確保するバイト数
+        """
+        if not self.waiters and self.can_grant(size):
+            self.grant(size)
+            return
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        waiter = (size, future)
+        self.waiters.append(waiter)
+        self.paused_count += 1
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 待機中にキャンセルされた場合は待ち行列から外す
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                self.dispatch()
+            # 割り当て直後にキャンセルされた場合は返却する
+            elif future.done() and not future.cancelled():
+                self.release(size)
+            raise
+
+    def release(self, size: int) -> None:
+        """
+        確保した使用量を返却し、待機中の確保に割り当てる
+
+        Args
+            size [int] 返却するバイト数（acquireと同じ値）
+        """
+        self.used_bytes -= size
+        self.reservations -= 1
+        self.dispatch()
+
+    def charge(self, size: int) -> None:
+        """
+        待機せずに使用量を加算する（接続ごとの受信バッファなど）
+
+        Args
+            size [int] 加算するバイト数
+        """
+        self.used_bytes += size
+        self.high_water_bytes = max(self.high_water_bytes, self.used_bytes)
+
+    def uncharge(self, size: int) -> None:
+        """
+        charge で加算した使用量を減らす
+
+        Args
+            size [int] 減らすバイト数（chargeと同じ値）
+        """
+        self.used_bytes -= size
+        self.dispatch()
+
+    def can_grant(self, size: int) -> bool:
+        """
+        上限を超えずに確保できるか
+        """
+        if self.max_bytes is None or self.reservations == 0:
+            return True
+        return self.used_bytes + size <= self.max_bytes
+
+    def grant(self, size: int) -> None:
+        """
+        使用量を確保する
+        """
+        self.used_bytes += size
+        self.reservations += 1
+        self.high_water_bytes = max(self.high_water_bytes, self.used_bytes)
+
+    def dispatch(self) -> None:
+        """
+        空いた使用量を、待機中の確保に先着順で割り当てる
+        """
+        while self.waiters and self.can_grant(self.waiters[0][0]):
+            size, future = self.waiters.popleft()
+            if future.done():
+                continue
+            self.grant(size)
+            future.set_result(None)
+
+    def get_metrics(self) -> dict:
+        """
+        使用量（メトリクス用）
+
+        Return
+            [dict] {"max_bytes", "used_bytes", "high_water_bytes", "reservations", "waiting", "paused_count"}
+        """
+        return {
+            "max_bytes": self.max_bytes,
+            "used_bytes": self.used_bytes,
+            "high_water_bytes": self.high_water_bytes,
+            "reservations": self.reservations,
+            "waiting": len(self.waiters),
+            "paused_count": self.paused_count,
+        }
@@ -1,4 +1,28 @@
 import json
+import zlib
+
+# MMPのバージョン
+#   1: ヘッダーのペイロードサイズの分だけペイロードが続く（サイズが事前に分かるデータのみ送信できる）
+#   2: 1に加えて、ペイロードサイズが CHUNKED_PAYLOAD_SIZE の場合は分割形式（chunked）でペイロードが続く
+#      リクエストJSONに "mmp_version": 2 を指定したクライアントにのみ使用し、レスポンスJSONにも "mmp_version": 2 を含める
+MMP_VERSION = 2
+
+# ペイロードが分割形式であることを表すペイロードサイズ（v1の上限値のため、v1では 2**40 - 2 バイトまで送信できる）
+CHUNKED_PAYLOAD_SIZE = 2 ** 40 - 1
+
+# 分割形式の各分割データ: サイズ（4バイト）+ CRC32（4バイト、サイズの最上位ビットが1の場合のみ）+ データ
+#   サイズ0の分割データが終端（CRC32がある場合は、ペイロード全体のCRC32）
+#   CRC32の有無は分割データごとに送信側が決める（受信側はサイズの最上位ビットで判断する）
+CHUNK_HEADER_BYTES = 4
+CHUNK_CHECKSUM_BYTES = 4
+CHUNK_CHECKSUM_FLAG = 0x80000000
+MAX_CHUNK_DATA_SIZE = CHUNK_CHECKSUM_FLAG - 1
+# CRC32がある分割データの上限（受信側は照合してから使用するため、分割データ全体をメモリに載せる）
+MAX_CHECKSUM_CHUNK_DATA_SIZE = 4 * 1024 * 1024
+
+
+class ChunkedPayloadError(ValueError):
+    """分割形式のペイロードが正しくない（CRC32が一致しない、分割データが上限を超える）"""
 
 
 def create_mmp_header(
@@ -39,7 +63,7 @@ def create_mmp_body(
     # 定数定義
     MAX_JSON_SIZE = 2 ** 16 - 1
     MAX_MEDIA_TYPE_SIZE = 2 ** 8 - 1
-    MAX_PAYLOAD_SIZE = 2 ** 40 - 1
+    MAX_PAYLOAD_SIZE = CHUNKED_PAYLOAD_SIZE - 1
 
 
     # jsonデータのコンバート
@@ -118,6 +142,99 @@ def parse_mmp_body(
     return (json_data, media_type, payload)
 
 
+def create_mmp_chunk_header(data: bytes, checksum: bool = False) -> bytes:
+    """
+    分割形式の分割データのヘッダーを作成（データは含まない）
+
+    Args
+        data [bytes] 分割データ（終端は create_mmp_end_chunk で作成する）
+        checksum [bool] 初期値 = False CRC32を含める場合True
+
+    Returns
+        [bytes] サイズ（4バイト）+ CRC32（4バイト、checksum が True の場合のみ）
+    """
+    if not data:
+        raise ValueError("分割データが空です（終端は create_mmp_end_chunk で作成してください）")
+    max_size = MAX_CHECKSUM_CHUNK_DATA_SIZE if checksum else MAX_CHUNK_DATA_SIZE
+    if len(data) > max_size:
+        raise ValueError(f"分割データのサイズが上限を超えています: {len(data)} > {max_size}")
+
+    if not checksum:
+        return len(data).to_bytes(CHUNK_HEADER_BYTES, byteorder="big")
+    return (
+        (len(data) | CHUNK_CHECKSUM_FLAG).to_bytes(CHUNK_HEADER_BYTES, byteorder="big")
+        + zlib.crc32(data).to_bytes(CHUNK_CHECKSUM_BYTES, byteorder="big")
+    )
+
+
+def create_mmp_end_chunk(payload_crc32: int | None = None) -> bytes:
+    """
+    分割形式の終端を作成
+
+    Args
+        payload_crc32 [int] 初期値 = None ペイロード全体のCRC32（照合しない場合None）
+
+    Returns
+        [bytes] サイズ0（4バイト）+ CRC32（4バイト、payload_crc32 を指定した場合のみ）
+    """
+    if payload_crc32 is None:
+        return (0).to_bytes(CHUNK_HEADER_BYTES, byteorder="big")
+    return (
+        CHUNK_CHECKSUM_FLAG.to_bytes(CHUNK_HEADER_BYTES, byteorder="big")
+        + payload_crc32.to_bytes(CHUNK_CHECKSUM_BYTES, byteorder="big")
+    )
+
+
+async def read_mmp_chunks(reader, read_size: int = 1024 * 1024):
+    """
+    分割形式のペイロードを終端まで受信する（非同期ジェネレーター）
+        CRC32がある分割データは照合してから返す
+        CRC32のない大きな分割データは read_size ずつに分けて返す（分割データ全体をメモリに載せない）
+
+    Args
+        reader [asyncio.StreamReader] 受信元
+        read_size [int] 初期値 = 1MB 1回に返すデータの上限
+
+    Yields
+        [bytes] データ
+
+    Raises
+        ChunkedPayloadError CRC32が一致しない場合（一致しない分割データは返さない）、
+            CRC32がある分割データが MAX_CHECKSUM_CHUNK_DATA_SIZE を超える場合
+        asyncio.IncompleteReadError 終端の前に切断された場合
+    """
+    payload_crc32 = 0
+    while True:
+        size = int.from_bytes(await reader.readexactly(CHUNK_HEADER_BYTES), byteorder="big")
+        checksum = bool(size & CHUNK_CHECKSUM_FLAG)
+        size &= MAX_CHUNK_DATA_SIZE
+        expected_crc32 = int.from_bytes(await reader.readexactly(CHUNK_CHECKSUM_BYTES), byteorder="big") if checksum else None
+
+        # 終端（CRC32がある場合はペイロード全体を照合し、分割データの欠落・順序の入れ替わりを検出する）
+        if size == 0:
+            if checksum and expected_crc32 != payload_crc32:
+                raise ChunkedPayloadError("ペイロード全体のCRC32が一致しません")
+            return
+
+        if not checksum:
+            remaining = size
+            while remaining > 0:
+                data = await reader.readexactly(min(read_size, remaining))
+                remaining -= len(data)
+                payload_crc32 = zlib.crc32(data, payload_crc32)
+                yield data
+            continue
+
+        if size > MAX_CHECKSUM_CHUNK_DATA_SIZE:
+            raise ChunkedPayloadError(f"分割データのサイズが上限を超えています: {size} > {MAX_CHECKSUM_CHUNK_DATA_SIZE}")
+        data = await reader.readexactly(size)
+        if zlib.crc32(data) != expected_crc32:
+            raise ChunkedPayloadError(f"分割データのCRC32が一致しません（{size}バイト）")
+        payload_crc32 = zlib.crc32(data, payload_crc32)
+        for position in range(0, size, read_size):
+            yield data[position:position + read_size]
+
+
 # def parse_mmp_message(message_bytes: bytes) -> tuple[dict, str, bytes]:
 #     """
 #     完全なMMPメッセージを解析
@@ -0,0 +1,134 @@
+import time
+
+
+class PresetController:
+    """負荷に応じてエンコードの速度段階（libx264 の -preset、libvpx の -cpu-used）を選ぶ
+
+    - 新しいジョブの開始時に、実行待ちのジョブ数と直近のエンコード速度（ffmpegの speed）から段階を決める
+        段階0が通常の設定で、段階が上がるほど速く（同じCRFでの出力サイズは大きく）なる
+        段階ごとの設定値はエンコーダーごとの speed_ladder（ENCODER_PREFERENCES）で指定する
+    - 設定が頻繁に切り替わらないよう、上げる条件と下げる条件の閾値を分け（ヒステリシス）、
+        変更後 hold_seconds は変更しない。変更は1回に1段階ずつ
+        上げる: 実行枠あたりの待ちジョブ数が raise_queue_per_slot 以上、
+                または lower_queue_per_slot を超えていてエンコード速度が slow_speed 未満
+        下げる: 実行枠あたりの待ちジョブ数が lower_queue_per_slot 以下で、エンコード速度が slow_speed 以上（または待ちなし）
+    - 画質を優先するジョブ（パラメーター "quality_over_speed": true）は常に段階0
+    """
+
+    def __init__(
+        self,
+        job_scheduler,
+        max_level: int = 3,
+        raise_queue_per_slot: float = 1.0,
+        lower_queue_per_slot: float = 0.25,
+        slow_speed: float = 1.0,
+        hold_seconds: float = 30.0,
+        speed_smoothing: float = 0.1,
+    ) -> None:
+        """
+        Args
+            job_scheduler [JobScheduler] 待ちジョブ数と実行枠の数を取得するスケジューラー
+            max_level [int] 初期値 = 3 速度段階の上限（0の場合は常に通常の設定）
+            raise_queue_per_slot [float] 初期値 = 1.0 段階を上げる実行枠あたりの待ちジョブ数
+            lower_queue_per_slot [float] 初期値 = 0.25 段階を下げる実行枠あたりの待ちジョブ数
+            slow_speed [float] 初期値 = 1.0 遅いと判断するエンコード速度（再生速度に対する倍率）
+            hold_seconds [float] 初期値 = 30.0 段階を変更してから次に変更できるまでの時間（秒）
+            speed_smoothing [float] 初期値 = 0.1 エンコード速度の指数移動平均の係数（0〜1、大きいほど直近の値を重視）
+        """
+        self.job_scheduler = job_scheduler
+        self.max_level = max_level
+        self.raise_queue_per_slot = raise_queue_per_slot
+        self.lower_queue_per_slot = lower_queue_per_slot
+        self.slow_speed = slow_speed
+        self.hold_seconds = hold_seconds
+        self.speed_smoothing = speed_smoothing
+
+        # 現在の速度段階
+        self.level: int = 0
+        # エンコード速度の指数移動平均（まだ計測していない場合None）
+        self.speed_factor: float | None = None
+        # 最後に段階を変更した時刻（time.monotonic）
+        self.last_change_at: float | None = None
+        # 段階を変更した回数（起動から）
+        self.changes: int = 0
+        # {段階: 選んだジョブ数}（画質優先のジョブを含む）
+        self.selected_counts: dict[int, int] = {}
+
+    def record_speed(self, speed: float | None) -> None:
+        """
+        エンコード中のffmpegが報告した速度を記録する（progress_callback から呼び出す）
+
+        Args
+            speed [float] 再生速度に対する倍率（"1.5x" の 1.5）。不明な場合None
+        """
+        if speed is None or speed <= 0:
+            return
+        if self.speed_factor is None:
+            self.speed_factor = speed
+        else:
+            self.speed_factor += self.speed_smoothing * (speed - self.speed_factor)
+
+    def update(self, now: float | None = None) -> int:
+        """
+        待ちジョブ数とエンコード速度から速度段階を更新する
+
+        Args
+            now [float] 初期値 = None 現在時刻（time.monotonic、Noneの場合は取得する）
+
+        Return
+            [int] 更新後の速度段階
+        """
+        now = time.monotonic() if now is None else now
+        if self.last_change_at is not None and now - self.last_change_at < self.hold_seconds:
+            return self.level
+
+        queue_depth = self.job_scheduler.queue_depth()
+        pressure = queue_depth / max(1, self.job_scheduler.max_concurrent_jobs)
+        slow = self.speed_factor is not None and self.speed_factor < self.slow_speed
+
+        new_level = self.level
+        if pressure >= self.raise_queue_per_slot or (slow and pressure > self.lower_queue_per_slot):
+            new_level = min(self.max_level, self.level + 1)
+        elif pressure <= self.lower_queue_per_slot and (not slow or queue_depth == 0):
+            new_level = max(0, self.level - 1)
+
+        if new_level != self.level:
+            print(
+                f"エンコードの速度段階を変更しました: {self.level} -> {new_level} "
+                f"(待ち: {queue_depth}, 速度: {self.speed_factor if self.speed_factor is not None else '-'})"
+            )
+            self.level = new_level
+            self.last_change_at = now
+            self.changes += 1
+        return self.level
+
+    def select(self, quality_over_speed: bool = False) -> int:
+        """
+        新しいジョブの速度段階を選ぶ（ジョブが実行枠を確保した後に呼び出す）
+
+        Args
+            quality_over_speed [bool] 初期値 = False 画質を優先する場合True（常に段階0）
+
+        Return
+            [int] ジョブの速度段階
+        """
+        level = self.update()
+        if quality_over_speed:
+            level = 0
+        self.selected_counts[level] = self.selected_counts.get(level, 0) + 1
+        return level
+
+    def get_metrics(self) -> dict:
+        """
+        速度段階の状況（メトリクス用）
+
+        Return
+            [dict] {"level", "max_level", "speed_factor", "changes", "selected"}
+        """
+        return {
+            "level": self.level,
+            "max_level": self.max_level,
+            "speed_factor": round(self.speed_factor, 3) if self.speed_factor is not None else None,
+            "changes": self.changes,
+            "selected": {str(level): count for level, count in sorted(self.selected_counts.items())},
+        }
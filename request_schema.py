@@ -0,0 +1,332 @@
+import math
+import re
+
+from ffmpeg_function import parse_time_to_seconds
+
+# ハッシュ値・IDに使用できる文字列（16進数）
+HEX_PATTERN = r"[0-9a-f]{8,64}"
+
+# リクエストJSONの項目の指定（actionごと）
+#   type: "string" | "integer" | "number" | "boolean" | "object" | "list" | "choice" | "time"
+#       number は数値または数値の文字列、time は "00:01:05" または "65" の形式（数値も可）
+#       choice は choices のいずれか（数値で指定された場合は文字列にそろえる）
+#   required: 必須の場合True
+#   choices: choice の候補
+#   min / max: integer、number、time の範囲（exclusive_min は指定値を含まない）
+#   pattern: string の形式（正規表現、全体一致）
+# 指定のない項目は確認しない
+ACTION_SCHEMAS: dict[str, dict[str, dict]] = {
+    "ping": {},
+    "probe_hash": {
+        "content_hash": {"type": "string", "required": True, "pattern": HEX_PATTERN},
+    },
+    "metrics": {},
+    "bandwidth": {
+        "limits": {"type": "object"},
+    },
+    "probe": {
+        "file_name": {"type": "string"},
+        "total_size": {"type": "integer", "required": True, "min": 1},
+        "ranges": {"type": "list", "required": True},
+        "content_hash": {"type": "string", "pattern": HEX_PATTERN},
+    },
+    "upload_range": {
+        "upload_id": {"type": "string", "required": True, "pattern": HEX_PATTERN},
+        "file_name": {"type": "string"},
+        "offset": {"type": "integer", "required": True, "min": 0},
+        "total_size": {"type": "integer", "required": True, "min": 1},
+    },
+    "upload": {
+        "file_name": {"type": "string", "required": True},
+        "operation": {"type": "choice", "required": True, "choices": ["compress", "resize", "aspect", "convert", "trim", "pipeline"]},
+        "parameters": {"type": "object"},
+        "stream": {"type": "boolean"},
+        "content_ref": {"type": "string", "pattern": HEX_PATTERN},
+        "content_hash": {"type": "string", "pattern": HEX_PATTERN},
+        "upload_id": {"type": "string", "pattern": HEX_PATTERN},
+        "total_size": {"type": "integer", "min": 1},
+    },
+    "attach": {
+        "job_id": {"type": "string", "required": True},
+    },
+}
+
+# 全てのactionで指定できる項目
+#   mmp_version: 2以上の場合、レスポンスにMMP v2 の分割形式を使用できる（mmp_protocol.py 参照）
+#   chunk_checksum: "crc32" の場合、レスポンスのファイルをCRC32付きの分割形式で送信する
+COMMON_REQUEST_SCHEMA: dict[str, dict] = {
+    "mmp_version": {"type": "integer", "min": 1},
+    "chunk_checksum": {"type": "choice", "choices": ["crc32"]},
+}
+
+# 全ての処理で指定できるパラメーター
+COMMON_PARAMETER_SCHEMA: dict[str, dict] = {
+    "passthrough": {"type": "boolean"},
+    "quality_over_speed": {"type": "boolean"},
+}
+
+# 処理（operation）ごとのパラメーターの指定
+OPERATION_SCHEMAS: dict[str, dict[str, dict]] = {
+    "compress": {
+        "target_size_mb": {"type": "number", "exclusive_min": 0},
+        "target_quality": {"type": "number", "exclusive_min": 0},
+        "quality_metric": {"type": "choice", "choices": ["ssim", "psnr"]},
+    },
+    "resize": {
+        "size": {"type": "choice", "required": True, "choices": ["1", "2", "3", "4"]},
+    },
+    "aspect": {
+        "ratio": {"type": "choice", "required": True, "choices": ["1", "2", "3"]},
+        "fit_mode": {"type": "choice", "required": True, "choices": ["1", "2"]},
+    },
+    "convert": {},
+    "trim": {
+        "type": {"type": "choice", "required": True, "choices": ["gif", "webm"]},
+        "start_time": {"type": "time", "required": True, "min": 0},
+        "duration": {"type": "time", "required": True, "exclusive_min": 0},
+    },
+    "pipeline": {
+        "steps": {"type": "list", "required": True},
+    },
+}
+
+# pipelineの処理（steps）ごとの指定
+PIPELINE_STEP_SCHEMAS: dict[str, dict[str, dict]] = {
+    "aspect": OPERATION_SCHEMAS["aspect"],
+    "resize": OPERATION_SCHEMAS["resize"],
+    "compress": {
+        "crf": {"type": "integer", "min": 0, "max": 51},
+    },
+}
+
+
+class RequestError(Exception):
+    """リクエストJSONが指定と一致しない
+
+    Attributes
+        code [str] エラーコード
+        description [str] エラー内容の説明
+        solution [str] 解決策
+    """
+
+    def __init__(self, code: str, description: str, solution: str) -> None:
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.solution = solution
+
+
+def describe_field(name: str, spec: dict) -> str:
+    """項目の指定方法の説明（解決策に使用する）
+
+    Args
+        name [str] 項目名
+        spec [dict] 項目の指定
+
+    Returns
+        [str] 説明
+    """
+    match spec["type"]:
+        case "choice":
+            return f"{name}には {', '.join(spec['choices'])} のいずれかを指定してください"
+        case "time":
+            return f"{name}は \"00:00:10\" または秒数（例: \"10\"）で指定してください"
+        case "string" if "pattern" in spec:
+            return f"{name}は16進数（8〜64文字）で指定してください"
+
+    names = {
+        "string": "文字列",
+        "integer": "整数",
+        "number": "数値",
+        "boolean": "true または false",
+        "object": "オブジェクト",
+        "list": "配列",
+    }
+    ranges = []
+    if "min" in spec:
+        ranges.append(f"{spec['min']}以上")
+    if "exclusive_min" in spec:
+        ranges.append(f"{spec['exclusive_min']}より大きい")
+    if "max" in spec:
+        ranges.append(f"{spec['max']}以下")
+    return f"{name}は{''.join(ranges) + 'の' if ranges else ''}{names[spec['type']]}で指定してください"
+
+
+def check_field(name: str, value, spec: dict):
+    """項目の値を確認する
+
+    Args
+        name [str] 項目名
+        value 値
+        spec [dict] 項目の指定
+
+    Returns
+        値（choice・time は文字列にそろえた値）
+
+    Raises
+        ValueError 指定と一致しない場合（引数は解決策）
+    """
+    field_type = spec["type"]
+    number: float | None = None
+
+    if field_type == "choice":
+        if isinstance(value, bool) or not isinstance(value, (str, int)) or str(value) not in spec["choices"]:
+            raise ValueError(describe_field(name, spec))
+        return str(value)
+
+    if field_type == "string":
+        if not isinstance(value, str) or (value == "" and spec.get("required")):
+            raise ValueError(describe_field(name, spec))
+        if "pattern" in spec and re.fullmatch(spec["pattern"], value) is None:
+            raise ValueError(describe_field(name, spec))
+        return value
+
+    if field_type == "boolean":
+        if not isinstance(value, bool):
+            raise ValueError(describe_field(name, spec))
+        return value
+
+    if field_type == "object":
+        if not isinstance(value, dict):
+            raise ValueError(describe_field(name, spec))
+        return value
+
+    if field_type == "list":
+        if not isinstance(value, list):
+            raise ValueError(describe_field(name, spec))
+        return value
+
+    if field_type == "integer":
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(describe_field(name, spec))
+        number = value
+    elif field_type == "number":
+        try:
+            number = float(value) if not isinstance(value, bool) else None
+        except (TypeError, ValueError):
+            number = None
+    elif field_type == "time":
+        number = parse_time_to_seconds(value) if isinstance(value, (str, int, float)) and not isinstance(value, bool) else None
+
+    if number is None or not math.isfinite(number):
+        raise ValueError(describe_field(name, spec))
+    if ("min" in spec and number < spec["min"]) or ("max" in spec and number > spec["max"]) or ("exclusive_min" in spec and number <= spec["exclusive_min"]):
+        raise ValueError(describe_field(name, spec))
+    # 時間はffmpegの引数にそのまま渡すため、数値で指定された場合も文字列にそろえる
+    if field_type == "time":
+        return str(value)
+    return value
+
+
+def check_fields(values: dict, schema: dict[str, dict], location: str) -> dict:
+    """指定に従って項目を確認する
+
+    Args
+        values [dict] 確認する内容
+        schema [dict] 項目の指定
+        location [str] エラー内容に含める場所（"parameters" など）
+
+    Returns
+        [dict] 確認後の内容（choice・time を文字列にそろえたもの）
+
+    Raises
+        ValueError 指定と一致しない場合（引数は エラー内容の説明, 解決策）
+    """
+    checked = dict(values)
+    for name, spec in schema.items():
+        if name not in values or values[name] is None:
+            if spec.get("required"):
+                raise ValueError(f"{location}に{name}がありません", describe_field(name, spec))
+            continue
+        try:
+            checked[name] = check_field(name, values[name], spec)
+        except ValueError as e:
+            raise ValueError(f"{location}の{name}が不正です: {values[name]!r}", str(e))
+    return checked
+
+
+def check_parameters(operation: str, parameters: dict) -> dict:
+    """処理（operation）ごとのパラメーターを確認する
+
+    Args
+        operation [str] 処理
+        parameters [dict] パラメーター
+
+    Returns
+        [dict] 確認後のパラメーター
+
+    Raises
+        ValueError 指定と一致しない場合（引数は エラー内容の説明, 解決策）
+    """
+    checked = check_fields(parameters, {**COMMON_PARAMETER_SCHEMA, **OPERATION_SCHEMAS[operation]}, "parameters")
+
+    if operation == "compress":
+        # SSIMは0〜1
+        if checked.get("quality_metric", "ssim") == "ssim" and "target_quality" in checked and float(checked["target_quality"]) > 1:
+            raise ValueError(
+                f"parametersのtarget_qualityが不正です: {checked['target_quality']!r}",
+                "quality_metricがssimの場合、target_qualityは0より大きく1以下で指定してください"
+            )
+
+    if operation == "pipeline":
+        steps = checked["steps"]
+        if not steps:
+            raise ValueError("parametersのstepsが空です", "stepsにはaspect、resize、compressを1つ以上指定してください")
+        checked_steps = []
+        for index, step in enumerate(steps):
+            location = f"steps[{index}]"
+            if not isinstance(step, dict):
+                raise ValueError(f"{location}が不正です: {step!r}", '{"operation": ...} の形式で指定してください')
+            step_operation = step.get("operation")
+            if step_operation not in PIPELINE_STEP_SCHEMAS:
+                raise ValueError(
+                    f"{location}のoperationが不正です: {step_operation!r}",
+                    f"operationには {', '.join(PIPELINE_STEP_SCHEMAS)} のいずれかを指定してください"
+                )
+            checked_steps.append(check_fields(step, PIPELINE_STEP_SCHEMAS[step_operation], location))
+        if sum(1 for step in checked_steps if step["operation"] == "compress") > 1:
+            raise ValueError("stepsにcompressが複数あります", "compressは1つまで指定できます")
+        checked["steps"] = checked_steps
+
+    return checked
+
+
+def validate_request(json_data: dict | None) -> dict:
+    """リクエストJSONをペイロードの受信前に確認する
+
+    Args
+        json_data [dict] リクエストJSON（解析できなかった場合None）
+
+    Returns
+        [dict] 確認後のリクエストJSON（パラメーターの choice・time を文字列にそろえたもの）
+
+    Raises
+        RequestError 指定と一致しない場合
+    """
+    if not isinstance(json_data, dict):
+        raise RequestError(
+            code="invalid_request",
+            description="リクエストJSONを解析できません",
+            solution="JSONはUTF-8のオブジェクトで指定してください"
+        )
+
+    action = json_data.get("action")
+    if action not in ACTION_SCHEMAS:
+        raise RequestError(
+            code="unknown_action",
+            description=f"不明なactionです: {action}",
+            solution=f"actionには{'、'.join(ACTION_SCHEMAS)}のいずれかを指定してください"
+        )
+
+    try:
+        checked = check_fields(json_data, {**COMMON_REQUEST_SCHEMA, **ACTION_SCHEMAS[action]}, "リクエスト")
+    except ValueError as e:
+        raise RequestError(code="invalid_request", description=e.args[0], solution=e.args[1])
+
+    if action == "upload":
+        try:
+            checked["parameters"] = check_parameters(checked["operation"], checked.get("parameters") or {})
+        except ValueError as e:
+            raise RequestError(code="invalid_parameters", description=e.args[0], solution=e.args[1])
+
+    return checked
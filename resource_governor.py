@@ -0,0 +1,249 @@
+import errno
+import os
+import shutil
+import uuid
+
+# cgroup v2 のマウント先
+CGROUP_ROOT = "/sys/fs/cgroup"
+# 自身が所属するcgroup（cgroup v2 は "0::/path" の1行）
+PROC_CGROUP_PATH = "/proc/self/cgroup"
+
+
+class ResourceGovernor:
+    """ffmpegの子プロセスに割り当てるリソースを制御する
+
+    - nice値とI/O優先度（ionice）を下げて起動する
+    - ffmpegを動かすCPUと、サーバーのイベントループを動かすCPUを分ける
+    - cgroup v2 が利用できる場合は、ffmpegごとにcgroupを作成して cpu.max / memory.max で制限する
+
+    ffmpegは "nice", "ionice", "taskset" コマンドを前に付けて起動するため、
+    起動直後（スレッド作成前）から制限が適用される。コマンドがない項目は起動後に設定する
+    """
+
+    def __init__(
+        self,
+        niceness: int = 10,
+        ionice_class: int | None = 2,
+        ionice_level: int = 7,
+        loop_cpu_count: int | None = None,
+        cgroup_cpu_max_cores: float | None = None,
+        cgroup_memory_max_bytes: int | None = None,
+    ) -> None:
+        """
+        Args
+            niceness [int] 初期値 = 10 ffmpegのnice値（大きいほど優先度が低い）
+            ionice_class [int] 初期値 = 2 I/Oスケジューリングクラス (1: realtime, 2: best-effort, 3: idle)。Noneの場合は変更しない
+            ionice_level [int] 初期値 = 7 best-effortのI/O優先度 (0〜7、大きいほど低い)
+            loop_cpu_count [int] 初期値 = None
+                イベントループ用に確保するCPU数。Noneの場合はCPU数の1/4（最低1）。CPUが1つの場合は分けない
+            cgroup_cpu_max_cores [float] 初期値 = None ffmpeg1つあたりのCPU上限（コア数）。Noneの場合は制限しない
+            cgroup_memory_max_bytes [int] 初期値 = None ffmpeg1つあたりのメモリ上限（バイト）。Noneの場合は制限しない
+        """
+        self.niceness = niceness
+        self.ionice_class = ionice_class
+        self.ionice_level = ionice_level
+        self.cgroup_cpu_max_cores = cgroup_cpu_max_cores
+        self.cgroup_memory_max_bytes = cgroup_memory_max_bytes
+
+        # 利用できるCPUをイベントループ用とffmpeg用に分ける
+        available_cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        if len(available_cpus) > 1:
+            if loop_cpu_count is None:
+                loop_cpu_count = max(1, len(available_cpus) // 4)
+            loop_cpu_count = min(loop_cpu_count, len(available_cpus) - 1)
+            self.loop_cpus: list[int] = available_cpus[:loop_cpu_count]
+            self.job_cpus: list[int] = available_cpus[loop_cpu_count:]
+        else:
+            self.loop_cpus = []
+            self.job_cpus = []
+
+        # 制限に使用するコマンド
+        self.nice_command = shutil.which("nice")
+        self.ionice_command = shutil.which("ionice")
+        self.taskset_command = shutil.which("taskset")
+
+        # cgroup v2 の準備（利用できない場合は理由を記録して無効にする）
+        self.cgroup_parent: str | None = None
+        self.cgroup_reason: str = ""
+        if cgroup_cpu_max_cores is not None or cgroup_memory_max_bytes is not None:
+            self.setup_cgroup()
+        else:
+            self.cgroup_reason = "制限値が設定されていません"
+
+    def setup_cgroup(self) -> None:
+        """
+        ffmpeg用のcgroupの親ディレクトリを作成し、cpu/memoryコントローラーを有効にする
+            cgroup v2 はプロセスが所属しているcgroupの子にコントローラーを有効にできないため（no internal processes）、
+            サーバー自身を所属するcgroupの下の "server" へ移動してから、同じ階層に "ffmpeg_jobs" を作成する
+                <サーバーのcgroup>/server                サーバー
+                <サーバーのcgroup>/ffmpeg_jobs/job-xxxx  ffmpeg1つごと
+            書き込み権限とコントローラーの委譲が必要（systemdの場合は Delegate=yes）
+        """
+        try:
+            if not os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers")):
+                self.cgroup_reason = "cgroup v2 が利用できません"
+                return
+
+            with open(PROC_CGROUP_PATH, mode="r", encoding="utf-8") as f:
+                own_path = next(line.strip()[3:] for line in f if line.startswith("0::"))
+            own_dir = os.path.join(CGROUP_ROOT, own_path.lstrip("/"))
+
+            controllers = []
+            if self.cgroup_cpu_max_cores is not None:
+                controllers.append("cpu")
+            if self.cgroup_memory_max_bytes is not None:
+                controllers.append("memory")
+
+            # サーバーのcgroupで使用できるコントローラーか（親から委譲されているか）
+            with open(os.path.join(own_dir, "cgroup.controllers"), mode="r", encoding="utf-8") as f:
+                available = f.read().split()
+            missing = [controller for controller in controllers if controller not in available]
+            if missing:
+                self.cgroup_reason = f"コントローラーが委譲されていません: {', '.join(missing)}"
+                return
+
+            # サーバー（全てのスレッド）を葉のcgroupへ移動する
+            server_dir = os.path.join(own_dir, "server")
+            os.makedirs(server_dir, exist_ok=True)
+            with open(os.path.join(server_dir, "cgroup.procs"), mode="w", encoding="utf-8") as f:
+                f.write(str(os.getpid()))
+
+            # 子のcgroup（server、ffmpeg_jobs）でコントローラーを使用できるようにする
+            enable = " ".join(f"+{controller}" for controller in controllers)
+            try:
+                with open(os.path.join(own_dir, "cgroup.subtree_control"), mode="w", encoding="utf-8") as f:
+                    f.write(enable)
+            except OSError as e:
+                if e.errno == errno.EBUSY:
+                    self.cgroup_reason = f"サーバーのcgroupに他のプロセスが所属しているため、コントローラーを有効にできません: {own_dir}"
+                    return
+                raise
+
+            parent = os.path.join(own_dir, "ffmpeg_jobs")
+            os.makedirs(parent, exist_ok=True)
+            with open(os.path.join(parent, "cgroup.subtree_control"), mode="w", encoding="utf-8") as f:
+                f.write(enable)
+
+            self.cgroup_parent = parent
+            self.cgroup_reason = ""
+
+        except (OSError, StopIteration) as e:
+            self.cgroup_parent = None
+            self.cgroup_reason = f"cgroupを作成できません: {e}"
+
+    def pin_event_loop(self) -> None:
+        """
+        サーバーのイベントループ（呼び出したスレッドと以降に作成されるスレッド）をイベントループ用のCPUに固定する
+            スレッドプールのスレッドを作成する前に呼び出す
+        """
+        if self.loop_cpus:
+            os.sched_setaffinity(0, self.loop_cpus)
+            print(f"イベントループをCPU {self.loop_cpus} に固定しました（ffmpeg用: {self.job_cpus}）")
+
+    def prepare_command(self, command: list[str]) -> tuple[list[str], str | None]:
+        """
+        ffmpegの起動コマンドに制限用のコマンドを付ける
+
+        Args
+            command [list[str]] 起動するコマンド（例: ["ffmpeg", "-i", ...]）
+
+        Return
+            tuple [command, cgroup_path]
+                cgroup_path はffmpeg用に作成したcgroup（作成しなかった場合None）。終了後 release で削除する
+        """
+        prefix: list[str] = []
+
+        if self.taskset_command and self.job_cpus:
+            prefix += [self.taskset_command, "-c", ",".join(str(cpu) for cpu in self.job_cpus)]
+        if self.nice_command and self.niceness:
+            prefix += [self.nice_command, "-n", str(self.niceness)]
+        if self.ionice_command and self.ionice_class is not None:
+            prefix += [self.ionice_command, "-c", str(self.ionice_class)]
+            if self.ionice_class == 2:
+                prefix += ["-n", str(self.ionice_level)]
+
+        cgroup_path = self.create_job_cgroup()
+        if cgroup_path is not None:
+            # シェルで自身をcgroupへ移動してからffmpegに置き換える（起動直後から制限される）
+            prefix = ["sh", "-c", 'echo $$ > "$0" && exec "$@"', os.path.join(cgroup_path, "cgroup.procs")] + prefix
+
+        return prefix + command, cgroup_path
+
+    def apply_to_process(self, pid: int) -> None:
+        """
+        制限用のコマンドがない項目を、起動したプロセスへ直接設定する
+
+        Args
+            pid [int] ffmpegのプロセスID
+        """
+        try:
+            if not self.nice_command and self.niceness:
+                os.setpriority(os.PRIO_PROCESS, pid, self.niceness)
+            if not self.taskset_command and self.job_cpus:
+                os.sched_setaffinity(pid, self.job_cpus)
+        except (OSError, AttributeError):
+            pass
+
+    def create_job_cgroup(self) -> str | None:
+        """
+        ffmpeg1つ分のcgroupを作成し、cpu.max / memory.max を設定する
+
+        Return
+            [str] 作成したcgroupのパス（cgroupを使用しない場合None）
+        """
+        if self.cgroup_parent is None:
+            return None
+
+        cgroup_path = os.path.join(self.cgroup_parent, f"job-{uuid.uuid4().hex[:12]}")
+        try:
+            os.makedirs(cgroup_path)
+            if self.cgroup_cpu_max_cores is not None:
+                period = 100000
+                with open(os.path.join(cgroup_path, "cpu.max"), mode="w", encoding="utf-8") as f:
+                    f.write(f"{int(self.cgroup_cpu_max_cores * period)} {period}")
+            if self.cgroup_memory_max_bytes is not None:
+                with open(os.path.join(cgroup_path, "memory.max"), mode="w", encoding="utf-8") as f:
+                    f.write(str(self.cgroup_memory_max_bytes))
+            return cgroup_path
+
+        except OSError as e:
+            print(f"ffmpeg用のcgroupを作成できません: {e}")
+            self.release(cgroup_path)
+            return None
+
+    def release(self, cgroup_path: str | None) -> None:
+        """
+        ffmpeg終了後にcgroupを削除する（プロセスが残っていない場合のみ削除できる）
+
+        Args
+            cgroup_path [str] prepare_commandで作成したcgroup
+        """
+        if cgroup_path is None:
+            return
+        try:
+            os.rmdir(cgroup_path)
+        except OSError:
+            pass
+
+    def get_policy(self) -> dict:
+        """
+        現在の制御内容（メトリクス用）
+
+        Return
+            [dict] 制御内容
+        """
+        return {
+            "niceness": self.niceness,
+            "niceness_applied_by": "nice" if self.nice_command else "setpriority",
+            "ionice_class": self.ionice_class if self.ionice_command else None,
+            "ionice_level": self.ionice_level if self.ionice_command and self.ionice_class == 2 else None,
+            "loop_cpus": self.loop_cpus,
+            "job_cpus": self.job_cpus,
+            "cgroup": {
+                "enabled": self.cgroup_parent is not None,
+                "path": self.cgroup_parent,
+                "cpu_max_cores": self.cgroup_cpu_max_cores,
+                "memory_max_bytes": self.cgroup_memory_max_bytes,
+                "reason": self.cgroup_reason or None,
+            },
+        }
@@ -0,0 +1,644 @@
+import argparse
+import asyncio
+import bisect
+import hashlib
+import ipaddress
+import json
+import math
+import time
+
+from mmp_protocol import (
+    create_mmp_body,
+    create_mmp_header,
+    parse_mmp_body,
+    parse_mmp_header,
+)
+
+# サーバー1台あたりの仮想ノード数（多いほどサーバーごとの担当範囲の偏りが小さくなる）
+VIRTUAL_NODES = 160
+
+
+def hash_key(key: str) -> int:
+    """文字列をリング上の位置（64bit）に変換する
+
+    Args
+        key [str] キー
+
+    Returns
+        [int] リング上の位置
+    """
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], byteorder="big")
+
+
+def get_route_key(json_data: dict, payload_size: int) -> str | None:
+    """リクエストの振り分けに使用するキーを取得する
+        同じファイルのリクエスト（probe_hash、probe、upload、upload_range）が同じサーバーに届くようにする
+
+    - クライアントが指定したキー（route_key）
+    - コンテンツハッシュ（content_hash、content_ref）
+    - ファイル名 + ファイルサイズ（total_size、ない場合はペイロードサイズ）
+
+    Args
+        json_data [dict] リクエストJSON
+        payload_size [int] ペイロードサイズ
+
+    Returns
+        [str] キー。ファイルを扱わないリクエスト（ping など）の場合None
+    """
+    for field in ("route_key", "content_hash", "content_ref"):
+        if isinstance(json_data.get(field), str) and json_data[field]:
+            return json_data[field]
+
+    file_name = json_data.get("file_name")
+    if isinstance(file_name, str):
+        return f"{file_name}:{json_data.get('total_size', payload_size)}"
+    return None
+
+
+class ConsistentHashRing:
+    """仮想ノードを持つコンシステントハッシュのリング
+
+    - サーバーごとに virtual_nodes 個の位置をリングに配置し、キーの位置から時計回りに最初のサーバーが担当する
+    - サーバーの追加・削除で担当が変わるのは、そのサーバーが担当する（していた）キーだけ
+    """
+
+    def __init__(self, virtual_nodes: int = VIRTUAL_NODES) -> None:
+        """
+        Args
+            virtual_nodes [int] 初期値 = VIRTUAL_NODES サーバー1台あたりの仮想ノード数
+        """
+        self.virtual_nodes = virtual_nodes
+        # リング上の位置（昇順）と、その位置のサーバー
+        self.points: list[int] = []
+        self.owners: list[str] = []
+        self.backends: set[str] = set()
+
+    def add(self, backend: str) -> None:
+        """
+        サーバーを追加する
+
+        Args
+            backend [str] サーバー（"host:port"）
+        """
+        if backend in self.backends:
+            return
+        self.backends.add(backend)
+        for index in range(self.virtual_nodes):
+            point = hash_key(f"{backend}#{index}")
+            position = bisect.bisect(self.points, point)
+            self.points.insert(position, point)
+            self.owners.insert(position, backend)
+
+    def remove(self, backend: str) -> None:
+        """
+        サーバーを削除する
+
+        Args
+            backend [str] サーバー（"host:port"）
+        """
+        if backend not in self.backends:
+            return
+        self.backends.discard(backend)
+        kept = [(point, owner) for point, owner in zip(self.points, self.owners) if owner != backend]
+        self.points = [point for point, _ in kept]
+        self.owners = [owner for _, owner in kept]
+
+    def iterate(self, key: str) -> list[str]:
+        """
+        キーの位置から時計回りにサーバーを並べる（重複なし）
+
+        Args
+            key [str] キー
+
+        Returns
+            [list[str]] 担当の優先順のサーバー
+        """
+        if not self.points:
+            return []
+        start = bisect.bisect(self.points, hash_key(key))
+        ordered: list[str] = []
+        for offset in range(len(self.points)):
+            owner = self.owners[(start + offset) % len(self.points)]
+            if owner not in ordered:
+                ordered.append(owner)
+                if len(ordered) == len(self.backends):
+                    break
+        return ordered
+
+
+class Router:
+    """複数のサーバーの前段で、同じファイルのリクエストを同じサーバーへ振り分けるルーター
+
+    - ヘッダーとJSONだけを受信し、キー（get_route_key）でサーバーを選ぶ
+        サーバーごとのキャッシュ（保持済ファイル、ffprobeの結果、分割アップロード）を再利用できるようにする
+    - サーバーの選択は負荷上限付きのコンシステントハッシュ
+        キーの担当サーバーの接続数が上限（平均の load_factor 倍）に達している場合は、リング上の次のサーバーへ送る
+    - 以降のデータ（ペイロード、レスポンス、途中経過）は chunk_size ずつ中継する（ファイル全体を保持しない）
+    - 接続できないサーバーは down_seconds の間、選択から外す
+    - 同じ接続の2つ目以降のリクエスト（probe_hash の後の upload）は最初のリクエストと同じサーバーへ送る
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8880,
+        backends: list[str] | None = None,
+        load_factor: float = 1.25,
+        chunk_size: int = 64 * 1024,
+        connect_timeout_seconds: float = 5.0,
+        down_seconds: float = 10.0,
+    ) -> None:
+        """
+        Args
+            host [str] 初期値 = "127.0.0.1" 待ち受けるホスト
+            port [int] 初期値 = 8880 待ち受けるポート
+            backends [list[str]] 初期値 = None 振り分け先のサーバー（"host:port"）
+            load_factor [float] 初期値 = 1.25 サーバー1台あたりの接続数の上限（平均に対する倍率、1より大きい値）
+            chunk_size [int] 初期値 = 64KB 中継の分割サイズ
+            connect_timeout_seconds [float] 初期値 = 5.0 サーバーへの接続の制限時間（秒）
+            down_seconds [float] 初期値 = 10.0 接続できないサーバーを選択から外す時間（秒）
+        """
+        self.host = host
+        self.port = port
+        self.header_bytes_int: int = 8
+        self.load_factor = load_factor
+        self.chunk_size = chunk_size
+        self.connect_timeout_seconds = connect_timeout_seconds
+        self.down_seconds = down_seconds
+        # ペイロードを受信せずに応答した接続で、クライアントの切断を待つ時間（秒）
+        self.unread_payload_timeout_seconds: float = 10.0
+
+        self.ring = ConsistentHashRing()
+        # サーバーごとの中継中の接続数
+        self.active: dict[str, int] = {}
+        # サーバーごとの振り分けた接続数（起動から）
+        self.routed: dict[str, int] = {}
+        # 接続できなかったサーバーの再選択までの時刻 {backend: time.monotonic}
+        self.down_until: dict[str, float] = {}
+        # 担当サーバーが負荷上限のため次のサーバーへ送った数
+        self.overflowed: int = 0
+        # 振り分け先を変更できるクライアントのIPアドレス（既定はルーターと同じマシンのみ、空の場合は変更を受け付けない）
+        # 現在の振り分け先の取得は全てのクライアントに許可する
+        self.admin_addresses: set[str] = {"127.0.0.1", "::1"}
+
+        for backend in backends or []:
+            self.add_backend(backend)
+
+    def add_backend(self, backend: str) -> None:
+        """
+        振り分け先のサーバーを追加する
+
+        Args
+            backend [str] サーバー（"host:port"）
+        """
+        self.parse_backend(backend)
+        self.ring.add(backend)
+        self.active.setdefault(backend, 0)
+        self.routed.setdefault(backend, 0)
+        print(f"振り分け先を追加しました: {backend}")
+
+    def remove_backend(self, backend: str) -> None:
+        """
+        振り分け先のサーバーを削除する（中継中の接続は終了まで続ける）
+
+        Args
+            backend [str] サーバー（"host:port"）
+        """
+        self.ring.remove(backend)
+        self.down_until.pop(backend, None)
+        if self.active.get(backend) == 0:
+            self.active.pop(backend, None)
+        print(f"振り分け先を削除しました: {backend}")
+
+    def parse_backend(self, backend: str) -> tuple[str, int]:
+        """
+        "host:port" をホストとポートに分ける
+
+        Raises
+            ValueError 形式が正しくない場合
+        """
+        host, separator, port = backend.rpartition(":")
+        if not separator or not host or not port.isdigit():
+            raise ValueError(f"振り分け先は host:port の形式で指定してください: {backend}")
+        return host, int(port)
+
+    def is_available(self, backend: str) -> bool:
+        """
+        選択できるサーバーか（接続できなかったサーバーは down_seconds の間は選択しない）
+        """
+        return time.monotonic() >= self.down_until.get(backend, 0.0)
+
+    def get_capacity(self) -> int:
+        """
+        サーバー1台あたりの接続数の上限
+            上限 = ceil(load_factor × (中継中の接続数 + 1) / サーバー数)
+        """
+        backends = [backend for backend in self.ring.backends if self.is_available(backend)]
+        total_active = sum(self.active.get(backend, 0) for backend in self.ring.backends)
+        return math.ceil(self.load_factor * (total_active + 1) / max(1, len(backends)))
+
+    def select_backends(self, key: str | None) -> list[str]:
+        """
+        リクエストを送るサーバーを優先順に並べる（先頭に接続できない場合は次のサーバーへ送る）
+
+        Args
+            key [str] 振り分けのキー。Noneの場合は接続数の少ない順
+
+        Returns
+            [list[str]] サーバー（選択できるサーバーがない場合は空）
+        """
+        if key is None:
+            candidates = sorted(self.ring.backends, key=lambda backend: (self.active.get(backend, 0), backend))
+            return [backend for backend in candidates if self.is_available(backend)]
+
+        candidates = [backend for backend in self.ring.iterate(key) if self.is_available(backend)]
+        capacity = self.get_capacity()
+        for index, backend in enumerate(candidates):
+            if self.active.get(backend, 0) < capacity:
+                if index > 0:
+                    self.overflowed += 1
+                return candidates[index:] + candidates[:index]
+        return candidates
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        クライアントからのリクエストのヘッダーとJSONを受信し、サーバーへ中継する
+        """
+        client_address = writer.get_extra_info('peername')
+
+        try:
+            header_bytes = await reader.readexactly(self.header_bytes_int)
+            json_size, media_type_size, payload_size = parse_mmp_header(header_bytes=header_bytes)
+            body_bytes = await reader.readexactly(json_size + media_type_size)
+            json_data, _, _ = parse_mmp_body(
+                body_bytes=body_bytes,
+                json_size=json_size,
+                media_type_size=media_type_size,
+                payload_size=0
+            )
+            request_head = header_bytes + body_bytes
+            if not isinstance(json_data, dict):
+                await self.send_response(writer, {
+                    "status": "error",
+                    "code": "invalid_request",
+                    "description": "リクエストJSONはオブジェクトで指定してください",
+                    "solution": '{"action": ...} の形式で送信してください',
+                })
+                await self.close_with_unread_payload(reader=reader, writer=writer, payload_size=payload_size)
+                return
+
+            match json_data.get("action"):
+                # ルーターの状態確認
+                case "metrics":
+                    await self.send_response(writer, {"status": "success", "operation": "metrics", "metrics": self.get_metrics()})
+                    await self.close_with_unread_payload(reader=reader, writer=writer, payload_size=payload_size)
+
+                # 振り分け先の追加・削除（省略した場合は現在の振り分け先を返す）
+                case "backends":
+                    response_json = self.update_backends(
+                        json_data=json_data,
+                        client_ip=client_address[0] if client_address else None
+                    )
+                    await self.send_response(writer, response_json)
+                    await self.close_with_unread_payload(reader=reader, writer=writer, payload_size=payload_size)
+
+                # 中継するとサーバーからはルーターのアドレスに見えるため、帯域制限の変更は中継しない
+                case "bandwidth" if json_data.get("limits") is not None:
+                    await self.send_response(writer, {
+                        "status": "error",
+                        "code": "forbidden",
+                        "description": "帯域制限の変更はルーター経由では実行できません",
+                        "solution": "サーバーへ直接接続して実行してください",
+                    })
+                    await self.close_with_unread_payload(reader=reader, writer=writer, payload_size=payload_size)
+
+                # ジョブを持つサーバーは分からないため、job_not_found 以外を返すサーバーを探す
+                case "attach":
+                    await self.forward_attach(reader=reader, writer=writer, request_head=request_head)
+
+                case _:
+                    route_key = get_route_key(json_data=json_data, payload_size=payload_size)
+                    candidates = self.select_backends(route_key)
+                    if not await self.forward(reader=reader, writer=writer, request_head=request_head, candidates=candidates):
+                        await self.send_response(writer, {
+                            "status": "error",
+                            "code": "no_backend",
+                            "description": "接続できる振り分け先のサーバーがありません",
+                            "solution": "サーバーを起動するか、backendsアクションで振り分け先を追加してください",
+                        })
+                        await self.close_with_unread_payload(reader=reader, writer=writer, payload_size=payload_size)
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print(f"クライアントが切断しました： {client_address}")
+        except ValueError as e:
+            print(f"不正なリクエストです： {client_address} ({e})")
+
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def connect_backend(self, backend: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter] | None:
+        """
+        サーバーへ接続する（接続できない場合は down_seconds の間、選択から外す）
+
+        Returns
+            tuple [reader, writer] 接続できない場合None
+        """
+        host, port = self.parse_backend(backend)
+        try:
+            return await asyncio.wait_for(asyncio.open_connection(host, port), timeout=self.connect_timeout_seconds)
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"振り分け先に接続できません: {backend} ({e})")
+            self.down_until[backend] = time.monotonic() + self.down_seconds
+            return None
+
+    async def forward(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request_head: bytes, candidates: list[str]) -> bool:
+        """
+        接続できた最初のサーバーへリクエストを中継する
+
+        Args
+            reader [asyncio.StreamReader] クライアントからの受信
+            writer [asyncio.StreamWriter] クライアントへの送信
+            request_head [bytes] 受信済みのヘッダー・JSON・メディアタイプ
+            candidates [list[str]] サーバー（優先順）
+
+        Returns
+            [bool] 中継した場合True。接続できるサーバーがない場合False
+        """
+        for backend in candidates:
+            # 選択と同時に接続数に加える（同時に届いたリクエストが同じサーバーに集中しないようにする）
+            self.acquire_backend(backend)
+            try:
+                connection = await self.connect_backend(backend)
+                if connection is None:
+                    continue
+                self.routed[backend] = self.routed.get(backend, 0) + 1
+                backend_reader, backend_writer = connection
+                backend_writer.write(request_head)
+                await self.splice(reader, writer, backend_reader, backend_writer)
+                return True
+            finally:
+                self.release_backend(backend)
+        return False
+
+    async def forward_attach(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request_head: bytes):
+        """
+        ジョブIDを指定した再受信（attach）を、ジョブを持つサーバーへ中継する
+            サーバーに順に問い合わせ、最初のレスポンスが job_not_found 以外のサーバーの応答を中継する
+
+        Args
+            reader [asyncio.StreamReader] クライアントからの受信
+            writer [asyncio.StreamWriter] クライアントへの送信
+            request_head [bytes] 受信済みのヘッダー・JSON・メディアタイプ
+        """
+        not_found_response: bytes | None = None
+
+        for backend in self.select_backends(None):
+            self.acquire_backend(backend)
+            try:
+                connection = await self.connect_backend(backend)
+                if connection is None:
+                    continue
+                backend_reader, backend_writer = connection
+                try:
+                    backend_writer.write(request_head)
+                    response_header = await backend_reader.readexactly(self.header_bytes_int)
+                    json_size, media_type_size, _ = parse_mmp_header(header_bytes=response_header)
+                    response_body = await backend_reader.readexactly(json_size + media_type_size)
+                    response_json = json.loads(response_body[:json_size].decode("utf-8"))
+                except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+                    backend_writer.close()
+                    continue
+
+                if response_json.get("code") == "job_not_found":
+                    not_found_response = response_header + response_body
+                    backend_writer.close()
+                    continue
+
+                # ジョブを持つサーバーの応答（途中経過・処理結果）を中継する
+                self.routed[backend] = self.routed.get(backend, 0) + 1
+                writer.write(response_header + response_body)
+                await self.splice(reader, writer, backend_reader, backend_writer)
+                return
+            finally:
+                self.release_backend(backend)
+
+        if not_found_response is not None:
+            writer.write(not_found_response)
+            await writer.drain()
+        else:
+            await self.send_response(writer, {
+                "status": "error",
+                "code": "no_backend",
+                "description": "接続できる振り分け先のサーバーがありません",
+                "solution": "サーバーを起動するか、backendsアクションで振り分け先を追加してください",
+            })
+
+    def acquire_backend(self, backend: str) -> None:
+        """
+        サーバーの中継中の接続数を増やす
+        """
+        self.active[backend] = self.active.get(backend, 0) + 1
+
+    def release_backend(self, backend: str) -> None:
+        """
+        サーバーの中継中の接続数を減らす（削除済みのサーバーは接続がなくなった時点で記録を消す）
+        """
+        self.active[backend] -= 1
+        if self.active[backend] == 0 and backend not in self.ring.backends:
+            del self.active[backend]
+
+    async def splice(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        backend_reader: asyncio.StreamReader,
+        backend_writer: asyncio.StreamWriter,
+    ):
+        """
+        クライアントとサーバーの間のデータを双方向に中継する
+            chunk_size ずつ読み込み、送信先の送信待ち（drain）を待ってから次を読み込む
+            クライアントが送信を終えた（切断した）場合はサーバーへ送信終了（FIN）を伝え、サーバーが閉じるまで中継する
+
+        Args
+            reader [asyncio.StreamReader] クライアントからの受信
+            writer [asyncio.StreamWriter] クライアントへの送信
+            backend_reader [asyncio.StreamReader] サーバーからの受信
+            backend_writer [asyncio.StreamWriter] サーバーへの送信
+        """
+        async def pump(source: asyncio.StreamReader, destination: asyncio.StreamWriter, write_eof: bool):
+            while True:
+                chunk = await source.read(self.chunk_size)
+                if not chunk:
+                    break
+                destination.write(chunk)
+                await destination.drain()
+            if write_eof and destination.can_write_eof():
+                destination.write_eof()
+
+        upstream = asyncio.ensure_future(pump(reader, backend_writer, True))
+        downstream = asyncio.ensure_future(pump(backend_reader, writer, False))
+
+        try:
+            pending = {upstream, downstream}
+            while downstream in pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # クライアント側でエラーが発生した場合は中継を終える（正常な送信終了の場合はレスポンスを待つ）
+                if upstream in done and upstream.exception() is not None:
+                    break
+        finally:
+            for task in (upstream, downstream):
+                task.cancel()
+            await asyncio.gather(upstream, downstream, return_exceptions=True)
+
+            backend_writer.close()
+            try:
+                await backend_writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def send_response(self, writer: asyncio.StreamWriter, response_json: dict):
+        """
+        ルーターからのレスポンス（ペイロードなし）をクライアントへ送信する
+        """
+        response_body = create_mmp_body(json_data=response_json, media_type="text/plain", payload=b"")
+        json_size = len(json.dumps(response_json, ensure_ascii=False).encode("utf-8"))
+        writer.write(create_mmp_header(json_size=json_size, media_type_size=len("text/plain"), payload_size=0))
+        writer.write(response_body)
+        await writer.drain()
+
+    async def close_with_unread_payload(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, payload_size: int):
+        """
+        ペイロードを受信せずに応答した接続を閉じる（Server.close_with_unread_payload 参照）
+        """
+        if payload_size <= 0:
+            return
+        if writer.can_write_eof():
+            writer.write_eof()
+
+        async def discard():
+            remaining = payload_size
+            while remaining > 0:
+                chunk = await reader.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+
+        try:
+            await asyncio.wait_for(discard(), timeout=self.unread_payload_timeout_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def update_backends(self, json_data: dict, client_ip: str | None = None) -> dict:
+        """
+        振り分け先を追加・削除する（backendsアクション）
+            変更は admin_addresses のクライアントのみ（他のクライアントは現在の振り分け先の取得のみ）
+
+        Args
+            json_data [dict] リクエストJSON {"add": ["host:port", ...], "remove": ["host:port", ...]}
+            client_ip [str] 初期値 = None クライアントのIPアドレス
+
+        Returns
+            [dict] レスポンスJSON（backendsに変更後の振り分け先）
+        """
+        if (json_data.get("add") or json_data.get("remove")) and not self.is_admin(client_ip):
+            print(f"振り分け先の変更を拒否しました: {client_ip}")
+            return {
+                "status": "error",
+                "code": "forbidden",
+                "description": "このクライアントは振り分け先を変更できません",
+                "solution": "ルーターと同じマシン、またはルーターの --admin で指定したアドレスから実行してください",
+            }
+        try:
+            for backend in json_data.get("add") or []:
+                self.add_backend(str(backend))
+            for backend in json_data.get("remove") or []:
+                self.remove_backend(str(backend))
+        except ValueError as e:
+            return {
+                "status": "error",
+                "code": "invalid_backend",
+                "description": str(e),
+                "solution": "振り分け先は host:port の形式で指定してください",
+            }
+        return {"status": "success", "operation": "backends", "backends": sorted(self.ring.backends)}
+
+    def is_admin(self, client_ip: str | None) -> bool:
+        """
+        振り分け先を変更できるクライアントか（IPv4射影アドレス ::ffff:127.0.0.1 はIPv4として確認する）
+
+        Args
+            client_ip [str] クライアントのIPアドレス
+
+        Return
+            [bool] 変更できる場合True
+        """
+        if client_ip is None:
+            return False
+        try:
+            address = ipaddress.ip_address(client_ip)
+        except ValueError:
+            return False
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        return str(address) in self.admin_addresses
+
+    def get_metrics(self) -> dict:
+        """
+        振り分けの状況（メトリクス用）
+
+        Return
+            [dict] {"backends": {backend: {"active", "routed", "available"}}, "capacity", "overflowed"}
+        """
+        return {
+            "backends": {
+                backend: {
+                    "active": self.active.get(backend, 0),
+                    "routed": self.routed.get(backend, 0),
+                    "available": self.is_available(backend),
+                }
+                for backend in sorted(self.ring.backends)
+            },
+            "capacity": self.get_capacity(),
+            "overflowed": self.overflowed,
+        }
+
+    async def router_start(self):
+        """
+        ルーターを起動する
+        """
+        router: asyncio.Server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        print(f"ルーター起動： ip {self.host} port {self.port} 振り分け先 {sorted(self.ring.backends)}")
+
+        async with router:
+            await router.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VideoCompressorService ルーター（同じファイルのリクエストを同じサーバーへ振り分ける）")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるホスト")
+    parser.add_argument("--port", type=int, default=8880, help="待ち受けるポート")
+    parser.add_argument("--backends", required=True, help="振り分け先のサーバー（カンマ区切り） 例: 127.0.0.1:8888,127.0.0.1:8889")
+    parser.add_argument("--load-factor", type=float, default=1.25, help="サーバー1台あたりの接続数の上限（平均に対する倍率）")
+    parser.add_argument(
+        "--admin",
+        action="append",
+        help="振り分け先を変更できるクライアントのIPアドレス（複数指定可、既定は 127.0.0.1 と ::1）"
+    )
+    args = parser.parse_args()
+
+    router = Router(
+        host=args.host,
+        port=args.port,
+        backends=[backend.strip() for backend in args.backends.split(",") if backend.strip()],
+        load_factor=args.load_factor,
+    )
+    if args.admin is not None:
+        router.admin_addresses = set(args.admin)
+    try:
+        asyncio.run(router.router_start())
+    except KeyboardInterrupt:
+        print("\nルーターを停止しました")
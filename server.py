@@ -1,42 +1,442 @@
+import argparse
 import asyncio
-import datetime
+import hashlib
 import inspect
+import ipaddress
 import json
 import os
+import re
+import shutil
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import ffmpeg_function
+from bandwidth_limiter import BandwidthShaper, ConnectionBandwidth
+from encoder_registry import EncoderRegistry
+from job_journal import JobJournal
+from job_scheduler import JobScheduler, estimate_job_cost
+from memory_budget import MemoryBudget
+from preset_controller import PresetController
+from request_schema import RequestError, validate_request
+from resource_governor import ResourceGovernor
+from staging_janitor import StagingJanitor
 from mmp_protocol import (
+    CHUNKED_PAYLOAD_SIZE,
+    MAX_CHECKSUM_CHUNK_DATA_SIZE,
+    MMP_VERSION,
+    ChunkedPayloadError,
     create_mmp_body,
+    create_mmp_chunk_header,
+    create_mmp_end_chunk,
     create_mmp_header,
     parse_mmp_body,
     parse_mmp_header,
+    read_mmp_chunks,
 )
 
 
 class Server:
-    def __init__(self) -> None:
-        self.host = "127.0.0.1"
-        self.port = 8888
+    def __init__(self, host: str = "127.0.0.1", port: int = 8888, upload_dir: str = "./upload/") -> None:
+        """
+        Args
+            host [str] 初期値 = "127.0.0.1" 待ち受けるホスト
+            port [int] 初期値 = 8888 待ち受けるポート
+            upload_dir [str] 初期値 = "./upload/" 作業領域（同じマシンで複数のサーバーを起動する場合はサーバーごとに分ける）
+        """
+        self.host = host
+        self.port = port
         self.header_bytes_int: int = 8
+        # ファイル受信・送信時の分割サイズ
+        self.chunk_size: int = 1024 * 1024
+
+        # 処理中の途中経過メッセージの送信間隔（秒）
+        self.progress_interval_seconds: float = 1.0
+        # 処理中にクライアントの切断を確認する間隔（秒）
+        self.disconnect_check_interval_seconds: float = 0.5
+
+        # 処理ごとの実行時間の上限（秒）
+        # 上限を超えたffmpegは停止してエラーを返す
+        self.operation_timeouts: dict[str, float] = {
+            "compress": 4 * 60 * 60,
+            "resize": 4 * 60 * 60,
+            "aspect": 4 * 60 * 60,
+            "convert": 60 * 60,
+            "trim": 30 * 60,
+            # aspect・resize・compressを1回の実行にまとめるため、compressと同じ上限にする
+            "pipeline": 4 * 60 * 60,
+        }
+
+        # 見積もりコストの小さいジョブから実行するスケジューラー
+        # 同時に実行するffmpegの数を制限し、待ち時間に応じて大きなジョブの優先度を上げる
+        self.job_scheduler = JobScheduler(
+            max_concurrent_jobs=max(1, (os.cpu_count() or 2) // 2),
+            aging_seconds=60.0,
+            max_wait_seconds=600.0
+        )
+
+        # 負荷に応じたエンコードの速度段階（libx264 の -preset など）の選択
+        # 待ちジョブが増えた場合やエンコードが遅い場合は速い設定（出力サイズは大きくなる）でジョブを開始する
+        # パラメーターに "quality_over_speed": true を指定したジョブは常に通常の設定
+        self.preset_controller = PresetController(
+            job_scheduler=self.job_scheduler,
+            max_level=3,
+            raise_queue_per_slot=1.0,
+            lower_queue_per_slot=0.25,
+            slow_speed=1.0,
+            hold_seconds=30.0
+        )
+
+        # ffmpegの子プロセスのリソース制御
+        # nice値・I/O優先度を下げ、イベントループとは別のCPUで動かす（cgroup v2 が使える場合は上限も設定）
+        self.resource_governor = ResourceGovernor(
+            niceness=10,
+            ionice_class=2,
+            ionice_level=7,
+            loop_cpu_count=None,
+            cgroup_cpu_max_cores=None,
+            cgroup_memory_max_bytes=None
+        )
+        ffmpeg_function.set_resource_governor(self.resource_governor)
+
+        # ffmpegが対応しているエンコーダー・フィルターの一覧（起動時に取得）
+        # 処理ごとに対応しているエンコーダーを選び、対応していない処理はファイルの受信前に拒否する
+        self.encoder_registry = EncoderRegistry()
+        ffmpeg_function.set_encoder_registry(self.encoder_registry)
+
+        # 送受信の帯域制限（バイト/秒、Noneの場合は制限しない）
+        # 一部のクライアントが帯域とディスク書込を占有しないよう、接続ごと・IPアドレスごと・サーバー全体で制限する
+        # 実行中は bandwidth アクションで変更できる
+        # 帯域制限を変更できるクライアントのIPアドレス（既定はサーバーと同じマシンのみ、空の場合は変更を受け付けない）
+        # 現在の設定の取得は全てのクライアントに許可する
+        self.bandwidth_admin_addresses: set[str] = {"127.0.0.1", "::1"}
+        self.bandwidth_shaper = BandwidthShaper(limits={
+            "global": {"receive": None, "send": None},
+            "per_ip": {"receive": None, "send": None},
+            "per_connection": {"receive": None, "send": None},
+        })
+
+        # サーバー全体で保持する送受信データの上限（バイト、Noneの場合は制限しない）
+        # 送受信中の分割データ（先読み分を含む）と接続ごとのバッファの合計が上限を超える場合、
+        # 新しい送受信はメモリが空くまで読み込みを待つ（待機中はTCPによりクライアントの送信が止まる）
+        self.memory_budget = MemoryBudget(max_bytes=512 * 1024 * 1024)
+        # 接続ごとのバッファの見込み（StreamReaderは64KiBの2倍まで受信し、送信は64KiBを超えるとdrainで待機する）
+        self.connection_buffer_bytes: int = 3 * 64 * 1024
+
+        # ファイル操作（書込・読込・削除）専用のスレッドプール
+        # スレッド数を制限し、ディスクへの同時アクセスが増えすぎないようにする
+        self.io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="server_io")
 
         # 動画ファイルのアップロード先
-        self.upload_dir = "./upload/"
+        self.upload_dir = upload_dir
         # 動画ファイルのアップロード先の作成（存在する場合は何もしない）
         os.makedirs(self.upload_dir, exist_ok=True)
 
-        # マイクロ秒まで含んだ値
-        # 例: 20231027_153045_123456
-        # 一時保存ファイルに連結させて一意性を保つ
-        now = datetime.datetime.now()
-        self.time_stamp_str = now.strftime("%Y%m%d_%H%M%S_%f")
+        # ジョブごとの作業ディレクトリの作成先
+        # 入力・中間ファイル・出力をジョブIDのディレクトリにまとめ、同時に処理しても上書きされないようにする
+        self.jobs_dir = os.path.join(self.upload_dir, "jobs")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        # 削除する作業ディレクトリの移動先
+        # 作業ディレクトリを一度で（rename）移動してから中身を削除する
+        self.trash_dir = os.path.join(self.upload_dir, "trash")
+        os.makedirs(self.trash_dir, exist_ok=True)
+
+        # 内容ハッシュで保持するアップロード済ファイルの保存先
+        # 同一内容のファイルの再アップロードを省略するために使用
+        self.content_store_dir = os.path.join(self.upload_dir, "store")
+        os.makedirs(self.content_store_dir, exist_ok=True)
+        # 保持するファイルの合計サイズ上限（バイト）
+        self.content_store_max_bytes: int = 20 * 1024 ** 3
+        # {content_hash: file_path} 使用順に並ぶ
+        self.content_store: OrderedDict[str, str] = OrderedDict()
+        # {content_hash: 参照中の接続数}
+        self.content_store_pins: dict[str, int] = {}
+
+        # ペイロードを受信せずに応答した後、クライアントの切断を待つ時間の上限（秒）
+        self.unread_payload_timeout_seconds: float = 10.0
+
+        # ffprobeの結果のキャッシュ {content_hash: probe} 使用順に並ぶ
+        # probeアクションと処理で同じファイルを再度ffprobeしないようにする
+        self.probe_cache: OrderedDict[str, dict] = OrderedDict()
+        self.probe_cache_max_entries: int = 1024
+        # probeアクションで受け付けるデータ（ファイルの一部）の上限（バイト）
+        self.probe_max_payload_bytes: int = 64 * 1024 * 1024
+
+        # ストリーミング（処理中に出力を送信）できる出力形式
+        # MP4はフラグメント形式で出力する
+        self.streamable_extensions: tuple[str, ...] = (".mp4", ".mp3", ".webm")
+
+        # 分割アップロード（複数接続で範囲ごとに送信）の受信状況 {upload_id: 受信状況}
+        self.striped_uploads: dict[str, dict] = {}
+        # 分割アップロードの待ち時間の上限（秒）
+        # 全範囲が届かない場合や、処理要求（upload）が届かない場合は破棄する
+        self.striped_upload_timeout_seconds: float = 10 * 60
+
+        # ジョブの状態の記録（入力・パラメーター・状態の変化を追記し、fsyncする）
+        # サーバーの再起動後に未完了のジョブを再開し、クライアントがジョブIDで結果を受信（attach）できるようにする
+        self.job_journal = JobJournal(path=os.path.join(self.upload_dir, "journal.jsonl"), executor=self.io_executor)
+        # 再起動後に再開したジョブ {job_id: 処理の完了時にsetするEvent}
+        self.detached_jobs: dict[str, asyncio.Event] = {}
+        # 再開したジョブのタスク（完了まで参照を保持する）
+        self.detached_tasks: set[asyncio.Task] = set()
+        # 結果を送信中のジョブID（同じ結果を複数の接続へ同時に送信しない）
+        self.attached_jobs: set[str] = set()
+
+        # 同じ内容・処理・パラメーターの処理中のジョブを共有するか
+        # 再試行や複数人による同じ依頼は、ffmpegを新たに起動せず処理中のジョブの結果を受け取る
+        self.coalesce_identical_jobs: bool = True
+        # 処理中の共有ジョブ {(content_hash, operation, パラメーター): {"task", "workspace_dir", "subscribers", "started"}}
+        self.inflight_jobs: dict[tuple[str, str, str], dict] = {}
+        # 処理中のジョブに合流したリクエスト数（起動から）
+        self.coalesced_requests: int = 0
+        # 受信されない処理結果（completed / failed）を保持する時間（秒）。過ぎたものは削除の対象になる
+        self.job_result_ttl_seconds: float = 24 * 60 * 60
+
+        # 使用中の作業ディレクトリ（作成から削除まで）
+        self.active_staging_paths: set[str] = set()
+        # 作業領域に残ったファイルを定期的に削除する
+        # 切断・例外・停止で削除されなかったもののうち、使用されていないものを期限後に削除速度を制限して削除する
+        self.staging_janitor = StagingJanitor(
+            directories=[self.upload_dir, self.jobs_dir, self.trash_dir, self.content_store_dir],
+            get_owned_paths=self.get_staging_owned_paths,
+            ttl_seconds=60 * 60,
+            interval_seconds=5 * 60,
+            unlink_bytes_per_second=256 * 1024 * 1024,
+            executor=self.io_executor
+        )
 
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         """
+        クライアントからのリクエストを受信して処理する
 
+        probe_hashは事前確認のため、応答後も同じ接続で次のリクエストを待つ
+        アップロードファイルはメモリに全て載せず、分割して受信しながら保存する
         """
         client_address = writer.get_extra_info('peername')
         print(f"クライアント接続： {client_address}")
 
+        # 一時保存ファイル・作業ディレクトリのパスリスト
+        # 一時ファイルの削除処理で使用
+        tmp_files_path = []
+
+        # この接続で参照予定のコンテンツハッシュ
+        # 処理完了まで削除されないように固定する
+        pinned_hashes: list[str] = []
+
+        # この接続で結果を送信するジョブID（attach）
+        attached_job_ids: list[str] = []
+
+        # この接続の帯域制限
+        bandwidth = self.bandwidth_shaper.open_connection(ip=client_address[0] if client_address else "unknown")
+
+        # この接続のバッファをメモリ使用量に加算
+        self.memory_budget.charge(self.connection_buffer_bytes)
+
+        try:
+            while True:
+                # ヘッダー、JSON、メディアタイプまでを受信（ペイロードは未受信）
+                json_data, media_type, payload_size = await self.receive_request_head(reader=reader)
+
+                # 事前確認（同一内容のファイルを保持しているか）
+                if isinstance(json_data, dict) and json_data.get("action") == "probe_hash":
+                    try:
+                        json_data = validate_request(json_data)
+                    except RequestError:
+                        # 不正な指定は他のactionと同様に、下の確認で応答して接続を閉じる
+                        break
+                    await self.discard_payload(reader=reader, payload_size=payload_size)
+                    response_json, response_media_type, response_payload = self.probe_hash(
+                        json_data=json_data,
+                        pinned_hashes=pinned_hashes
+                    )
+                    # MMP v2 に対応していることをクライアントへ通知する（以降のアップロードを分割形式で送信できる）
+                    if self.get_response_framing(json_data=json_data)[0]:
+                        response_json["mmp_version"] = MMP_VERSION
+                    await self.send_response(writer, response_json, response_media_type, response_payload)
+                    continue
+
+                break
+
+            # 処理結果のファイル（ファイルを返さない場合はNone）
+            response_file_path: str | None = None
+            # 受信せずに応答したペイロードのサイズ
+            unread_payload_size = 0
+
+            # ペイロードを受信する前にリクエストJSONを確認する
+            # 不正な指定はペイロードを受信せずに応答し、接続を閉じる
+            try:
+                json_data = validate_request(json_data)
+                # 分割形式のペイロードはサイズ・位置を指定して受信する処理（probe、upload_range）には使用できない
+                if payload_size == CHUNKED_PAYLOAD_SIZE and json_data["action"] in ("probe", "upload_range"):
+                    raise RequestError(
+                        code="invalid_request",
+                        description=f"{json_data['action']}のペイロードは分割形式で送信できません",
+                        solution="ヘッダーにペイロードサイズを指定して送信してください"
+                    )
+                rejection = self.validate_upload_request(json_data=json_data) if json_data["action"] == "upload" else None
+            except RequestError as e:
+                print(f"リクエストを拒否しました: {e.code} {e.description}")
+                rejection = self.create_error_response(code=e.code, description=e.description, solution=e.solution)
+
+            if rejection is not None:
+                response_json, response_media_type, _ = rejection
+                unread_payload_size = payload_size
+
+            else:
+                # # クライアントからのデータを確認して応答データの作成を行う
+                match json_data.get("action"):
+                    # 疎通時
+                    case "ping":
+                        await self.discard_payload(reader=reader, payload_size=payload_size)
+                        response_json, response_media_type, _ = self.create_success_response(operation="ping")
+
+                    # サーバーの状態確認
+                    case "metrics":
+                        await self.discard_payload(reader=reader, payload_size=payload_size)
+                        response_json, response_media_type, _ = self.create_success_response(operation="metrics")
+                        response_json["metrics"] = self.get_metrics()
+
+                    # 帯域制限の変更（limitsを省略した場合は現在の設定を返す）
+                    case "bandwidth":
+                        await self.discard_payload(reader=reader, payload_size=payload_size)
+                        response_json, response_media_type, _ = self.update_bandwidth_limits(
+                            json_data=json_data,
+                            client_ip=client_address[0] if client_address else None
+                        )
+
+                    # 動画の情報（ffprobe）の取得（ファイルの一部のみ受信）
+                    case "probe":
+                        response_json, response_media_type, _ = await self.handle_probe(
+                            json_data=json_data,
+                            reader=reader,
+                            payload_size=payload_size,
+                            tmp_files_path=tmp_files_path,
+                            bandwidth=bandwidth
+                        )
+
+                    # 分割アップロードの範囲データ
+                    case "upload_range":
+                        response_json, response_media_type, _ = await self.receive_upload_range(
+                            json_data=json_data,
+                            reader=reader,
+                            payload_size=payload_size,
+                            bandwidth=bandwidth
+                        )
+
+                    # ファイルアップロード時
+                    case "upload":
+                        try:
+                            response_json, response_media_type, response_file_path = await self.handle_upload(
+                                json_data=json_data,
+                                reader=reader,
+                                writer=writer,
+                                payload_size=payload_size,
+                                tmp_files_path=tmp_files_path,
+                                bandwidth=bandwidth,
+                                pinned_hashes=pinned_hashes
+                            )
+                        except ChunkedPayloadError as e:
+                            # 破損したペイロードは処理せずに応答し、残りを読み捨てて接続を閉じる
+                            print(f"分割形式のペイロードが正しくありません: {e}")
+                            response_json, response_media_type, _ = self.create_error_response(
+                                code="corrupted_payload",
+                                description=f"受信したファイルが破損しています: {e}",
+                                solution="通信環境を確認し、再度アップロードしてください"
+                            )
+                            unread_payload_size = CHUNKED_PAYLOAD_SIZE
+
+                    # ジョブIDを指定して処理結果を受信（切断後・サーバーの再起動後の再受信）
+                    case "attach":
+                        await self.discard_payload(reader=reader, payload_size=payload_size)
+                        response_json, response_media_type, response_file_path = await self.handle_attach(
+                            json_data=json_data,
+                            reader=reader,
+                            tmp_files_path=tmp_files_path,
+                            attached_job_ids=attached_job_ids
+                        )
+
+                    case _:
+                        response_json, response_media_type, _ = self.create_error_response(
+                            code="unknown_action",
+                            description=f"不明なactionです: {json_data.get('action')}",
+                            solution="actionにはping、probe_hash、probe、metrics、bandwidth、upload、upload_range、attachのいずれかを指定してください"
+                        )
+
+            # 処理結果を記録済みのジョブ（送信後に送信済みとして記録する）
+            delivering_job_id: str | None = None
+            if rejection is None and json_data.get("action") in ("upload", "attach") and isinstance(response_json.get("job_id"), str):
+                job = self.job_journal.get(response_json["job_id"])
+                if job is not None and job["state"] in ("completed", "failed"):
+                    delivering_job_id = response_json["job_id"]
+
+            # MMP v2 を指定したクライアントには、ファイルをCRC32付きの分割形式で送信できる
+            chunked_response, checksum_response = self.get_response_framing(json_data=json_data)
+            if chunked_response:
+                response_json["mmp_version"] = MMP_VERSION
+
+            # クライアントに送信
+            try:
+                await self.send_file_response(
+                    writer,
+                    response_json,
+                    response_media_type,
+                    response_file_path,
+                    bandwidth=bandwidth,
+                    checksum=checksum_response
+                )
+            except ConnectionError:
+                # 送信できなかった処理結果は、ジョブIDで再受信できるよう作業ディレクトリを残す
+                if delivering_job_id is not None:
+                    self.retain_job_workspace(job_id=delivering_job_id, tmp_files_path=tmp_files_path)
+                raise
+            if delivering_job_id is not None:
+                await self.job_journal.record(delivering_job_id, "delivered")
+
+            # 未受信のペイロードがある場合は、レスポンスが届くようにしてから閉じる
+            if unread_payload_size > 0:
+                await self.close_with_unread_payload(reader=reader, writer=writer, payload_size=unread_payload_size)
+
+            # 接続を閉じる
+            writer.close()
+            await writer.wait_closed()
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print(f"クライアントが切断しました： {client_address}")
+            # 送信側だけを閉じたクライアント（ルーターの中継など）は、サーバーが閉じるまで待つ
+            writer.close()
+
+        except ChunkedPayloadError as e:
+            # 読み捨てるペイロード（分割形式）が破損している場合は応答せずに閉じる
+            print(f"分割形式のペイロードが正しくないため接続を閉じます： {client_address} ({e})")
+            writer.close()
+
+        finally:
+            self.bandwidth_shaper.close_connection(bandwidth)
+            self.memory_budget.uncharge(self.connection_buffer_bytes)
+
+            # 参照の固定を解除
+            for content_hash in pinned_hashes:
+                self.unpin_content(content_hash)
+            for job_id in attached_job_ids:
+                self.attached_jobs.discard(job_id)
+
+            # 一時保存ファイルの削除
+            await self.clean_up_files(tmp_files_path=tmp_files_path)
+
+    async def receive_request_head(self, reader: asyncio.StreamReader) -> tuple[dict | None, str, int]:
+        """
+        ヘッダー、JSON、メディアタイプを受信して解析する
+            ペイロードは受信しない（呼び出し側で読み込む）
+
+        Args
+            reader [asyncio.StreamReader] 受信元
+
+        Return
+            tuple [json_data, media_type, payload_size]
+                json_data はJSONを解析できない場合None（ペイロードを受信せずに拒否する）
+        """
         header_bytes = await reader.readexactly(self.header_bytes_int)
         print(f"ヘッダー受信 {len(header_bytes)}バイト")
 
@@ -44,232 +444,221 @@ class Server:
         json_size, media_type_size, payload_size = parse_mmp_header(header_bytes=header_bytes)
         print(f"解析結果: JSON={json_size}B, media_type={media_type_size}B, payload={payload_size}B")
 
-        # ボディデータのサイズを計算
-        body_size = json_size + media_type_size + payload_size
-        body_bytes = await reader.readexactly(body_size)
-        print(f"ボディデータ受信: {len(body_bytes)}バイト")
+        # JSONとメディアタイプを受信して解析
+        body_bytes = await reader.readexactly(json_size + media_type_size)
+        try:
+            json_data, media_type, _ = parse_mmp_body(
+                body_bytes=body_bytes,
+                json_size=json_size,
+                media_type_size=media_type_size,
+                payload_size=0
+            )
+        except ValueError as e:
+            # JSON・メディアタイプの形式が正しくない（UnicodeDecodeError、JSONDecodeErrorを含む）
+            print(f"リクエストを解析できません: {e}")
+            return None, "", payload_size
+
+        return json_data, media_type, payload_size
+
+    async def run_io(self, func, *args):
+        """
+        ファイル操作をI/O専用のスレッドプールで実行する
+            イベントループ（他の接続の送受信）を止めないため、ファイル操作は全てここを通す
 
-        # ボディデータを解析
-        json_data, media_type, payload = parse_mmp_body(
-            body_bytes=body_bytes,
-            json_size=json_size,
-            media_type_size=media_type_size,
-            payload_size=payload_size
-        )
-        # デバッグ
-        # print(f"JSON: {json_data}")
-        # print(f"media_type: {media_type}")
-        # print(f"payload: {payload}")
+        Args
+            func 実行する関数
+            args 関数の位置引数
 
-        # 一時保存ファイルのパスリスト
-        # 一時ファイルの削除処理で使用
-        tmp_files_path = []
+        Return
+            funcの戻り値
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.io_executor, func, *args)
+
+    async def receive_payload_to_file(self, reader: asyncio.StreamReader, file_path: str, payload_size: int, bandwidth: ConnectionBandwidth | None = None) -> str:
+        """
+        ペイロードを分割して受信しながらファイルへ書き込む
+            書き込みとハッシュ計算はI/Oスレッドで行い、その間に次の分割データを受信する
+            帯域制限を超えた場合は次の読み込みを待たせる（受信バッファが埋まりクライアントの送信が止まる）
 
-        # # クライアントからのデータを確認して応答データの作成を行う
-        match json_data.get("action"):
-            # 疎通時
-            case "ping":
-                    response_json, response_media_type, response_payload = self.create_success_response(operation="ping")
+        Args
+            reader [asyncio.StreamReader] 受信元
+            file_path [str] 保存先
+            payload_size [int] ペイロードサイズ（CHUNKED_PAYLOAD_SIZE の場合は分割形式で終端まで受信する）
+            bandwidth [ConnectionBandwidth] 初期値 = None 接続の帯域制限
 
-            # ファイルアップロード時
-            case "upload":
-                # ファイル名取得
-                upload_file_name: str | None = json_data.get("file_name")
+        Return
+            [str] 受信したファイル内容のハッシュ値（SHA-256）
 
-                # ファイル名が存在しない場合はエラー内容をレスポンス
-                if upload_file_name is None:
-                    response_json, response_media_type, response_payload = self.create_error_response()
-                else:
-                    # ファイルの保存先のフルパスを作成
-                    upload_file_path = os.path.join(self.upload_dir, upload_file_name)
+        Raises
+            ChunkedPayloadError 分割形式のCRC32が一致しない場合など
+        """
+        sha256 = hashlib.sha256()
+        chunked = payload_size == CHUNKED_PAYLOAD_SIZE
+
+        async def read_payload():
+            if chunked:
+                async for chunk in read_mmp_chunks(reader, read_size=self.chunk_size):
+                    yield chunk
+                return
+            remaining = payload_size
+            while remaining > 0:
+                chunk = await reader.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(partial=b"", expected=remaining)
+                remaining -= len(chunk)
+                yield chunk
+
+        def write_chunk(f, chunk: bytes):
+            f.write(chunk)
+            sha256.update(chunk)
+
+        f = await self.run_io(open, file_path, "wb")
+        # 書き込み中のタスク（同時に保持する分割データは最大2つ）
+        pending_write: asyncio.Future | None = None
+        try:
+            # 分割データ2つ分のメモリを確保してから受信する（確保できるまで読み込まない）
+            # 分割形式ではCRC32を照合する分割データ全体も保持する
+            reserved_bytes = self.chunk_size * 2 + MAX_CHECKSUM_CHUNK_DATA_SIZE if chunked else min(self.chunk_size, payload_size) * 2
+            async with self.memory_budget.reserve(reserved_bytes):
+                async for chunk in read_payload():
+                    # 前の書き込みの完了を待ってから次を書き込む
+                    if pending_write is not None:
+                        await pending_write
+                    pending_write = asyncio.ensure_future(self.run_io(write_chunk, f, chunk))
+
+                    # 帯域制限（書き込み中に待機し、待機中は受信しない）
+                    if bandwidth is not None:
+                        await bandwidth.throttle("receive", len(chunk))
+
+                if pending_write is not None:
+                    await pending_write
+
+        finally:
+            # 受信エラー時も書き込みの終了を待ってから閉じる
+            if pending_write is not None and not pending_write.done():
+                await asyncio.wait({pending_write})
+            await self.run_io(f.close)
+
+        print(f"ファイル保存完了: {file_path}")
+
+        return sha256.hexdigest()
+
+    async def send_response(self, writer: asyncio.StreamWriter, response_json: dict, response_media_type: str, response_payload: bytes):
+        """
+        MMPレスポンスをクライアントへ送信
 
-                    # ファイルパスの保存
-                    tmp_files_path.append(upload_file_path)
+        Args
+            writer [asyncio.StreamWriter] 送信先
+            response_json [dict] レスポンスJSON
+            response_media_type [str] メディアタイプ
+            response_payload [bytes] ペイロード
+        """
+        # MMPプロトコルのヘッダー、ボディデータ作成
+        response_header, response_body = self.create_response_message(
+            response_json=response_json,
+            response_media_type=response_media_type,
+            response_payload=response_payload
+        )
 
-                    try:
-                        # ファイルをバイナリデータで保存
-                        with open(upload_file_path, "wb") as f:
-                            f.write(payload)
-                        print(f"ファイル保存完了: {upload_file_path}")
-
-                        # 指示を確認して圧縮、音声抽出...などの処理を行う
-                        match json_data.get("operation"):
-                            case "compress": # 圧縮
-                                # 出力ファイルパスの作成
-                                output_file_name = f"compressed_video_{self.time_stamp_str}.mp4"
-                                output_file_path = os.path.join(self.upload_dir, output_file_name)
-
-                                # ファイルパスの保存
-                                tmp_files_path.append(output_file_path)
-
-                                # 別スレッドで圧縮を実行
-                                success = await asyncio.to_thread(
-                                    ffmpeg_function.compress_video_file,
-                                    upload_file_path, # input_path
-                                    output_file_path  # output_path
-                                )
-
-                                # 結果を確認
-                                if success:
-                                    # 圧縮済ファイルを読み込んでレスポンスに含める
-                                    with open(output_file_path, mode="rb") as f:
-                                        # レスポンス作成
-                                        response_json, response_media_type, response_payload = self.create_success_response(operation="compress", media_type="video/mp4", payload=f.read())
-                                        print(f"{upload_file_name} の圧縮に成功")
-                                else:
-                                    # エラー内容レスポンス
-                                    response_json, response_media_type, response_payload = self.create_error_response()
-
-                            case "resize": # 解像度変更
-                                # 出力ファイルパスの作成
-                                output_file_name = f"resize_video_{self.time_stamp_str}.mp4"
-                                output_file_path = os.path.join(self.upload_dir, output_file_name)
-
-                                # パラメーターの内容確認
-                                parameters = json_data.get("parameters")
-                                if parameters is not None:
-
-                                    # ファイルパスの保存
-                                    tmp_files_path.append(output_file_path)
-
-                                    # 別スレッドで解像度変更を実行
-                                    success = await asyncio.to_thread(
-                                        ffmpeg_function.resize_video_resolution,
-                                        upload_file_path,   # input_path
-                                        parameters["size"], # target_format
-                                        output_file_path    # output_path
-                                    )
-
-                                    # 結果を確認
-                                    if success:
-                                        # 処理されたファイルデータをレスポンスに含める
-                                        with open(output_file_path, mode="rb") as f:
-                                            # レスポンス作成
-                                            response_json, response_media_type, response_payload = self.create_success_response(operation="resize", media_type="video/mp4", payload=f.read())
-                                            print(f"{upload_file_name} の解像度変更に成功")
-                                    else:
-                                        # エラー内容レスポンス
-                                        response_json, response_media_type, response_payload = self.create_error_response()
-
-                            case "aspect": # アスペクト比変更
-                                # 出力ファイルパスの作成
-                                output_file_name = f"change_aspect_video_{self.time_stamp_str}.mp4"
-                                output_file_path = os.path.join(self.upload_dir, output_file_name)
-
-                                # パラメーターの内容確認
-                                parameters = json_data.get("parameters")
-                                if parameters is not None:
-
-                                    # ファイルパスの保存
-                                    tmp_files_path.append(output_file_path)
-
-                                    # 別スレッドでアスペクト比変更を実行
-                                    success = await asyncio.to_thread(
-                                        ffmpeg_function.change_video_aspect_ratio,
-                                        upload_file_path,       # input_path
-                                        parameters["ratio"],    # aspect_ratio
-                                        output_file_path,       # output_path
-                                        parameters["fit_mode"]  # fit_mode
-                                    )
-
-                                    # 結果を確認
-                                    if success:
-                                        # 処理されたファイルデータをレスポンスに含める
-                                        with open(output_file_path, mode="rb") as f:
-                                            # レスポンス作成
-                                            response_json, response_media_type, response_payload = self.create_success_response(operation="aspect", media_type="video/mp4", payload=f.read())
-                                            print(f"{upload_file_name} のアスペクト比変更に成功")
-                                    else:
-                                        # エラー内容レスポンス
-                                        response_json, response_media_type, response_payload = self.create_error_response()
-
-                            case "convert": # コンバート
-                                # 出力ファイルパスの作成
-                                output_file_name = f"converted_video_{self.time_stamp_str}.mp3"
-                                output_file_path = os.path.join(self.upload_dir, output_file_name)
-
-                                # ファイルパスの保存
-                                tmp_files_path.append(output_file_path)
-
-                                # 別スレッドでコンバートを実行
-                                success = await asyncio.to_thread(
-                                    ffmpeg_function.convert_to_mp3file,
-                                    upload_file_path, # input_path
-                                    output_file_path, # output_path
-                                )
-
-                                # 結果を確認
-                                if success:
-                                    # コンバート済ファイルを読み込んでレスポンスに含める
-                                    with open(output_file_path, mode="rb") as f:
-                                        # レスポンス作成
-                                        response_json, response_media_type, response_payload = self.create_success_response(operation="convert", media_type="video/mp3", payload=f.read())
-                                        print(f"{upload_file_name} をmp3形式へコンバートに成功")
-                                else:
-                                    # エラー内容レスポンス
-                                    response_json, response_media_type, response_payload = self.create_error_response()
-
-                            case "trim": # gif or webmの作成
-                                # パラメーターの内容確認
-                                parameters: str | None = json_data.get("parameters")
-
-                                # パラメーターの内容確認
-                                if parameters is not None:
-                                    # 出力ファイルパスの作成
-                                    if parameters["type"] == "gif":
-                                        output_file_name = f"changed_gif_video_{self.time_stamp_str}.gif"
-                                        output_file_path = os.path.join(self.upload_dir, output_file_name)
-                                    elif parameters["type"] == "webm":
-                                        output_file_name = f"changed_webm_video_{self.time_stamp_str}.webm"
-                                        output_file_path = os.path.join(self.upload_dir, output_file_name)
-
-                                    # ファイルパスの保存
-                                    tmp_files_path.append(output_file_path)
-
-                                    # 別スレッドでgif or webmの作成を実行
-                                    success = await asyncio.to_thread(
-                                        ffmpeg_function.trim_video_to_gif_webm,
-                                        upload_file_path,          # input_path
-                                        parameters["start_time"],  # start_time
-                                        parameters["duration"],    # duration
-                                        output_file_path,          # output_path
-                                        parameters["type"]         # output_format
-                                    )
-
-                                    # 結果を確認
-                                    if success:
-                                        # コンバート済ファイルを読み込んでレスポンスに含める
-                                        with open(output_file_path, mode="rb") as f:
-                                            # レスポンス作成
-                                            response_json, response_media_type, response_payload = self.create_success_response(
-                                                operation="trim",
-                                                media_type=f"video/{parameters["type"]}",
-                                                payload=f.read()
-                                            )
-                                            print(f"{upload_file_name} を{parameters["type"]}形式へコンバートに成功")
-                                    else:
-                                        # エラー内容レスポンス
-                                        response_json, response_media_type, response_payload = self.create_error_response()
-                                else:
-                                    # エラー内容レスポンス
-                                    response_json, response_media_type, response_payload = self.create_error_response()
-
-
-                    except Exception as e:
-                        print(f"{inspect.currentframe().f_code.co_name}関数でエラー発生") # type: ignore
-                        print(f"エラー内容: {e}")
-                        # エラー内容レスポンス
-                        response_json, response_media_type, response_payload = self.create_error_response()
+        writer.write(response_header)
+        writer.write(response_body)
+        await writer.drain()
+        print("クライアントに送信完了")
+
+    async def send_file_response(
+        self,
+        writer: asyncio.StreamWriter,
+        response_json: dict,
+        response_media_type: str,
+        file_path: str | None,
+        bandwidth: ConnectionBandwidth | None = None,
+        checksum: bool = False,
+    ):
+        """
+        ファイルをペイロードとしたMMPレスポンスをクライアントへ送信
+            ファイルは分割してI/Oスレッドで読み込み、送信中に次の分割データを読み込む
+
+        Args
+            writer [asyncio.StreamWriter] 送信先
+            response_json [dict] レスポンスJSON
+            response_media_type [str] メディアタイプ
+            file_path [str] ペイロードにするファイル（Noneの場合はペイロードなし）
+            bandwidth [ConnectionBandwidth] 初期値 = None 接続の帯域制限
+            checksum [bool] 初期値 = False 分割形式（MMP v2）で分割データごとにCRC32を付けて送信する場合True
+        """
+        if file_path is None:
+            await self.send_response(writer, response_json, response_media_type, b"")
+            return
+
+        payload_size = CHUNKED_PAYLOAD_SIZE if checksum else await self.run_io(os.path.getsize, file_path)
+        # ペイロード全体のCRC32（終端で送信する）
+        payload_crc32 = 0
+
+        # ペイロードを除いたヘッダー、ボディデータ作成
+        response_header, response_body = self.create_response_message(
+            response_json=response_json,
+            response_media_type=response_media_type,
+            response_payload=b"",
+            payload_size=payload_size
+        )
+        writer.write(response_header)
+        writer.write(response_body)
+
+        f = await self.run_io(open, file_path, "rb")
+        try:
+            # 送信中と先読みの分割データ2つ分のメモリを確保してから読み込む
+            async with self.memory_budget.reserve(self.chunk_size * 2):
+                read_task = asyncio.ensure_future(self.run_io(f.read, self.chunk_size))
+                try:
+                    while True:
+                        chunk = await read_task
+                        if not chunk:
+                            break
+                        # 送信している間に次の分割データを読み込む
+                        read_task = asyncio.ensure_future(self.run_io(f.read, self.chunk_size))
+                        if checksum:
+                            writer.write(create_mmp_chunk_header(chunk, checksum=True))
+                            payload_crc32 = zlib.crc32(chunk, payload_crc32)
+                        writer.write(chunk)
+                        await writer.drain()
+
+                        # 帯域制限
+                        if bandwidth is not None:
+                            await bandwidth.throttle("send", len(chunk))
+                finally:
+                    # 送信エラー時も先読みの終了を待つ（確保したメモリを返す前に読み込みを終える）
+                    if not read_task.done():
+                        await asyncio.wait({read_task})
+        finally:
+            await self.run_io(f.close)
+
+        if checksum:
+            writer.write(create_mmp_end_chunk(payload_crc32=payload_crc32))
+
+        await writer.drain()
+        print("クライアントに送信完了")
 
+    def create_response_message(self, response_json: dict, response_media_type: str, response_payload: bytes, payload_size: int | None = None) -> tuple[bytes, bytes]:
+        """
+        MMPレスポンスのヘッダーとボディデータを作成
 
+        Args
+            response_json [dict] レスポンスJSON
+            response_media_type [str] メディアタイプ
+            response_payload [bytes] ペイロード
+            payload_size [int] 初期値 = None ペイロードを別途送信する場合のサイズ
 
+        Return
+            tuple [response_header, response_body]
+        """
         # JSONサイズ
-        response_json_string = json.dumps(response_json)
+        response_json_string = json.dumps(response_json, ensure_ascii=False)
         response_json_size = len(response_json_string.encode("utf-8"))
         # Mediaサイズ
         response_media_type_size = len(response_media_type.encode("utf-8"))
         # Payloadサイズ
-        response_payload_size = len(response_payload)
+        response_payload_size = len(response_payload) if payload_size is None else payload_size
 
         # MMPプロトコルのヘッダー作成
         response_header= create_mmp_header(
@@ -285,42 +674,1910 @@ class Server:
             payload=response_payload
         )
 
-        # クライアントに送信
-        writer.write(response_header)
-        writer.write(response_body)
-        await writer.drain()
-        print("クライアントに送信完了")
+        return response_header, response_body
+
+    def get_response_framing(self, json_data: dict | None) -> tuple[bool, bool]:
+        """
+        リクエストJSONで指定されたレスポンスの形式（MMP v2 の分割形式を使用できるか）
+
+        Args
+            json_data [dict] リクエストJSON（解析できなかった場合None）
+
+        Return
+            tuple [chunked, checksum]
+                chunked: "mmp_version" が2以上の場合True（サイズが事前に分からない出力を分割形式で送信する）
+                checksum: さらに "chunk_checksum": "crc32" が指定された場合True（ファイルもCRC32付きの分割形式で送信する）
+        """
+        if not isinstance(json_data, dict):
+            return False, False
+        version = json_data.get("mmp_version")
+        chunked = isinstance(version, int) and not isinstance(version, bool) and version >= 2
+        return chunked, chunked and json_data.get("chunk_checksum") == "crc32"
+
+    def probe_hash(self, json_data: dict, pinned_hashes: list[str]):
+        """
+        同一内容のファイルを保持しているかを確認する
+
+        保持している場合は、この接続の処理が終わるまで削除されないよう固定する
+
+        Args
+            json_data [dict] content_hashを含むリクエストJSON（確認後のもの）
+            pinned_hashes [list] 固定したハッシュの記録先
+
+        Return
+            tuple [response_json, response_media_type, response_payload]
+        """
+        content_hash: str = json_data["content_hash"]
+
+        exists = content_hash in self.content_store
+        if exists:
+            self.pin_content(content_hash)
+            pinned_hashes.append(content_hash)
+
+        response_json, response_media_type, response_payload = self.create_success_response(operation="probe_hash")
+        response_json["exists"] = exists
+        print(f"probe_hash: {content_hash} exists={exists}")
+
+        return response_json, response_media_type, response_payload
+
+    def validate_upload_request(self, json_data: dict):
+        """
+        アップロードのリクエストJSONを、ペイロードを受信する前に確認する
+
+        Args
+            json_data [dict] リクエストJSON
+
+        Return
+            tuple [response_json, response_media_type, response_payload] 拒否する場合のレスポンス。問題ない場合None
+        """
+        # ffmpegが対応していない処理
+        unsupported = self.encoder_registry.check_operation(
+            operation=json_data.get("operation"),
+            parameters=json_data.get("parameters") or {}
+        )
+        if unsupported is not None:
+            return self.create_error_response(
+                code="unsupported_operation",
+                description=unsupported,
+                solution="サーバーのffmpegを必要なエンコーダーを含むビルドに更新するか、別の処理を指定してください"
+            )
+
+        return None
+
+    async def close_with_unread_payload(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, payload_size: int):
+        """
+        ペイロードを受信せずに応答した接続を閉じる
+            未受信のデータがあるまま閉じるとTCPがRSTを送り、クライアントがレスポンスを受信できないため、
+            送信側を閉じて（FIN）からクライアントが切断するまでのデータを読み捨てる
+
+        Args
+            reader [asyncio.StreamReader] 受信元
+            writer [asyncio.StreamWriter] 送信先
+            payload_size [int] 未受信のペイロードサイズ
+        """
+        if writer.can_write_eof():
+            writer.write_eof()
+
+        async def drain():
+            if payload_size != CHUNKED_PAYLOAD_SIZE:
+                await self.discard_payload(reader=reader, payload_size=payload_size)
+                return
+            # 分割形式は途中まで受信した場合もあるため、区切りを解析せずに切断まで読み捨てる
+            while await reader.read(self.chunk_size):
+                pass
+
+        # クライアントはレスポンスを受信すると送信を中止するため、通常は短時間で終わる
+        try:
+            await asyncio.wait_for(drain(), timeout=self.unread_payload_timeout_seconds)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            pass
+
+    async def discard_payload(self, reader: asyncio.StreamReader, payload_size: int):
+        """
+        ペイロードを分割して受信し、読み捨てる（使用しないペイロードをメモリに溜めない）
+
+        Args
+            reader [asyncio.StreamReader] 受信元
+            payload_size [int] ペイロードサイズ（CHUNKED_PAYLOAD_SIZE の場合は分割形式で終端まで受信する）
+
+        Raises
+            asyncio.IncompleteReadError 全て受信する前に切断された場合
+            ChunkedPayloadError 分割形式のCRC32が一致しない場合など
+        """
+        if payload_size <= 0:
+            return
+
+        if payload_size == CHUNKED_PAYLOAD_SIZE:
+            async with self.memory_budget.reserve(self.chunk_size + MAX_CHECKSUM_CHUNK_DATA_SIZE):
+                async for _ in read_mmp_chunks(reader, read_size=self.chunk_size):
+                    pass
+            return
+
+        async with self.memory_budget.reserve(min(self.chunk_size, payload_size)):
+            remaining = payload_size
+            while remaining > 0:
+                chunk = await reader.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(partial=b"", expected=remaining)
+                remaining -= len(chunk)
+
+    async def handle_upload(
+        self,
+        json_data: dict,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        payload_size: int,
+        tmp_files_path: list,
+        bandwidth: ConnectionBandwidth | None = None,
+        pinned_hashes: list[str] | None = None,
+    ):
+        """
+        アップロードされたファイル（または保持済ファイルの参照）に対して処理を行う
+
+        Args
+            json_data [dict] リクエストJSON
+            reader [asyncio.StreamReader] ペイロードの受信元
+            writer [asyncio.StreamWriter] 進捗の送信先
+            payload_size [int] ペイロードサイズ（参照指定時は0）
+            tmp_files_path [list] 一時保存ファイル・作業ディレクトリのパスリスト
+            bandwidth [ConnectionBandwidth] 初期値 = None 接続の帯域制限
+            pinned_hashes [list] 初期値 = None 固定したハッシュの記録先（接続の終了時に解除する）
+
+        Return
+            tuple [response_json, response_media_type, response_file_path]
+        """
+        # ファイル名取得
+        upload_file_name: str | None = json_data.get("file_name")
+
+        # ファイル名が存在しない場合はエラー内容をレスポンス
+        if upload_file_name is None:
+            response_json, response_media_type, _ = self.create_error_response()
+            return response_json, response_media_type, None
+
+        # ジョブごとの作業ディレクトリを作成（入力・中間ファイル・出力を保存）
+        job_id = uuid.uuid4().hex
+        workspace_dir = await self.create_workspace(job_id=job_id)
+        tmp_files_path.append(workspace_dir)
+
+        # 参照指定（ペイロードなし）の場合は保持済ファイルを入力とする
+        content_ref: str | None = json_data.get("content_ref")
+        content_hash: str | None = None
+        if content_ref is not None:
+            upload_file_path = self.content_store.get(content_ref)
+            if upload_file_path is None:
+                response_json, response_media_type, _ = self.create_error_response(
+                    code="content_not_found",
+                    description=f"指定されたファイルはサーバーに存在しません: {content_ref}",
+                    solution="content_refを指定せずにファイルを送信してください"
+                )
+                return response_json, response_media_type, None
+            # 処理中に削除されないよう固定する（probe_hash を行っていない接続の参照指定、再試行など）
+            if pinned_hashes is not None:
+                self.pin_content(content_ref)
+                pinned_hashes.append(content_ref)
+            print(f"保持済ファイルを使用: {upload_file_path}")
+        elif json_data.get("upload_id") is not None:
+            # 分割アップロードの場合は全範囲の受信を待つ（ペイロードなし）
+            upload_file_path, content_hash, error = await self.wait_striped_upload(
+                json_data=json_data,
+                reader=reader,
+                tmp_files_path=tmp_files_path
+            )
+            if error is not None:
+                response_json, response_media_type, _ = error
+                return response_json, response_media_type, None
+        else:
+            # ファイルの保存先のフルパスを作成（拡張子はクライアントのファイル名に合わせる）
+            _, ext = os.path.splitext(os.path.basename(upload_file_name))
+            upload_file_path = os.path.join(workspace_dir, f"input{ext}")
+
+            # ファイルを受信しながら保存
+            content_hash = await self.receive_payload_to_file(
+                reader=reader,
+                file_path=upload_file_path,
+                payload_size=payload_size,
+                bandwidth=bandwidth
+            )
+
+        # 入力とパラメーターを記録し、ジョブIDをクライアントへ通知する
+        # （サーバーの再起動後はこの記録から処理を再開し、クライアントはジョブIDで結果を受信できる）
+        await self.job_journal.record(
+            job_id,
+            "staged",
+            workspace_dir=workspace_dir,
+            input_path=upload_file_path,
+            file_name=upload_file_name,
+            operation=json_data.get("operation"),
+            parameters=json_data.get("parameters") or {},
+            content_hash=content_hash or content_ref
+        )
+        self.send_job_accepted(writer=writer, job_id=job_id)
+
+        try:
+            try:
+                # 同じ内容・処理・パラメーターのジョブが処理中の場合は合流する
+                coalesce_key = self.get_coalesce_key(json_data=json_data, content_hash=content_hash or content_ref)
+                if coalesce_key is not None:
+                    response = await self.run_coalesced_operation(
+                        coalesce_key=coalesce_key,
+                        json_data=json_data,
+                        reader=reader,
+                        writer=writer,
+                        upload_file_path=upload_file_path,
+                        upload_file_name=upload_file_name,
+                        workspace_dir=workspace_dir,
+                        content_hash=content_hash or content_ref,
+                        job_id=job_id
+                    )
+                else:
+                    response = await self.process_operation(
+                        json_data=json_data,
+                        reader=reader,
+                        writer=writer,
+                        upload_file_path=upload_file_path,
+                        upload_file_name=upload_file_name,
+                        workspace_dir=workspace_dir,
+                        bandwidth=bandwidth,
+                        content_hash=content_hash or content_ref,
+                        job_id=job_id
+                    )
+            except ConnectionError:
+                # 処理中に切断した場合は処理を中止したため再開しない
+                await self.job_journal.record(job_id, "cancelled")
+                raise
+            # レスポンスにジョブIDを含める
+            response[0]["job_id"] = job_id
+            await self.record_job_result(job_id=job_id, response=response)
+
+            # 次回以降の再アップロードを省略できるよう、内容ハッシュで保持する
+            if content_hash is not None:
+                await self.store_content(
+                    content_hash=content_hash,
+                    file_path=upload_file_path
+                )
+
+            return response
+
+        except ConnectionError:
+            # クライアント切断時はレスポンスを返さない
+            raise
+        except Exception as e:
+            print(f"{inspect.currentframe().f_code.co_name}関数でエラー発生") # type: ignore
+            print(f"エラー内容: {e}")
+            # エラー内容レスポンス
+            response_json, response_media_type, _ = self.create_error_response()
+            response_json["job_id"] = job_id
+            await self.record_job_result(job_id=job_id, response=(response_json, response_media_type, None))
+            return response_json, response_media_type, None
+
+    def send_job_accepted(self, writer: asyncio.StreamWriter, job_id: str):
+        """
+        ジョブの受付（ジョブID）をクライアントへ通知する
+            {"status": "accepted", "job_id"}（JSONのみ、ペイロードサイズ0）
+            切断した場合やサーバーが再起動した場合は、このジョブIDで結果を受信できる（attach）
+
+        Args
+            writer [asyncio.StreamWriter] 送信先
+            job_id [str] ジョブID
+        """
+        accepted_header, accepted_body = self.create_response_message(
+            response_json={"status": "accepted", "job_id": job_id},
+            response_media_type="application/json",
+            response_payload=b""
+        )
+        writer.write(accepted_header)
+        writer.write(accepted_body)
+
+    async def record_job_result(self, job_id: str, response: tuple):
+        """
+        処理結果を記録する（送信前に停止した場合も、再起動後にジョブIDで受信できるようにする）
+
+        Args
+            job_id [str] ジョブID
+            response [tuple] process_operationの戻り値 [response_json, response_media_type, response_file_path]
+        """
+        response_json, response_media_type, response_file_path = response
+        if response_json.get("streamed"):
+            # ストリーミングで送信済み（出力ファイルはない）
+            await self.job_journal.record(job_id, "delivered")
+        elif response_json.get("status") == "success" and response_file_path is not None:
+            await self.job_journal.record(
+                job_id,
+                "completed",
+                response=response_json,
+                media_type=response_media_type,
+                output_path=response_file_path
+            )
+        else:
+            await self.job_journal.record(job_id, "failed", response=response_json, media_type=response_media_type)
+
+    def retain_job_workspace(self, job_id: str, tmp_files_path: list):
+        """
+        ジョブの作業ディレクトリを削除対象から外す（処理結果を再受信できるよう残す）
+
+        Args
+            job_id [str] ジョブID
+            tmp_files_path [list] 一時保存ファイル・作業ディレクトリのパスリスト
+        """
+        job = self.job_journal.get(job_id)
+        if job is None:
+            return
+        workspace_dir = os.path.normpath(job["workspace_dir"])
+        tmp_files_path[:] = [path for path in tmp_files_path if os.path.normpath(path) != workspace_dir]
+        print(f"処理結果を再受信できるよう作業ディレクトリを残します: {workspace_dir}")
+
+    async def handle_attach(self, json_data: dict, reader: asyncio.StreamReader, tmp_files_path: list, attached_job_ids: list[str]):
+        """
+        ジョブIDを指定して処理結果を受信する
+            処理中（再起動後に再開したジョブ）の場合は完了を待ってから送信する
+            送信後は作業ディレクトリを削除する（再受信は1回のみ）
+
+        Args
+            json_data [dict] リクエストJSON（job_id）
+            reader [asyncio.StreamReader] 切断検知用の受信元
+            tmp_files_path [list] 一時保存ファイル・作業ディレクトリのパスリスト
+            attached_job_ids [list] この接続で結果を送信するジョブID（接続終了時に解除する）
+
+        Return
+            tuple [response_json, response_media_type, response_file_path]
+        """
+        job_id = json_data.get("job_id")
+        job = self.job_journal.get(job_id) if isinstance(job_id, str) else None
+        if job is None:
+            response_json, response_media_type, _ = self.create_error_response(
+                code="job_not_found",
+                description=f"ジョブが存在しません: {job_id}",
+                solution="処理結果は一度受信すると削除されます。ファイルを再送信してください"
+            )
+            return response_json, response_media_type, None
+
+        if job_id in self.attached_jobs or (job["state"] in ("staged", "running") and job_id not in self.detached_jobs):
+            response_json, response_media_type, _ = self.create_error_response(
+                code="job_busy",
+                description=f"ジョブは別の接続で処理中または送信中です: {job_id}",
+                solution="しばらく待ってから再度実行してください"
+            )
+            return response_json, response_media_type, None
+
+        self.attached_jobs.add(job_id)
+        attached_job_ids.append(job_id)
+
+        # 再開したジョブの完了を待つ（切断してもジョブは続ける）
+        event = self.detached_jobs.get(job_id)
+        if event is not None:
+            await self.run_until_disconnected(reader=reader, coroutine=event.wait())
+            job = self.job_journal.get(job_id)
+            if job is None:
+                response_json, response_media_type, _ = self.create_error_response(
+                    code="job_not_found",
+                    description=f"ジョブが存在しません: {job_id}",
+                    solution="ファイルを再送信してください"
+                )
+                return response_json, response_media_type, None
+
+        # 送信後に作業ディレクトリを削除する
+        tmp_files_path.append(job["workspace_dir"])
+
+        output_path = job.get("output_path")
+        if job["state"] == "completed" and output_path is not None and await self.run_io(os.path.exists, output_path):
+            return dict(job["response"]), job["media_type"], output_path
+
+        if job["state"] == "failed":
+            return dict(job["response"]), job["media_type"], None
+
+        # 出力ファイルが失われている場合
+        await self.job_journal.record(job_id, "cancelled")
+        response_json, response_media_type, _ = self.create_error_response(
+            code="job_not_found",
+            description=f"ジョブの処理結果が存在しません: {job_id}",
+            solution="ファイルを再送信してください"
+        )
+        return response_json, response_media_type, None
+
+    def get_coalesce_key(self, json_data: dict, content_hash: str | None) -> tuple[str, str, str] | None:
+        """
+        処理中のジョブを共有するためのキー（入力の内容ハッシュ、処理、パラメーター）
+
+        Args
+            json_data [dict] リクエストJSON（確認後のもの）
+            content_hash [str] 入力ファイルの内容ハッシュ
+
+        Return
+            tuple [content_hash, operation, parameters] パラメーターはキーの順序をそろえたJSON
+                共有しない場合None（内容ハッシュが不明、出力をその接続へ直接送信するストリーミング）
+        """
+        if not self.coalesce_identical_jobs or content_hash is None or json_data.get("stream"):
+            return None
+        parameters = json.dumps(json_data.get("parameters") or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return content_hash, str(json_data.get("operation")), parameters
+
+    async def run_coalesced_operation(
+        self,
+        coalesce_key: tuple[str, str, str],
+        json_data: dict,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        upload_file_path: str,
+        upload_file_name: str,
+        workspace_dir: str,
+        content_hash: str,
+        job_id: str,
+    ):
+        """
+        同じ内容・処理・パラメーターのジョブを1回だけ実行し、待っている全てのリクエストで結果を共有する
+
+        - 処理中の同じジョブがない場合は、共有ジョブの作業ディレクトリ（入力はハードリンク）で処理を開始する
+        - 処理中の同じジョブがある場合は、ffmpegを起動せずに合流して完了を待つ
+        - 途中経過は待っている全てのリクエストへ送信し、切断したリクエストには送信しない
+        - ジョブの記録は実行枠を確保するまで "staged" のままにし、確保した時点で全てのリクエストを "running" にする
+        - 出力はリクエストごとの作業ディレクトリへハードリンクする（送信・再受信・削除はリクエストごとに行う）
+        - 共有ジョブを中止するのは、待っているリクエストが全て切断した場合のみ（参照カウント）
+
+        Args
+            coalesce_key [tuple] get_coalesce_key の戻り値
+            json_data [dict] リクエストJSON
+            reader [asyncio.StreamReader] クライアントの切断検知に使用
+            writer [asyncio.StreamWriter] 進捗の送信先
+            upload_file_path [str] 入力ファイルパス
+            upload_file_name [str] クライアントが指定したファイル名
+            workspace_dir [str] リクエストの作業ディレクトリ（出力のリンク先）
+            content_hash [str] 入力ファイルの内容ハッシュ
+            job_id [str] リクエストのジョブID
+
+        Return
+            tuple [response_json, response_media_type, response_file_path]
+
+        Raises
+            ConnectionError 完了前にクライアントが切断した場合
+        """
+        flight = self.inflight_jobs.get(coalesce_key)
+        coalesced = flight is not None
+        if flight is None:
+            flight_dir = os.path.join(self.jobs_dir, f"shared_{uuid.uuid4().hex}")
+
+            async def run_flight():
+                await self.create_workspace(job_id=os.path.basename(flight_dir))
+                _, ext = os.path.splitext(upload_file_path)
+                flight_input_path = os.path.join(flight_dir, f"input{ext}")
+                await self.run_io(self.link_file, upload_file_path, flight_input_path)
+                # 進捗は flight["subscribers"] の全ての接続へ送信する
+                return await self.process_operation(
+                    json_data=json_data,
+                    reader=None,
+                    writer=None,
+                    upload_file_path=flight_input_path,
+                    upload_file_name=upload_file_name,
+                    workspace_dir=flight_dir,
+                    content_hash=content_hash,
+                    flight=flight
+                )
+
+            # 作業ディレクトリの作成前に登録する（同時に届いた同じリクエストも合流させる）
+            # subscribers: 待っているリクエスト {job_id: writer}、started: 実行枠を確保したか
+            flight = {"workspace_dir": flight_dir, "subscribers": {}, "started": False}
+            flight["task"] = asyncio.ensure_future(run_flight())
+            self.inflight_jobs[coalesce_key] = flight
+        else:
+            self.coalesced_requests += 1
+            print(f"{upload_file_name} の処理({json_data.get('operation')})は処理中の同じジョブに合流します")
+
+        flight["subscribers"][job_id] = writer
+        try:
+            if flight["started"]:
+                await self.job_journal.record(job_id, "running")
+
+            # 切断した場合は待つのをやめる（共有ジョブは他に待っているリクエストがあれば続ける）
+            response_json, response_media_type, output_path = await self.run_until_disconnected(
+                reader=reader,
+                coroutine=asyncio.shield(flight["task"])
+            )
+
+            response_json = dict(response_json)
+            if coalesced:
+                response_json["coalesced"] = True
+            response_file_path: str | None = None
+            if output_path is not None:
+                response_file_path = os.path.join(workspace_dir, os.path.basename(output_path))
+                await self.run_io(self.link_file, output_path, response_file_path)
+            return response_json, response_media_type, response_file_path
+
+        finally:
+            # 切断した（または結果を受け取った）リクエストには以降の進捗を送信しない
+            del flight["subscribers"][job_id]
+            if not flight["subscribers"]:
+                # 最後のリクエストが結果を受け取った（または切断した）時点で共有ジョブを終える
+                if self.inflight_jobs.get(coalesce_key) is flight:
+                    del self.inflight_jobs[coalesce_key]
+                if not flight["task"].done():
+                    print(f"{upload_file_name} の処理({json_data.get('operation')})を待つリクエストがないため中止します")
+                    flight["task"].cancel()
+                asyncio.ensure_future(self.clean_up_flight(flight))
+
+    async def clean_up_flight(self, flight: dict):
+        """
+        共有ジョブの終了（中止）を待ってから作業ディレクトリを削除する
+
+        Args
+            flight [dict] 共有ジョブ
+        """
+        await asyncio.wait({flight["task"]})
+        # 誰も結果を受け取らなかった場合の例外はここで確認済みにする
+        if not flight["task"].cancelled() and flight["task"].exception() is not None:
+            print(f"共有ジョブでエラー発生: {flight['task'].exception()}")
+        await self.clean_up_files(tmp_files_path=[flight["workspace_dir"]])
+
+    def link_file(self, source_path: str, destination_path: str):
+        """
+        ファイルをハードリンクする（作成できない場合はコピーする）（I/Oスレッドで実行）
+
+        Args
+            source_path [str] 元のファイル
+            destination_path [str] 作成するファイル
+        """
+        try:
+            os.link(source_path, destination_path)
+        except OSError:
+            shutil.copyfile(source_path, destination_path)
+
+    async def process_operation(
+        self,
+        json_data: dict,
+        reader: asyncio.StreamReader | None,
+        writer: asyncio.StreamWriter | None,
+        upload_file_path: str,
+        upload_file_name: str,
+        workspace_dir: str,
+        bandwidth: ConnectionBandwidth | None = None,
+        content_hash: str | None = None,
+        job_id: str | None = None,
+        flight: dict | None = None,
+    ):
+        """
+        指示内容に従って圧縮、音声抽出...などの処理を行う
+
+        リクエストJSONに "stream": true が指定され、出力がストリーミング可能な形式（MP4、MP3、WEBM）の場合は、
+        ffmpegの出力をパイプで受け取り、処理中に分割データ（status: "chunk"）として送信する
+
+        Args
+            json_data [dict] リクエストJSON
+            reader [asyncio.StreamReader] クライアントの切断検知に使用（再開したジョブなど接続がない場合None）
+            writer [asyncio.StreamWriter] 進捗の送信先（接続がない場合None）
+            upload_file_path [str] 入力ファイルパス
+            upload_file_name [str] クライアントが指定したファイル名
+            workspace_dir [str] ジョブの作業ディレクトリ（出力・中間ファイルの作成先）
+            bandwidth [ConnectionBandwidth] 初期値 = None 接続の帯域制限（ストリーミング送信時に使用）
+            content_hash [str] 初期値 = None 入力ファイルの内容ハッシュ（ffprobeの結果のキャッシュに使用）
+            job_id [str] 初期値 = None ジョブID（実行開始をジョブの記録に残す）
+            flight [dict] 初期値 = None 共有ジョブ（run_coalesced_operation 参照）
+                待っている全てのリクエストへ進捗を送信し、実行開始を全てのジョブの記録に残す
+
+        Return
+            tuple [response_json, response_media_type, response_file_path]
+                response_file_path は処理に失敗した場合、ストリーミングで送信済みの場合None
+        """
+        operation: str | None = json_data.get("operation")
+        # パラメーターの内容確認
+        parameters: dict = json_data.get("parameters") or {}
+
+        # 動画の情報（長さ、解像度など）を取得（probeアクションなどで取得済みの場合は再利用）
+        probe = self.probe_cache.get(content_hash) if content_hash is not None else None
+        if probe is None:
+            probe = await ffmpeg_function.probe_media(upload_file_path)
+            if probe is not None and content_hash is not None:
+                self.cache_probe(content_hash=content_hash, probe=probe)
+        else:
+            self.probe_cache.move_to_end(content_hash) # type: ignore
+
+        # 指示を確認して圧縮、音声抽出...などの処理を行う
+        match operation:
+            case "compress": # 圧縮
+                # 出力ファイルパスの作成
+                output_file_name = "compressed_video.mp4"
+                output_file_path = os.path.join(workspace_dir, output_file_name)
+                media_type = "video/mp4"
+
+                if "target_size_mb" in parameters or "target_quality" in parameters:
+                    # 目標サイズ・目標画質を満たすCRFをサンプルで探してから圧縮
+                    target_size_mb = parameters.get("target_size_mb")
+                    target_quality = parameters.get("target_quality")
+                    task = (
+                        ffmpeg_function.compress_video_to_target,
+                        upload_file_path,
+                        output_file_path,
+                        workspace_dir,
+                        ffmpeg_function.get_media_duration(probe),
+                        int(float(target_size_mb) * 1024 * 1024) if target_size_mb is not None else None,
+                        float(target_quality) if target_quality is not None else None,
+                        parameters.get("quality_metric", "ssim")
+                    )
+                else:
+                    task = (ffmpeg_function.compress_video_file, upload_file_path, output_file_path)
+
+            case "resize": # 解像度変更
+                output_file_name = "resize_video.mp4"
+                output_file_path = os.path.join(workspace_dir, output_file_name)
+                media_type = "video/mp4"
+                task = (ffmpeg_function.resize_video_resolution, upload_file_path, parameters["size"], output_file_path)
+
+            case "aspect": # アスペクト比変更
+                output_file_name = "change_aspect_video.mp4"
+                output_file_path = os.path.join(workspace_dir, output_file_name)
+                media_type = "video/mp4"
+                task = (
+                    ffmpeg_function.change_video_aspect_ratio,
+                    upload_file_path,
+                    parameters["ratio"],
+                    output_file_path,
+                    parameters["fit_mode"]
+                )
+
+            case "convert": # コンバート
+                output_file_name = "converted_video.mp3"
+                output_file_path = os.path.join(workspace_dir, output_file_name)
+                media_type = "video/mp3"
+                task = (ffmpeg_function.convert_to_mp3file, upload_file_path, output_file_path)
+
+            case "trim": # gif or webmの作成
+                output_format = parameters["type"]
+                output_file_name = f"changed_{output_format}_video.{output_format}"
+                output_file_path = os.path.join(workspace_dir, output_file_name)
+                media_type = f"video/{output_format}"
+                task = (
+                    ffmpeg_function.trim_video_to_gif_webm,
+                    upload_file_path,
+                    parameters["start_time"],
+                    parameters["duration"],
+                    output_file_path,
+                    output_format
+                )
+
+            case "pipeline": # 複数の処理（aspect, resize, compress）を1回のエンコードで実行
+                output_file_name = "pipeline_video.mp4"
+                output_file_path = os.path.join(workspace_dir, output_file_name)
+                media_type = "video/mp4"
+                task = (ffmpeg_function.run_pipeline, upload_file_path, parameters["steps"], output_file_path)
+
+            case _:
+                response_json, response_media_type, _ = self.create_error_response(
+                    code="unknown_operation",
+                    description=f"不明なoperationです: {operation}",
+                    solution="operationにはcompress、resize、aspect、convert、trim、pipelineのいずれかを指定してください"
+                )
+                return response_json, response_media_type, None
+
+        # 進捗率の計算に使用する処理対象の長さ（秒）
+        target_seconds = self.get_target_duration(
+            operation=operation,
+            parameters=parameters,
+            probe=probe
+        )
+
+        # 入力のコーデック・解像度が出力と同じ場合は、再エンコードせずにコピーする
+        stream_copy = ffmpeg_function.can_stream_copy(operation=operation, parameters=parameters, probe=probe)
+        task_options = {"stream_copy": True} if stream_copy else {}
+        if stream_copy:
+            print(f"{upload_file_name} の処理({operation})は再エンコードせずにコピーします")
+
+        # 処理コストを見積もり、小さいジョブから順に実行する
+        cost = estimate_job_cost(
+            operation=operation,
+            parameters=parameters,
+            probe=probe,
+            target_seconds=target_seconds,
+            stream_copy=stream_copy
+        )
+        print(f"{upload_file_name} の処理({operation})の見積もりコスト: {cost:.3g}")
+
+        function, *args = task
+
+        # ストリーミング（目標サイズ・画質での圧縮はCRFの決定後にしか出力できないため対象外）
+        stream_output = (
+            writer is not None
+            and bool(json_data.get("stream"))
+            and os.path.splitext(output_file_path)[1] in self.streamable_extensions
+            and function is not ffmpeg_function.compress_video_to_target
+        )
+        stream_read_fd: int | None = None
+        stream_write_fd: int | None = None
+        # MMP v2 では出力を1つのメッセージ（分割形式）で送信する
+        chunked_stream, checksum_stream = self.get_response_framing(json_data=json_data)
+        if stream_output:
+            # ffmpegの出力先をファイルからパイプに置き換える
+            stream_read_fd, stream_write_fd = os.pipe()
+            args = [f"pipe:{stream_write_fd}" if arg == output_file_path else arg for arg in args]
+
+        # 分割形式の送信中は他のメッセージを挟めないため、MMP v2 のストリーミングでは途中経過を送信しない
+        progress_sender = self.create_progress_sender(
+            writer=writer,
+            operation=operation,
+            target_seconds=target_seconds
+        ) if writer is not None and not (stream_output and chunked_stream) else None
+        if flight is not None:
+            progress_sender = self.create_flight_progress_sender(
+                flight=flight,
+                operation=operation,
+                target_seconds=target_seconds
+            )
+        # 実行枠の確保後に選んだエンコードの速度段階と設定値（速度段階のないエンコーダーの場合None）
+        speed_level = 0
+        preset: str | None = None
+
+        def record_progress(progress: dict):
+            # エンコード速度を速度段階の選択に使用する
+            self.preset_controller.record_speed(progress.get("speed"))
+            if progress_sender is not None:
+                progress_sender(progress)
+
+        async def run_job():
+            nonlocal speed_level, preset
+            async with self.job_scheduler.slot(cost=cost, job_class=operation):
+                if job_id is not None:
+                    await self.job_journal.record(job_id, "running")
+                if flight is not None:
+                    # 以降に合流したリクエストは合流時に記録する
+                    flight["started"] = True
+                    for subscriber_job_id in list(flight["subscribers"]):
+                        await self.job_journal.record(subscriber_job_id, "running")
+
+                # 開始時点の待ちジョブ数とエンコード速度から速度段階を選ぶ（ジョブのタスク内でのみ有効）
+                if self.encoder_registry.get_operation_preset(operation, parameters) is not None:
+                    speed_level = self.preset_controller.select(quality_over_speed=bool(parameters.get("quality_over_speed")))
+                    preset = self.encoder_registry.get_operation_preset(operation, parameters, speed_level)
+                    print(f"{upload_file_name} の処理({operation})の速度段階: {speed_level} ({preset})")
+                speed_level_token = ffmpeg_function.encoder_speed_level.set(speed_level)
+                try:
+                    return await function(
+                        *args,
+                        timeout=self.operation_timeouts.get(operation),
+                        # コピーの速度はエンコード速度として扱わない
+                        progress_callback=record_progress if preset is not None and not stream_copy else progress_sender,
+                        **task_options
+                    )
+                finally:
+                    ffmpeg_function.encoder_speed_level.reset(speed_level_token)
+
+        async def run_streaming_job():
+            relay_task = asyncio.ensure_future(self.relay_output_stream(
+                read_fd=stream_read_fd,
+                writer=writer,
+                operation=operation,
+                media_type=media_type,
+                bandwidth=bandwidth,
+                chunked=chunked_stream,
+                checksum=checksum_stream
+            ))
+            try:
+                try:
+                    result = await run_job()
+                finally:
+                    # ffmpeg終了後に書き込み側を閉じ、残りのデータを送信し終えるのを待つ
+                    os.close(stream_write_fd)
+                stream_bytes = await relay_task
+            finally:
+                relay_task.cancel()
+            return result, stream_bytes
+
+        # ffmpegを実行（待機中・処理中にクライアントが切断した場合は処理を中止する）
+        stream_bytes = 0
+        if stream_output:
+            success, stream_bytes = await self.run_until_disconnected(reader=reader, coroutine=run_streaming_job()) # type: ignore
+        elif reader is not None:
+            success = await self.run_until_disconnected(reader=reader, coroutine=run_job())
+        else:
+            # 接続のないジョブ（再起動後に再開したジョブ）
+            success = await run_job()
+
+        # 結果を確認
+        if not success:
+            # エラー内容レスポンス
+            response_json, response_media_type, _ = self.create_error_response()
+            return response_json, response_media_type, None
+
+        print(f"{upload_file_name} の処理({operation})に成功")
+        response_json, response_media_type, _ = self.create_success_response(operation=operation, media_type=media_type)
+        # 再エンコードしたか（"transcode"）、コピーしたか（"stream_copy"）。コピーに失敗した場合は再エンコードする
+        response_json["codec_path"] = "transcode"
+
+        # 処理で決定した設定（目標サイズ・画質での圧縮のCRFなど）をレスポンスに含める
+        if isinstance(success, dict):
+            response_json.update(success)
+
+        # 再エンコードした場合は適用した速度段階と設定値（libx264 の -preset など）をレスポンスに含める
+        if preset is not None and response_json["codec_path"] == "transcode":
+            response_json["speed_level"] = speed_level
+            response_json["preset"] = preset
+
+        # ストリーミングで送信済みの場合はペイロードなしで完了を通知する
+        if stream_output:
+            response_json["streamed"] = True
+            response_json["stream_bytes"] = stream_bytes
+            return response_json, response_media_type, None
+
+        return response_json, response_media_type, output_file_path
+
+    async def relay_output_stream(
+        self,
+        read_fd: int,
+        writer: asyncio.StreamWriter,
+        operation: str,
+        media_type: str,
+        bandwidth: ConnectionBandwidth | None = None,
+        chunked: bool = False,
+        checksum: bool = False,
+    ) -> int:
+        """
+        ffmpegの出力（パイプ）を読み込み、分割データとしてクライアントへ送信する
+            MMP v1: {"status": "chunk", "operation", "seq"} + 分割データ
+                サイズが事前に分からないため、分割データごとにMMPメッセージとして送信する
+            MMP v2（chunked が True）: {"status": "stream", "operation"} + 分割形式のペイロード
+                最初の出力を読み込んだ時点で1つのメッセージを開始し、ffmpegの終了後に終端を送信する
+            送信が追いつかない場合はパイプの読み込みを止める（ffmpegの書き込みも止まる）
+
+        Args
+            read_fd [int] パイプの読み込み側（終了時に閉じる）
+            writer [asyncio.StreamWriter] 送信先
+            operation [str] 指示内容
+            media_type [str] 出力のメディアタイプ
+            bandwidth [ConnectionBandwidth] 初期値 = None 接続の帯域制限
+            chunked [bool] 初期値 = False MMP v2 の分割形式で送信する場合True
+            checksum [bool] 初期値 = False 分割形式の分割データにCRC32を付ける場合True
 
-        # 接続を閉じる
-        writer.close()
-        await writer.wait_closed()
+        Return
+            [int] 送信したバイト数
+        """
+        # パイプの受信バッファ（上限の2倍）と送信中の分割データ分のメモリを確保してから読み込む
+        # 確保できるまでパイプを読み込まないため、ffmpegの書き込みも止まる
+        reserved_bytes = self.chunk_size * 3
+        try:
+            await self.memory_budget.acquire(reserved_bytes)
+        except asyncio.CancelledError:
+            os.close(read_fd)
+            raise
+
+        loop = asyncio.get_running_loop()
+        stream_reader = asyncio.StreamReader(limit=self.chunk_size)
+        transport: asyncio.ReadTransport | None = None
+
+        sent_bytes = 0
+        seq = 0
+        # ペイロード全体のCRC32（MMP v2 でCRC32を付ける場合に終端で送信する）
+        payload_crc32 = 0
+        try:
+            transport, _ = await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(stream_reader),
+                os.fdopen(read_fd, "rb", buffering=0)
+            )
+
+            while True:
+                chunk = await stream_reader.read(self.chunk_size)
+                if not chunk:
+                    break
+
+                if not chunked:
+                    chunk_header, chunk_body = self.create_response_message(
+                        response_json={"status": "chunk", "operation": operation, "seq": seq},
+                        response_media_type=media_type,
+                        response_payload=chunk
+                    )
+                    writer.write(chunk_header)
+                    writer.write(chunk_body)
+                else:
+                    if seq == 0:
+                        stream_header, stream_body = self.create_response_message(
+                            response_json={"status": "stream", "operation": operation, "mmp_version": MMP_VERSION},
+                            response_media_type=media_type,
+                            response_payload=b"",
+                            payload_size=CHUNKED_PAYLOAD_SIZE
+                        )
+                        writer.write(stream_header)
+                        writer.write(stream_body)
+                    writer.write(create_mmp_chunk_header(chunk, checksum=checksum))
+                    writer.write(chunk)
+                    if checksum:
+                        payload_crc32 = zlib.crc32(chunk, payload_crc32)
+                await writer.drain()
+
+                sent_bytes += len(chunk)
+                seq += 1
+
+                if bandwidth is not None:
+                    await bandwidth.throttle("send", len(chunk))
+
+            # 分割形式のメッセージを終える（最終結果はこの後に別のメッセージで送信する）
+            if chunked and seq > 0:
+                writer.write(create_mmp_end_chunk(payload_crc32=payload_crc32 if checksum else None))
+                await writer.drain()
+        finally:
+            if transport is not None:
+                transport.close()
+            self.memory_budget.release(reserved_bytes)
+
+        return sent_bytes
+
+    def get_target_duration(self, operation: str, parameters: dict, probe: dict | None) -> float | None:
+        """
+        処理対象の長さ（秒）を取得する
+            trimの場合は切り取り時間、それ以外は動画全体の長さ
+
+        Args
+            operation [str] 指示内容
+            parameters [dict] 追加パラメーター
+            probe [dict] ffprobeの出力（取得できない場合None）
+
+        Return
+            [float] 長さ（秒）。取得できない場合None
+        """
+        media_seconds = ffmpeg_function.get_media_duration(probe)
+
+        if operation != "trim":
+            return media_seconds
+
+        trim_seconds = ffmpeg_function.parse_time_to_seconds(parameters.get("duration", ""))
+        start_seconds = ffmpeg_function.parse_time_to_seconds(parameters.get("start_time", "0")) or 0.0
+        if media_seconds is not None:
+            remaining_seconds = max(0.0, media_seconds - start_seconds)
+            trim_seconds = remaining_seconds if trim_seconds is None else min(trim_seconds, remaining_seconds)
+
+        return trim_seconds
+
+    def create_flight_progress_sender(self, flight: dict, operation: str, target_seconds: float | None):
+        """
+        共有ジョブの進捗を、待っている全てのリクエストへ送信する関数を作成
+            切断したリクエストは flight["subscribers"] から外れるため送信しない
+
+        Args
+            flight [dict] 共有ジョブ
+            operation [str] 指示内容
+            target_seconds [float] 処理対象の長さ（秒）。不明な場合None
+
+        Return
+            run_ffmpegのprogress_callbackに渡す関数
+        """
+        # {job_id: 送信する関数}（合流したリクエストごとに送信間隔を管理する）
+        senders: dict = {}
+
+        def send_progress(progress: dict):
+            subscribers = flight["subscribers"]
+            for subscriber_job_id in [job_id for job_id in senders if job_id not in subscribers]:
+                del senders[subscriber_job_id]
+            for subscriber_job_id, writer in list(subscribers.items()):
+                if subscriber_job_id not in senders:
+                    senders[subscriber_job_id] = self.create_progress_sender(
+                        writer=writer,
+                        operation=operation,
+                        target_seconds=target_seconds
+                    )
+                senders[subscriber_job_id](progress)
+
+        return send_progress
+
+    def create_progress_sender(self, writer: asyncio.StreamWriter, operation: str, target_seconds: float | None):
+        """
+        ffmpegの進捗を途中経過メッセージとしてクライアントへ送信する関数を作成
+            送信間隔は progress_interval_seconds 以上あける
+            途中経過メッセージはJSONのみ（ペイロードサイズ0）
+
+        Args
+            writer [asyncio.StreamWriter] 送信先
+            operation [str] 指示内容
+            target_seconds [float] 処理対象の長さ（秒）。不明な場合None
+
+        Return
+            run_ffmpegのprogress_callbackに渡す関数
+        """
+        last_sent = 0.0
+
+        def send_progress(progress: dict):
+            nonlocal last_sent
+
+            now = time.monotonic()
+            if now - last_sent < self.progress_interval_seconds or writer.is_closing():
+                return
+            last_sent = now
+
+            out_time_seconds = progress.get("out_time_seconds")
+            speed = progress.get("speed")
+
+            # 進捗率と残り時間を計算
+            percent: float | None = None
+            eta_seconds: float | None = None
+            if target_seconds and out_time_seconds is not None:
+                percent = round(min(100.0, out_time_seconds / target_seconds * 100), 1)
+                if speed:
+                    eta_seconds = round(max(0.0, target_seconds - out_time_seconds) / speed, 1)
+
+            progress_json = {
+                "status": "progress",
+                "operation": operation,
+                "percent": percent,
+                "eta_seconds": eta_seconds,
+                "out_time_seconds": out_time_seconds,
+                "fps": progress.get("fps"),
+                "speed": speed,
+            }
+            progress_header, progress_body = self.create_response_message(
+                response_json=progress_json,
+                response_media_type="application/json",
+                response_payload=b""
+            )
+            writer.write(progress_header)
+            writer.write(progress_body)
+
+        return send_progress
+
+    async def run_until_disconnected(self, reader: asyncio.StreamReader, coroutine):
+        """
+        処理を実行し、完了前にクライアントが切断した場合は処理をキャンセルする
+            受信の終端(EOF)または接続エラーのみを切断とみなす
+            クライアントが次のリクエスト（pingなど）を先に送信する場合があるため、受信データは読み込まずに残す
+            （未読のデータがある間は終端を確認できないため、処理を続ける）
+
+        Args
+            reader [asyncio.StreamReader] クライアントからの受信
+            coroutine 実行する処理
+
+        Return
+            処理の戻り値
+
+        Raises
+            ConnectionError 処理中にクライアントが切断した場合
+        """
+        async def wait_for_disconnect():
+            while not reader.at_eof() and reader.exception() is None:
+                await asyncio.sleep(self.disconnect_check_interval_seconds)
+
+        job_task = asyncio.ensure_future(coroutine)
+        disconnect_task = asyncio.ensure_future(wait_for_disconnect())
+
+        try:
+            done, _ = await asyncio.wait({job_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+
+            if job_task in done:
+                return job_task.result()
+
+            # 処理より先に切断を検知した場合は処理を中止する
+            job_task.cancel()
+            try:
+                await job_task
+            except asyncio.CancelledError:
+                pass
+            raise ConnectionError("処理中にクライアントが切断しました")
+
+        finally:
+            # サーバー停止などで自身がキャンセルされた場合も処理を中止する
+            for task in (job_task, disconnect_task):
+                if not task.done():
+                    task.cancel()
+
+    async def handle_probe(self, json_data: dict, reader: asyncio.StreamReader, payload_size: int, tmp_files_path: list, bandwidth: ConnectionBandwidth | None = None):
+        """
+        ファイルの一部（先頭N MB、MP4の場合はmoovを含む範囲）からffprobeの結果を返す
+            {"action": "probe", "file_name", "total_size", "ranges": [{"offset", "length"}, ...], "content_hash"}
+            + ranges の順に連結したデータ
+
+            受信した範囲を total_size の疎ファイルの該当位置へ書き込み、ffprobeを実行する
+            content_hash を指定した場合は結果をキャッシュし、以降のprobe・処理ではffprobeを省略する
+
+        Args
+            json_data [dict] リクエストJSON
+            reader [asyncio.StreamReader] 受信元
+            payload_size [int] ペイロードサイズ（rangesの合計）
+            tmp_files_path [list] 一時保存ファイル・作業ディレクトリのパスリスト
+            bandwidth [ConnectionBandwidth] 初期値 = None 接続の帯域制限
+
+        Return
+            tuple [response_json, response_media_type, response_payload]
+        """
+        ranges = json_data.get("ranges") or []
+        total_size = json_data.get("total_size")
+        content_hash: str | None = json_data.get("content_hash")
+
+        # ペイロードを受信する前に指定内容を確認する
+        error: str | None = None
+        if payload_size > self.probe_max_payload_bytes:
+            error = f"probeで送信できるデータは{self.probe_max_payload_bytes}バイトまでです"
+        elif not isinstance(total_size, int) or isinstance(total_size, bool) or total_size <= 0:
+            error = "total_sizeは1以上の整数で指定してください"
+        elif not isinstance(ranges, list) or not all(
+            isinstance(item, dict)
+            and isinstance(item.get("offset"), int) and not isinstance(item.get("offset"), bool)
+            and isinstance(item.get("length"), int) and not isinstance(item.get("length"), bool)
+            and item["offset"] >= 0 and item["length"] >= 0 and item["offset"] + item["length"] <= total_size
+            for item in ranges
+        ):
+            error = "rangesは {offset, length} の一覧で、ファイルサイズの範囲内で指定してください"
+        elif sum(item["length"] for item in ranges) != payload_size:
+            error = "rangesの合計とペイロードサイズが一致しません"
+        if error is not None:
+            return self.create_error_response(
+                code="invalid_probe_request",
+                description=error,
+                solution="ファイルの先頭（MP4の場合はmoovを含む範囲も）をrangesに指定してください"
+            )
+
+        # キャッシュ済みの場合はデータを読み捨ててffprobeを省略する
+        cached_probe = self.probe_cache.get(content_hash) if content_hash is not None else None
+        if cached_probe is not None:
+            self.probe_cache.move_to_end(content_hash) # type: ignore
+            await self.discard_payload(reader=reader, payload_size=payload_size)
+            response_json, response_media_type, response_payload = self.create_success_response(operation="probe", media_type="application/json")
+            response_json["cached"] = True
+            response_json["probe"] = cached_probe
+            return response_json, response_media_type, response_payload
+
+        # 元のファイルと同じサイズの疎ファイルを作成し、受信した範囲だけを書き込む
+        job_id = uuid.uuid4().hex
+        workspace_dir = await self.create_workspace(job_id=job_id)
+        tmp_files_path.append(workspace_dir)
+        _, ext = os.path.splitext(os.path.basename(json_data.get("file_name") or ""))
+        probe_file_path = os.path.join(workspace_dir, f"probe{ext}")
+
+        def create_sparse_file() -> int:
+            fd = os.open(probe_file_path, os.O_RDWR | os.O_CREAT, 0o644)
+            os.ftruncate(fd, total_size)
+            return fd
+
+        fd = await self.run_io(create_sparse_file)
+        try:
+            for item in ranges:
+                await self.receive_payload_at_offset(
+                    reader=reader,
+                    fd=fd,
+                    offset=item["offset"],
+                    size=item["length"],
+                    bandwidth=bandwidth
+                )
+        finally:
+            await self.run_io(os.close, fd)
+
+        probe = await ffmpeg_function.probe_media(probe_file_path)
+        if probe is None:
+            return self.create_error_response(
+                code="probe_failed",
+                description="送信された範囲から動画の情報を取得できませんでした",
+                solution="先頭から送信する範囲を増やすか、MP4の場合はmoovを含む範囲を指定してください"
+            )
+
+        # 一時ファイルのパスはクライアントに返さない
+        probe.get("format", {}).pop("filename", None)
+        if content_hash is not None:
+            self.cache_probe(content_hash=content_hash, probe=probe)
+
+        response_json, response_media_type, response_payload = self.create_success_response(operation="probe", media_type="application/json")
+        response_json["cached"] = False
+        response_json["probe"] = probe
+        return response_json, response_media_type, response_payload
+
+    def cache_probe(self, content_hash: str, probe: dict):
+        """
+        ffprobeの結果をキャッシュする（上限を超えた場合は古いものから削除）
+
+        Args
+            content_hash [str] ファイル内容のハッシュ値
+            probe [dict] ffprobeの出力
+        """
+        # 作業ディレクトリのパスは保持しない（probeアクションでクライアントに返すため）
+        probe = {**probe, "format": {key: value for key, value in probe.get("format", {}).items() if key != "filename"}}
+        self.probe_cache[content_hash] = probe
+        self.probe_cache.move_to_end(content_hash)
+        while len(self.probe_cache) > self.probe_cache_max_entries:
+            self.probe_cache.popitem(last=False)
+
+    def validate_striped_upload(self, json_data: dict) -> str | None:
+        """
+        分割アップロードの指定（upload_id, total_size）を検証する
+
+        Args
+            json_data [dict] リクエストJSON
+
+        Return
+            [str] エラー内容（問題ない場合None）
+        """
+        upload_id = json_data.get("upload_id")
+        total_size = json_data.get("total_size")
+        # upload_idは作業ディレクトリ名に使用するため16進数のみ許可する
+        if not isinstance(upload_id, str) or re.fullmatch(r"[0-9a-f]{8,64}", upload_id) is None:
+            return "upload_idは16進数（8〜64文字）で指定してください"
+        if not isinstance(total_size, int) or isinstance(total_size, bool) or total_size <= 0:
+            return "total_sizeは1以上の整数で指定してください"
+        entry = self.striped_uploads.get(upload_id)
+        if entry is not None and entry["total_size"] != total_size:
+            return f"total_sizeが他の範囲と一致しません: {total_size} != {entry['total_size']}"
+        return None
+
+    def get_striped_upload(self, upload_id: str, total_size: int, file_name: str) -> dict:
+        """
+        分割アップロードの受信状況を取得する（最初の範囲または処理要求の受信時に作成する）
+            保存先のファイルは total_size で事前に確保する
+
+        Args
+            upload_id [str] アップロードID
+            total_size [int] ファイル全体のサイズ
+            file_name [str] ファイル名（拡張子を使用）
+
+        Return
+            [dict] 受信状況
+        """
+        entry = self.striped_uploads.get(upload_id)
+        if entry is not None:
+            return entry
+
+        _, ext = os.path.splitext(os.path.basename(file_name or ""))
+        workspace_dir = os.path.join(self.jobs_dir, f"upload-{upload_id}")
+        entry = {
+            "upload_id": upload_id,
+            "workspace_dir": workspace_dir,
+            "file_path": os.path.join(workspace_dir, f"input{ext}"),
+            "total_size": total_size,
+            "fd": None,
+            # {offset: length} 受信済みの範囲
+            "ranges": {},
+            "received_bytes": 0,
+            # 全範囲の受信完了
+            "complete": asyncio.Event(),
+            # 処理要求（upload）を受信したか（受信後は処理要求側で削除する）
+            "claimed": False,
+            # 書き込み中の範囲の数（書き込み中はファイルを閉じない）
+            "active_ranges": 0,
+            # ファイルを閉じる（以降の書き込みは中止する）
+            "closing": False,
+        }
+
+        def prepare_file() -> int:
+            os.makedirs(workspace_dir, exist_ok=True)
+            fd = os.open(entry["file_path"], os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # 範囲ごとの書き込みで断片化しないよう全体を確保する
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, total_size)
+                else:
+                    os.ftruncate(fd, total_size)
+            except OSError:
+                os.ftruncate(fd, total_size)
+            return fd
+
+        # 同時に届いた範囲が同じファイルを使うよう、作成処理を共有する
+        entry["ready"] = asyncio.ensure_future(self.run_io(prepare_file))
+        # 処理要求が届かない場合は破棄する
+        entry["expire_handle"] = asyncio.get_running_loop().call_later(
+            self.striped_upload_timeout_seconds,
+            self.expire_striped_upload,
+            upload_id
+        )
+        self.striped_uploads[upload_id] = entry
+        print(f"分割アップロードを開始: {upload_id} ({total_size}バイト)")
+
+        return entry
+
+    def expire_striped_upload(self, upload_id: str):
+        """
+        処理要求（upload）が届かないまま待ち時間の上限を超えた分割アップロードを破棄する
+
+        Args
+            upload_id [str] アップロードID
+        """
+        entry = self.striped_uploads.get(upload_id)
+        if entry is None or entry["claimed"]:
+            return
+        print(f"分割アップロードを破棄: {upload_id}")
+        asyncio.ensure_future(self.discard_striped_upload(entry))
 
-        # 一時保存ファイルの削除
-        await self.clean_up_files(tmp_files_path=tmp_files_path)
+    async def discard_striped_upload(self, entry: dict):
+        """
+        分割アップロードの受信状況を削除し、ファイルを閉じて作業ディレクトリを削除する
+
+        Args
+            entry [dict] 受信状況
+        """
+        if self.striped_uploads.get(entry["upload_id"]) is entry:
+            del self.striped_uploads[entry["upload_id"]]
+        entry["expire_handle"].cancel()
+        await self.close_striped_file(entry)
+        await self.clean_up_files(tmp_files_path=[entry["workspace_dir"]])
+
+    async def close_striped_file(self, entry: dict):
+        """
+        分割アップロードの保存先ファイルを閉じる
+            書き込み中の範囲がある場合は、最後の書き込みの終了時に閉じる
+            （閉じたファイル番号が再利用され、別のファイルへ書き込むことを防ぐ）
+
+        Args
+            entry [dict] 受信状況
+        """
+        entry["closing"] = True
+        if entry["active_ranges"] > 0:
+            return
+        try:
+            fd = await entry["ready"]
+        except OSError:
+            return
+        if entry["fd"] != -1:
+            entry["fd"] = -1
+            await self.run_io(os.close, fd)
+
+    async def receive_upload_range(self, json_data: dict, reader: asyncio.StreamReader, payload_size: int, bandwidth: ConnectionBandwidth | None = None):
+        """
+        分割アップロードの範囲データを受信し、ファイルの該当位置へ書き込む（pwrite）
+            {"action": "upload_range", "upload_id", "file_name", "offset", "total_size"} + 範囲データ
+
+        Args
+            json_data [dict] リクエストJSON
+            reader [asyncio.StreamReader] 受信元
+            payload_size [int] 範囲データのサイズ
+            bandwidth [ConnectionBandwidth] 初期値 = None 接続の帯域制限
+
+        Return
+            tuple [response_json, response_media_type, response_payload]
+        """
+        error = self.validate_striped_upload(json_data)
+        offset = json_data.get("offset")
+        if error is None and (not isinstance(offset, int) or isinstance(offset, bool) or offset < 0 or offset + payload_size > json_data["total_size"]):
+            error = f"範囲がファイルサイズを超えています: offset={offset}, size={payload_size}"
+        if error is not None:
+            return self.create_error_response(
+                code="invalid_upload_range",
+                description=error,
+                solution="upload_id、offset、total_sizeを正しく指定してください"
+            )
+
+        upload_id: str = json_data["upload_id"]
+        entry = self.get_striped_upload(
+            upload_id=upload_id,
+            total_size=json_data["total_size"],
+            file_name=json_data.get("file_name", "")
+        )
+        entry["active_ranges"] += 1
+        try:
+            try:
+                fd = await entry["ready"]
+            except OSError as e:
+                return self.create_error_response(
+                    code="upload_failed",
+                    description=f"保存先のファイルを作成できません: {e}",
+                    solution="サーバーの空き容量を確認してください"
+                )
+
+            completed = await self.receive_payload_at_offset(
+                reader=reader,
+                fd=fd,
+                offset=offset,
+                size=payload_size,
+                bandwidth=bandwidth,
+                is_aborted=lambda: entry["closing"]
+            )
+            if not completed:
+                # 受信中に破棄された場合
+                return self.create_error_response(
+                    code="upload_expired",
+                    description=f"分割アップロードは破棄されました: {upload_id}",
+                    solution="ファイル全体を再送信してください"
+                )
+
+        finally:
+            entry["active_ranges"] -= 1
+            if entry["closing"]:
+                await self.close_striped_file(entry)
+
+        # 同じ範囲の再送は重複して数えない
+        if entry["ranges"].get(offset) != payload_size:
+            entry["ranges"][offset] = payload_size
+            entry["received_bytes"] = self.count_covered_bytes(entry["ranges"])
+
+        print(f"分割アップロード {upload_id}: {entry['received_bytes']}/{entry['total_size']}バイト受信")
+
+        if entry["received_bytes"] >= entry["total_size"] and not entry["complete"].is_set():
+            entry["complete"].set()
+
+        response_json, response_media_type, response_payload = self.create_success_response(operation="upload_range")
+        response_json["received_bytes"] = entry["received_bytes"]
+        response_json["total_size"] = entry["total_size"]
+        return response_json, response_media_type, response_payload
+
+    async def receive_payload_at_offset(self, reader: asyncio.StreamReader, fd: int, offset: int, size: int, bandwidth: ConnectionBandwidth | None = None, is_aborted=None) -> bool:
+        """
+        ペイロードを分割して受信しながら、ファイルの指定位置へ書き込む（pwrite）
+            書き込み中に次の分割データを受信する
+
+        Args
+            reader [asyncio.StreamReader] 受信元
+            fd [int] 書き込み先のファイル記述子
+            offset [int] 書き込みを開始する位置
+            size [int] 受信するバイト数
+            bandwidth [ConnectionBandwidth] 初期値 = None 接続の帯域制限
+            is_aborted 初期値 = None 書き込みを中止するか判定する関数（Trueを返すと中止）
+
+        Return
+            [bool] 全て書き込んだ場合True、中止した場合False
+        """
+        if size <= 0:
+            return True
+
+        position = offset
+        remaining = size
+        pending_write: asyncio.Future | None = None
+        # 分割データ2つ分のメモリを確保してから受信する（確保できるまで読み込まない）
+        async with self.memory_budget.reserve(min(self.chunk_size, size) * 2):
+            try:
+                while remaining > 0:
+                    chunk = await reader.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        raise asyncio.IncompleteReadError(partial=b"", expected=remaining)
+                    remaining -= len(chunk)
+
+                    if pending_write is not None:
+                        await pending_write
+                    if is_aborted is not None and is_aborted():
+                        return False
+                    pending_write = asyncio.ensure_future(self.run_io(os.pwrite, fd, chunk, position))
+                    position += len(chunk)
+
+                    if bandwidth is not None:
+                        await bandwidth.throttle("receive", len(chunk))
+
+                if pending_write is not None:
+                    await pending_write
+
+            finally:
+                # 受信エラー時も書き込みの終了を待つ（呼び出し元がファイルを閉じられるように）
+                if pending_write is not None and not pending_write.done():
+                    await asyncio.wait({pending_write})
+
+        return True
+
+    def count_covered_bytes(self, ranges: dict[int, int]) -> int:
+        """
+        受信済みの範囲（重なりを除く）の合計バイト数
+
+        Args
+            ranges [dict] {offset: length}
+
+        Return
+            [int] 合計バイト数
+        """
+        covered = 0
+        end = 0
+        for offset, length in sorted(ranges.items()):
+            start = max(offset, end)
+            if offset + length > start:
+                covered += offset + length - start
+                end = offset + length
+        return covered
+
+    async def wait_striped_upload(self, json_data: dict, reader: asyncio.StreamReader, tmp_files_path: list):
+        """
+        分割アップロードの全範囲が届くまで待機する
+            受信したファイルの作業ディレクトリは一時ファイルとして削除対象に加える
+
+        Args
+            json_data [dict] リクエストJSON（upload_id, total_size, 任意でcontent_hash）
+            reader [asyncio.StreamReader] 切断検知用の受信元
+            tmp_files_path [list] 一時保存ファイル・作業ディレクトリのパスリスト
+
+        Return
+            tuple [upload_file_path, content_hash, error]
+                error はエラー時のレスポンス（成功時None）
+        """
+        error = self.validate_striped_upload(json_data)
+        if error is not None:
+            return None, None, self.create_error_response(
+                code="invalid_upload_range",
+                description=error,
+                solution="upload_id、total_sizeを正しく指定してください"
+            )
+
+        entry = self.get_striped_upload(
+            upload_id=json_data["upload_id"],
+            total_size=json_data["total_size"],
+            file_name=json_data.get("file_name", "")
+        )
+        # 以降は処理要求側で削除する
+        entry["claimed"] = True
+        entry["expire_handle"].cancel()
+        tmp_files_path.append(entry["workspace_dir"])
+
+        try:
+            try:
+                await self.run_until_disconnected(
+                    reader=reader,
+                    coroutine=asyncio.wait_for(entry["complete"].wait(), timeout=self.striped_upload_timeout_seconds)
+                )
+            except asyncio.TimeoutError:
+                return None, None, self.create_error_response(
+                    code="upload_incomplete",
+                    description=f"分割アップロードの範囲が揃いませんでした: {entry['received_bytes']}/{entry['total_size']}バイト",
+                    solution="ファイル全体を再送信してください"
+                )
+        finally:
+            if self.striped_uploads.get(entry["upload_id"]) is entry:
+                del self.striped_uploads[entry["upload_id"]]
+            await self.close_striped_file(entry)
+
+        # 内容ハッシュを計算（同一内容の再アップロード省略と、クライアントのハッシュとの照合に使用）
+        content_hash = await self.run_io(self.calculate_file_hash, entry["file_path"])
+        expected_hash = json_data.get("content_hash")
+        if expected_hash is not None and expected_hash != content_hash:
+            return None, None, self.create_error_response(
+                code="content_hash_mismatch",
+                description="受信したファイルの内容がクライアントのハッシュ値と一致しません",
+                solution="ファイル全体を再送信してください"
+            )
+
+        print(f"分割アップロードの受信完了: {entry['file_path']}")
+        return entry["file_path"], content_hash, None
+
+    def calculate_file_hash(self, file_path: str) -> str:
+        """
+        ファイル内容のハッシュ値（SHA-256）を計算する（I/Oスレッドで実行する）
+
+        Args
+            file_path [str] ファイルパス
+
+        Return
+            [str] 16進数のハッシュ値
+        """
+        sha256 = hashlib.sha256()
+        with open(file_path, mode="rb") as f:
+            while chunk := f.read(self.chunk_size):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    async def store_content(self, content_hash: str, file_path: str):
+        """
+        アップロードファイルを内容ハッシュで保持する
+
+        保持したファイルは作業ディレクトリから保存先へ移動する（作業ディレクトリの削除対象から外れる）
+        保存上限を超えた場合は古いものから削除する
+
+        Args
+            content_hash [str] ファイル内容のハッシュ値
+            file_path [str] アップロードファイルのパス
+        """
+        # 既に保持している場合は、使用順だけ更新
+        if content_hash in self.content_store:
+            self.content_store.move_to_end(content_hash)
+            return
+
+        _, ext = os.path.splitext(file_path)
+        store_file_path = os.path.join(self.content_store_dir, f"{content_hash}{ext}")
+        await self.run_io(os.replace, file_path, store_file_path)
+
+        self.content_store[content_hash] = store_file_path
+        print(f"ファイルを保持しました: {store_file_path}")
+
+        await self.evict_content()
+
+    async def evict_content(self):
+        """
+        保存上限を超えている間、使用されていない古いファイルから削除する
+        """
+        def get_size(path: str) -> int:
+            return os.path.getsize(path) if os.path.exists(path) else 0
+
+        # サイズの取得中に他の接続が保持ファイルを追加・削除するため、一覧を複製してから取得する
+        sizes = {content_hash: await self.run_io(get_size, path) for content_hash, path in list(self.content_store.items())}
+        total_bytes = sum(sizes.values())
+
+        for content_hash in list(self.content_store):
+            if total_bytes <= self.content_store_max_bytes:
+                break
+            # 参照予定のファイルは削除しない
+            if self.content_store_pins.get(content_hash, 0) > 0:
+                continue
+
+            store_file_path = self.content_store.pop(content_hash, None)
+            if store_file_path is None:
+                # 他の接続が削除済み
+                continue
+            total_bytes -= sizes.get(content_hash, 0)
+            await self.clean_up_files(tmp_files_path=[store_file_path])
+
+    def update_bandwidth_limits(self, json_data: dict, client_ip: str | None = None):
+        """
+        帯域制限を変更する（接続中のクライアントにも反映される）
+            {"action": "bandwidth", "limits": {"per_ip": {"receive": 10485760}}}
+            制限値はバイト/秒、nullで制限解除
+            変更は bandwidth_admin_addresses のクライアントのみ（他のクライアントは現在の設定の取得のみ）
+
+        Args
+            json_data [dict] リクエストJSON
+            client_ip [str] 初期値 = None クライアントのIPアドレス
+
+        Return
+            tuple [response_json, response_media_type, response_payload]
+        """
+        limits = json_data.get("limits")
+        if limits is not None and not self.is_bandwidth_admin(client_ip):
+            print(f"帯域制限の変更を拒否しました: {client_ip}")
+            return self.create_error_response(
+                code="forbidden",
+                description="このクライアントは帯域制限を変更できません",
+                solution="サーバーと同じマシン、またはサーバーの --bandwidth-admin で指定したアドレスから実行してください"
+            )
+        if limits is not None:
+            try:
+                if not isinstance(limits, dict):
+                    raise ValueError("limitsはオブジェクトで指定してください")
+                self.bandwidth_shaper.update_limits(limits)
+            except ValueError as e:
+                return self.create_error_response(
+                    code="invalid_bandwidth_limits",
+                    description=str(e),
+                    solution='limitsは {"global"|"per_ip"|"per_connection": {"receive"|"send": バイト/秒 または null}} の形式で指定してください'
+                )
+            print(f"帯域制限を変更しました: {self.bandwidth_shaper.limits}")
+
+        response_json, response_media_type, response_payload = self.create_success_response(operation="bandwidth")
+        response_json["limits"] = self.bandwidth_shaper.limits
+        return response_json, response_media_type, response_payload
+
+    def is_bandwidth_admin(self, client_ip: str | None) -> bool:
+        """
+        帯域制限を変更できるクライアントか（IPv4射影アドレス ::ffff:127.0.0.1 はIPv4として確認する）
+
+        Args
+            client_ip [str] クライアントのIPアドレス
+
+        Return
+            [bool] 変更できる場合True
+        """
+        if client_ip is None:
+            return False
+        try:
+            address = ipaddress.ip_address(client_ip)
+        except ValueError:
+            return False
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        return str(address) in self.bandwidth_admin_addresses
+
+    def pin_content(self, content_hash: str):
+        """
+        保持ファイルを削除対象から外す
+        """
+        self.content_store_pins[content_hash] = self.content_store_pins.get(content_hash, 0) + 1
+        self.content_store.move_to_end(content_hash)
+
+    def unpin_content(self, content_hash: str):
+        """
+        保持ファイルの固定を解除する
+        """
+        count = self.content_store_pins.get(content_hash, 0) - 1
+        if count > 0:
+            self.content_store_pins[content_hash] = count
+        else:
+            self.content_store_pins.pop(content_hash, None)
+
+    def get_metrics(self) -> dict:
+        """
+        サーバーの状態（メトリクス）を取得する
+
+        Return
+            [dict] メトリクス
+        """
+        return {
+            "scheduler": self.job_scheduler.get_metrics(),
+            "resource_governor": self.resource_governor.get_policy(),
+            "bandwidth": self.bandwidth_shaper.get_metrics(),
+            "memory": self.memory_budget.get_metrics(),
+            "jobs": {**self.job_journal.get_metrics()["jobs"], "resumed_running": len(self.detached_jobs)},
+            "janitor": self.staging_janitor.get_metrics(),
+            "coalescing": {
+                "inflight": len(self.inflight_jobs),
+                "waiters": sum(len(flight["subscribers"]) for flight in self.inflight_jobs.values()),
+                "coalesced_requests": self.coalesced_requests,
+            },
+            "encoders": self.encoder_registry.get_metrics(),
+            "presets": self.preset_controller.get_metrics(),
+            "probe_cache": {"entries": len(self.probe_cache), "max_entries": self.probe_cache_max_entries},
+            "striped_uploads": {
+                upload_id: {"received_bytes": entry["received_bytes"], "total_size": entry["total_size"]}
+                for upload_id, entry in self.striped_uploads.items()
+            },
+            "content_store": {
+                "files": len(self.content_store),
+                "max_bytes": self.content_store_max_bytes,
+            },
+        }
 
     async def server_start(self):
         """
         サーバーを起動する
         """
+        # イベントループをffmpegとは別のCPUに固定（スレッドプールのスレッドもこれに従う）
+        self.resource_governor.pin_event_loop()
+
+        # ffmpegが対応しているエンコーダー・フィルターを取得
+        await self.encoder_registry.load()
+
+        # 前回停止時に未完了だったジョブを再開し、どのジョブにも属さない作業ディレクトリを削除
+        await self.resume_jobs()
+
+        # 作業領域の定期的な削除を開始
+        self.janitor_task = asyncio.ensure_future(self.staging_janitor.run())
+        # 受信されない処理結果の記録の定期的な削除を開始
+        self.job_result_expiry_task = asyncio.ensure_future(self.expire_job_results())
+
         server: asyncio.Server = await asyncio.start_server(self.handle_client, self.host, self.port)
         print(f"サーバー起動： ip {self.host} port {self.port}")
 
         async with server:
             await server.serve_forever()
 
+    async def resume_jobs(self):
+        """
+        ジョブの記録を読み込み、前回停止時に未完了だったジョブを再開する
+            staged / running: 入力ファイルが残っていれば処理を再開する（接続なしで実行し、結果はattachで受信）
+            completed / failed: 処理結果をattachで受信できるよう残す
+            記録にない作業ディレクトリ（停止時に削除されなかったもの）は削除する
+        """
+        jobs = await self.run_io(self.job_journal.load, self.job_result_ttl_seconds)
+
+        # 残す作業ディレクトリ
+        retained_dirs: set[str] = set()
+        for job_id, job in jobs.items():
+            state = job.get("state")
+            workspace_dir = job.get("workspace_dir")
+            input_path = job.get("input_path")
+            output_path = job.get("output_path")
+
+            if state in ("staged", "running") and input_path and await self.run_io(os.path.exists, input_path):
+                retained_dirs.add(os.path.normpath(workspace_dir))
+                # 分割アップロードの入力は別の作業ディレクトリにある
+                retained_dirs.add(os.path.normpath(os.path.dirname(input_path)))
+                self.detached_jobs[job_id] = asyncio.Event()
+                task = asyncio.ensure_future(self.run_detached_job(job_id=job_id, job=job))
+                self.detached_tasks.add(task)
+                task.add_done_callback(self.detached_tasks.discard)
+                print(f"ジョブを再開します: {job_id} ({job.get('operation')})")
+            elif (state == "completed" and output_path and await self.run_io(os.path.exists, output_path)) or state == "failed":
+                retained_dirs.add(os.path.normpath(workspace_dir))
+                print(f"処理結果を保持しています: {job_id} ({state})")
+            else:
+                await self.job_journal.record(job_id, "cancelled")
+
+        orphans = [
+            os.path.join(self.jobs_dir, name) for name in await self.run_io(os.listdir, self.jobs_dir)
+            if os.path.normpath(os.path.join(self.jobs_dir, name)) not in retained_dirs
+        ]
+        orphans += [os.path.join(self.trash_dir, name) for name in await self.run_io(os.listdir, self.trash_dir)]
+        await self.clean_up_files(tmp_files_path=orphans)
+
+    async def expire_job_results(self):
+        """
+        保持期間（job_result_ttl_seconds）を過ぎても受信されない処理結果を、作業領域の確認と同じ間隔で記録から削除する
+            削除した処理結果の作業ディレクトリは、使用中でなくなるため作業領域の定期削除で削除される
+        """
+        while True:
+            await asyncio.sleep(self.staging_janitor.interval_seconds)
+            try:
+                expired = await self.job_journal.expire_results(self.job_result_ttl_seconds, exclude=self.attached_jobs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"処理結果の記録の削除でエラーが発生しました: {e}")
+                continue
+            if expired:
+                print(f"保持期間を過ぎた処理結果を削除しました: {len(expired)}件")
+
+    async def run_detached_job(self, job_id: str, job: dict):
+        """
+        記録から再開したジョブを接続なしで実行し、結果を記録する
+
+        Args
+            job_id [str] ジョブID
+            job [dict] ジョブの記録（input_path, workspace_dir, operation, parameters など）
+        """
+        try:
+            response = await self.process_operation(
+                json_data={"operation": job.get("operation"), "parameters": job.get("parameters") or {}},
+                reader=None,
+                writer=None,
+                upload_file_path=job["input_path"],
+                upload_file_name=job.get("file_name") or "",
+                workspace_dir=job["workspace_dir"],
+                content_hash=job.get("content_hash"),
+                job_id=job_id
+            )
+        except Exception as e:
+            print(f"{inspect.currentframe().f_code.co_name}関数でエラー発生") # type: ignore
+            print(f"エラー内容: {e}")
+            response = self.create_error_response()
+        try:
+            response[0]["job_id"] = job_id
+            await self.record_job_result(job_id=job_id, response=response)
+        finally:
+            # 完了を待っている受信（attach）へ通知する
+            event = self.detached_jobs.pop(job_id)
+            event.set()
+
+    def get_staging_owned_paths(self) -> set[str]:
+        """
+        作業領域のうち使用中のパス（作業領域の定期削除の対象外）
+            処理中・送信中のジョブの作業ディレクトリ、受信前の処理結果（保持期間内）、分割アップロード、
+            保持済ファイル、ジョブの記録
+
+        Return
+            [set[str]] os.path.normpath で正規化したパスの集合
+        """
+        owned = {
+            os.path.normpath(path) for path in (
+                self.jobs_dir,
+                self.trash_dir,
+                self.content_store_dir,
+                self.job_journal.path,
+                self.job_journal.path + ".tmp",
+            )
+        }
+        owned |= self.active_staging_paths
+        owned |= {os.path.normpath(entry["workspace_dir"]) for entry in self.striped_uploads.values()}
+        owned |= {os.path.normpath(path) for path in self.content_store.values()}
+
+        now = time.time()
+        for job_id, job in self.job_journal.jobs.items():
+            if (
+                job.get("state") in ("completed", "failed")
+                and job_id not in self.attached_jobs
+                and now - job.get("ts", now) >= self.job_result_ttl_seconds
+            ):
+                # 保持期間を過ぎた処理結果
+                continue
+            for path in (job.get("workspace_dir"), job.get("input_path")):
+                if path:
+                    owned.add(os.path.normpath(path))
+            if job.get("input_path"):
+                owned.add(os.path.normpath(os.path.dirname(job["input_path"])))
+        return owned
+
+    async def create_workspace(self, job_id: str) -> str:
+        """
+        ジョブの作業ディレクトリを作成する
+
+        Args
+            job_id [str] ジョブID
+
+        Return
+            [str] 作業ディレクトリのパス
+        """
+        workspace_dir = os.path.join(self.jobs_dir, job_id)
+        self.active_staging_paths.add(os.path.normpath(workspace_dir))
+        await self.run_io(os.makedirs, workspace_dir)
+        print(f"作業ディレクトリを作成: {workspace_dir}")
+
+        return workspace_dir
+
     async def clean_up_files(self, tmp_files_path: list):
         """
-        アップロードファイル、処理済ファイルの削除
+        アップロードファイル、処理済ファイル、作業ディレクトリの削除
+
+        作業ディレクトリは削除用ディレクトリへ一度で移動（rename）してから中身を削除するため、
+        途中まで削除された作業ディレクトリが残ることはない
 
         Args
             files [list]
-            アップロードされた元ファイル、圧縮処理などを行ったファイル
+            アップロードされた元ファイル、圧縮処理などを行ったファイル、作業ディレクトリ
         """
+        def remove_file(file: str, trash_path: str) -> bool:
+            if os.path.isdir(file):
+                os.rename(file, trash_path)
+                shutil.rmtree(trash_path, ignore_errors=True)
+                return True
+            if os.path.exists(file):
+                os.remove(file)
+                return True
+            return False
+
         try:
             for file in tmp_files_path:
-                if os.path.exists(file):
-                    os.remove(file)
-                    print(f"一時保存ファイルの削除完了: {file}")
+                trash_path = os.path.join(self.trash_dir, f"{os.path.basename(os.path.normpath(file))}_{uuid.uuid4().hex[:8]}")
+                # 削除中は作業領域の定期削除の対象から外す
+                self.active_staging_paths.add(os.path.normpath(trash_path))
+                try:
+                    # 大きなファイルの削除でイベントループを止めないようI/Oスレッドで行う
+                    if await self.run_io(remove_file, file, trash_path):
+                        print(f"一時保存ファイルの削除完了: {file}")
+                finally:
+                    self.active_staging_paths.discard(os.path.normpath(trash_path))
+                    self.active_staging_paths.discard(os.path.normpath(file))
 
         except Exception as e:
             print(f"{inspect.currentframe().f_code.co_name}関数でエラー発生") # type: ignore
@@ -350,21 +2607,46 @@ class Server:
         return response_json, response_media_type, response_payload
 
 
-    def create_error_response(self):
+    def create_error_response(self, code: str | None = None, description: str | None = None, solution: str | None = None):
         """
         エラー時のレスポンスデータの作成
 
+        Args
+            code [str] 初期値 = None エラーコード
+            description [str] 初期値 = None エラー内容の説明
+            solution [str] 初期値 = None 解決策
+
         Return
             tuple [response_json, response_media_type, response_payload]
         """
-        response_json = {"status": "error"}
+        response_json: dict = {"status": "error"}
+        if code is not None:
+            response_json["code"] = code
+        if description is not None:
+            response_json["description"] = description
+        if solution is not None:
+            response_json["solution"] = solution
         response_media_type = "text/plain"
         response_payload = b""
 
         return response_json, response_media_type, response_payload
 
 if __name__ == "__main__":
-    server = Server()
+    parser = argparse.ArgumentParser(description="VideoCompressorService サーバー")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるホスト")
+    parser.add_argument("--port", type=int, default=8888, help="待ち受けるポート")
+    parser.add_argument("--upload-dir", default="./upload/", help="作業領域（同じマシンで複数起動する場合はサーバーごとに分ける）")
+    parser.add_argument(
+        "--bandwidth-admin",
+        action="append",
+        metavar="ADDRESS",
+        help="帯域制限を変更できるクライアントのIPアドレス（複数指定可、既定は127.0.0.1と::1）"
+    )
+    args = parser.parse_args()
+
+    server = Server(host=args.host, port=args.port, upload_dir=args.upload_dir)
+    if args.bandwidth_admin is not None:
+        server.bandwidth_admin_addresses = set(args.bandwidth_admin)
     try:
         asyncio.run(server.server_start())
     except KeyboardInterrupt:
@@ -0,0 +1,229 @@
+import asyncio
+import os
+import time
+
+from bandwidth_limiter import TokenBucket
+
+
+class StagingJanitor:
+    """作業領域に残ったファイル・ディレクトリを定期的に削除する
+
+    - 切断・例外・サーバーの停止で削除されなかったものを対象にする
+    - 処理中のジョブなどが使用しているもの（get_owned_paths の戻り値に含まれるパス）は削除しない
+    - 最後の更新から ttl_seconds を過ぎたものだけを削除する（ディレクトリは中の最新の更新時刻）
+    - 削除は unlink_bytes_per_second バイト/秒までに制限し、大きなファイルは少しずつ切り詰めてから削除する
+        一度に大きなファイルを削除するとファイルシステムの処理が集中し、他のファイル操作が遅れるため
+        ハードリンク（共有ジョブの入出力など）は他のリンクの内容も消えるため切り詰めずに削除する
+    """
+
+    def __init__(
+        self,
+        directories: list[str],
+        get_owned_paths,
+        ttl_seconds: float = 60 * 60,
+        interval_seconds: float = 5 * 60,
+        unlink_bytes_per_second: float | None = 256 * 1024 * 1024,
+        truncate_step_bytes: int = 64 * 1024 * 1024,
+        executor=None,
+    ) -> None:
+        """
+        Args
+            directories [list[str]] 削除対象を探すディレクトリ（直下のファイル・ディレクトリが対象）
+            get_owned_paths 使用中のパス（os.path.normpath で正規化したもの）の集合を返す関数
+            ttl_seconds [float] 初期値 = 3600 最後の更新から削除するまでの時間（秒）
+            interval_seconds [float] 初期値 = 300 確認の間隔（秒）
+            unlink_bytes_per_second [float] 初期値 = 256MB 1秒あたりに削除するバイト数（Noneの場合は制限しない）
+            truncate_step_bytes [int] 初期値 = 64MB 大きなファイルを1回に切り詰めるバイト数
+            executor 初期値 = None ファイル操作を行うスレッドプール（Noneの場合はイベントループの既定）
+        """
+        self.directories = directories
+        self.get_owned_paths = get_owned_paths
+        self.ttl_seconds = ttl_seconds
+        self.interval_seconds = interval_seconds
+        self.truncate_step_bytes = truncate_step_bytes
+        self.executor = executor
+        self.bucket = TokenBucket(unlink_bytes_per_second)
+
+        # 確認した回数
+        self.sweeps: int = 0
+        self.last_sweep_at: float | None = None
+        # 削除したファイル・ディレクトリの数と合計バイト数（起動から）
+        self.removed_entries: int = 0
+        self.reclaimed_bytes: int = 0
+
+    async def run(self) -> None:
+        """
+        interval_seconds ごとに確認・削除を繰り返す（サーバー起動時にタスクとして開始する）
+        """
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"作業領域の削除でエラーが発生しました: {e}")
+
+    async def sweep(self) -> int:
+        """
+        期限を過ぎた使用されていないファイル・ディレクトリを削除する
+
+        Return
+            [int] 削除したバイト数
+        """
+        loop = asyncio.get_running_loop()
+        candidates = await loop.run_in_executor(self.executor, self.list_expired, self.get_owned_paths(), time.time())
+
+        reclaimed = 0
+        for path in candidates:
+            # 確認中に使用され始めたものは削除しない
+            if os.path.normpath(path) in self.get_owned_paths():
+                continue
+            removed_bytes = await self.remove_path(path)
+            if removed_bytes is None:
+                continue
+            reclaimed += removed_bytes
+            self.removed_entries += 1
+            print(f"期限切れのファイルを削除しました: {path} ({removed_bytes}バイト)")
+
+        self.reclaimed_bytes += reclaimed
+        self.sweeps += 1
+        self.last_sweep_at = time.time()
+        return reclaimed
+
+    def list_expired(self, owned_paths: set[str], now: float) -> list[str]:
+        """
+        期限を過ぎた使用されていないファイル・ディレクトリの一覧（I/Oスレッドで実行）
+
+        Args
+            owned_paths [set[str]] 使用中のパス
+            now [float] 現在時刻（time.time）
+
+        Return
+            [list[str]] パスの一覧
+        """
+        expired = []
+        for directory in self.directories:
+            try:
+                names = os.listdir(directory)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                if os.path.normpath(path) in owned_paths:
+                    continue
+                newest_mtime = self.get_newest_mtime(path)
+                if newest_mtime is not None and now - newest_mtime >= self.ttl_seconds:
+                    expired.append(path)
+        return expired
+
+    def get_newest_mtime(self, path: str) -> float | None:
+        """
+        ファイルの更新時刻（ディレクトリの場合は中のファイルを含めた最新の更新時刻）
+            削除済みの場合None
+        """
+        try:
+            newest = os.lstat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, files in os.walk(path):
+                for name in dirs + files:
+                    try:
+                        newest = max(newest, os.lstat(os.path.join(root, name)).st_mtime)
+                    except FileNotFoundError:
+                        continue
+        return newest
+
+    async def remove_path(self, path: str) -> int | None:
+        """
+        ファイル・ディレクトリを削除速度を制限しながら削除する
+
+        Args
+            path [str] 削除するパス
+
+        Return
+            [int] 削除したバイト数。削除できなかった場合None
+        """
+        loop = asyncio.get_running_loop()
+
+        def list_files() -> tuple[list[str], list[str]]:
+            if not os.path.isdir(path) or os.path.islink(path):
+                return [path], []
+            files, dirs = [], []
+            for root, dir_names, file_names in os.walk(path, topdown=False):
+                files += [os.path.join(root, name) for name in file_names]
+                dirs += [os.path.join(root, name) for name in dir_names]
+            dirs.append(path)
+            return files, dirs
+
+        try:
+            files, dirs = await loop.run_in_executor(self.executor, list_files)
+            removed_bytes = 0
+            for file_path in files:
+                removed_bytes += await self.remove_file(file_path)
+            for dir_path in dirs:
+                await loop.run_in_executor(self.executor, os.rmdir, dir_path)
+        except OSError as e:
+            print(f"作業領域のファイルを削除できません: {path} ({e})")
+            return None
+
+        return removed_bytes
+
+    async def remove_file(self, file_path: str) -> int:
+        """
+        ファイルを削除する（大きなファイルは truncate_step_bytes ずつ切り詰めてから削除する）
+            他にリンクがあるファイル（ハードリンク）とシンボリックリンクは切り詰めずに削除する
+
+        Args
+            file_path [str] ファイルパス
+
+        Return
+            [int] 削除したバイト数（他にリンクが残る場合は0）
+        """
+        def is_unshared_file(path: str) -> bool:
+            return not os.path.islink(path) and os.lstat(path).st_nlink == 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            stat = await loop.run_in_executor(self.executor, os.lstat, file_path)
+        except FileNotFoundError:
+            return 0
+        size = stat.st_size if stat.st_nlink == 1 else 0
+
+        remaining = size
+        # 切り詰めの途中でリンクが作成された場合も中止する
+        while remaining > self.truncate_step_bytes and await loop.run_in_executor(self.executor, is_unshared_file, file_path):
+            remaining -= self.truncate_step_bytes
+            await loop.run_in_executor(self.executor, os.truncate, file_path, remaining)
+            await self.throttle(self.truncate_step_bytes)
+
+        try:
+            await loop.run_in_executor(self.executor, os.unlink, file_path)
+        except FileNotFoundError:
+            return 0
+        await self.throttle(remaining)
+        return size
+
+    async def throttle(self, size: int) -> None:
+        """
+        削除したバイト数に応じて待機する
+        """
+        delay = self.bucket.consume(size)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def get_metrics(self) -> dict:
+        """
+        削除の状況（メトリクス用）
+
+        Return
+            [dict] {"sweeps", "last_sweep_at", "removed_entries", "reclaimed_bytes", "ttl_seconds"}
+        """
+        return {
+            "sweeps": self.sweeps,
+            "last_sweep_at": self.last_sweep_at,
+            "removed_entries": self.removed_entries,
+            "reclaimed_bytes": self.reclaimed_bytes,
+            "ttl_seconds": self.ttl_seconds,
+        }
@@ -0,0 +1,76 @@
+import os
+import sys
+
+import pytest
+
+# リポジトリ直下のモジュール（server.py など）を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FAKE_FFMPEG = '''#!{python}
+import os
+import shutil
+import sys
+import time
+
+args = sys.argv[1:]
+if "-encoders" in args or "-filters" in args:
+    print(" V..... libx264 H.264\\n V..... libvpx-vp9 VP9\\n A..... libmp3lame MP3\\n V..... gif GIF")
+    print(" ... scale Scale\\n ... pad Pad\\n ... fps Fps\\n ... setsar Setsar\\n ... ssim SSIM\\n ... psnr PSNR")
+    sys.exit(0)
+
+with open(os.environ["FAKE_FFMPEG_LOG"], "a") as log:
+    log.write(" ".join(args) + "\\n")
+
+seconds = float(os.environ.get("FAKE_FFMPEG_SECONDS", "0.2"))
+if "-progress" in args:
+    steps = max(1, int(seconds / 0.1))
+    for step in range(steps):
+        time.sleep(seconds / steps)
+        print(f"out_time_us={{step * 1000000}}\\nspeed=2.0x\\nprogress=continue", flush=True)
+    print("progress=end", flush=True)
+else:
+    time.sleep(seconds)
+if args[-1].startswith("pipe:"):
+    # パイプへの出力（ストリーミング出力）は分割して書き込む
+    with open(args[args.index("-i") + 1], "rb") as source, os.fdopen(int(args[-1][5:]), "wb") as output:
+        while chunk := source.read(16 * 1024):
+            output.write(chunk)
+            output.flush()
+else:
+    shutil.copyfile(args[args.index("-i") + 1], args[-1])
+'''
+
+FAKE_FFPROBE = '''#!{python}
+import json
+import os
+import sys
+
+path = sys.argv[-1]
+if not os.path.exists(path):
+    sys.exit(1)
+print(json.dumps({{
+    "format": {{"duration": "10.0", "format_name": "mov,mp4,m4a,3gp,3g2,mj2", "size": str(os.path.getsize(path))}},
+    "streams": [{{"index": 0, "codec_type": "video", "codec_name": "h264", "width": 1280, "height": 720, "r_frame_rate": "30/1"}}],
+}}))
+'''
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """
+    入力をコピーするだけのffmpeg・ffprobeをPATHに追加する
+
+    Return
+        [pathlib.Path] ffmpegの実行ごとに引数を1行追記するログ
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, script in (("ffmpeg", FAKE_FFMPEG), ("ffprobe", FAKE_FFPROBE)):
+        path = bin_dir / name
+        path.write_text(script.format(python=sys.executable))
+        path.chmod(0o755)
+    log_path = tmp_path / "ffmpeg.log"
+    log_path.touch()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv("FAKE_FFMPEG_LOG", str(log_path))
+    return log_path
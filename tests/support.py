@@ -0,0 +1,76 @@
+import asyncio
+import contextlib
+import json
+
+from mmp_protocol import create_mmp_header, parse_mmp_header
+from server import Server
+
+
+@contextlib.asynccontextmanager
+async def running_server(upload_dir: str, **attributes):
+    """
+    テスト用のサーバーを空いているポートで起動する
+
+    Args
+        upload_dir [str] 作業領域
+        attributes 起動前に変更するServerの属性
+
+    Return
+        tuple [server, port]
+    """
+    server = Server(port=0, upload_dir=upload_dir)
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    # 接続ごとの処理（終了時に一時ファイルの削除が終わるまで待つ）
+    client_tasks: set[asyncio.Task] = set()
+
+    async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        client_tasks.add(task)
+        try:
+            await server.handle_client(reader, writer)
+        finally:
+            client_tasks.discard(task)
+
+    listener = await asyncio.start_server(handle_client, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        yield server, port
+    finally:
+        listener.close()
+        if client_tasks:
+            await asyncio.wait(set(client_tasks), timeout=5)
+        for task in list(client_tasks):
+            task.cancel()
+        server.io_executor.shutdown(wait=False)
+
+
+async def send_request(port: int, request: dict, payload: bytes = b"", media_type: str = "application/json") -> tuple[dict, str, bytes]:
+    """
+    MMP v1 でリクエストを1つ送信し、最終的なレスポンスを受信する（途中経過・受付通知は読み飛ばす）
+
+    Args
+        port [int] サーバーのポート
+        request [dict] リクエストJSON
+        payload [bytes] 初期値 = b"" ペイロード
+        media_type [str] 初期値 = "application/json" メディアタイプ
+
+    Return
+        tuple [response_json, response_media_type, response_payload]
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        json_bytes = json.dumps(request).encode("utf-8")
+        media_type_bytes = media_type.encode("utf-8")
+        writer.write(create_mmp_header(len(json_bytes), len(media_type_bytes), len(payload)) + json_bytes + media_type_bytes)
+        writer.write(payload)
+        await writer.drain()
+        while True:
+            json_size, media_type_size, payload_size = parse_mmp_header(await reader.readexactly(8))
+            body = await reader.readexactly(json_size + media_type_size)
+            response_payload = await reader.readexactly(payload_size)
+            response_json = json.loads(body[:json_size].decode("utf-8"))
+            if response_json.get("status") not in ("progress", "accepted"):
+                return response_json, body[json_size:].decode("utf-8"), response_payload
+    finally:
+        writer.close()
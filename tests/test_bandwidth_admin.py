@@ -0,0 +1,42 @@
+import asyncio
+
+from support import running_server, send_request
+
+LIMITS = {"global": {"receive": 1}}
+
+
+def test_bandwidth_change_is_rejected_from_non_admin_address(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path), bandwidth_admin_addresses=set()) as (server, port):
+            response_json, _, _ = await send_request(port, {"action": "bandwidth", "limits": LIMITS})
+            assert response_json["status"] == "error"
+            assert response_json["code"] == "forbidden"
+            assert server.bandwidth_shaper.limits["global"]["receive"] is None
+
+            # 現在の設定の取得は許可する
+            response_json, _, _ = await send_request(port, {"action": "bandwidth"})
+            assert response_json["status"] == "success"
+            assert response_json["limits"]["global"]["receive"] is None
+
+    asyncio.run(run())
+
+
+def test_bandwidth_change_is_accepted_from_loopback(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path)) as (server, port):
+            response_json, _, _ = await send_request(port, {"action": "bandwidth", "limits": LIMITS})
+            assert response_json["status"] == "success"
+            assert server.bandwidth_shaper.limits["global"]["receive"] == 1
+
+    asyncio.run(run())
+
+
+def test_ipv4_mapped_loopback_is_admin(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path)) as (server, _):
+            assert server.is_bandwidth_admin("::ffff:127.0.0.1")
+            assert server.is_bandwidth_admin("::1")
+            assert not server.is_bandwidth_admin("192.0.2.10")
+            assert not server.is_bandwidth_admin(None)
+
+    asyncio.run(run())
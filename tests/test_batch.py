@@ -0,0 +1,89 @@
+import asyncio
+import json
+import socket
+
+import pytest
+
+from client import Client
+from support import running_server
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # 処理結果は作業ディレクトリの ./response_data/ に保存される
+    monkeypatch.chdir(tmp_path)
+    client = Client()
+    yield client
+    client.io_executor.shutdown(wait=False)
+
+
+def write_inputs(directory, count: int) -> list:
+    directory.mkdir()
+    paths = []
+    for index in range(count):
+        path = directory / f"input_{index}.mp4"
+        path.write_bytes(f"video {index} ".encode("utf-8") * 5000)
+        paths.append(path)
+    (directory / "notes.txt").write_text("対象外の拡張子")
+    return paths
+
+
+def test_load_batch_jobs_from_directory_and_manifest(tmp_path, client):
+    paths = write_inputs(tmp_path / "inputs", 2)
+
+    jobs = client.load_batch_jobs(str(tmp_path / "inputs"), operation="resize", parameters={"size": "2"})
+    assert [job["file_path"] for job in jobs] == [str(path) for path in paths]
+    assert all(job["operation"] == "resize" and job["parameters"] == {"size": "2"} for job in jobs)
+
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps({"jobs": [
+        {"file_path": "inputs/input_0.mp4", "operation": "convert"},
+        {"file_path": "inputs/input_1.mp4"},
+    ]}))
+    jobs = client.load_batch_jobs(str(manifest), operation="compress")
+    assert [job["file_path"] for job in jobs] == [str(path) for path in paths]
+    assert [job["operation"] for job in jobs] == ["convert", "compress"]
+
+    with pytest.raises(ValueError):
+        client.load_batch_jobs(str(tmp_path / "inputs"))
+
+
+def test_run_batch_processes_every_file_and_writes_summary(tmp_path, client, fake_ffmpeg):
+    paths = write_inputs(tmp_path / "inputs", 3)
+    summary_path = tmp_path / "summary.json"
+
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            client.port = port
+            jobs = client.load_batch_jobs(str(tmp_path / "inputs"), operation="convert")
+            return await client.run_batch(jobs, concurrency=2, summary_path=str(summary_path))
+
+    summary = asyncio.run(run())
+
+    assert summary["total"] == 3
+    assert summary["succeeded"] == 3
+    assert summary["failed"] == 0
+    assert json.loads(summary_path.read_text())["succeeded"] == 3
+    for path, result in zip(paths, summary["results"]):
+        assert result["file_path"] == str(path)
+        assert result["attempts"] == 1
+        with open(tmp_path / result["output_path"], "rb") as f:
+            assert f.read() == path.read_bytes()
+
+
+def test_run_batch_retries_connection_errors(tmp_path, client):
+    paths = write_inputs(tmp_path / "inputs", 1)
+    # 接続できないポート
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        client.port = sock.getsockname()[1]
+
+    summary = asyncio.run(client.run_batch(
+        [{"file_path": str(paths[0]), "operation": "convert", "parameters": {}}],
+        max_retries=2,
+        retry_backoff=0.01,
+    ))
+
+    assert summary["failed"] == 1
+    assert summary["results"][0]["attempts"] == 3
+    assert "ConnectionRefusedError" in summary["results"][0]["error"]
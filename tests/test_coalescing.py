@@ -0,0 +1,148 @@
+import asyncio
+import json
+
+from mmp_protocol import create_mmp_header, parse_mmp_header
+from support import running_server
+
+DATA = b"same input" * 10000
+REQUEST = {"action": "upload", "file_name": "input.mp4", "operation": "compress", "parameters": {}}
+
+
+class UploadClient:
+    """アップロードして、受付通知・途中経過・最終的なレスポンスを記録する"""
+
+    def __init__(self, port: int) -> None:
+        self.port = port
+        self.job_id: str | None = None
+        self.progress: list[dict] = []
+        self.accepted = asyncio.Event()
+        self.first_progress = asyncio.Event()
+
+    async def run(self) -> tuple[dict, bytes]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        try:
+            request = json.dumps(REQUEST).encode("utf-8")
+            writer.write(create_mmp_header(len(request), 9, len(DATA)) + request + b"video/mp4" + DATA)
+            await writer.drain()
+            while True:
+                json_size, media_type_size, payload_size = parse_mmp_header(await reader.readexactly(8))
+                body = await reader.readexactly(json_size + media_type_size)
+                payload = await reader.readexactly(payload_size)
+                response_json = json.loads(body[:json_size].decode("utf-8"))
+                if response_json["status"] == "accepted":
+                    self.job_id = response_json["job_id"]
+                    self.accepted.set()
+                elif response_json["status"] == "progress":
+                    self.progress.append(response_json)
+                    self.first_progress.set()
+                else:
+                    return response_json, payload
+        finally:
+            writer.close()
+
+
+def ffmpeg_runs(log_path) -> int:
+    return sum(1 for line in log_path.read_text().splitlines() if "-progress" in line)
+
+
+def test_identical_requests_share_one_run_and_all_receive_progress(tmp_path, fake_ffmpeg, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_SECONDS", "1.5")
+
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (server, port):
+            first, second = UploadClient(port), UploadClient(port)
+            first_task = asyncio.ensure_future(first.run())
+            await first.first_progress.wait()
+            second_task = asyncio.ensure_future(second.run())
+
+            (first_json, first_payload), (second_json, second_payload) = await asyncio.gather(first_task, second_task)
+
+            assert first_json["status"] == second_json["status"] == "success"
+            assert first_payload == second_payload == DATA
+            assert "coalesced" not in first_json
+            assert second_json["coalesced"] is True
+            # 合流したリクエストにも途中経過を送信する
+            assert second.progress
+            assert ffmpeg_runs(fake_ffmpeg) == 1
+            assert server.inflight_jobs == {}
+
+    asyncio.run(run())
+
+
+def test_coalesced_jobs_stay_staged_until_a_slot_is_acquired(tmp_path, fake_ffmpeg, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_SECONDS", "1.0")
+
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (server, port):
+            server.job_scheduler.max_concurrent_jobs = 1
+            # 実行枠を埋めておく
+            await server.job_scheduler.acquire(cost=1.0, job_class="occupied")
+
+            first, second = UploadClient(port), UploadClient(port)
+            tasks = [asyncio.ensure_future(first.run()), asyncio.ensure_future(second.run())]
+            await first.accepted.wait()
+            await second.accepted.wait()
+            await asyncio.sleep(0.3)
+            assert server.job_journal.get(first.job_id)["state"] == "staged"
+            assert server.job_journal.get(second.job_id)["state"] == "staged"
+
+            server.job_scheduler.release()
+            await first.first_progress.wait()
+            assert server.job_journal.get(first.job_id)["state"] == "running"
+            assert server.job_journal.get(second.job_id)["state"] == "running"
+
+            results = await asyncio.gather(*tasks)
+            assert [response_json["status"] for response_json, _ in results] == ["success", "success"]
+            assert ffmpeg_runs(fake_ffmpeg) == 1
+
+    asyncio.run(run())
+
+
+def test_shared_job_continues_after_first_requester_disconnects(tmp_path, fake_ffmpeg, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_SECONDS", "1.5")
+
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (server, port):
+            first, second = UploadClient(port), UploadClient(port)
+            first_task = asyncio.ensure_future(first.run())
+            await first.first_progress.wait()
+            second_task = asyncio.ensure_future(second.run())
+            await second.first_progress.wait()
+
+            # 最初のリクエストが切断しても、合流したリクエストの途中経過と結果は届く
+            first_task.cancel()
+            progress_before = len(second.progress)
+            second_json, second_payload = await second_task
+
+            assert second_json["status"] == "success"
+            assert second_payload == DATA
+            assert len(second.progress) > progress_before
+            assert server.job_journal.get(first.job_id) is None  # 完了（cancelled）
+            assert ffmpeg_runs(fake_ffmpeg) == 1
+
+    asyncio.run(run())
+
+
+def test_shared_job_is_cancelled_when_all_requesters_disconnect(tmp_path, fake_ffmpeg, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_SECONDS", "3.0")
+
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (server, port):
+            clients = [UploadClient(port), UploadClient(port)]
+            tasks = [asyncio.ensure_future(client.run()) for client in clients]
+            for client in clients:
+                await client.first_progress.wait()
+            assert len(server.inflight_jobs) == 1
+
+            for task in tasks:
+                task.cancel()
+            for _ in range(50):
+                if not server.inflight_jobs:
+                    break
+                await asyncio.sleep(0.05)
+
+            assert server.inflight_jobs == {}
+            for client in clients:
+                assert server.job_journal.get(client.job_id) is None  # 完了（cancelled）
+
+    asyncio.run(run())
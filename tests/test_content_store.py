@@ -0,0 +1,47 @@
+import asyncio
+import hashlib
+
+from support import running_server, send_request
+
+FIRST = b"first input" * 1000
+SECOND = b"second input" * 1000
+
+
+def upload_request(**fields) -> dict:
+    return {"action": "upload", "file_name": "input.mp4", "operation": "compress", "parameters": {}, **fields}
+
+
+def test_content_ref_input_is_not_evicted_during_the_job(tmp_path, fake_ffmpeg, monkeypatch):
+    async def run():
+        # 保持できるファイルは1つだけ
+        async with running_server(str(tmp_path / "upload"), content_store_max_bytes=len(SECOND)) as (server, port):
+            # 2つのジョブを同時に実行する
+            server.job_scheduler.max_concurrent_jobs = 2
+            monkeypatch.setenv("FAKE_FFMPEG_SECONDS", "0.1")
+            response_json, _, _ = await send_request(port, upload_request(), payload=FIRST, media_type="video/mp4")
+            assert response_json["status"] == "success"
+            first_hash = hashlib.sha256(FIRST).hexdigest()
+            assert first_hash in server.content_store
+
+            # probe_hash を行わない新しい接続で参照指定（バッチの再試行など）
+            monkeypatch.setenv("FAKE_FFMPEG_SECONDS", "1.5")
+            ref_task = asyncio.ensure_future(send_request(port, upload_request(content_ref=first_hash)))
+            await asyncio.sleep(0.5)
+
+            # 処理中に別のファイルを保持して上限を超えさせる
+            monkeypatch.setenv("FAKE_FFMPEG_SECONDS", "0.1")
+            response_json, _, _ = await send_request(port, upload_request(), payload=SECOND, media_type="video/mp4")
+            assert response_json["status"] == "success"
+            assert first_hash in server.content_store
+
+            response_json, _, payload = await ref_task
+            assert response_json["status"] == "success"
+            assert payload == FIRST
+            # 接続の終了時に固定を解除する
+            for _ in range(50):
+                if first_hash not in server.content_store_pins:
+                    break
+                await asyncio.sleep(0.02)
+            assert first_hash not in server.content_store_pins
+
+    asyncio.run(run())
@@ -0,0 +1,59 @@
+import asyncio
+
+import ffmpeg_function
+
+
+class FakeEncoder:
+    """サンプルのエンコードを記録し、CRFが大きいほど小さいファイルを作成する"""
+
+    def __init__(self) -> None:
+        self.running = 0
+        self.max_running = 0
+        self.crfs: list[int] = []
+
+    async def run_ffmpeg(self, command_args: list[str], timeout=None, progress_callback=None, stderr_tail=None) -> bool:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            crf = int(command_args[command_args.index("-crf") + 1])
+            self.crfs.append(crf)
+            with open(command_args[-1], "wb") as f:
+                f.write(b"\0" * (100 - crf) * 10)
+            return True
+        finally:
+            self.running -= 1
+
+
+def search(tmp_path, monkeypatch, target_size_bytes: int) -> tuple[dict | None, FakeEncoder]:
+    encoder = FakeEncoder()
+    monkeypatch.setattr(ffmpeg_function, "run_ffmpeg", encoder.run_ffmpeg)
+    result = asyncio.run(ffmpeg_function.search_compress_crf(
+        input_path=str(tmp_path / "input.mp4"),
+        work_dir=str(tmp_path),
+        duration_seconds=120.0,
+        target_size_bytes=target_size_bytes,
+        target_quality=None,
+        quality_metric="ssim",
+        timeout=None,
+    ))
+    return result, encoder
+
+
+def test_crf_search_encodes_one_sample_at_a_time(tmp_path, monkeypatch):
+    result, encoder = search(tmp_path, monkeypatch, target_size_bytes=10 ** 9)
+
+    assert encoder.max_running == 1
+    assert result["crf"] == ffmpeg_function.CRF_CANDIDATES[0]
+    # 最初の候補で目標を満たすため、以降の候補は試さない
+    assert set(encoder.crfs) == {ffmpeg_function.CRF_CANDIDATES[0]}
+
+
+def test_crf_search_picks_the_lowest_crf_within_target_size(tmp_path, monkeypatch):
+    # サンプル3つ（12秒）を120秒に換算: CRF26は (100-26)*10*3*10 = 22200バイト、CRF30は21000バイト
+    result, encoder = search(tmp_path, monkeypatch, target_size_bytes=21500)
+
+    assert result["crf"] == 30
+    assert result["estimated_size_bytes"] == 21000
+    assert max(encoder.crfs) == 30
+    assert list(tmp_path.glob("crf_search_*")) == []
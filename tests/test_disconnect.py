@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+from mmp_protocol import create_mmp_header, parse_mmp_header
+from support import running_server
+
+DATA = b"input video" * 1000
+
+
+def create_message(request: dict, media_type: bytes = b"application/json", payload: bytes = b"") -> bytes:
+    json_bytes = json.dumps(request).encode("utf-8")
+    return create_mmp_header(len(json_bytes), len(media_type), len(payload)) + json_bytes + media_type + payload
+
+
+async def start_upload(port: int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(create_message(
+        {"action": "upload", "file_name": "input.mp4", "operation": "convert", "parameters": {}},
+        media_type=b"video/mp4",
+        payload=DATA,
+    ))
+    await writer.drain()
+    return reader, writer
+
+
+async def receive_final_response(reader: asyncio.StreamReader) -> dict:
+    while True:
+        json_size, media_type_size, payload_size = parse_mmp_header(await reader.readexactly(8))
+        body = await reader.readexactly(json_size + media_type_size)
+        await reader.readexactly(payload_size)
+        response_json = json.loads(body[:json_size].decode("utf-8"))
+        if response_json["status"] not in ("progress", "accepted"):
+            return response_json
+
+
+def test_data_sent_while_job_runs_does_not_cancel_the_job(tmp_path, fake_ffmpeg, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_SECONDS", "1.0")
+
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            reader, writer = await start_upload(port)
+            await asyncio.sleep(0.3)
+            # 処理中に次のリクエストを先に送信する
+            writer.write(create_message({"action": "ping"}))
+            await writer.drain()
+            try:
+                response_json = await asyncio.wait_for(receive_final_response(reader), timeout=10)
+            finally:
+                writer.close()
+            assert response_json["status"] == "success"
+
+    asyncio.run(run())
+
+
+def test_eof_while_job_runs_cancels_the_job(tmp_path, fake_ffmpeg, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_SECONDS", "3.0")
+
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (server, port):
+            reader, writer = await start_upload(port)
+            await asyncio.sleep(0.5)
+            writer.write_eof()
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            while server.job_scheduler.get_metrics()["running"] and loop.time() - started < 2.0:
+                await asyncio.sleep(0.05)
+            writer.close()
+            assert server.job_scheduler.get_metrics()["running"] == 0
+
+    asyncio.run(run())
+
+
+def test_server_closes_the_connection_when_the_client_stops_sending(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            try:
+                writer.write(create_message({"action": "probe_hash", "content_hash": "ab" * 32}))
+                await writer.drain()
+                assert (await receive_final_response(reader))["status"] == "success"
+                # 次のリクエストを送らずに送信を終える
+                writer.write_eof()
+                assert await asyncio.wait_for(reader.read(), timeout=5) == b""
+            finally:
+                writer.close()
+
+    asyncio.run(run())
@@ -0,0 +1,90 @@
+import asyncio
+import sys
+
+import pytest
+
+import ffmpeg_function
+from encoder_registry import ENCODER_PREFERENCES, EncoderRegistry
+from support import running_server, send_request
+
+# libx264・libvpx-vp9・libmp3lame のないffmpeg（代わりの mpeg4・libvpx・libshine のみ）
+LIMITED_FFMPEG = '''#!{python}
+import sys
+
+if "-encoders" in sys.argv:
+    print("Encoders:\\n V..... = Video\\n ------\\n V..... mpeg4 MPEG-4 part 2\\n V..... libvpx libvpx VP8\\n A..... libshine Shine MP3\\n V..... gif GIF")
+elif "-filters" in sys.argv:
+    print("Filters:\\n  T.. = Timeline support\\n ... scale V->V Scale\\n ... fps V->V Fps")
+'''
+
+
+@pytest.fixture
+def limited_ffmpeg(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    path = bin_dir / "ffmpeg"
+    path.write_text(LIMITED_FFMPEG.format(python=sys.executable))
+    path.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir))
+
+
+def load_registry() -> EncoderRegistry:
+    registry = EncoderRegistry()
+    asyncio.run(registry.load())
+    return registry
+
+
+def test_registry_falls_back_to_available_encoders(limited_ffmpeg):
+    registry = load_registry()
+
+    assert registry.loaded
+    assert registry.get_metrics()["encoders"] == {
+        "mp4_video": "mpeg4",
+        "webm_video": "libvpx",
+        "mp3_audio": "libshine",
+        "gif_video": "gif",
+    }
+
+
+def test_get_encoder_args_uses_the_selected_encoder(limited_ffmpeg, monkeypatch):
+    monkeypatch.setattr(ffmpeg_function, "encoder_registry", load_registry())
+
+    # mpeg4 はCRFを固定量子化値に換算し、-tune は指定しない
+    assert ffmpeg_function.get_encoder_args("mp4_video", crf=23, tune="film") == ["-c:v", "mpeg4", "-q:v", "4"]
+    assert ffmpeg_function.get_encoder_args("mp3_audio") == ["-c:a", "libshine"]
+
+
+def test_registry_rejects_operations_missing_filters(limited_ffmpeg):
+    registry = load_registry()
+
+    assert registry.check_operation("resize", {"size": "2"}) is None
+    assert "padフィルター" in registry.check_operation("aspect", {"ratio": "1", "fit_mode": "1"})
+    assert "ssimフィルター" in registry.check_operation("compress", {"target_quality": 0.95})
+
+
+def test_registry_without_ffmpeg_uses_first_preference(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    registry = load_registry()
+
+    assert not registry.loaded
+    assert registry.select("mp4_video") == ENCODER_PREFERENCES["mp4_video"][0]
+    assert registry.check_operation("aspect", {"ratio": "1", "fit_mode": "1"}) is None
+
+
+def test_server_rejects_unsupported_operation_before_upload(tmp_path, limited_ffmpeg, monkeypatch):
+    # サーバーが設定するエンコーダーの一覧を終了後に戻す
+    monkeypatch.setattr(ffmpeg_function, "encoder_registry", None)
+
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (server, port):
+            await server.encoder_registry.load()
+            return await send_request(
+                port,
+                {"action": "upload", "file_name": "input.mp4", "operation": "aspect", "parameters": {"ratio": "1", "fit_mode": "1"}},
+                payload=b"input video" * 1000,
+                media_type="video/mp4",
+            )
+
+    response_json, _, _ = asyncio.run(run())
+    assert response_json["status"] == "error"
+    assert response_json["code"] == "unsupported_operation"
@@ -0,0 +1,27 @@
+import asyncio
+
+from ffmpeg_function import read_progress
+
+
+def read_progress_output(output: bytes) -> list[dict]:
+    async def run():
+        stream = asyncio.StreamReader()
+        stream.feed_data(output)
+        stream.feed_eof()
+        progress: list[dict] = []
+        await read_progress(stream, progress.append)
+        return progress
+
+    return asyncio.run(run())
+
+
+def test_read_progress_skips_values_that_are_not_numbers():
+    progress = read_progress_output(
+        b"fps=0.00\nout_time_us=N/A\nout_time=N/A\nspeed=N/A\nprogress=continue\n"
+        b"fps=nan\nout_time_us=\nout_time=00:00:01.500000\nspeed=\nprogress=continue\n"
+        b"fps=30.0\nout_time_us=2000000\nout_time=00:00:02.000000\nspeed=1.5x\nprogress=end\n"
+    )
+
+    assert [item["out_time_seconds"] for item in progress] == [None, 1.5, 2.0]
+    assert progress[0]["speed"] is None
+    assert progress[2] == {"out_time_seconds": 2.0, "fps": 30.0, "speed": 1.5}
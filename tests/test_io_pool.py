@@ -0,0 +1,75 @@
+import asyncio
+import builtins
+import json
+import time
+
+import server
+from mmp_protocol import create_mmp_header
+from support import running_server, send_request
+
+UPLOAD_BYTES = 8 * 1024 * 1024
+WRITE_CHUNK = b"\0" * (1024 * 1024)
+# 遅いディスクを模擬する書き込み1回あたりの時間
+SLOW_WRITE_SECONDS = 0.3
+# アップロード中のpingの往復時間の上限（書き込み1回分より十分短い）
+MAX_PING_SECONDS = 0.15
+# pingを送信し続ける時間（書き込みが続いている間）
+PING_DURATION_SECONDS = 1.5
+
+
+class SlowFile:
+    """書き込みごとに待機するファイル（遅いディスクの模擬）"""
+
+    def __init__(self, f) -> None:
+        self.f = f
+
+    def write(self, data: bytes) -> int:
+        time.sleep(SLOW_WRITE_SECONDS)
+        return self.f.write(data)
+
+    def __getattr__(self, name: str):
+        return getattr(self.f, name)
+
+
+def slow_open(file, mode="r", *args, **kwargs):
+    f = builtins.open(file, mode, *args, **kwargs)
+    return SlowFile(f) if "w" in mode else f
+
+
+async def upload_large_file(port: int) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        request = json.dumps({"action": "upload", "file_name": "large.mp4", "operation": "convert"}).encode("utf-8")
+        media_type = b"video/mp4"
+        writer.write(create_mmp_header(len(request), len(media_type), UPLOAD_BYTES) + request + media_type)
+        for _ in range(UPLOAD_BYTES // len(WRITE_CHUNK)):
+            writer.write(WRITE_CHUNK)
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+def test_ping_latency_during_large_upload(tmp_path, monkeypatch):
+    # アップロードの書き込みをI/Oスレッドプールで行わない場合、書き込み中はpingに応答できない
+    monkeypatch.setattr(server, "open", slow_open, raising=False)
+
+    async def run():
+        async with running_server(str(tmp_path)) as (_, port):
+            upload_task = asyncio.ensure_future(upload_large_file(port))
+            round_trips: list[float] = []
+            try:
+                # アップロードの受信が始まってから書き込みが続いている間にpingを送信する
+                await asyncio.sleep(SLOW_WRITE_SECONDS)
+                finish_at = time.perf_counter() + PING_DURATION_SECONDS
+                while time.perf_counter() < finish_at:
+                    started = time.perf_counter()
+                    response_json, _, _ = await send_request(port, {"action": "ping"})
+                    round_trips.append(time.perf_counter() - started)
+                    assert response_json["status"] == "success"
+                    await asyncio.sleep(0.02)
+            finally:
+                upload_task.cancel()
+
+            assert max(round_trips) < MAX_PING_SECONDS, f"ping round trips: {sorted(round_trips)[-5:]}"
+
+    asyncio.run(run())
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+import time
+
+from job_journal import JobJournal
+from support import running_server, send_request
+
+DATA = b"input video" * 1000
+
+
+def test_undelivered_results_expire_after_ttl(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+
+    async def run():
+        journal = JobJournal(path=path, flush_interval_seconds=0)
+        journal.load()
+        await journal.record("old", "completed", output_path="old.mp4")
+        await journal.record("failed", "failed")
+        await journal.record("sending", "completed")
+        await journal.record("running", "running")
+        for job_id in ("old", "failed", "sending"):
+            journal.jobs[job_id]["ts"] = time.time() - 120
+        await journal.record("new", "completed")
+
+        expired = await journal.expire_results(60, exclude={"sending"})
+        assert sorted(expired) == ["failed", "old"]
+        assert journal.get("old") is None
+        assert journal.get("failed") is None
+        assert journal.get("sending")["state"] == "completed"
+        assert journal.get("running")["state"] == "running"
+        assert journal.get("new")["state"] == "completed"
+
+    asyncio.run(run())
+
+    # 再起動後も expired のジョブは読み込まない
+    assert sorted(JobJournal(path=path).load()) == ["new", "running", "sending"]
+
+
+def test_load_drops_results_older_than_ttl(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    old = time.time() - 120
+    path.write_text(
+        f'{{"job_id": "old", "state": "completed", "ts": {old}}}\n'
+        f'{{"job_id": "running", "state": "running", "ts": {old}}}\n'
+        f'{{"job_id": "new", "state": "failed", "ts": {time.time()}}}\n'
+    )
+
+    jobs = JobJournal(path=str(path)).load(result_ttl_seconds=60)
+
+    assert sorted(jobs) == ["new", "running"]
+    # 記録も書き直される
+    assert "old" not in path.read_text()
+
+
+def write_previous_run(upload_dir) -> dict[str, str]:
+    """前回停止時の作業領域とジョブの記録を作成し、{名前: ジョブID} を返す"""
+    jobs_dir = upload_dir / "jobs"
+    records = []
+    job_ids = {}
+    for name, state in (("interrupted", "running"), ("lost_input", "staged"), ("finished", "completed")):
+        job_id = f"{name}0000"
+        job_ids[name] = job_id
+        workspace_dir = jobs_dir / job_id
+        workspace_dir.mkdir(parents=True)
+        input_path = workspace_dir / "input.mp4"
+        if name != "lost_input":
+            input_path.write_bytes(DATA)
+        record = {
+            "job_id": job_id,
+            "state": "staged",
+            "ts": time.time(),
+            "workspace_dir": str(workspace_dir),
+            "input_path": str(input_path),
+            "file_name": "input.mp4",
+            "operation": "convert",
+            "parameters": {},
+        }
+        records.append(record)
+        if state != "staged":
+            records.append({"job_id": job_id, "state": "running", "ts": time.time()})
+        if state == "completed":
+            output_path = workspace_dir / "output.mp3"
+            output_path.write_bytes(b"previous output")
+            records.append({
+                "job_id": job_id,
+                "state": "completed",
+                "ts": time.time(),
+                "output_path": str(output_path),
+                "response": {"status": "success", "operation": "convert", "job_id": job_id},
+                "media_type": "audio/mp3",
+            })
+    # どのジョブにも属さない作業ディレクトリ
+    (jobs_dir / "orphan").mkdir()
+    (upload_dir / "journal.jsonl").write_text("".join(json.dumps(record) + "\n" for record in records) + '{"job_id": "torn')
+    return job_ids
+
+
+def test_server_resumes_interrupted_jobs_after_restart(tmp_path, fake_ffmpeg):
+    upload_dir = tmp_path / "upload"
+    job_ids = write_previous_run(upload_dir)
+
+    async def run():
+        async with running_server(str(upload_dir)) as (server, port):
+            await server.resume_jobs()
+            assert not (upload_dir / "jobs" / "orphan").exists()
+            assert server.job_journal.get(job_ids["lost_input"]) is None
+
+            interrupted = await send_request(port, {"action": "attach", "job_id": job_ids["interrupted"]})
+            finished = await send_request(port, {"action": "attach", "job_id": job_ids["finished"]})
+            # 送信後の作業ディレクトリの削除を待つ
+            while os.path.exists(upload_dir / "jobs" / job_ids["finished"]):
+                await asyncio.sleep(0.01)
+            # 再受信は1回のみ
+            again = await send_request(port, {"action": "attach", "job_id": job_ids["finished"]})
+            return interrupted, finished, again
+
+    interrupted, finished, again = asyncio.run(run())
+
+    response_json, _, payload = interrupted
+    assert response_json["status"] == "success"
+    assert response_json["job_id"] == job_ids["interrupted"]
+    assert payload == DATA
+
+    response_json, media_type, payload = finished
+    assert response_json["status"] == "success"
+    assert media_type == "audio/mp3"
+    assert payload == b"previous output"
+
+    assert again[0]["code"] == "job_not_found"
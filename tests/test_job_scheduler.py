@@ -0,0 +1,51 @@
+import asyncio
+
+from job_scheduler import JobScheduler
+
+
+def test_overdue_job_runs_before_cheaper_jobs():
+    async def run():
+        scheduler = JobScheduler(max_concurrent_jobs=1, aging_seconds=60.0, max_wait_seconds=600.0)
+        started: list[str] = []
+
+        async def job(name: str, cost: float):
+            async with scheduler.slot(cost=cost, job_class=name):
+                started.append(name)
+
+        # 実行枠を埋めておく
+        await scheduler.acquire(cost=1.0, job_class="running")
+
+        # 2時間の1080p圧縮と、10秒の720pジョブ（コスト比 約1600倍）
+        long_task = asyncio.ensure_future(job("long", 7200 * 1920 * 1080 * 30))
+        await asyncio.sleep(0)
+        short_tasks = [asyncio.ensure_future(job(f"short{i}", 10 * 1280 * 720 * 30)) for i in range(3)]
+        await asyncio.sleep(0)
+
+        # エイジングだけでは追い越せない待ち時間（max_wait_seconds を超えたところ）
+        long_job = next(waiting for waiting in scheduler.waiting_jobs if waiting["job_class"] == "long")
+        long_job["enqueued_at"] -= 601.0
+
+        scheduler.release()
+        await asyncio.gather(long_task, *short_tasks)
+        assert started[0] == "long"
+
+    asyncio.run(run())
+
+
+def test_wait_is_bounded_by_max_wait_seconds():
+    scheduler = JobScheduler(max_concurrent_jobs=1, aging_seconds=60.0, max_wait_seconds=600.0)
+    long_job = {"cost": 1600.0, "enqueued_at": 0.0, "seq": 0}
+    short_job = {"cost": 1.0, "enqueued_at": 599.0, "seq": 1}
+
+    # 上限前はコストの小さいジョブが先
+    assert scheduler.dispatch_order(short_job, 599.5) < scheduler.dispatch_order(long_job, 599.5)
+    # 上限を超えたジョブは先に実行される
+    assert scheduler.dispatch_order(long_job, 600.0) < scheduler.dispatch_order(short_job, 600.0)
+
+
+def test_overdue_jobs_run_in_arrival_order():
+    scheduler = JobScheduler(max_concurrent_jobs=1, max_wait_seconds=10.0)
+    first = {"cost": 100.0, "enqueued_at": 0.0, "seq": 0}
+    second = {"cost": 1.0, "enqueued_at": 1.0, "seq": 1}
+
+    assert scheduler.dispatch_order(first, 20.0) < scheduler.dispatch_order(second, 20.0)
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import shutil
+
+import pytest
+
+from memory_budget import MemoryBudget
+from mmp_protocol import create_mmp_header, parse_mmp_header
+from server import Server
+from support import running_server
+
+# 同時に送受信するクライアント数とファイルサイズ（合計は上限より十分大きい）
+CLIENTS = 12
+FILE_BYTES = 16 * 1024 * 1024
+WRITE_CHUNK_BYTES = 1024 * 1024
+# サーバー全体の上限
+MAX_BYTES = 8 * 1024 * 1024
+# インタプリタ・アロケーターによる増加の許容量
+RSS_SLACK_BYTES = 32 * 1024 * 1024
+
+
+def current_rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def copy_input_to_output(self, json_data, reader, writer, upload_file_path, upload_file_name, workspace_dir, bandwidth=None, content_hash=None, job_id=None):
+    """入力をそのまま出力とする処理（ffmpegを使用せずに送受信のみを確認する）"""
+    output_path = os.path.join(workspace_dir, "output.mp4")
+    await self.run_io(shutil.copyfile, upload_file_path, output_path)
+    response_json, response_media_type, _ = self.create_success_response(operation=json_data["operation"])
+    return response_json, "video/mp4", output_path
+
+
+async def upload_and_download(port: int, index: int) -> int:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        request = json.dumps({"action": "upload", "file_name": f"input{index}.mp4", "operation": "convert"}).encode("utf-8")
+        media_type = b"video/mp4"
+        writer.write(create_mmp_header(len(request), len(media_type), FILE_BYTES) + request + media_type)
+        # 内容ハッシュが重複しないよう先頭をクライアントごとに変える
+        writer.write(index.to_bytes(WRITE_CHUNK_BYTES, byteorder="big"))
+        await writer.drain()
+        for _ in range(FILE_BYTES // WRITE_CHUNK_BYTES - 1):
+            writer.write(bytes(WRITE_CHUNK_BYTES))
+            await writer.drain()
+
+        # 受付通知などを読み飛ばし、ファイルは分割して読み捨てる
+        while True:
+            json_size, media_type_size, payload_size = parse_mmp_header(await reader.readexactly(8))
+            body = await reader.readexactly(json_size + media_type_size)
+            response_json = json.loads(body[:json_size].decode("utf-8"))
+            if response_json.get("status") in ("progress", "accepted"):
+                continue
+            assert response_json["status"] == "success", response_json
+            received = 0
+            while received < payload_size:
+                received += len(await reader.read(min(WRITE_CHUNK_BYTES, payload_size - received)))
+            return received
+    finally:
+        writer.close()
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="RSSを取得できない環境")
+def test_concurrent_transfers_stay_under_memory_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(Server, "process_operation", copy_input_to_output)
+
+    async def run():
+        budget = MemoryBudget(max_bytes=MAX_BYTES)
+        async with running_server(str(tmp_path), memory_budget=budget, coalesce_identical_jobs=False) as (server, port):
+            baseline_rss = current_rss_bytes()
+            peak_rss = baseline_rss
+            done = asyncio.Event()
+
+            async def sample_rss():
+                nonlocal peak_rss
+                while not done.is_set():
+                    peak_rss = max(peak_rss, current_rss_bytes())
+                    await asyncio.sleep(0.005)
+
+            sampler = asyncio.ensure_future(sample_rss())
+            try:
+                received = await asyncio.gather(*(upload_and_download(port, index) for index in range(CLIENTS)))
+            finally:
+                done.set()
+                await sampler
+
+            assert received == [FILE_BYTES] * CLIENTS
+            # 接続ごとの受信バッファ（待機せずに加算する分）を除いて上限を超えない
+            allowed_bytes = MAX_BYTES + CLIENTS * server.connection_buffer_bytes
+            assert budget.high_water_bytes <= allowed_bytes
+            # 上限に達して送受信を待たせた
+            assert budget.paused_count > 0
+            assert budget.used_bytes == 0
+            # 送受信したデータ（合計 CLIENTS × FILE_BYTES × 2）をメモリに溜めていない
+            assert peak_rss - baseline_rss <= allowed_bytes + RSS_SLACK_BYTES
+
+    asyncio.run(run())
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import zlib
+
+import pytest
+
+from mmp_protocol import (
+    CHUNK_CHECKSUM_FLAG,
+    CHUNKED_PAYLOAD_SIZE,
+    ChunkedPayloadError,
+    create_mmp_chunk_header,
+    create_mmp_end_chunk,
+    create_mmp_header,
+    parse_mmp_header,
+    read_mmp_chunks,
+)
+from support import running_server
+
+DATA = b"input video" * 10000
+
+
+def read_chunks(data: bytes, read_size: int = 1024 * 1024) -> bytes:
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return b"".join([chunk async for chunk in read_mmp_chunks(reader, read_size=read_size)])
+
+    return asyncio.run(run())
+
+
+def create_chunked_payload(chunks: list[bytes], checksum: bool) -> bytes:
+    payload = b"".join(create_mmp_chunk_header(chunk, checksum=checksum) + chunk for chunk in chunks)
+    return payload + create_mmp_end_chunk(payload_crc32=zlib.crc32(b"".join(chunks)) if checksum else None)
+
+
+@pytest.mark.parametrize("checksum", [False, True])
+def test_chunked_payload_round_trip(checksum):
+    chunks = [b"first", b"x" * 100000, b"last"]
+
+    assert read_chunks(create_chunked_payload(chunks, checksum=checksum), read_size=4096) == b"".join(chunks)
+
+
+def test_chunk_header_layout():
+    assert create_mmp_chunk_header(b"abc") == (3).to_bytes(4, "big")
+    assert create_mmp_chunk_header(b"abc", checksum=True) == (3 | CHUNK_CHECKSUM_FLAG).to_bytes(4, "big") + zlib.crc32(b"abc").to_bytes(4, "big")
+    with pytest.raises(ValueError):
+        create_mmp_chunk_header(b"")
+
+
+def test_chunk_crc_mismatch_is_rejected():
+    payload = bytearray(create_chunked_payload([b"first", b"second"], checksum=True))
+    # 2つ目の分割データを1バイト書き換える
+    payload[payload.index(b"second")] ^= 0xFF
+
+    with pytest.raises(ChunkedPayloadError):
+        read_chunks(bytes(payload))
+
+
+def test_payload_crc_mismatch_is_rejected():
+    # 分割データごとのCRC32は一致するが、終端のCRC32（ペイロード全体）が一致しない（分割データの欠落）
+    chunks = [b"first", b"second"]
+    payload = create_mmp_chunk_header(chunks[0], checksum=True) + chunks[0] + create_mmp_end_chunk(payload_crc32=zlib.crc32(b"".join(chunks)))
+
+    with pytest.raises(ChunkedPayloadError):
+        read_chunks(payload)
+
+
+def test_truncated_chunked_payload_raises_incomplete_read():
+    payload = create_chunked_payload([b"first", b"second"], checksum=False)
+
+    with pytest.raises(asyncio.IncompleteReadError):
+        read_chunks(payload[:-4])
+
+
+async def upload_chunked(port: int, payload: bytes) -> tuple[dict, bytes]:
+    """MMP v2 の分割形式でアップロードし、CRC32付きの分割形式で処理結果を受信する"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        request = {
+            "action": "upload",
+            "file_name": "input.mp4",
+            "operation": "convert",
+            "parameters": {},
+            "mmp_version": 2,
+            "chunk_checksum": "crc32",
+        }
+        json_bytes = json.dumps(request).encode("utf-8")
+        writer.write(create_mmp_header(len(json_bytes), 9, CHUNKED_PAYLOAD_SIZE) + json_bytes + b"video/mp4" + payload)
+        await writer.drain()
+        while True:
+            json_size, media_type_size, payload_size = parse_mmp_header(await reader.readexactly(8))
+            body = await reader.readexactly(json_size + media_type_size)
+            response_json = json.loads(body[:json_size].decode("utf-8"))
+            if payload_size == CHUNKED_PAYLOAD_SIZE:
+                return response_json, b"".join([chunk async for chunk in read_mmp_chunks(reader)])
+            response_payload = await reader.readexactly(payload_size)
+            if response_json["status"] not in ("progress", "accepted"):
+                return response_json, response_payload
+    finally:
+        writer.close()
+
+
+def test_server_round_trips_chunked_payload_with_checksums(tmp_path, fake_ffmpeg):
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            chunks = [DATA[position:position + 30000] for position in range(0, len(DATA), 30000)]
+            response_json, payload = await upload_chunked(port, create_chunked_payload(chunks, checksum=True))
+            assert response_json["status"] == "success"
+            assert response_json["mmp_version"] == 2
+            assert payload == DATA
+
+    asyncio.run(run())
+
+
+def test_server_rejects_corrupted_chunked_upload(tmp_path, fake_ffmpeg):
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            payload = bytearray(create_chunked_payload([DATA[:50000], DATA[50000:]], checksum=True))
+            payload[-100] ^= 0xFF
+            response_json, _ = await upload_chunked(port, bytes(payload))
+            assert response_json["status"] == "error"
+            assert response_json["code"] == "corrupted_payload"
+
+    asyncio.run(run())
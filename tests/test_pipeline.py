@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+import ffmpeg_function
+from ffmpeg_function import build_aspect_filter, compile_pipeline
+from request_schema import ACTION_SCHEMAS, RequestError, validate_request
+from support import running_server, send_request
+
+
+@pytest.fixture(autouse=True)
+def default_encoders(monkeypatch):
+    # エンコーダーは優先順位の先頭を使用する（起動したサーバーの一覧に依存しない）
+    monkeypatch.setattr(ffmpeg_function, "encoder_registry", None)
+
+
+def test_every_operation_has_a_timeout(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path)) as (server, _):
+            for operation in ACTION_SCHEMAS["upload"]["operation"]["choices"]:
+                assert server.operation_timeouts.get(operation) is not None, operation
+            assert server.operation_timeouts["pipeline"] >= server.operation_timeouts["compress"]
+
+    asyncio.run(run())
+
+
+def test_compile_pipeline_chains_filters_and_encodes_once():
+    args = compile_pipeline([
+        {"operation": "aspect", "ratio": "1", "fit_mode": "1"},
+        {"operation": "resize", "size": "2"},
+        {"operation": "compress", "crf": 30},
+    ])
+
+    # フィルターは指定順に1つの -vf にまとめる
+    assert args.count("-vf") == 1
+    assert args[args.index("-vf") + 1] == f"{build_aspect_filter('1', '1')},scale=1280:720"
+    # エンコードは compress の設定で1回（音声は削除）
+    assert args.count("-crf") == 1
+    assert args[args.index("-crf") + 1] == "30"
+    assert "-an" in args
+
+
+def test_compile_pipeline_without_compress_keeps_audio():
+    args = compile_pipeline([{"operation": "resize", "size": "3"}])
+
+    assert args[args.index("-vf") + 1] == "scale=640:480"
+    assert args[args.index("-crf") + 1] == "23"
+    assert args[args.index("-c:a") + 1] == "copy"
+
+
+@pytest.mark.parametrize("steps", [
+    [],
+    [{"operation": "compress"}, {"operation": "compress"}],
+    [{"operation": "convert"}],
+    [{"operation": "resize", "size": "9"}],
+    ["resize"],
+])
+def test_compile_pipeline_rejects_invalid_steps(steps):
+    assert compile_pipeline(steps) is None
+
+
+def test_pipeline_steps_are_validated_before_upload():
+    for steps in ([], [{"operation": "trim"}], [{"operation": "compress"}, {"operation": "compress"}], [{"operation": "resize"}]):
+        with pytest.raises(RequestError) as e:
+            validate_request({"action": "upload", "file_name": "input.mp4", "operation": "pipeline", "parameters": {"steps": steps}})
+        assert e.value.code == "invalid_parameters"
+
+
+def test_server_runs_pipeline_in_one_ffmpeg_pass(tmp_path, fake_ffmpeg):
+    data = b"input video" * 1000
+
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            return await send_request(
+                port,
+                {
+                    "action": "upload",
+                    "file_name": "input.mp4",
+                    "operation": "pipeline",
+                    "parameters": {"steps": [{"operation": "resize", "size": "2"}, {"operation": "compress"}]},
+                },
+                payload=data,
+                media_type="video/mp4",
+            )
+
+    response_json, media_type, payload = asyncio.run(run())
+    assert response_json["status"] == "success"
+    assert media_type == "video/mp4"
+    assert payload == data
+
+    runs = fake_ffmpeg.read_text().splitlines()
+    assert len(runs) == 1
+    args = runs[0].split()
+    assert args[args.index("-vf") + 1] == "scale=1280:720"
+    assert "-an" in args
@@ -0,0 +1,88 @@
+from preset_controller import PresetController
+
+
+class FakeScheduler:
+    def __init__(self, max_concurrent_jobs=2):
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.depth = 0
+
+    def queue_depth(self):
+        return self.depth
+
+
+def make_controller(**attributes):
+    scheduler = FakeScheduler()
+    return scheduler, PresetController(scheduler, hold_seconds=30.0, **attributes)
+
+
+def test_level_steps_up_one_at_a_time_and_holds():
+    scheduler, controller = make_controller()
+    scheduler.depth = 4
+
+    assert controller.update(now=0.0) == 1
+    # 変更後 hold_seconds は変更しない
+    assert controller.update(now=10.0) == 1
+    assert controller.update(now=30.0) == 2
+    assert controller.update(now=60.0) == 3
+    # 上限を超えない
+    assert controller.update(now=90.0) == 3
+    assert controller.changes == 3
+
+
+def test_level_does_not_oscillate_between_thresholds():
+    scheduler, controller = make_controller()
+    scheduler.depth = 2
+    assert controller.update(now=0.0) == 1
+
+    # 上げる閾値と下げる閾値の間では段階を維持する
+    scheduler.depth = 1
+    for now in (30.0, 60.0, 90.0):
+        assert controller.update(now=now) == 1
+
+    scheduler.depth = 0
+    assert controller.update(now=120.0) == 0
+    assert controller.changes == 2
+
+
+def test_slow_encoding_raises_level_only_with_waiting_jobs():
+    scheduler, controller = make_controller()
+    scheduler.max_concurrent_jobs = 4
+    controller.record_speed(0.5)
+
+    # 待ちがなければ遅くても上げない
+    assert controller.update(now=0.0) == 0
+
+    scheduler.depth = 2
+    assert controller.update(now=1.0) == 1
+
+    # 遅いままでは待ちが少なくても下げない
+    scheduler.depth = 1
+    assert controller.update(now=31.0) == 1
+    scheduler.depth = 0
+    assert controller.update(now=61.0) == 0
+
+
+def test_record_speed_is_smoothed():
+    _, controller = make_controller(speed_smoothing=0.5)
+    controller.record_speed(None)
+    controller.record_speed(0)
+    assert controller.speed_factor is None
+
+    controller.record_speed(2.0)
+    controller.record_speed(1.0)
+    assert controller.speed_factor == 1.5
+
+
+def test_quality_over_speed_jobs_always_use_level_zero():
+    scheduler, controller = make_controller()
+    scheduler.depth = 4
+
+    assert controller.select() == 1
+    assert controller.select(quality_over_speed=True) == 0
+    assert controller.get_metrics() == {
+        "level": 1,
+        "max_level": 3,
+        "speed_factor": None,
+        "changes": 1,
+        "selected": {"0": 1, "1": 1},
+    }
@@ -0,0 +1,90 @@
+import asyncio
+import struct
+
+import pytest
+
+import ffmpeg_function
+from client import Client
+from support import running_server, send_request
+
+CONTENT_HASH = "cd" * 32
+
+
+def create_mp4(path, mdat_size: int) -> tuple[bytes, int]:
+    """moovがファイルの最後にあるMP4（ボックスの構造のみ）を作成し、(内容, moovの位置) を返す"""
+    ftyp = struct.pack(">I4s", 16, b"ftyp") + b"isom" + b"\0" * 4
+    mdat = struct.pack(">I4s", mdat_size, b"mdat") + b"\x11" * (mdat_size - 8)
+    moov = struct.pack(">I4s", 24, b"moov") + b"moov data itself"
+    data = ftyp + mdat + moov
+    path.write_bytes(data)
+    return data, len(ftyp) + len(mdat)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = Client()
+    yield client
+    client.io_executor.shutdown(wait=False)
+
+
+def test_find_mp4_box_skips_to_moov(tmp_path, client):
+    path = tmp_path / "input.mp4"
+    _, moov_offset = create_mp4(path, mdat_size=100000)
+
+    assert client.find_mp4_box(str(path), b"moov") == (moov_offset, 24)
+    assert client.find_mp4_box(str(path), b"ftyp") == (0, 16)
+    assert client.find_mp4_box(str(path), b"free") is None
+
+
+def test_probe_sends_only_head_and_moov(tmp_path, client, monkeypatch):
+    path = tmp_path / "input.mp4"
+    data, moov_offset = create_mp4(path, mdat_size=100000)
+    client.probe_head_bytes = 1024
+    probed: list[bytes] = []
+
+    async def fake_probe_media(input_path: str, timeout: float = 30.0) -> dict:
+        with open(input_path, "rb") as f:
+            probed.append(f.read())
+        return {"format": {"filename": input_path, "duration": "10.0"}, "streams": []}
+
+    monkeypatch.setattr(ffmpeg_function, "probe_media", fake_probe_media)
+
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            client.port = port
+            first = await client.execute_request(client.probe_file, str(path), CONTENT_HASH)
+            second = await client.execute_request(client.probe_file, str(path), CONTENT_HASH)
+            return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first["status"] == "success"
+    assert first["cached"] is False
+    assert first["probe"]["format"] == {"duration": "10.0"}
+    # 2回目はキャッシュからffprobeを省略する
+    assert second["cached"] is True
+    assert second["probe"] == first["probe"]
+    assert len(probed) == 1
+
+    # サーバーは元のファイルと同じサイズの疎ファイルに、先頭とmoovだけを書き込む
+    received = probed[0]
+    assert len(received) == len(data)
+    assert received[:1024] == data[:1024]
+    assert received[moov_offset:] == data[moov_offset:]
+    assert received[1024:moov_offset] == b"\0" * (moov_offset - 1024)
+
+
+def test_probe_rejects_ranges_outside_the_file(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            return await send_request(
+                port,
+                {"action": "probe", "file_name": "input.mp4", "total_size": 10, "ranges": [{"offset": 8, "length": 4}]},
+                payload=b"abcd",
+                media_type="video/mp4",
+            )
+
+    response_json, _, _ = asyncio.run(run())
+    assert response_json["status"] == "error"
+    assert response_json["code"] == "invalid_probe_request"
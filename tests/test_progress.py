@@ -0,0 +1,92 @@
+import asyncio
+import json
+import time
+
+from mmp_protocol import create_mmp_header, parse_mmp_header
+from support import running_server
+
+DATA = b"input video" * 1000
+
+
+class RecordingWriter:
+    """送信したデータを記録する"""
+
+    def __init__(self) -> None:
+        self.data = b""
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    def is_closing(self) -> bool:
+        return False
+
+    def get_messages(self) -> list[dict]:
+        messages = []
+        position = 0
+        while position < len(self.data):
+            json_size, media_type_size, payload_size = parse_mmp_header(self.data[position:position + 8])
+            messages.append(json.loads(self.data[position + 8:position + 8 + json_size].decode("utf-8")))
+            position += 8 + json_size + media_type_size + payload_size
+        return messages
+
+
+def test_progress_sender_computes_percent_and_eta_and_throttles(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path), progress_interval_seconds=60.0) as (server, _):
+            writer = RecordingWriter()
+            send_progress = server.create_progress_sender(writer=writer, operation="compress", target_seconds=20.0)
+            send_progress({"out_time_seconds": 5.0, "fps": 30.0, "speed": 1.5})
+            # 送信間隔内の進捗は送信しない
+            send_progress({"out_time_seconds": 6.0, "fps": 30.0, "speed": 1.5})
+            return writer.get_messages()
+
+    messages = asyncio.run(run())
+    assert messages == [{
+        "status": "progress",
+        "operation": "compress",
+        "percent": 25.0,
+        "eta_seconds": 10.0,
+        "out_time_seconds": 5.0,
+        "fps": 30.0,
+        "speed": 1.5,
+    }]
+
+
+def test_server_sends_progress_frames_before_the_result(tmp_path, fake_ffmpeg, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_SECONDS", "1.5")
+
+    async def run():
+        async with running_server(str(tmp_path / "upload"), progress_interval_seconds=0.25) as (_, port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            try:
+                request = json.dumps({"action": "upload", "file_name": "input.mp4", "operation": "compress", "parameters": {}}).encode("utf-8")
+                writer.write(create_mmp_header(len(request), 9, len(DATA)) + request + b"video/mp4" + DATA)
+                await writer.drain()
+                frames: list[tuple[float, dict, str, int]] = []
+                while True:
+                    json_size, media_type_size, payload_size = parse_mmp_header(await reader.readexactly(8))
+                    body = await reader.readexactly(json_size + media_type_size)
+                    await reader.readexactly(payload_size)
+                    response_json = json.loads(body[:json_size].decode("utf-8"))
+                    frames.append((time.monotonic(), response_json, body[json_size:].decode("utf-8"), payload_size))
+                    if response_json["status"] not in ("progress", "accepted"):
+                        return frames
+            finally:
+                writer.close()
+
+    frames = asyncio.run(run())
+    assert frames[-1][1]["status"] == "success"
+    progress = [frame for frame in frames if frame[1]["status"] == "progress"]
+    assert len(progress) >= 2
+    for _, progress_json, media_type, payload_size in progress:
+        assert media_type == "application/json"
+        assert payload_size == 0
+        assert progress_json["operation"] == "compress"
+        assert progress_json["speed"] == 2.0
+    # ffprobeの長さ（10秒）に対する進捗率
+    percents = [frame[1]["percent"] for frame in progress]
+    assert percents == sorted(percents)
+    assert all(0 <= percent <= 100 for percent in percents)
+    # 送信間隔は progress_interval_seconds 以上
+    times = [frame[0] for frame in progress]
+    assert all(later - earlier >= 0.2 for earlier, later in zip(times, times[1:]))
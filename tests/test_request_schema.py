@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from request_schema import RequestError, validate_request
+from support import running_server, send_request
+
+CONTENT_HASH = "ab" * 32
+
+
+def test_probe_hash_is_validated():
+    assert validate_request({"action": "probe_hash", "content_hash": CONTENT_HASH})["content_hash"] == CONTENT_HASH
+
+    for json_data in ({"action": "probe_hash"}, {"action": "probe_hash", "content_hash": "../../etc/passwd"}):
+        with pytest.raises(RequestError) as e:
+            validate_request(json_data)
+        assert e.value.code == "invalid_request"
+
+
+def test_server_rejects_invalid_probe_hash(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path)) as (_, port):
+            response_json, _, _ = await send_request(port, {"action": "probe_hash", "content_hash": "not a hash"})
+            assert response_json["status"] == "error"
+            assert response_json["code"] == "invalid_request"
+
+            response_json, _, _ = await send_request(port, {"action": "probe_hash", "content_hash": CONTENT_HASH})
+            assert response_json["status"] == "success"
+            assert response_json["exists"] is False
+
+    asyncio.run(run())
+
+
+def test_numeric_time_values_are_converted_to_strings():
+    checked = validate_request({
+        "action": "upload",
+        "file_name": "input.mp4",
+        "operation": "trim",
+        "parameters": {"type": "gif", "start_time": 5, "duration": 2.5},
+    })
+    assert checked["parameters"]["start_time"] == "5"
+    assert checked["parameters"]["duration"] == "2.5"
+
+    with pytest.raises(RequestError) as e:
+        validate_request({
+            "action": "upload",
+            "file_name": "input.mp4",
+            "operation": "trim",
+            "parameters": {"type": "gif", "start_time": 5, "duration": 0},
+        })
+    assert e.value.code == "invalid_parameters"
+
+
+def test_server_trims_with_numeric_time_values(tmp_path, fake_ffmpeg):
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            response_json, _, payload = await send_request(
+                port,
+                {
+                    "action": "upload",
+                    "file_name": "input.mp4",
+                    "operation": "trim",
+                    "parameters": {"type": "webm", "start_time": 5, "duration": 3},
+                },
+                payload=b"input video" * 1000,
+                media_type="video/mp4",
+            )
+            assert response_json["status"] == "success"
+            assert payload == b"input video" * 1000
+
+    asyncio.run(run())
+    args = fake_ffmpeg.read_text().split()
+    assert args[args.index("-ss") + 1] == "5"
+    assert args[args.index("-t") + 1] == "3"
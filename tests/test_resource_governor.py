@@ -0,0 +1,48 @@
+import os
+
+import resource_governor
+from resource_governor import ResourceGovernor
+
+
+def create_cgroup_tree(tmp_path, monkeypatch, controllers: str):
+    """サーバーが /service に所属する cgroup v2 の階層（ファイルのみ）を作成する"""
+    root = tmp_path / "cgroup"
+    own_dir = root / "service"
+    own_dir.mkdir(parents=True)
+    (root / "cgroup.controllers").write_text("cpu memory io")
+    (own_dir / "cgroup.controllers").write_text(controllers)
+    proc_cgroup = tmp_path / "proc_cgroup"
+    proc_cgroup.write_text("0::/service\n")
+    monkeypatch.setattr(resource_governor, "CGROUP_ROOT", str(root))
+    monkeypatch.setattr(resource_governor, "PROC_CGROUP_PATH", str(proc_cgroup))
+    return own_dir
+
+
+def test_server_moves_to_leaf_before_enabling_controllers(tmp_path, monkeypatch):
+    own_dir = create_cgroup_tree(tmp_path, monkeypatch, controllers="cpu memory io")
+
+    governor = ResourceGovernor(cgroup_cpu_max_cores=1.5, cgroup_memory_max_bytes=512 * 1024 * 1024)
+
+    # サーバーは葉のcgroupへ移動し、親ではコントローラーを子に有効にする
+    assert (own_dir / "server" / "cgroup.procs").read_text() == str(os.getpid())
+    assert (own_dir / "cgroup.subtree_control").read_text() == "+cpu +memory"
+    assert (own_dir / "ffmpeg_jobs" / "cgroup.subtree_control").read_text() == "+cpu +memory"
+    assert governor.cgroup_parent == str(own_dir / "ffmpeg_jobs")
+    assert governor.get_policy()["cgroup"]["reason"] is None
+
+    # ffmpegごとのcgroupは ffmpeg_jobs の下の葉
+    cgroup_path = governor.create_job_cgroup()
+    assert os.path.dirname(cgroup_path) == governor.cgroup_parent
+    with open(os.path.join(cgroup_path, "cpu.max")) as f:
+        assert f.read() == "150000 100000"
+
+
+def test_cgroup_is_disabled_when_controllers_are_not_delegated(tmp_path, monkeypatch):
+    own_dir = create_cgroup_tree(tmp_path, monkeypatch, controllers="io")
+
+    governor = ResourceGovernor(cgroup_memory_max_bytes=512 * 1024 * 1024)
+
+    assert governor.cgroup_parent is None
+    assert "memory" in governor.cgroup_reason
+    # 制限できない場合はサーバーを移動しない
+    assert not (own_dir / "server").exists()
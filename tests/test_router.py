@@ -0,0 +1,151 @@
+import asyncio
+import json
+
+import socket
+
+from mmp_protocol import create_mmp_header, parse_mmp_header
+from router import ConsistentHashRing, Router, get_route_key
+from support import running_server, send_request
+
+BACKENDS = [f"127.0.0.1:{port}" for port in range(9001, 9005)]
+KEYS = [f"video_{index}.mp4:{index * 1000}" for index in range(2000)]
+
+
+async def start_router(router: Router) -> tuple[asyncio.Server, int]:
+    listener = await asyncio.start_server(router.handle_client, "127.0.0.1", 0)
+    return listener, listener.sockets[0].getsockname()[1]
+
+
+def test_backends_change_is_rejected_from_non_admin_address():
+    async def run():
+        router = Router(backends=["127.0.0.1:8888"])
+        router.admin_addresses = set()
+        listener, port = await start_router(router)
+        async with listener:
+            response_json, _, _ = await send_request(port, {"action": "backends", "add": ["192.0.2.10:8888"]})
+            assert response_json["status"] == "error"
+            assert response_json["code"] == "forbidden"
+            response_json, _, _ = await send_request(port, {"action": "backends", "remove": ["127.0.0.1:8888"]})
+            assert response_json["code"] == "forbidden"
+            assert router.ring.backends == {"127.0.0.1:8888"}
+
+            # 現在の振り分け先の取得は許可する
+            response_json, _, _ = await send_request(port, {"action": "backends"})
+            assert response_json["status"] == "success"
+            assert response_json["backends"] == ["127.0.0.1:8888"]
+
+    asyncio.run(run())
+
+
+def test_backends_change_is_accepted_from_loopback():
+    async def run():
+        router = Router(backends=["127.0.0.1:8888"])
+        listener, port = await start_router(router)
+        async with listener:
+            response_json, _, _ = await send_request(port, {"action": "backends", "add": ["127.0.0.1:8889"], "remove": ["127.0.0.1:8888"]})
+            assert response_json["status"] == "success"
+            assert response_json["backends"] == ["127.0.0.1:8889"]
+
+    asyncio.run(run())
+
+
+def test_non_object_json_returns_error_response():
+    async def run():
+        router = Router(backends=["127.0.0.1:8888"])
+        listener, port = await start_router(router)
+        async with listener:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            json_bytes = json.dumps(["backends"]).encode("utf-8")
+            media_type_bytes = b"application/json"
+            writer.write(create_mmp_header(len(json_bytes), len(media_type_bytes), 0) + json_bytes + media_type_bytes)
+            await writer.drain()
+            json_size, media_type_size, _ = parse_mmp_header(await reader.readexactly(8))
+            body = await reader.readexactly(json_size + media_type_size)
+            writer.close()
+            response_json = json.loads(body[:json_size].decode("utf-8"))
+            assert response_json["status"] == "error"
+            assert response_json["code"] == "invalid_request"
+
+    asyncio.run(run())
+
+
+def test_route_key_prefers_client_key_then_hash_then_file():
+    assert get_route_key({"route_key": "r", "content_hash": "h", "file_name": "a.mp4"}, 10) == "r"
+    assert get_route_key({"content_ref": "h", "file_name": "a.mp4"}, 10) == "h"
+    assert get_route_key({"file_name": "a.mp4", "total_size": 99}, 10) == "a.mp4:99"
+    assert get_route_key({"file_name": "a.mp4"}, 10) == "a.mp4:10"
+    assert get_route_key({"action": "ping"}, 0) is None
+
+
+def test_ring_moves_only_keys_of_the_added_backend():
+    ring = ConsistentHashRing()
+    for backend in BACKENDS[:3]:
+        ring.add(backend)
+    before = {key: ring.iterate(key)[0] for key in KEYS}
+
+    ring.add(BACKENDS[3])
+    after = {key: ring.iterate(key)[0] for key in KEYS}
+
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert all(after[key] == BACKENDS[3] for key in moved)
+    # 新しいサーバーはおおよそ1/4のキーを担当する
+    assert 0.15 < len(moved) / len(KEYS) < 0.35
+    # 各サーバーの担当の偏りは小さい
+    counts = [sum(1 for owner in after.values() if owner == backend) for backend in BACKENDS]
+    assert max(counts) < 2 * min(counts)
+
+    ring.remove(BACKENDS[3])
+    assert {key: ring.iterate(key)[0] for key in KEYS} == before
+    assert sorted(ring.iterate(KEYS[0])) == sorted(BACKENDS[:3])
+
+
+def test_select_backends_overflows_to_next_backend_at_capacity():
+    router = Router(backends=BACKENDS[:2], load_factor=1.25)
+    key = KEYS[0]
+    owner, other = router.ring.iterate(key)
+
+    assert router.select_backends(key)[0] == owner
+    # 担当サーバーの接続数が上限（ceil(1.25 * (2 + 1) / 2) = 2）に達した場合は次のサーバー
+    router.active[owner] = 2
+    assert router.get_capacity() == 2
+    assert router.select_backends(key) == [other, owner]
+    assert router.overflowed == 1
+
+    # 接続できなかったサーバーは選択しない
+    router.active[owner] = 0
+    router.down_until[owner] = float("inf")
+    assert router.select_backends(key) == [other]
+    assert router.select_backends(None) == [other]
+
+
+def test_router_sends_the_same_file_to_the_same_server(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path / "a")) as (_, port_a), running_server(str(tmp_path / "b")) as (_, port_b):
+            # 接続できないサーバー
+            with socket.socket() as sock:
+                sock.bind(("127.0.0.1", 0))
+                down = f"127.0.0.1:{sock.getsockname()[1]}"
+            router = Router(backends=[f"127.0.0.1:{port_a}", f"127.0.0.1:{port_b}", down])
+            listener, port = await start_router(router)
+            async with listener:
+                routes: dict[str, set[str]] = {}
+                for key in KEYS[:20]:
+                    for _ in range(2):
+                        before = dict(router.routed)
+                        response_json, _, _ = await send_request(port, {"action": "probe_hash", "content_hash": "ab" * 32, "route_key": key})
+                        assert response_json["status"] == "success"
+                        routes.setdefault(key, set()).update(
+                            backend for backend, count in router.routed.items() if count != before.get(backend, 0)
+                        )
+                        # 中継中の接続が終わるまで待つ（接続数の上限による振り分けを避ける）
+                        while any(router.active.values()):
+                            await asyncio.sleep(0.01)
+            return router, down, routes
+
+    router, down, routes = asyncio.run(run())
+    for key, backends in routes.items():
+        # 同じキーは同じサーバーへ送られる（接続できないサーバーの担当は次のサーバーへ）
+        expected = next(backend for backend in router.ring.iterate(key) if backend != down)
+        assert backends == {expected}
+    assert router.routed.get(down, 0) == 0
+    assert not router.is_available(down)
@@ -0,0 +1,41 @@
+import asyncio
+import os
+
+from staging_janitor import StagingJanitor
+
+FILE_BYTES = 10 * 1024
+
+
+def create_janitor(directory: str) -> StagingJanitor:
+    # 小さなファイルでも切り詰めてから削除する設定
+    return StagingJanitor(
+        directories=[directory],
+        get_owned_paths=set,
+        unlink_bytes_per_second=None,
+        truncate_step_bytes=1024,
+    )
+
+
+def test_remove_file_truncates_unshared_file(tmp_path):
+    file_path = tmp_path / "input.mp4"
+    file_path.write_bytes(b"x" * FILE_BYTES)
+
+    removed_bytes = asyncio.run(create_janitor(str(tmp_path)).remove_file(str(file_path)))
+
+    assert removed_bytes == FILE_BYTES
+    assert not file_path.exists()
+
+
+def test_remove_file_keeps_hard_linked_content(tmp_path):
+    # 共有ジョブの入力のように、同じ内容を別の作業ディレクトリからハードリンクしている場合
+    data = os.urandom(FILE_BYTES)
+    linked_path = tmp_path / "shared_input.mp4"
+    linked_path.write_bytes(data)
+    file_path = tmp_path / "input.mp4"
+    os.link(linked_path, file_path)
+
+    removed_bytes = asyncio.run(create_janitor(str(tmp_path)).remove_file(str(file_path)))
+
+    assert removed_bytes == 0
+    assert not file_path.exists()
+    assert linked_path.read_bytes() == data
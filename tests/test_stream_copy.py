@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from ffmpeg_function import can_stream_copy
+from support import running_server, send_request
+
+DATA = b"input video" * 1000
+
+
+def create_probe(video: dict | None = None, audio: dict | None = None) -> dict:
+    streams = []
+    if video is not None:
+        streams.append({"codec_type": "video", **video})
+    if audio is not None:
+        streams.append({"codec_type": "audio", **audio})
+    return {"format": {"duration": "10.0"}, "streams": streams}
+
+
+H264_720P = {"codec_name": "h264", "width": 1280, "height": 720}
+
+
+@pytest.mark.parametrize(("operation", "parameters", "probe", "expected"), [
+    ("resize", {"size": "2"}, create_probe(H264_720P), True),
+    ("resize", {"size": "3"}, create_probe(H264_720P), False),
+    ("resize", {"size": "2", "passthrough": False}, create_probe(H264_720P), False),
+    ("resize", {"size": "2"}, create_probe({**H264_720P, "tags": {"rotate": "90"}}), False),
+    ("resize", {"size": "2"}, create_probe({**H264_720P, "codec_name": "vp9"}), False),
+    ("convert", {}, create_probe(H264_720P, {"codec_name": "mp3"}), True),
+    ("convert", {}, create_probe(H264_720P, {"codec_name": "aac"}), False),
+    ("trim", {"type": "webm"}, create_probe({**H264_720P, "codec_name": "vp9"}), True),
+    ("trim", {"type": "gif"}, create_probe({**H264_720P, "codec_name": "vp9"}), False),
+    ("compress", {}, create_probe(H264_720P), False),
+    ("resize", {"size": "2"}, None, False),
+])
+def test_can_stream_copy(operation, parameters, probe, expected):
+    assert can_stream_copy(operation, parameters, probe) is expected
+
+
+@pytest.mark.parametrize(("parameters", "codec_path"), [
+    ({"size": "2"}, "stream_copy"),
+    ({"size": "2", "passthrough": False}, "transcode"),
+    ({"size": "3"}, "transcode"),
+])
+def test_server_stream_copies_matching_input(tmp_path, fake_ffmpeg, parameters, codec_path):
+    # 偽のffprobeは 1280x720 の h264 を返す
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            return await send_request(
+                port,
+                {"action": "upload", "file_name": "input.mp4", "operation": "resize", "parameters": parameters},
+                payload=DATA,
+                media_type="video/mp4",
+            )
+
+    response_json, _, payload = asyncio.run(run())
+    assert response_json["status"] == "success"
+    assert response_json["codec_path"] == codec_path
+    assert payload == DATA
+
+    args = fake_ffmpeg.read_text().split()
+    if codec_path == "stream_copy":
+        assert args[args.index("-c:v") + 1] == "copy"
+        assert not any(arg.startswith("scale=") for arg in args)
+    else:
+        assert "scale=" + {"2": "1280:720", "3": "640:480"}[parameters["size"]] in args
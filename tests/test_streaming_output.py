@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+from mmp_protocol import CHUNKED_PAYLOAD_SIZE, create_mmp_header, parse_mmp_header, read_mmp_chunks
+from support import running_server
+
+DATA = b"input video" * 10000
+
+
+async def upload_streaming(port: int, **fields) -> tuple[list[dict], bytes, dict]:
+    """"stream": true でアップロードし、(分割データのメッセージ, 受信したデータ, 最終結果) を返す"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        request = {"action": "upload", "file_name": "input.mp4", "operation": "convert", "parameters": {}, "stream": True, **fields}
+        json_bytes = json.dumps(request).encode("utf-8")
+        writer.write(create_mmp_header(len(json_bytes), 9, len(DATA)) + json_bytes + b"video/mp4" + DATA)
+        await writer.drain()
+        messages: list[dict] = []
+        received = b""
+        while True:
+            json_size, media_type_size, payload_size = parse_mmp_header(await reader.readexactly(8))
+            body = await reader.readexactly(json_size + media_type_size)
+            response_json = json.loads(body[:json_size].decode("utf-8"))
+            if payload_size == CHUNKED_PAYLOAD_SIZE:
+                messages.append(response_json)
+                received += b"".join([chunk async for chunk in read_mmp_chunks(reader)])
+                continue
+            payload = await reader.readexactly(payload_size)
+            if response_json["status"] == "chunk":
+                messages.append(response_json)
+                received += payload
+            elif response_json["status"] not in ("progress", "accepted"):
+                return messages, received, response_json
+    finally:
+        writer.close()
+
+
+def test_streamed_output_is_sent_in_ordered_chunks(tmp_path, fake_ffmpeg):
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            messages, received, final_json = await upload_streaming(port)
+            assert final_json["status"] == "success"
+            assert final_json["streamed"] is True
+            assert final_json["stream_bytes"] == len(DATA)
+            assert received == DATA
+            assert len(messages) > 1
+            assert [message["seq"] for message in messages] == list(range(len(messages)))
+
+    asyncio.run(run())
+
+    # ffmpegはファイルではなくパイプへ出力する
+    assert fake_ffmpeg.read_text().split()[-1].startswith("pipe:")
+
+
+def test_streamed_output_uses_one_chunked_message_with_mmp_v2(tmp_path, fake_ffmpeg):
+    async def run():
+        async with running_server(str(tmp_path / "upload")) as (_, port):
+            messages, received, final_json = await upload_streaming(port, mmp_version=2)
+            assert final_json["status"] == "success"
+            assert final_json["stream_bytes"] == len(DATA)
+            assert [message["status"] for message in messages] == ["stream"]
+            assert received == DATA
+
+    asyncio.run(run())
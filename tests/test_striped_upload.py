@@ -0,0 +1,63 @@
+import asyncio
+
+from support import running_server, send_request
+
+UPLOAD_ID = "0123456789abcdef"
+DATA = b"striped upload data" * 100
+
+
+def upload_request(**fields) -> dict:
+    return {
+        "action": "upload",
+        "file_name": "input.mp4",
+        "operation": "convert",
+        "upload_id": UPLOAD_ID,
+        "total_size": len(DATA),
+        **fields,
+    }
+
+
+def test_content_hash_mismatch_returns_error_response(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path)) as (_, port):
+            response_json, _, _ = await send_request(
+                port,
+                {"action": "upload_range", "upload_id": UPLOAD_ID, "file_name": "input.mp4", "offset": 0, "total_size": len(DATA)},
+                payload=DATA,
+                media_type="application/octet-stream",
+            )
+            assert response_json["status"] == "success"
+
+            response_json, _, payload = await send_request(port, upload_request(content_hash="ff" * 32))
+            assert response_json["status"] == "error"
+            assert response_json["code"] == "content_hash_mismatch"
+            assert payload == b""
+
+    asyncio.run(run())
+
+
+def test_invalid_upload_range_returns_error_response(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path)) as (_, port):
+            await send_request(
+                port,
+                {"action": "upload_range", "upload_id": UPLOAD_ID, "file_name": "input.mp4", "offset": 0, "total_size": len(DATA)},
+                payload=DATA[:100],
+                media_type="application/octet-stream",
+            )
+
+            response_json, _, _ = await send_request(port, upload_request(total_size=len(DATA) + 1))
+            assert response_json["status"] == "error"
+            assert response_json["code"] == "invalid_upload_range"
+
+    asyncio.run(run())
+
+
+def test_upload_incomplete_returns_error_response(tmp_path):
+    async def run():
+        async with running_server(str(tmp_path), striped_upload_timeout_seconds=0.2) as (_, port):
+            response_json, _, _ = await send_request(port, upload_request())
+            assert response_json["status"] == "error"
+            assert response_json["code"] == "upload_incomplete"
+
+    asyncio.run(run())